@@ -0,0 +1,82 @@
+import contextvars, sqlite3, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import connect, current_athlete
+from logs import get_logger
+
+
+logger = get_logger("ai_insights")
+
+# Upper bound on concurrent LLM calls within one background job
+AI_MAX_WORKERS = 8
+
+# Per-call timeout for background generation
+AI_CALL_TIMEOUT_SECONDS = 60
+
+# Background jobs run one at a time, off the Streamlit script thread
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai-insights")
+_pending = set()
+_pending_lock = threading.Lock()
+
+def enqueue_insight_job(name, job, *args):
+    """Queues job(*args) in the background unless a job with the same name is already queued or running
+    for the current athlete.
+
+    The job runs in a copy of the caller's context, so it reads and writes the same athlete's shard.
+    Returns True when the job was queued.
+    """
+    pending_key = (current_athlete.get(), name)
+    with _pending_lock:
+        if pending_key in _pending:
+            return False
+        _pending.add(pending_key)
+
+    def run():
+        started = time.perf_counter()
+        try:
+            job(*args)
+            logger.info(f"[AI] Generated insights '{name}' in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            logger.error(f"[AI] Error generating insights '{name}': {e}")
+        finally:
+            with _pending_lock:
+                _pending.discard(pending_key)
+
+    _executor.submit(contextvars.copy_context().run, run)
+    return True
+
+def is_pending(name):
+    with _pending_lock:
+        return (current_athlete.get(), name) in _pending
+
+def generate_all(model, prompts, timeout=AI_CALL_TIMEOUT_SECONDS):
+    """Runs {key: prompt} concurrently and returns {key: text} for the calls that succeeded."""
+    def generate(item):
+        key, prompt = item
+        try:
+            return key, model.generate_content(prompt, timeout=timeout).text
+        except Exception as e:
+            logger.error(f"[AI] Error generating '{key}': {e}")
+            return key, None
+
+    if not prompts:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(AI_MAX_WORKERS, len(prompts))) as pool:
+        return {key: text for key, text in pool.map(generate, prompts.items()) if text is not None}
+
+def store_insights(insights, data_version, database=None):
+    """Stores {key: text} stamped with the data version they were generated from."""
+    conn = connect(database)
+    conn.executemany("""
+        INSERT OR REPLACE INTO ai_insights (key, data_version, content, generated_at) VALUES (?, ?, ?, ?)
+    """, [(key, data_version, content, time.time()) for key, content in insights.items()])
+    conn.commit()
+    conn.close()
+
+def load_insights(conn, prefix):
+    """Returns {key: (content, data_version)} for the stored insights whose key starts with prefix."""
+    try:
+        cursor = conn.execute("SELECT key, content, data_version FROM ai_insights WHERE key LIKE ? || '%'", (prefix,))
+    except sqlite3.OperationalError:
+        return {}
+    return {key: (content, version) for key, content, version in cursor.fetchall()}
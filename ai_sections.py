@@ -0,0 +1,74 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_backend import parse_json_response
+from logs import get_logger
+
+
+logger = get_logger("ai_sections")
+
+# Dashboard sections answered by the single structured request, with what each analysis should cover
+SECTION_INSTRUCTIONS = {
+    'performance': "Performance patterns (distance, pace, run count) and suggestions for improvement.",
+    'physiological': "Training intensity and physiological adaptations from heart rate, calories and suffer score.",
+    'elevation': "Elevation gain and cadence habits and how they relate to overall performance.",
+    'environmental': "How temperature, humidity and air quality affect performance, with recommendations.",
+    'inferred': "Training consistency and adaptations from weekly pace variability, heart rate zones, "
+                "run frequency and grade adjusted pace.",
+    'monthly': "A detailed review of the last 30 days: training load, consistency and performance, "
+               "with actionable recommendations."
+}
+SECTION_KEYS = list(SECTION_INSTRUCTIONS)
+
+SECTION_SCHEMA = {
+    "type": "object",
+    "properties": {key: {"type": "string"} for key in SECTION_KEYS},
+    "required": SECTION_KEYS
+}
+
+def build_sections_prompt(digest):
+    """Builds the single prompt asking for every section analysis as one JSON object."""
+    sections = "\n".join(f"- {key}: {instruction}" for key, instruction in SECTION_INSTRUCTIONS.items())
+    return f"""You are a running coach. Using the runner's statistics below, write one focused analysis per section.
+
+Sections:
+{sections}
+
+Statistics (JSON, distances in km, paces in min/km, heart rates in bpm):
+{json.dumps(digest, separators=(',', ':'), sort_keys=True)}
+
+Respond with only a JSON object whose keys are exactly {', '.join(SECTION_KEYS)} and whose values are markdown strings."""
+
+def generate_section_analyses(model, digest, fallback_prompts, timeout=None):
+    """Returns {section: analysis text} from one structured request.
+
+    Sections missing from (or invalid in) the structured answer are requested one by one, concurrently,
+    with the prompts returned by fallback_prompts() (only built when needed). Sections that still fail are
+    left out, so they are never stored in place of an analysis and the next render requests them again.
+    """
+    sections = {}
+    try:
+        response = model.generate_content(build_sections_prompt(digest), timeout=timeout, schema=SECTION_SCHEMA)
+        sections = parse_json_response(response.text, SECTION_SCHEMA)
+    except Exception as e:
+        logger.warning(f"[AI] Structured analysis failed, falling back to per-section requests: {e}")
+
+    missing = [key for key in SECTION_KEYS if key not in sections]
+    if missing:
+        logger.info(f"[AI] Requesting sections individually: {', '.join(missing)}")
+        try:
+            prompts = fallback_prompts()
+        except Exception as e:
+            logger.error(f"[AI] Could not build the section prompts: {e}")
+            return sections
+
+        def fallback(key):
+            try:
+                return model.generate_content(prompts[key], timeout=timeout).text
+            except Exception as e:
+                logger.error(f"[AI] Error generating section '{key}': {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+            sections.update((key, text) for key, text in zip(missing, pool.map(fallback, missing)) if text is not None)
+    return sections
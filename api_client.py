@@ -1,103 +1,188 @@
-import stravalib,os, requests, time
-from dotenv import load_dotenv
-import streamlit as st
+import os, time
 from datetime import timezone
 
-load_dotenv()
+from instrumentation import increment, record, timed
+from logs import get_logger
+
+# stravalib, requests and python-dotenv are imported on first use: importing this module stays cheap and
+# pulls in neither the Strava client nor any UI code
 
-STRAVA_CLIENT_ID = os.getenv("STRAVA_CLIENT_ID")
-STRAVA_CLIENT_SECRET = os.getenv("STRAVA_CLIENT_SECRET")
-STRAVA_REFRESH_TOKEN = os.getenv("STRAVA_REFRESH_TOKEN")
-OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
 REDIRECT_URI = "http://localhost:8000/authorized"
 
 # Rate limiting variables
 STRAVA_REQUEST_DELAY = 10  # 10 seconds delay between requests
 
-def authenticate_strava(code=None):
-    """Authenticates with the Strava API using OAuth 2.0."""
-    client = stravalib.Client()
-    print("[Strava] Authenticating...")
+# OpenWeatherMap requests time out after this many seconds; connection errors, 429 and 5xx answers are
+# retried with exponential backoff, up to HTTP_ATTEMPTS attempts in total
+HTTP_TIMEOUT_SECONDS = 30
+HTTP_ATTEMPTS = 3
+HTTP_RETRY_BACKOFF_SECONDS = 1.0
+
+# City names are reverse geocoded once per start location rounded to this many decimals (about 1 km)
+GEOCODE_CACHE_DIGITS = 2
+
+_env_loaded = False
+
+logger = get_logger("api_client")
+
+# Reverse geocoding answers of this process, keyed by rounded (latitude, longitude)
+_city_names = {}
+
+def load_env():
+    """Loads .env into the environment once; variables already set in the environment take precedence."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _env_loaded = True
+
+def _count_strava_response(response, *args, **kwargs):
+    """requests response hook: latency, request count and bytes of every Strava API call."""
+    record("http.strava", response.elapsed.total_seconds())
+    increment('strava_requests')
+    increment('strava_bytes', len(response.content))
+
+def authenticate_strava(code=None, interactive=True, refresh_token=None, rate_limiter=None):
+    """Authenticates with the Strava API using OAuth 2.0.
+
+    rate_limiter replaces stravalib's default limiter; it is called with the response headers and method
+    after every request.
+
+    refresh_token defaults to STRAVA_REFRESH_TOKEN; the environment is only updated for that default token.
+    Without a refresh token the OAuth flow needs an authorization code: `code` when given, otherwise it is
+    read from the terminal unless interactive is False (headless runs then fail instead of blocking).
+    """
+    import stravalib
+
+    load_env()
+    client_id = os.getenv("STRAVA_CLIENT_ID")
+    client_secret = os.getenv("STRAVA_CLIENT_SECRET")
+    client = stravalib.Client(rate_limiter=rate_limiter)
+    client.protocol.rsession.hooks['response'].append(_count_strava_response)
+    logger.info("[Strava] Authenticating...")
 
     # Check if we have a refresh token
-    refresh_token = os.getenv("STRAVA_REFRESH_TOKEN")
+    from_environment = refresh_token is None
+    refresh_token = os.getenv("STRAVA_REFRESH_TOKEN") if from_environment else refresh_token
     if refresh_token:
         try:
             refresh_response = client.refresh_access_token(
-                client_id=STRAVA_CLIENT_ID,
-                client_secret=STRAVA_CLIENT_SECRET,
+                client_id=client_id,
+                client_secret=client_secret,
                 refresh_token=refresh_token
             )
             client.access_token = refresh_response['access_token']
-            os.environ["STRAVA_ACCESS_TOKEN"] = client.access_token
-            print("[Strava] Authentication successful")
+            # Strava may rotate the refresh token; callers persist client.refresh_token
+            client.refresh_token = refresh_response.get('refresh_token', refresh_token)
+            if from_environment:
+                os.environ["STRAVA_ACCESS_TOKEN"] = client.access_token
+            logger.info("[Strava] Authentication successful")
             return client
         except Exception as e:
-            print("[Strava] Token refresh failed")
+            logger.error(f"[Strava] Token refresh failed: {e}")
             return None
 
     # If no refresh token or refresh failed, start the OAuth flow
     authorize_url = client.authorization_url(
-        client_id=STRAVA_CLIENT_ID,
+        client_id=client_id,
         redirect_uri=REDIRECT_URI,
         scope=["read_all", "activity:read_all"]
     )
     
-    print(f"\n[Strava] Please visit this URL to authorize: {authorize_url}")
-    code = input("[Strava] Enter the authorization code from the URL: ")
+    if code is None:
+        if not interactive:
+            logger.info(f"[Strava] No STRAVA_REFRESH_TOKEN set; authorize at {authorize_url} and set it in .env")
+            return None
+        print(f"\n[Strava] Please visit this URL to authorize: {authorize_url}")
+        code = input("[Strava] Enter the authorization code from the URL: ")
     
     try:
         token_response = client.exchange_code_for_token(
-            client_id=STRAVA_CLIENT_ID,
-            client_secret=STRAVA_CLIENT_SECRET,
+            client_id=client_id,
+            client_secret=client_secret,
             code=code
         )
         client.access_token = token_response['access_token']
-        os.environ["STRAVA_ACCESS_TOKEN"] = client.access_token
-        os.environ["STRAVA_REFRESH_TOKEN"] = token_response['refresh_token']
-        print("[Strava] New authentication successful")
+        client.refresh_token = token_response['refresh_token']
+        if from_environment:
+            os.environ["STRAVA_ACCESS_TOKEN"] = client.access_token
+            os.environ["STRAVA_REFRESH_TOKEN"] = token_response['refresh_token']
+        logger.info("[Strava] New authentication successful")
         return client
     except Exception as e:
-        print("[Strava] Authentication failed")
+        logger.error(f"[Strava] Authentication failed: {e}")
         return None
-def stream_activities(client, after=None):
+
+def stream_activities(client, after=None, on_error=None, before=None, delay=STRAVA_REQUEST_DELAY):
     """
-    Streams activities one at a time from Strava API.
+    Streams activities one at a time from Strava API, newest first (only those older than `before` if given).
     Stops when an activity older than the cutoff date is encountered.
+    Errors are logged and passed to on_error(message) when given (the dashboard shows them with st.error).
+    `delay` seconds are waited after each activity; clients with a quota limiter pass 0.
     """
     try:
-        print("[Strava] Starting activity stream...")
+        logger.info("[Strava] Starting activity stream...")
         activity_count = 0
-        for activity in client.get_activities():
+        for activity in client.get_activities(before=before):
             activity_count += 1
             activity_date = activity.start_date.replace(tzinfo=timezone.utc)
             if after and activity_date < after:
-                print(f"[Strava] Reached cutoff date after {activity_count} activities")
+                logger.info(f"[Strava] Reached cutoff date after {activity_count} activities")
                 break
-            print(f"[Strava] Processing activity {activity_count}: {activity.id}")
+            logger.info(f"[Strava] Processing activity {activity_count}: {activity.id}")
             yield activity
-            time.sleep(10)  # 10 second delay between Strava API calls
+            if delay:
+                time.sleep(delay)  # delay between Strava API calls
             
     except Exception as e:
-        print(f"[Strava] Error streaming activities: {e}")
-        st.error(f"Error streaming activities: {e}")
+        logger.error(f"[Strava] Error streaming activities: {e}")
+        if on_error:
+            on_error(f"Error streaming activities: {e}")
 
-def process_activity(client, activity_id):
+def process_activity(client, activity_id, on_error=None):
     """Process a single Strava activity."""
     try:
-        print(f"[Strava] Fetching details for activity {activity_id}")
+        logger.info(f"[Strava] Fetching details for activity {activity_id}")
         activity = client.get_activity(activity_id)
         if activity:
-            print(f"[Strava] Successfully fetched activity {activity_id}")
+            logger.info(f"[Strava] Successfully fetched activity {activity_id}")
         return activity
     except Exception as e:
-        print(f"[Strava] Error fetching activity {activity_id}: {e}")
-        st.error(f"Error fetching activity {activity_id}: {e}")
+        logger.error(f"[Strava] Error fetching activity {activity_id}: {e}")
+        if on_error:
+            on_error(f"Error fetching activity {activity_id}: {e}")
         return None
 
+def _get_json(url, params, name):
+    """GET returning the decoded JSON body; timed as http.<name>, with retries on transient failures."""
+    import requests
+
+    for attempt in range(HTTP_ATTEMPTS):
+        if attempt:
+            increment('http_retries')
+            time.sleep(HTTP_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+        try:
+            with timed(f"http.{name}"):
+                response = requests.get(url, params=params, timeout=HTTP_TIMEOUT_SECONDS)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == HTTP_ATTEMPTS - 1:
+                raise
+            continue
+        increment('http_requests')
+        increment('http_bytes', len(response.content))
+        if (response.status_code == 429 or response.status_code >= 500) and attempt < HTTP_ATTEMPTS - 1:
+            continue
+        response.raise_for_status()
+        return response.json()
+
 def fetch_openweathermap_data(latitude, longitude, timestamp, elapsed_time):
     """Fetches historical weather data and city name from OpenWeatherMap API."""
-    print("[Weather] Fetching weather data...")
+    import requests
+
+    load_env()
+    api_key = os.getenv("OPENWEATHERMAP_API_KEY")
+    logger.info("[Weather] Fetching weather data...")
     base_url = "https://api.openweathermap.org/data/3.0/onecall/timemachine"
     air_pollution_url = "http://api.openweathermap.org/data/2.5/air_pollution/history"
     reverse_geocode_url = "http://api.openweathermap.org/geo/1.0/reverse"
@@ -106,13 +191,11 @@ def fetch_openweathermap_data(latitude, longitude, timestamp, elapsed_time):
         "lat": latitude,
         "lon": longitude,
         "dt": int(timestamp),
-        "appid": OPENWEATHERMAP_API_KEY,
+        "appid": api_key,
         "units": "metric",
     }
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        weather_data = response.json()
+        weather_data = _get_json(base_url, params, "weather")
 
         # Calculate end time for pollution data (activity end time)
         end_timestamp = int(timestamp) + int(elapsed_time)
@@ -122,23 +205,26 @@ def fetch_openweathermap_data(latitude, longitude, timestamp, elapsed_time):
             "lon": longitude,
             "start": int(timestamp),
             "end": end_timestamp,
-            "appid": OPENWEATHERMAP_API_KEY
+            "appid": api_key
         }
-        air_pollution_response = requests.get(air_pollution_url, params=air_pollution_params)
-        air_pollution_response.raise_for_status()
-        air_pollution_data = air_pollution_response.json()
+        air_pollution_data = _get_json(air_pollution_url, air_pollution_params, "air_pollution")
         
-        # Fetch city name
+        # Fetch city name, once per start location
+        location = (round(latitude, GEOCODE_CACHE_DIGITS), round(longitude, GEOCODE_CACHE_DIGITS))
+        if location in _city_names:
+            increment('geocode_cache_hits')
+            return weather_data, air_pollution_data, _city_names[location]
+        increment('geocode_cache_misses')
         reverse_geocode_params = {
             "lat": latitude,
             "lon": longitude,
-            "appid": OPENWEATHERMAP_API_KEY,
+            "appid": api_key,
             "limit": 1
         }
-        reverse_geocode_response = requests.get(reverse_geocode_url, params=reverse_geocode_params)
-        reverse_geocode_response.raise_for_status()
-        city_data = reverse_geocode_response.json()
+        city_data = _get_json(reverse_geocode_url, reverse_geocode_params, "geocode")
         city_name = city_data[0]["name"] if city_data else None
+        _city_names[location] = city_name
         return weather_data, air_pollution_data, city_name
     except requests.exceptions.RequestException as e:
-        return None, None, None
\ No newline at end of file
+        logger.error(f"[Weather] Request failed: {e}")
+        return None, None, None
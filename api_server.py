@@ -0,0 +1,311 @@
+"""Read-only JSON API over the dashboard metrics, for external dashboards.
+
+    python -m api_server [--host 127.0.0.1] [--port 8765]
+
+    GET /api/version                                   data version of the database
+    GET /api/metrics[?metric=...&period=...]           value, median and change per metric and period
+    GET /api/trends?metric=M&period=P[&offset&limit]   daily trend series of a metric
+    GET /api/weekly[?offset&limit]                     weekly inferred metrics, one row per week
+    GET /api/env                                       environmental correlations, ranges and optimal conditions
+    GET /tiles/{z}/{x}/{y}.png                         pre-rendered route heatmap tile (slippy map scheme)
+    GET /metrics                                       instrumentation counters in Prometheus text format
+
+Every endpoint takes ?athlete=ID to read a registered athlete's shard. Responses carry an ETag derived
+from the data version (and the day, since periods are relative to today); clients sending it back in
+If-None-Match get 304 without anything being recomputed. Bodies are gzip-compressed when accepted, and
+series are paginated with offset/limit. Heatmap tiles are files rendered when activities are
+stored; their ETag hashes the PNG.
+"""
+import argparse, gzip, hashlib, json, math, re, threading
+from collections import OrderedDict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from database import connect, create_database_and_tables, get_data_version, use_athlete
+from instrumentation import prometheus_text, timed
+from logs import get_logger
+
+
+# Default listen address; bind to 0.0.0.0 explicitly to serve other hosts
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Rows per page of a series when no limit is given, and the largest limit accepted
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# Responses kept in memory (keyed by ETag), and loaded datasets (keyed by athlete and data version)
+RESPONSE_CACHE_ENTRIES = 256
+DATASET_CACHE_ENTRIES = 4
+
+# Bodies smaller than this are sent uncompressed
+GZIP_MIN_BYTES = 512
+
+# Heatmap tile URLs, as used by Leaflet, OpenLayers and the like
+TILE_PATH = re.compile(r'/tiles/(\d+)/(\d+)/(\d+)\.png')
+
+logger = get_logger("api_server")
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class LRUCache:
+    """Thread-safe mapping that keeps the most recently used `size` entries."""
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+_responses = LRUCache(RESPONSE_CACHE_ENTRIES)
+_datasets = LRUCache(DATASET_CACHE_ENTRIES)
+
+# Athletes whose tables this process has created or checked; requests after the first only read
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+def _ensure_schema(athlete_id):
+    with _schema_lock:
+        if athlete_id not in _schema_ready:
+            create_database_and_tables()
+            _schema_ready.add(athlete_id)
+
+def _json_safe(value):
+    """Replaces NaN and infinities (not valid JSON) with None."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    return value
+
+def _records(frame):
+    """DataFrame rows as JSON-ready dicts (ISO dates, NaN as null)."""
+    return json.loads(frame.to_json(orient='records', date_format='iso'))
+
+def _page(items, query):
+    offset = _int_param(query, 'offset', 0)
+    limit = min(_int_param(query, 'limit', DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+    next_offset = offset + limit if offset + limit < len(items) else None
+    return {'items': items[offset:offset + limit], 'offset': offset, 'limit': limit, 'total': len(items),
+            'next_offset': next_offset}
+
+def _int_param(query, name, default):
+    try:
+        value = int(query.get(name, default))
+    except ValueError:
+        raise ApiError(400, f"'{name}' must be an integer")
+    if value < 0:
+        raise ApiError(400, f"'{name}' must not be negative")
+    return value
+
+def _dataset(athlete_id, data_version):
+    """prepare_data() and the weekly metrics frame, loaded once per athlete and data version."""
+    from metrics import calculate_weekly_metrics, prepare_data, weekly_metrics_frame
+
+    key = (athlete_id, data_version)
+    dataset = _datasets.get(key)
+    if dataset is None:
+        strava_df, split_stats_df, _ = prepare_data()
+        weekly = weekly_metrics_frame(calculate_weekly_metrics(strava_df, split_stats_df))
+        dataset = {'activities': strava_df, 'weekly': weekly}
+        _datasets.put(key, dataset)
+    return dataset
+
+def get_version(athlete_id, data_version, query):
+    return {'athlete': athlete_id, 'data_version': data_version}
+
+def get_metrics(athlete_id, data_version, query):
+    from metrics import COMPARISON_PERIODS, METRIC_NAMES, period_metrics
+
+    metrics = [query['metric']] if 'metric' in query else METRIC_NAMES
+    periods = [query['period']] if 'period' in query else COMPARISON_PERIODS
+    if not set(metrics) <= set(METRIC_NAMES) or not set(periods) <= set(COMPARISON_PERIODS):
+        raise ApiError(400, f"Unknown metric or period; metrics: {METRIC_NAMES}, periods: {COMPARISON_PERIODS}")
+    frame = period_metrics(_dataset(athlete_id, data_version)['activities'], metrics, periods)
+    return {'items': _records(frame)}
+
+def get_trends(athlete_id, data_version, query):
+    from metrics import COMPARISON_PERIODS, METRIC_NAMES, get_trend_data
+
+    metric, period = query.get('metric'), query.get('period', 'Overall')
+    if metric not in METRIC_NAMES or period not in COMPARISON_PERIODS:
+        raise ApiError(400, f"'metric' must be one of {METRIC_NAMES}, 'period' one of {COMPARISON_PERIODS}")
+    trend_data = get_trend_data(_dataset(athlete_id, data_version)['activities'], metric, period)
+    items = []
+    if not trend_data.empty:
+        trend_data = trend_data.iloc[:, 0].rename('value').rename_axis('date').reset_index()
+        items = _records(trend_data)
+    return {'metric': metric, 'period': period, **_page(items, query)}
+
+def get_weekly(athlete_id, data_version, query):
+    return _page(_records(_dataset(athlete_id, data_version)['weekly']), query)
+
+def get_env(athlete_id, data_version, query):
+    from env_stats import get_env_correlations, get_env_ranges, get_optimal_conditions
+
+    conn = connect()
+    try:
+        return {
+            'correlations': get_env_correlations(conn),
+            'ranges': get_env_ranges(conn),
+            'optimal_conditions': get_optimal_conditions(conn)
+        }
+    finally:
+        conn.close()
+
+ROUTES = {
+    '/api/version': get_version,
+    '/api/metrics': get_metrics,
+    '/api/trends': get_trends,
+    '/api/weekly': get_weekly,
+    '/api/env': get_env
+}
+
+def _resolve_athlete(query):
+    athlete_id = query.get('athlete')
+    if athlete_id is not None:
+        from athletes import get_athlete
+
+        try:
+            get_athlete(athlete_id)
+        except KeyError as e:
+            raise ApiError(404, str(e.args[0]))
+    return athlete_id
+
+def build_response(path, query, known_etags=()):
+    """Returns (etag, body, gzipped body) for a GET, reusing the cached response while the data version holds.
+
+    The ETag only depends on the request and the data version, so when it is one of known_etags (the
+    client's If-None-Match) this returns (etag, None, None) without computing anything.
+    """
+    if path not in ROUTES:
+        raise ApiError(404, f"Unknown endpoint '{path}'; try one of {sorted(ROUTES)}")
+    athlete_id = _resolve_athlete(query)
+    with use_athlete(athlete_id):
+        _ensure_schema(athlete_id)
+        conn = connect()
+        try:
+            data_version = get_data_version(conn)
+        finally:
+            conn.close()
+
+        # Periods are relative to today, so the day is part of the representation
+        key = json.dumps([athlete_id, data_version, date.today().isoformat(), path, sorted(query.items())])
+        etag = '"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"'
+        if etag in known_etags:
+            return etag, None, None
+        cached = _responses.get(etag)
+        if cached is None:
+            with timed(f"api {path}"):
+                payload = {**ROUTES[path](athlete_id, data_version, query), 'data_version': data_version}
+            body = json.dumps(_json_safe(payload), default=str, allow_nan=False).encode()
+            cached = (body, gzip.compress(body) if len(body) >= GZIP_MIN_BYTES else None)
+            _responses.put(etag, cached)
+    return (etag, *cached)
+
+def tile_response(zoom, x, y, query):
+    """Returns (etag, PNG bytes) of a heatmap tile, served as rendered at insert time."""
+    from heatmap import MAX_ZOOM, MIN_ZOOM, tile_png
+
+    if not MIN_ZOOM <= zoom <= MAX_ZOOM:
+        raise ApiError(404, f"Heatmap tiles exist for zoom {MIN_ZOOM} to {MAX_ZOOM}")
+    athlete_id = _resolve_athlete(query)
+    with use_athlete(athlete_id):
+        _ensure_schema(athlete_id)
+        conn = connect()
+        try:
+            with timed("api /tiles"):
+                png = tile_png(conn, zoom, x, y)
+        finally:
+            conn.close()
+    if png is None:
+        raise ApiError(404, f"No routes cross tile {zoom}/{x}/{y}")
+    return '"' + hashlib.sha1(png).hexdigest()[:20] + '"', png
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = 'RunInsightAPI/1.0'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/metrics':
+            return self._send(200, prometheus_text().encode(), content_type='text/plain; version=0.0.4')
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        tile = TILE_PATH.fullmatch(url.path)
+        try:
+            if tile:
+                etag, body = tile_response(*map(int, tile.groups()), query)
+                return self._send_tile(etag, body)
+            etag, body, gzipped = build_response(url.path.rstrip('/'), query, self._if_none_match())
+        except ApiError as e:
+            return self._send(e.status, json.dumps({'error': str(e)}).encode())
+        except Exception as e:
+            logger.exception(f"[API] Error serving {self.path}: {e}")
+            return self._send(500, json.dumps({'error': f"{type(e).__name__}: {e}"}).encode())
+
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if body is None:
+            return self._send(304, b'', headers)
+        if gzipped is not None and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            headers['Content-Encoding'] = 'gzip'
+            body = gzipped
+        self._send(200, body, headers)
+
+    def _if_none_match(self):
+        return [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',') if tag.strip()]
+
+    def _send_tile(self, etag, png):
+        # PNGs are already compressed
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag in self._if_none_match():
+            return self._send(304, b'', headers)
+        self._send(200, png, headers, content_type='image/png')
+
+    def _send(self, status, body, headers=None, content_type='application/json'):
+        self.send_response(status)
+        if status != 304:
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info(f"[API] {self.address_string()} {format % args}")
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    logger.info(f"[API] Serving on http://{host}:{server.server_address[1]}/api/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='api_server', description="Read-only JSON API over the RunInsight metrics.")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    serve(args.host, args.port)
@@ -1,555 +1,47 @@
 import streamlit as st
-import pandas as pd
-import sqlite3, os
-from datetime import datetime, timedelta, timezone
-import numpy as np
-import plotly.graph_objects as go
-import plotly.express as px
-from api_client import authenticate_strava,fetch_openweathermap_data, stream_activities
-from database import activity_exists, insert_strava_data
-import google.generativeai as genai
-
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel('gemini-pro')
-
-# --- Database Connection and Data Fetching ---
-def fetch_data_from_db(query):
-    """Fetches data from the database using the provided query."""
-    conn = sqlite3.connect("ai_running_coach.db")
-    cursor = conn.cursor()
-    cursor.execute(query)
-    data = cursor.fetchall()
-    columns = [description[0] for description in cursor.description]
-    conn.close()
-    return pd.DataFrame(data, columns=columns)
-
-# --- Data Preparation ---
-def prepare_data():
-    """Fetches data from the database and prepares it for analysis."""
-    
-    strava_query = "SELECT id, start_date_ist, distance, elapsed_time, moving_time, average_speed, max_speed, average_heartrate, max_heartrate, suffer_score, calories, total_elevation_gain, average_cadence, temperature, feels_like, humidity, weather_conditions, pollution_aqi, pollution_pm25, city_name FROM strava_activities_weather"
-    splits_query = "SELECT activity_id, split, distance, elapsed_time, average_speed, elevation_difference, moving_time, average_heartrate, average_grade_adjusted_speed FROM splits_data"
-    best_efforts_query = "SELECT activity_id, name, distance, elapsed_time, start_date FROM best_efforts_data"
-
-    strava_df = fetch_data_from_db(strava_query)
-    splits_df = fetch_data_from_db(splits_query)
-    best_efforts_df = fetch_data_from_db(best_efforts_query)
-
-    # Convert start_date_ist to numeric, coercing errors to NaN
-    strava_df['start_date_ist'] = pd.to_numeric(strava_df['start_date_ist'], errors='coerce')
-    
-    # Drop rows where start_date_ist is NaN
-    strava_df.dropna(subset=['start_date_ist'], inplace=True)
-
-    # Convert start_date_ist to datetime
-    strava_df['start_date_ist'] = pd.to_datetime(strava_df['start_date_ist'], unit='s')
-    
-    # Convert other columns to numeric where applicable
-    numeric_cols = ['distance', 'elapsed_time', 'moving_time', 'average_speed', 'max_speed', 'average_heartrate', 'max_heartrate', 'suffer_score', 'calories', 'total_elevation_gain', 'average_cadence', 'temperature', 'feels_like', 'humidity', 'pollution_aqi', 'pollution_pm25']
-    for col in numeric_cols:
-        if col in strava_df.columns:
-            strava_df[col] = pd.to_numeric(strava_df[col], errors='coerce')
-    
-    numeric_cols_splits = ['distance', 'elapsed_time', 'average_speed', 'elevation_difference', 'moving_time', 'average_heartrate', 'average_grade_adjusted_speed']
-    for col in numeric_cols_splits:
-        if col in splits_df.columns:
-            splits_df[col] = pd.to_numeric(splits_df[col], errors='coerce')
-    
-    numeric_cols_best_efforts = ['distance', 'elapsed_time']
-    for col in numeric_cols_best_efforts:
-        if col in best_efforts_df.columns:
-            best_efforts_df[col] = pd.to_numeric(best_efforts_df[col], errors='coerce')
-    
-    best_efforts_df['start_date'] = pd.to_datetime(best_efforts_df['start_date'], errors='coerce')
-
-    return strava_df, splits_df, best_efforts_df
-# --- Metric Calculation Functions ---
-# def calculate_metric(df, metric, period):
-#     """Calculates a metric for a given period."""
-#     now = datetime.now()
-#     if period == "Last 7 Days":
-#         cutoff = now - timedelta(days=7)
-#     elif period == "Last 30 Days":
-#         cutoff = now - timedelta(days=30)
-#     elif period == "Last 90 Days":
-#         cutoff = now - timedelta(days=90)
-#     elif period == "Year-to-Date":
-#         cutoff = datetime(now.year, 1, 1)
-#     # elif period == "Last Year":
-#     #     cutoff = datetime(now.year - 1, 1, 1)
-#     else: # Overall
-#         cutoff = datetime.min
-
-#     filtered_df = df[
-#         df['start_date_ist'] >= cutoff] if 'start_date_ist' in df.columns else df[df['start_date'] >= cutoff] if 'start_date' in df.columns else df
-
-def calculate_metric(df, metric, period):
-    """Calculates a metric for a given period."""
-    now = datetime.now()
-    
-    if period == "Last 7 Days":
-        start = now - timedelta(days=7)
-        end = now
-    elif period == "Last 30 Days":
-        start = now - timedelta(days=30)
-        end = now
-    elif period == "Last 90 Days":
-        start = now - timedelta(days=90)
-        end = now
-    elif period == "Year-to-Date":
-        start = datetime(now.year, 1, 1)
-        end = now
-    elif period == "Last Year":
-        # Start from January 1st of previous year
-        start = datetime(now.year - 1, 1, 1)
-        # End on December 31st of previous year
-        end = datetime(now.year - 1, 12, 31, 23, 59, 59)
-    elif period == "Overall":
-        start = datetime.min
-        end = now
-    else:
-        return None, None, None, None, None
-
-    filtered_df = df[
-        (df['start_date_ist'] >= start) & 
-        (df['start_date_ist'] <= end)
-    ] if 'start_date_ist' in df.columns else df[
-        (df['start_date'] >= start) & 
-        (df['start_date'] <= end)
-    ] if 'start_date' in df.columns else df
-
-    if filtered_df.empty:
-        return None, None, None, None, None
-    
-    if 'start_date_ist' in filtered_df.columns:
-        daily_data = filtered_df.groupby(filtered_df['start_date_ist'].dt.date)
-    elif 'start_date' in filtered_df.columns:
-        daily_data = filtered_df.groupby(filtered_df['start_date'].dt.date)
-    else:
-        return None, None, None, None, None
-    
-    if metric == "Average Pace":
-        def avg_pace(x):
-            total_distance = x['distance'].sum()
-            total_time = x['elapsed_time'].sum()
-            if total_distance > 0 and total_time > 0:
-                avg_pace_seconds_per_km = (total_time / total_distance)
-                avg_pace_minutes_per_km = avg_pace_seconds_per_km / 60
-                return avg_pace_minutes_per_km
-            else:
-                return None
-        daily_avg_paces = daily_data.apply(avg_pace).dropna()
-        if not daily_avg_paces.empty:
-            avg_pace_minutes_per_km = daily_avg_paces.mean()
-            median_pace_minutes_per_km = daily_avg_paces.median()
-            return round(avg_pace_minutes_per_km, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_pace_minutes_per_km, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
-        else:
-            return None, None, None, None, None
-    elif metric == "Average Heart Rate":
-        daily_avg_heartrates = daily_data['average_heartrate'].mean().dropna()
-        if not daily_avg_heartrates.empty:
-            avg_heartrate = daily_avg_heartrates.mean()
-            median_heartrate = daily_avg_heartrates.median()
-            return round(avg_heartrate, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_heartrate, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
-        else:
-            return None, None, None, None, None
-    elif metric == "Distance":
-        daily_distances = daily_data['distance'].sum().dropna()
-        if not daily_distances.empty:
-            avg_distance = daily_distances.mean()
-            median_distance = daily_distances.median()
-            return round(avg_distance, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_distance, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
-        else:
-            return None, None, None, None, None
-    elif metric == "Max Speed":
-        def max_speed_km_hr(x):
-            max_speed = x['max_speed'].max()
-            return max_speed if max_speed is not None else None
-        daily_max_speeds = daily_data.apply(max_speed_km_hr).dropna()
-        if not daily_max_speeds.empty:
-            avg_max_speed = daily_max_speeds.mean()
-            median_max_speed = daily_max_speeds.median()
-            return round(avg_max_speed, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_max_speed, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
-        else:
-            return None, None, None, None, None
-    elif metric == "Total Elevation Gain":
-        daily_elevation_gains = daily_data['total_elevation_gain'].mean().dropna()
-        if not daily_elevation_gains.empty:
-            avg_elevation_gain = daily_elevation_gains.mean()
-            median_elevation_gain = daily_elevation_gains.median()
-            return round(avg_elevation_gain, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_elevation_gain, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
-        else:
-            return None, None, None, None, None
-    elif metric == "Average Cadence":
-        daily_avg_cadences = daily_data['average_cadence'].mean().dropna()
-        if not daily_avg_cadences.empty:
-            avg_cadence = daily_avg_cadences.mean()
-            median_cadence = daily_avg_cadences.median()
-            return round(avg_cadence, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_cadence, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
-        else:
-            return None, None, None, None, None
-    elif metric == "Calories Burned":
-        daily_calories = daily_data['calories'].mean().dropna()
-        if not daily_calories.empty:
-            avg_calories = daily_calories.mean()
-            median_calories = daily_calories.median()
-            return round(avg_calories, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_calories, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
-        else:
-            return None, None, None, None, None
-    elif metric == "Suffer Score":
-        daily_suffer_scores = daily_data['suffer_score'].mean().dropna()
-        if not daily_suffer_scores.empty:
-            avg_suffer_score = daily_suffer_scores.mean()
-            median_suffer_score = daily_suffer_scores.median()
-            return round(avg_suffer_score, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_suffer_score, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
-        else:
-            return None, None, None, None, None
-    elif metric == "Temperature":
-        daily_temperatures = daily_data['temperature'].mean().dropna()
-        if not daily_temperatures.empty:
-            avg_temperature = daily_temperatures.mean()
-            median_temperature = daily_temperatures.median()
-            return round(avg_temperature, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_temperature, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
-        else:
-            return None, None, None, None, None
-    elif metric == "Feels Like Temperature":
-        daily_feels_like_temperatures = daily_data['feels_like'].mean().dropna()
-        if not daily_feels_like_temperatures.empty:
-            avg_feels_like_temperature = daily_feels_like_temperatures.mean()
-            median_feels_like_temperature = daily_feels_like_temperatures.median()
-            return round(avg_feels_like_temperature, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_feels_like_temperature, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
-        else:
-            return None, None, None, None, None
-    elif metric == "Humidity":
-        daily_humidities = daily_data['humidity'].mean().dropna()
-        if not daily_humidities.empty:
-            avg_humidity = daily_humidities.mean()
-            median_humidity = daily_humidities.median()
-            return round(avg_humidity, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_humidity, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
-        else:
-            return None, None, None, None, None
-    elif metric == "Pollution PM2.5":
-        daily_pm25 = daily_data['pollution_pm25'].mean().dropna()
-        if not daily_pm25.empty:
-            avg_pm25 = daily_pm25.mean()
-            median_pm25 = daily_pm25.median()
-            return round(avg_pm25, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_pm25, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
-        else:
-            return None, None, None, None, None
-    elif metric == "Pollution AQI":
-        daily_aqi = daily_data['pollution_aqi'].mean().dropna()
-        if not daily_aqi.empty:
-            avg_aqi = daily_aqi.mean()
-            median_aqi = daily_aqi.median()
-            return round(avg_aqi, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_aqi, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
-        else:
-            return None, None, None, None, None
-    else:
-        return None, None, None, None, None
-
-def calculate_percentage_change(current, previous):
-    """Calculates the percentage change between two values."""
-    if previous is None or previous == 0:
-        return None
-    if current is None:
-        return None
-    return ((current - previous) / previous) * 100
-
-def get_previous_period(period):
-    """Gets the previous period for comparison."""
-    if period == "Last 7 Days":
-        return "Last 14 Days"
-    elif period == "Last 30 Days":
-        return "Last 60 Days"
-    elif period == "Last 90 Days":
-        return "Last 180 Days"
-    elif period == "Year-to-Date":
-        return "Last Year"
-    elif period == "Last Year":
-        return "Previous Year"
-    else:
-        return None
-
-# def get_trend_data(df, metric, period):
-#     """Gets the trend data for a metric over a period."""
-#     now = datetime.now()
-#     if period == "Last 7 Days":
-#         cutoff = now - timedelta(days=7)
-#     elif period == "Last 30 Days":
-#         cutoff = now - timedelta(days=30)
-#     elif period == "Last 90 Days":
-#         cutoff = now - timedelta(days=90)
-#     elif period == "Year-to-Date":
-#         cutoff = datetime(now.year, 1, 1)
-#     elif period == "Last Year":
-#         cutoff = datetime(now.year - 1, 1, 1)
-#     else:  # Overall
-#         cutoff = datetime.min
-    
-#     filtered_df = df[
-#         df['start_date_ist'] >= cutoff] if 'start_date_ist' in df.columns else df[df['start_date'] >= cutoff] if 'start_date' in df.columns else df
-
-def get_trend_data(df, metric, period, outlier_settings=None):
-    """Gets the trend data for a metric over a period."""
-    now = datetime.now()
-    
-    if period == "Last 7 Days":
-        start = now - timedelta(days=7)
-        end = now
-    elif period == "Last 30 Days":
-        start = now - timedelta(days=30)
-        end = now
-    elif period == "Last 90 Days":
-        start = now - timedelta(days=90)
-        end = now
-    elif period == "Year-to-Date":
-        start = datetime(now.year, 1, 1)
-        end = now
-    elif period == "Last Year":
-        start = datetime(now.year - 1, 1, 1)
-        end = datetime(now.year - 1, 12, 31, 23, 59, 59)
-    elif period == "Overall":
-        start = datetime.min
-        end = now
-    else:
-        return pd.DataFrame()
-    
-    filtered_df = df[
-        (df['start_date_ist'] >= start) & 
-        (df['start_date_ist'] <= end)
-    ] if 'start_date_ist' in df.columns else df[
-        (df['start_date'] >= start) & 
-        (df['start_date'] <= end)
-    ] if 'start_date' in df.columns else df
-
-    if outlier_settings and outlier_settings['enable_filtering']:
-        filtered_df = filter_outliers(filtered_df, outlier_settings)
-
-    if filtered_df.empty:
-        return pd.DataFrame()
-    
-    if 'start_date_ist' in filtered_df.columns:
-        date_column = 'start_date_ist'
-    elif 'start_date' in filtered_df.columns:
-        date_column = 'start_date'
-    else:
-        return pd.DataFrame()
-    
-    filtered_df = filtered_df.sort_values(by=date_column)
-    
-    
-
-    # Group by date and calculate the appropriate metric
-    if metric == "Average Pace":
-        # filtered_df['pace'] = filtered_df['elapsed_time'] / filtered_df['distance']
-        # daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['pace'].mean()
-        filtered_df['pace_kmh'] = filtered_df['average_speed'] * 3.6  # Convert m/s to km/h
-        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['pace_kmh'].mean()
-
-    elif metric == "Average Heart Rate":
-        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['average_heartrate'].mean()
-    elif metric == "Distance":
-        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['distance'].sum()
-    elif metric == "Max Speed":
-        filtered_df['max_speed_km_hr'] = filtered_df['max_speed']
-        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['max_speed_km_hr'].max()
-    elif metric == "Total Elevation Gain":
-        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['total_elevation_gain'].mean()
-    elif metric == "Average Cadence":
-        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['average_cadence'].mean()
-    elif metric == "Calories Burned":
-        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['calories'].mean()
-    elif metric == "Suffer Score":
-        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['suffer_score'].mean()
-    elif metric == "Temperature":
-        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['temperature'].mean()
-    elif metric == "Feels Like Temperature":
-        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['feels_like'].mean()
-    elif metric == "Humidity":
-        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['humidity'].mean()
-    elif metric == "Pollution PM2.5":
-        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['pollution_pm25'].mean()
-    elif metric == "Pollution AQI":
-        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['pollution_aqi'].mean()
-    else:
-        return pd.DataFrame()
-    
-    # Convert the daily_data Series to a DataFrame with datetime index
-    daily_df = daily_data.to_frame()
-    daily_df.index = pd.to_datetime(daily_df.index)
-    
-    # Remove zeros
-    daily_df = daily_df[daily_df.iloc[:, 0] != 0]
-    
-    return daily_df
-
-# Calculate pace variation for a single activity
-
-def calculate_pace_variation(splits_df, activity_id):
-    """Calculate pace variation for a single activity using splits data."""
-    activity_splits = splits_df[splits_df['activity_id'] == activity_id]
-    if activity_splits.empty:
-        return None
-    
-    # Calculate pace for each split (seconds per kilometer)
-    activity_splits['pace'] = activity_splits['elapsed_time'] / activity_splits['distance']
-    return activity_splits['pace'].std()
-
-# Calculate heart rate zones for a single activity
-
-def calculate_heart_rate_zones(strava_df, row):
-    """Calculate time spent in different heart rate zones for an activity."""
-    if pd.isna(row['average_heartrate']) or pd.isna(row['max_heartrate']):
-        return None
-    
-    # Define heart rate zones based on max heart rate
-    max_hr = row['max_heartrate']
-    zones = {
-        'Easy': (0.6 * max_hr, 0.7 * max_hr),
-        'Moderate': (0.7 * max_hr, 0.8 * max_hr),
-        'Hard': (0.8 * max_hr, 0.9 * max_hr),
-        'Very Hard': (0.9 * max_hr, float('inf'))
-    }
-    
-    # Categorize average heart rate into a zone
-    avg_hr = row['average_heartrate']
-    for zone_name, (min_hr, max_hr) in zones.items():
-        if min_hr <= avg_hr < max_hr:
-            return zone_name
-    return None
-
-# Calculate running consistency over a period
-
-def calculate_running_consistency(strava_df, period):
-    """Calculate number of runs per week over the specified period."""
-    now = datetime.now()
-    if period == "Last 7 Days":
-        cutoff = now - timedelta(days=7)
-    elif period == "Last 30 Days":
-        cutoff = now - timedelta(days=30)
-    elif period == "Last 90 Days":
-        cutoff = now - timedelta(days=90)
-    else:
-        cutoff = datetime(now.year, 1, 1)
-    
-    filtered_df = strava_df[strava_df['start_date_ist'] >= cutoff].copy()
-    filtered_df['week'] = filtered_df['start_date_ist'].dt.isocalendar().week
-    weekly_runs = filtered_df.groupby('week').size()
-    return weekly_runs.mean(), weekly_runs.std()
-
-# Calculate grade adjusted pace metrics
-
-def calculate_grade_adjusted_metrics(splits_df, strava_df):
-    """Calculate grade adjusted pace metrics."""
-    if splits_df.empty or 'average_grade_adjusted_speed' not in splits_df.columns:
-        return {
-            'mean_gap': None,
-            'median_gap': None,
-            'std_gap': None
-        }
-        
-    # Filter out zero or NaN values in average_grade_adjusted_speed
-    valid_splits = splits_df[
-        (splits_df['average_grade_adjusted_speed'] > 0) & 
-        (splits_df['average_grade_adjusted_speed'].notna())
-    ]
-    
-    if valid_splits.empty:
-        return {
-            'mean_gap': None,
-            'median_gap': None,
-            'std_gap': None
-        }
-    
-    valid_splits['grade_adjusted_pace'] = 1000 / valid_splits['average_grade_adjusted_speed']
-    
-    metrics = {
-        'mean_gap': valid_splits['grade_adjusted_pace'].mean(),
-        'median_gap': valid_splits['grade_adjusted_pace'].median(),
-        'std_gap': valid_splits['grade_adjusted_pace'].std()
-    }
-    return metrics
+import time, json
+from datetime import date, datetime, timedelta, timezone
+from api_client import load_env
+from database import (connect, create_database_and_tables, current_athlete, get_data_version, pending_rebuilds,
+                      set_current_athlete, use_athlete)
+from env_stats import get_env_correlations, get_optimal_conditions
+from location_clusters import location_metrics_query
+from personal_records import PERSONAL_RECORDS_QUERY, PR_TOP_N
+from route_similarity import MIN_ROUTE_RUNS, route_comparison_query
+from routes import routes_in_bbox
+from heatmap import MAX_ZOOM, MIN_ZOOM, TILE_SIZE, tile_bounds, tile_png
+from time_of_day import TIME_SLOT_ORDER, time_of_day_metrics_query
+from instrumentation import collect, prometheus_text, timed
+from outliers import DEFAULT_SENSITIVITY, OUTLIER_MODES, compute_outlier_mask, outlier_thresholds, settings_key
+from sync import last_sync_run, sync_activities
+from athletes import list_athletes
+from llm_cache import CachedModel
+from llm_backend import get_backend
+from ai_sections import SECTION_KEYS, generate_section_analyses
+from ai_insights import AI_CALL_TIMEOUT_SECONDS, enqueue_insight_job, generate_all, load_insights, store_insights
+
+# Credentials and LLM settings come from .env; heavy libraries (pandas, plotly, stravalib, the LLM SDK) and the
+# modules built on pandas (metrics, chart_data, year_review) are imported on first use inside the pages
+load_env()
+
+@st.cache_resource(show_spinner=False)
+def load_model(athlete_id):
+    """Backend and model come from LLM_BACKEND / LLM_MODEL; identical prompts are answered from the SQLite cache."""
+    with use_athlete(athlete_id):
+        return CachedModel(get_backend())
+
+@st.cache_resource(show_spinner=False)
+def ensure_schema(athlete_id):
+    """Creates missing tables and backfills rollups once per athlete and process; page renders only read."""
+    with use_athlete(athlete_id):
+        create_database_and_tables()
 
-# Calculate weekly metrics
+def get_model():
+    """The model whose cache and call log live in the current athlete's database."""
+    return load_model(current_athlete.get())
 
-def calculate_weekly_metrics(strava_df, splits_df):
-    """Calculate metrics aggregated by week."""
-    # Ensure we have datetime index
-    strava_df = strava_df.copy()
-    strava_df['week'] = strava_df['start_date_ist'].dt.strftime('%Y-%W')
-    splits_df = splits_df.copy()
-    
-    # 1. Pace Variation by Week
-    pace_variations = []
-    for activity_id in strava_df['id'].unique():
-        activity_splits = splits_df[splits_df['activity_id'] == activity_id]
-        if not activity_splits.empty:
-            activity_splits['pace'] = activity_splits['elapsed_time'] / activity_splits['distance']
-            variation = activity_splits['pace'].std()
-            if variation is not None and not pd.isna(variation):
-                activity_date = strava_df[strava_df['id'] == activity_id]['start_date_ist'].iloc[0]
-                pace_variations.append({
-                    'week': activity_date.strftime('%Y-%W'),
-                    'variation': variation
-                })
-    
-    weekly_pace_variation = pd.DataFrame(pace_variations)
-    if not weekly_pace_variation.empty:
-        weekly_pace_variation = weekly_pace_variation.groupby('week')['variation'].mean().reset_index()
-        weekly_pace_variation['week'] = pd.to_datetime(weekly_pace_variation['week'].apply(
-            lambda x: f"{x}-1"), format='%Y-%W-%w')
-    
-    # 2. Heart Rate Zones by Week
-    weekly_hr_zones = []
-    for _, row in strava_df.iterrows():
-        zone = calculate_heart_rate_zones(strava_df, row)
-        if zone:
-            weekly_hr_zones.append({
-                'week': row['start_date_ist'].strftime('%Y-%W'),
-                'zone': zone
-            })
-    
-    hr_zones_df = pd.DataFrame(weekly_hr_zones)
-    if not hr_zones_df.empty:
-        hr_zones_pivot = pd.crosstab(hr_zones_df['week'], hr_zones_df['zone'], normalize='index') * 100
-        hr_zones_pivot.index = pd.to_datetime(hr_zones_pivot.index.map(lambda x: f"{x}-1"), format='%Y-%W-%w')
-    else:
-        hr_zones_pivot = pd.DataFrame()
-    
-    # 3. Running Consistency (runs per week)
-    weekly_runs = strava_df.groupby('week').size().reset_index()
-    weekly_runs.columns = ['week', 'num_runs']
-    weekly_runs['week'] = pd.to_datetime(weekly_runs['week'].apply(lambda x: f"{x}-1"), format='%Y-%W-%w')
-    
-    # 4. Grade Adjusted Pace by Week
-    splits_df['week'] = pd.to_datetime(splits_df['activity_id'].map(
-        strava_df.set_index('id')['start_date_ist'])).dt.strftime('%Y-%W')
-    
-    weekly_gap = splits_df[splits_df['average_grade_adjusted_speed'] > 0].groupby('week').agg({
-        'average_grade_adjusted_speed': lambda x: 1000 / x.mean()  # Convert to pace
-    }).reset_index()
-    
-    weekly_gap['week'] = pd.to_datetime(weekly_gap['week'].apply(lambda x: f"{x}-1"), format='%Y-%W-%w')
-    
-    return weekly_pace_variation, hr_zones_pivot, weekly_runs, weekly_gap
-
-def calculate_location_metrics(strava_df):
-    """Calculate performance metrics grouped by city."""
-    # print("Input DataFrame (strava_df):")
-    # print(strava_df.head())  # Debug log to check the input DataFrame
-
-    location_metrics = strava_df.groupby('city_name').agg({
-        'distance': 'mean',
-        'average_heartrate': 'mean',
-        'temperature': 'mean',
-        'pollution_aqi': 'mean',
-        'pollution_pm25': 'mean',
-        'total_elevation_gain': 'mean',
-        'average_speed': 'mean',
-        'id': 'count',  # Number of runs in each city
-        'start_date_ist': 'first' #Include Start Date for each run
-    }).reset_index()
-    
+def normalize_location_metrics(location_metrics):
+    """Adds 0-1 normalized columns used by the radar charts."""
     # Calculate average pace (min/km)
     location_metrics['average_pace'] = 1000 / (location_metrics['average_speed'] * 60)
     
@@ -564,45 +56,38 @@ def calculate_location_metrics(strava_df):
             location_metrics[f'{metric}_normalized'] = (location_metrics[metric] - min_val) / (max_val - min_val)
         else:
             location_metrics[f'{metric}_normalized'] = 1
-    # print("Normalized Location Metrics:")
-    # print(location_metrics[[f'{metric}_normalized' for metric in metrics_to_normalize]])
-    # print(location_metrics)# Debug log to check output DataFrame
     return location_metrics
 
-def calculate_environmental_impact(strava_df):
-    """Calculate environmental impact on running performance."""
-    df = strava_df.copy()
-    
-    # Filter out any rows with missing values in key columns
-    required_columns = ['temperature', 'humidity', 'pollution_aqi', 'pollution_pm25', 
-                       'distance', 'elapsed_time', 'average_speed']
-    df = df.dropna(subset=required_columns)
-    
-    # Basic performance calculations
-    df['pace_min_km'] = 1000 / (df['average_speed'] * 60)
-    
-    # Normalize environmental factors (0-1 scale)
-    env_factors = ['temperature', 'humidity', 'pollution_aqi', 'pollution_pm25']
-    for factor in env_factors:
-        max_val = df[factor].max()
-        min_val = df[factor].min()
-        if max_val != min_val:
-            df[f'{factor}_normalized'] = (df[factor] - min_val) / (max_val - min_val)
-        else:
-            df[f'{factor}_normalized'] = 1
-    
-    # Calculate performance score (inverse of pace - faster is better)
-    df['performance_score'] = 1 / (df['elapsed_time'] / df['distance'])
-    if df['performance_score'].max() != df['performance_score'].min():
-        df['performance_score_normalized'] = (df['performance_score'] - df['performance_score'].min()) / \
-                                           (df['performance_score'].max() - df['performance_score'].min())
-    else:
-        df['performance_score_normalized'] = 1
-    
-    return df
-
+@timed()
+def calculate_location_metrics():
+    """Read performance metrics per location cluster from the precomputed cluster aggregates."""
+    from metrics import fetch_data_from_db
+
+    location_metrics = fetch_data_from_db(location_metrics_query())
+    if location_metrics.empty:
+        return location_metrics
+    
+    # Several clusters can share a reverse-geocoded name; tell them apart by centroid
+    duplicated = location_metrics['city_name'].duplicated(keep=False)
+    location_metrics.loc[duplicated, 'city_name'] = location_metrics.loc[duplicated].apply(
+        lambda row: f"{row['city_name']} ({row['centroid_lat']:.3f}, {row['centroid_lon']:.3f})", axis=1)
+    return normalize_location_metrics(location_metrics)
+
+@timed()
+def calculate_location_metrics_by_year():
+    """Read performance metrics per location cluster and year from the precomputed cluster aggregates."""
+    from metrics import fetch_data_from_db
+
+    yearly_metrics = fetch_data_from_db(location_metrics_query(by_year=True))
+    yearly_metrics = yearly_metrics.dropna(subset=['year'])
+    if yearly_metrics.empty:
+        return yearly_metrics
+    return normalize_location_metrics(yearly_metrics)
+
+@timed()
 def create_environmental_performance_chart(env_impact):
     """Create an intuitive environmental performance visualization."""
+    import plotly.express as px
     
     # Format the pace for hover display
     env_impact['pace_display'] = env_impact['pace_min_km'].apply(
@@ -682,22 +167,16 @@ def add_environmental_insights(env_impact):
     """Add clear insights about environmental patterns."""
     st.markdown("#### 🎯 Optimal Running Conditions")
     
-    # Find best performing runs (top 10%)
-    best_runs = env_impact.nsmallest(int(len(env_impact) * 0.1), 'pace_min_km')
+    # Optimal ranges over the best performing runs (top 10%) and correlations are
+    # read from the running statistics store
+    conn = connect()
+    optimal_conditions = get_optimal_conditions(conn)
+    correlations = get_env_correlations(conn)
+    conn.close()
     
-    # Calculate optimal ranges
-    optimal_conditions = {
-        'temperature': {
-            'min': best_runs['temperature'].min(),
-            'max': best_runs['temperature'].max(),
-            'mean': best_runs['temperature'].mean()
-        },
-        'humidity': {
-            'min': best_runs['humidity'].min(),
-            'max': best_runs['humidity'].max(),
-            'mean': best_runs['humidity'].mean()
-        }
-    }
+    if not optimal_conditions:
+        st.info("Not enough runs with environmental data to determine optimal conditions.")
+        return
     
     cols = st.columns(2)
     with cols[0]:
@@ -717,9 +196,8 @@ def add_environmental_insights(env_impact):
     # Add performance insights
     st.markdown("#### 💡 Key Insights")
     
-    # Calculate correlations
-    temp_corr = env_impact['temperature'].corr(env_impact['pace_min_km'])
-    humid_corr = env_impact['humidity'].corr(env_impact['pace_min_km'])
+    temp_corr = correlations['temperature'] or 0
+    humid_corr = correlations['humidity'] or 0
     
     insights = [
         f"- Your fastest runs occur in temperatures between {optimal_conditions['temperature']['min']:.1f}°C and {optimal_conditions['temperature']['max']:.1f}°C",
@@ -730,53 +208,23 @@ def add_environmental_insights(env_impact):
     
     st.markdown('\n'.join(insights))
 
-def calculate_time_of_day_metrics(strava_df):
-    """Calculate performance metrics by time of day."""
-    df = strava_df.copy()
-    
-    # Convert Unix timestamp to datetime
-    df['datetime'] = pd.to_datetime(df['start_date_ist'], unit='s')
-    df['hour'] = df['datetime'].dt.hour
-    
-    # Define time slots
-    def get_time_slot(hour):
-        if 5 <= hour < 8:
-            return 'Early Morning (5-8 AM)'
-        elif 8 <= hour < 11:
-            return 'Morning (8-11 AM)'
-        elif 11 <= hour < 16:
-            return 'Afternoon (11 AM-4 PM)'
-        elif 16 <= hour < 19:
-            return 'Evening (4-7 PM)'
-        else:
-            return 'Night (7 PM-5 AM)'
-    
-    df['time_slot'] = df['hour'].apply(get_time_slot)
-    
-    # Calculate metrics by time slot
-    time_metrics = df.groupby('time_slot').agg({
-        'average_speed': 'mean',
-        'average_heartrate': 'mean',
-        'temperature': 'mean',
-        'pollution_aqi': 'mean',
-        'distance': 'mean',
-        'id': 'count'  # Number of runs in each slot
-    }).reset_index()
+@timed()
+def calculate_time_of_day_metrics():
+    """Read performance metrics by time of day from the precomputed time slot x month aggregates."""
+    import pandas as pd
+    from metrics import fetch_data_from_db
+
+    time_metrics = fetch_data_from_db(time_of_day_metrics_query())
+    if time_metrics.empty:
+        return time_metrics
     
     # Calculate average pace (minutes per km)
     time_metrics['average_pace'] = 1000 / (time_metrics['average_speed'] * 60)
     
     # Sort time slots in chronological order
-    time_slot_order = [
-        'Early Morning (5-8 AM)',
-        'Morning (8-11 AM)',
-        'Afternoon (11 AM-4 PM)',
-        'Evening (4-7 PM)',
-        'Night (7 PM-5 AM)'
-    ]
     time_metrics['time_slot'] = pd.Categorical(
         time_metrics['time_slot'], 
-        categories=time_slot_order, 
+        categories=TIME_SLOT_ORDER, 
         ordered=True
     )
     time_metrics = time_metrics.sort_values('time_slot')
@@ -784,10 +232,14 @@ def calculate_time_of_day_metrics(strava_df):
     # Add summary statistics
     time_metrics['runs_percentage'] = (time_metrics['id'] / time_metrics['id'].sum() * 100).round(1)
     
-    return time_metrics, df
+    return time_metrics
 
+@timed()
 def create_location_radar_chart(location_metrics):
     """Create a single radar chart with all cities overlaid."""
+    import plotly.express as px
+    import plotly.graph_objects as go
+
     fig = go.Figure()
     
     metrics = [
@@ -806,18 +258,17 @@ def create_location_radar_chart(location_metrics):
         'Pace'
     ]
 
-    colors = px.colors.qualitative.Set3[:len(location_metrics['city_name'].unique())]
+    colors = px.colors.qualitative.Set3
+    labels_plot = labels + [labels[0]]
 
-    for idx, city in enumerate(location_metrics['city_name'].unique()):
-        city_data = location_metrics[location_metrics['city_name'] == city]
-        values = [city_data[metric].iloc[0] for metric in metrics]
+    for idx, location in enumerate(location_metrics.itertuples(index=False)):
+        values = [getattr(location, metric) for metric in metrics]
         values.append(values[0])  # Close the radar chart
-        labels_plot = labels + [labels[0]]
         
         fig.add_trace(go.Scatterpolar(
             r=values,
             theta=labels_plot,
-            name=city,
+            name=location.city_name,
             fill='none',
             fillcolor=colors[idx % len(colors)],
             line=dict(color=colors[idx % len(colors)])
@@ -851,16 +302,12 @@ def create_location_radar_chart(location_metrics):
     
     return fig
 
-def create_yoy_comparison_chart(location_metrics):
+@timed()
+def create_yoy_comparison_chart(yearly_location_metrics):
     """Create year-over-year comparison radar charts."""
-    # Add year column based on start_date_ist
-    location_metrics['year'] = pd.to_datetime(location_metrics['start_date_ist'], unit='s').dt.year
-    
-    # Get available years
-    years_available = sorted(location_metrics['year'].unique())
-    print(f"Available years: {years_available}")  # Debug print
-    
-    if len(years_available) < 2:
+    import plotly.graph_objects as go
+
+    if yearly_location_metrics.empty:
         return None
     
     # Define metrics and labels
@@ -880,44 +327,30 @@ def create_yoy_comparison_chart(location_metrics):
         'Temperature'
     ]
 
-    fig = go.Figure()
+    # Average the normalized location profiles of each year
+    yearly_profiles = yearly_location_metrics.groupby('year')[metrics].mean() * 100
+    years_available = sorted(yearly_profiles.index)
     
-    # Print available columns for debugging
-    print(f"Available columns: {location_metrics.columns}")
+    if len(years_available) < 2:
+        return None
+
+    fig = go.Figure()
+    labels_plot = labels + [labels[0]]
     
-    # Calculate yearly averages differently
     for year in years_available:
-        year_data = location_metrics[location_metrics['year'] == year]
+        values = yearly_profiles.loc[year].tolist()
+        values.append(values[0])  # Close the polygon
         
-        # Print metrics for debugging
-        print(f"\nMetrics for {year}:")
-        for metric in metrics:
-            if metric in year_data.columns:
-                print(f"{metric}: {year_data[metric].mean()}")
+        color = '#FF9999' if year == years_available[0] else '#66B2FF'
         
-        values = []
-        for metric in metrics:
-            if metric in year_data.columns:
-                avg_value = year_data[metric].mean()
-                values.append(avg_value)
-            else:
-                print(f"Missing metric: {metric}")
-        
-        if values:  # Only add trace if we have values
-            values = [year_data[metric].mean() * 100 for metric in metrics]
-            values.append(values[0])  # Close the polygon
-            labels_plot = labels + [labels[0]]
-            
-            color = '#FF9999' if year == years_available[0] else '#66B2FF'
-            
-            fig.add_trace(go.Scatterpolar(
-                r=values,
-                theta=labels_plot,
-                name=str(int(year)),
-                fill='none',
-                fillcolor=color,
-                line=dict(color=color)
-            ))
+        fig.add_trace(go.Scatterpolar(
+            r=values,
+            theta=labels_plot,
+            name=str(int(year)),
+            fill='none',
+            fillcolor=color,
+            line=dict(color=color)
+        ))
 
     fig.update_layout(
         polar=dict(
@@ -949,42 +382,53 @@ def create_yoy_comparison_chart(location_metrics):
 
 def add_combined_metrics_tab(tab, strava_df):
     """Add combined metrics visualizations with improved UI."""
+    import plotly.express as px
+    from metrics import calculate_environmental_impact
+
     with tab:
         st.header("Environmental Impact on Running Performance")
         # Create three main sections using tabs for better organization
         section_tabs = st.tabs(["Environmental Impact", "Location Analysis", "Time of Day Patterns"])
         
+        # Shared by the environmental section and the location section's environmental column
+        env_impact = calculate_environmental_impact(strava_df)
+
         with section_tabs[0]:
             st.header("🌡️ Environmental Impact")
             
-            env_impact = calculate_environmental_impact(strava_df)
+            # Optimal conditions (best performing runs - top 10%) and correlations come
+            # from the running statistics store
+            conn = connect()
+            optimal_conditions = get_optimal_conditions(conn)
+            env_correlations = get_env_correlations(conn)
+            conn.close()
             
-            if not env_impact.empty:
+            if not env_impact.empty and optimal_conditions:
                 # Optimal conditions summary
                 st.subheader("Optimal Running Conditions")
                 metrics_cols = st.columns(4)
                 
-                # Get optimal conditions (from best performing runs - top 10%)
-                best_runs = env_impact.nsmallest(int(len(env_impact) * 0.1), 'pace_min_km')
+                def condition_range(factor):
+                    return (optimal_conditions[factor]['max'] - optimal_conditions[factor]['min']) / 2
                 
                 with metrics_cols[0]:
-                    optimal_temp = best_runs['temperature'].mean()
-                    temp_range = f"±{(best_runs['temperature'].max() - best_runs['temperature'].min())/2:.1f}°C"
+                    optimal_temp = optimal_conditions['temperature']['mean']
+                    temp_range = f"±{condition_range('temperature'):.1f}°C"
                     st.metric("Best Temperature", f"{optimal_temp:.1f}°C", temp_range)
                 
                 with metrics_cols[1]:
-                    optimal_humidity = best_runs['humidity'].mean()
-                    humidity_range = f"±{(best_runs['humidity'].max() - best_runs['humidity'].min())/2:.1f}%"
+                    optimal_humidity = optimal_conditions['humidity']['mean']
+                    humidity_range = f"±{condition_range('humidity'):.1f}%"
                     st.metric("Best Humidity", f"{optimal_humidity:.1f}%", humidity_range)
                 
                 with metrics_cols[2]:
-                    optimal_aqi = best_runs['pollution_aqi'].mean()
-                    aqi_range = f"±{(best_runs['pollution_aqi'].max() - best_runs['pollution_aqi'].min())/2:.1f}"
+                    optimal_aqi = optimal_conditions['pollution_aqi']['mean']
+                    aqi_range = f"±{condition_range('pollution_aqi'):.1f}"
                     st.metric("Best AQI", f"{optimal_aqi:.1f}", aqi_range)
                 
                 with metrics_cols[3]:
-                    optimal_pm25 = best_runs['pollution_pm25'].mean()
-                    pm25_range = f"±{(best_runs['pollution_pm25'].max() - best_runs['pollution_pm25'].min())/2:.1f}"
+                    optimal_pm25 = optimal_conditions['pollution_pm25']['mean']
+                    pm25_range = f"±{condition_range('pollution_pm25'):.1f}"
                     st.metric("Best PM2.5", f"{optimal_pm25:.1f}", pm25_range)
                 
                 # Main performance visualization
@@ -995,12 +439,11 @@ def add_combined_metrics_tab(tab, strava_df):
                 # Insights section
                 st.subheader("💡 Key Insights")
                 
-                # Calculate correlations
                 correlations = {
-                    'Temperature': env_impact['temperature'].corr(env_impact['pace_min_km']),
-                    'Humidity': env_impact['humidity'].corr(env_impact['pace_min_km']),
-                    'AQI': env_impact['pollution_aqi'].corr(env_impact['pace_min_km']),
-                    'PM2.5': env_impact['pollution_pm25'].corr(env_impact['pace_min_km'])
+                    'Temperature': env_correlations['temperature'],
+                    'Humidity': env_correlations['humidity'],
+                    'AQI': env_correlations['pollution_aqi'],
+                    'PM2.5': env_correlations['pollution_pm25']
                 }
                 
                 # Create correlation summary
@@ -1008,6 +451,9 @@ def add_combined_metrics_tab(tab, strava_df):
                 with insight_cols[0]:
                     st.markdown("**Impact on Performance:**")
                     for factor, corr in correlations.items():
+                        if corr is None:
+                            st.markdown(f"- {factor}: not enough data")
+                            continue
                         impact = "slows you down" if corr > 0 else "helps your performance"
                         strength = abs(corr)
                         if strength < 0.2:
@@ -1048,7 +494,7 @@ def add_combined_metrics_tab(tab, strava_df):
         # 1. Location Performance Profile
             with location_col:
                 st.subheader("🌍 Location Analysis")
-                location_metrics = calculate_location_metrics(strava_df)
+                location_metrics = calculate_location_metrics()
                 
                 if not location_metrics.empty:
                     # Summary metrics first
@@ -1060,16 +506,16 @@ def add_combined_metrics_tab(tab, strava_df):
                         f"({int(location_metrics.loc[location_metrics['id'].idxmax(), 'id'])} runs)")
                     st.success(f"🏃 Best performance location: **{best_pace_city}**")
                     
-                    # Show detailed city comparison
-                    st.markdown("##### City Performance Comparison")
+                    # Show detailed location comparison
+                    st.markdown("##### Location Performance Comparison")
                     
                     # Create a clean comparison table
                     comparison_df = location_metrics[['city_name', 'average_pace', 'average_heartrate', 
                                                 'temperature', 'pollution_aqi', 'id']].copy()
                     comparison_df['average_pace'] = comparison_df['average_pace'].apply(
                         lambda x: f"{int(x)}:{int((x % 1) * 60):02d} /km")
-                    comparison_df.columns = ['City', 'Avg Pace', 'Avg HR', 'Temp (°C)', 'AQI', 'Total Runs']
-                    st.dataframe(comparison_df.set_index('City'), use_container_width=True)
+                    comparison_df.columns = ['Location', 'Avg Pace', 'Avg HR', 'Temp (°C)', 'AQI', 'Total Runs']
+                    st.dataframe(comparison_df.set_index('Location'), use_container_width=True)
                     
             # Radar chart for all locations
             # top_locations = location_metrics.nlargest(5, 'id')
@@ -1087,7 +533,7 @@ def add_combined_metrics_tab(tab, strava_df):
 
             with col2:
                 st.subheader("Year-over-Year Analysis")
-                yoy_chart = create_yoy_comparison_chart(location_metrics)
+                yoy_chart = create_yoy_comparison_chart(calculate_location_metrics_by_year())
                 if yoy_chart:
                     st.plotly_chart(yoy_chart, use_container_width=True)
                 else:
@@ -1096,7 +542,6 @@ def add_combined_metrics_tab(tab, strava_df):
             # 2. Environmental Impact Analysis
             with env_col:
                 st.subheader("🌡️ Environmental Impact")
-                env_impact = calculate_environmental_impact(strava_df)
                 
                 if not env_impact.empty:
                     # Show optimal conditions
@@ -1133,7 +578,7 @@ def add_combined_metrics_tab(tab, strava_df):
         with section_tabs[2]:
         # 3. Time of Day Analysis (Full Width)
             st.subheader("⏰ Time of Day Analysis")
-            time_metrics, time_df = calculate_time_of_day_metrics(strava_df)
+            time_metrics = calculate_time_of_day_metrics()
             
             if not time_metrics.empty:
                 # Show summary insights
@@ -1207,81 +652,29 @@ def calculate_date_for_range(range_option):
 def sync_data(time_range):
     """Syncs data from Strava API for the selected time range."""
     try:
-
-        # Create database and tables if they don't exist
-
-        from database import create_database_and_tables
-        create_database_and_tables()
-
-        # Initialize Strava client
-        client = authenticate_strava()
-        if not client:
-            return False, "Failed to authenticate with Strava"
-        
         # Get datetime for start of selected range
         after_datetime = calculate_date_for_range(time_range)
         if after_datetime:
             # Add timezone info to match Strava's timezone-aware datetimes
             after_datetime = after_datetime.replace(tzinfo=timezone.utc)
-        
-        # Stream and process activities
-        activities_processed = 0
-        conn = sqlite3.connect("ai_running_coach.db")
-        
-        for activity in stream_activities(client, after=after_datetime):
-            if activity.type != 'Run':
-                continue
-                
-            # Check if activity already exists
-            if activity_exists(conn, activity.id):
-                continue
-                
-            # Get detailed activity data
-            detailed_activity = client.get_activity(activity.id)
-            if not detailed_activity:
-                continue
-                
-            # Get weather data if location available
-            weather_data = None
-            air_pollution_data = None
-            city_name = None
-            
-            if detailed_activity.start_latlng:
-                # Use start of activity day for weather data
-                activity_date = detailed_activity.start_date.date()
-                activity_timestamp = int(datetime.combine(activity_date, 
-                                                       datetime.min.time()).timestamp())
-                
-                weather_data, air_pollution_data, city_name = fetch_openweathermap_data(
-                    detailed_activity.start_latlng.lat,
-                    detailed_activity.start_latlng.lon,
-                    activity_timestamp,
-                    detailed_activity.elapsed_time
-                )
-            
-            # Store timestamp at start of day
-            ist_timestamp = int(datetime.combine(detailed_activity.start_date.date(), 
-                                               datetime.min.time()).timestamp())
-            
-            # Insert data into database
-            insert_strava_data(conn, detailed_activity, weather_data, air_pollution_data, 
-                             city_name, ist_timestamp)
-            activities_processed += 1
-            
-            # Add delay to respect API rate limits
-            # time.sleep(STRAVA_REQUEST_DELAY)
-        
-        conn.close()
-        
+
+        report = sync_activities(after_datetime, on_error=st.error)
+
+        # Regenerate the AI insights affected by the new activities in the background
+        if report['activities_processed']:
+            enqueue_insight_refresh(report['synced_years'])
+
         # Format message with date range
         start_date = after_datetime.strftime('%Y-%m-%d')
         end_date = datetime.now().strftime('%Y-%m-%d')
-        return True, f"Successfully synced {activities_processed} new activities from {start_date} to {end_date}"
-        
+        return True, f"Successfully synced {report['activities_processed']} new activities from {start_date} to {end_date}"
+
     except Exception as e:
         return False, f"Error during sync: {str(e)}"
 
-def create_activity_trends_tab(tab, strava_df, outlier_setting=None):
+def create_activity_trends_tab(tab, data_version, outlier_setting=None):
+    import plotly.io as pio
+
     with tab:
         st.header("Activity Trends")
         
@@ -1304,20 +697,31 @@ def create_activity_trends_tab(tab, strava_df, outlier_setting=None):
             "Total Elevation Gain"
         ]
         
+        outlier_key = settings_key(outlier_setting) if outlier_setting else None
         for idx, period in enumerate(time_tabs):
             with period:
                 for metric in metrics:
-                    trend_data = get_trend_data(strava_df, metric, time_periods[idx], outlier_setting)
-                    if trend_data is not None and not trend_data.empty:
-                        fig = create_metric_chart(trend_data, metric, time_periods[idx])
-                        st.plotly_chart(fig, use_container_width=True)
+                    fig_json = load_metric_figure(current_athlete.get(), data_version, date.today(), metric, time_periods[idx], outlier_key)
+                    if fig_json is not None:
+                        st.plotly_chart(pio.from_json(fig_json), use_container_width=True,
+                                        key=f"trend_{time_periods[idx]}_{metric}")
                     else:
                         st.warning(f"No {metric} data available for {time_periods[idx]}")
 
+@timed()
 def create_metric_chart(trend_data, metric, period):
-    """Creates a visualization for the given metric."""
+    """Creates a visualization for the given metric, resampled or downsampled for long periods."""
+    import plotly.graph_objects as go
+    from chart_data import reduce_chart_frame
+
     fig = go.Figure()
     
+    chart_data = trend_data.iloc[:, [0]].copy()
+    # Rolling average over the daily values, reduced together with them
+    if period not in ["Last 7 Days"]:
+        chart_data['rolling_avg'] = chart_data.iloc[:, 0].rolling(window=7).mean()
+    chart_data, resolution = reduce_chart_frame(chart_data, how='sum' if metric == "Distance" else 'mean')
+    
     y_axis_label = {
         "Distance": "Distance (km)",
         "Average Pace": "Speed (km/h)",
@@ -1326,7 +730,7 @@ def create_metric_chart(trend_data, metric, period):
     }
     
     hover_text = {
-        "Distance": "Daily distance: %{y:.2f} km",
+        "Distance": f"{resolution.capitalize()} distance: %{{y:.2f}} km",
         "Average Pace": "Average speed: %{y:.2f} km/h",
         "Average Heart Rate": "Average heart rate: %{y:.0f} bpm",
         "Total Elevation Gain": "Total elevation gain: %{y:.0f} m"
@@ -1334,8 +738,8 @@ def create_metric_chart(trend_data, metric, period):
 
     # Main data trace
     fig.add_trace(go.Scatter(
-        x=trend_data.index,
-        y=trend_data.iloc[:, 0],
+        x=chart_data.index,
+        y=chart_data.iloc[:, 0],
         mode='lines+markers',
         name=metric,
         line=dict(color='rgb(102,178,255)', width=2),
@@ -1344,11 +748,10 @@ def create_metric_chart(trend_data, metric, period):
     ))
     
     # Add rolling average except for short periods
-    if period not in ["Last 7 Days"]:
-        rolling_avg = trend_data.iloc[:, 0].rolling(window=7).mean()
+    if 'rolling_avg' in chart_data.columns:
         fig.add_trace(go.Scatter(
-            x=trend_data.index,
-            y=rolling_avg,
+            x=chart_data.index,
+            y=chart_data['rolling_avg'],
             mode='lines',
             name='7-day moving average',
             line=dict(color='rgb(255,153,153)', width=2, dash='dash'),
@@ -1393,8 +796,8 @@ def create_metric_chart(trend_data, metric, period):
     
     return fig
 
-def generate_monthly_analysis(strava_df):
-    """Generate analysis for last 30 days of data."""
+def monthly_analysis_prompt(strava_df):
+    """Build the analysis prompt for the last 30 days of data."""
     recent_df = strava_df[strava_df['start_date_ist'] >= (datetime.now() - timedelta(days=30))]
     
     analysis_data = {
@@ -1416,38 +819,31 @@ def generate_monthly_analysis(strava_df):
 
     Provide a detailed analysis of the runner's training load, consistency, and performance. Focus on specific metrics and patterns. Give actionable recommendations."""
 
-    try:
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        return f"Error generating analysis: {e}"
-
-def get_tab_specific_analysis(tab_data):
-    """Generate analysis specific to each metric tab."""
-    # Format data based on tab content
-    prompt = f"""Analyze this specific aspect of the runner's training:
-    {tab_data}
-    
-    Provide focused insights on this metric and how it relates to overall performance."""
-    
-    try:
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        return f"Error generating analysis: {e}"
+    return prompt
 
-def create_ai_analysis_tab(tab, strava_df):
+def create_ai_analysis_tab(tab, insights, data_version):
     with tab:
         st.header("AI Training Analysis")
-        
-        with st.spinner("Generating monthly analysis..."):
-            analysis = generate_monthly_analysis(strava_df)
-            st.markdown(analysis)
-
-def add_metrics_analysis(strava_df, metrics_data, tab_name):
-    st.divider()  # Visual separator
-    st.subheader("🤖 AI Analysis")
-    
+        show_insight(insights, 'section:monthly', data_version)
+
+# Section of the structured AI request shown under each metrics tab
+METRICS_TAB_SECTIONS = {
+    "Performance Metrics": 'performance',
+    "Physiological Metrics": 'physiological',
+    "Elevation & Cadence": 'elevation',
+    "Environmental Metrics": 'environmental'
+}
+
+INFERRED_METRICS_PROMPT = """Analyze the runner's derived metrics:
+    - Pace Variability Trend
+    - Heart Rate Zone Distribution
+    - Weekly Running Consistency
+    - Grade Adjusted Pace
+
+    Provide insights about training consistency and adaptations."""
+
+def metrics_analysis_prompt(strava_df, tab_name):
+    """Build the standalone analysis prompt for a metrics tab, used when the structured request fails."""
     # Prepare data for analysis based on tab type
     if tab_name == "Performance Metrics":
         analysis_data = {
@@ -1495,15 +891,154 @@ def add_metrics_analysis(strava_df, metrics_data, tab_name):
 
         Provide insights about performance in different conditions and recommendations."""
 
+    elif tab_name == "Elevation & Cadence":
+        analysis_data = {
+            "avg_elevation": strava_df['total_elevation_gain'].mean(),
+            "total_elevation": strava_df['total_elevation_gain'].sum(),
+            "avg_cadence": strava_df['average_cadence'].mean()
+        }
+        
+        prompt = f"""Analyze this runner's elevation and cadence:
+        - Average elevation gain per run: {analysis_data['avg_elevation']:.0f} m
+        - Total elevation gain: {analysis_data['total_elevation']:.0f} m
+        - Average cadence: {analysis_data['avg_cadence']:.1f} spm
+
+        Provide insights about hill training and running form."""
+
     else:
         prompt = "Analyze the runner's overall training patterns and provide specific recommendations."
 
-    with st.spinner("Generating analysis..."):
-        try:
-            response = model.generate_content(prompt)
-            st.markdown(response.text)
-        except Exception as e:
-            st.error(f"Error generating analysis: {e}")
+    return prompt
+
+def section_fallback_prompts(strava_df):
+    """Standalone prompts for each AI section, keyed like SECTION_INSTRUCTIONS."""
+    prompts = {section: metrics_analysis_prompt(strava_df, tab_name) for tab_name, section in METRICS_TAB_SECTIONS.items()}
+    prompts['inferred'] = INFERRED_METRICS_PROMPT
+    prompts['monthly'] = monthly_analysis_prompt(strava_df)
+    return prompts
+
+def _digest_value(value, digits=2):
+    """Rounds a statistic for the AI digest, mapping missing values to None."""
+    import pandas as pd
+
+    return None if value is None or pd.isna(value) else round(float(value), digits)
+
+def build_analysis_digest(strava_df, weekly_metrics):
+    """Compact statistics shared by every AI section, computed once per page."""
+    recent_df = strava_df[strava_df['start_date_ist'] >= (datetime.now() - timedelta(days=30))]
+    weekly_pace_var, weekly_hr_zones, weekly_runs, weekly_gap = weekly_metrics
+
+    def pace(speed):
+        return 1000 / (speed * 60) if speed else None
+
+    def recent_weeks(values, weeks=8):
+        return [_digest_value(v) for v in values.tail(weeks)]
+
+    return {
+        'last_30_days': {
+            'runs': len(recent_df),
+            'distance_total': _digest_value(recent_df['distance'].sum()),
+            'pace_avg': _digest_value(pace(recent_df['average_speed'].mean())),
+            'heartrate_avg': _digest_value(recent_df['average_heartrate'].mean(), 1),
+            'elevation_total_m': _digest_value(recent_df['total_elevation_gain'].sum(), 0),
+            'speed_std': _digest_value(recent_df['average_speed'].std())
+        },
+        'performance': {
+            'runs': len(strava_df),
+            'distance_avg': _digest_value(strava_df['distance'].mean()),
+            'distance_std': _digest_value(strava_df['distance'].std()),
+            'pace_avg': _digest_value(pace(strava_df['average_speed'].mean()))
+        },
+        'physiological': {
+            'heartrate_avg': _digest_value(strava_df['average_heartrate'].mean(), 1),
+            'heartrate_max': _digest_value(strava_df['max_heartrate'].max(), 1),
+            'calories_avg': _digest_value(strava_df['calories'].mean(), 0),
+            'suffer_score_avg': _digest_value(strava_df['suffer_score'].mean(), 1)
+        },
+        'elevation': {
+            'elevation_avg_m': _digest_value(strava_df['total_elevation_gain'].mean(), 0),
+            'elevation_total_m': _digest_value(strava_df['total_elevation_gain'].sum(), 0),
+            'cadence_avg': _digest_value(strava_df['average_cadence'].mean(), 1)
+        },
+        'environmental': {
+            'temperature_avg_c': _digest_value(strava_df['temperature'].mean(), 1),
+            'humidity_avg_pct': _digest_value(strava_df['humidity'].mean(), 1),
+            'aqi_avg': _digest_value(strava_df['pollution_aqi'].mean(), 1)
+        },
+        'inferred_last_8_weeks': {
+            'pace_variation': recent_weeks(weekly_pace_var['variation']) if not weekly_pace_var.empty else [],
+            'runs_per_week': recent_weeks(weekly_runs['num_runs']) if not weekly_runs.empty else [],
+            'grade_adjusted_pace': recent_weeks(weekly_gap['average_grade_adjusted_speed'] / 60) if not weekly_gap.empty else [],
+            'hr_zone_share_pct': {zone: _digest_value(share, 1) for zone, share in weekly_hr_zones.tail(8).mean().items()}
+                                 if not weekly_hr_zones.empty else {}
+        }
+    }
+
+def add_metrics_analysis(strava_df, metrics_data, tab_name, insights, data_version):
+    st.divider()  # Visual separator
+    st.subheader("🤖 AI Analysis")
+    show_insight(insights, f"section:{METRICS_TAB_SECTIONS[tab_name]}", data_version)
+
+def show_insight(insights, key, data_version, style="markdown"):
+    """Renders a stored AI insight, flagging it when it was generated from older data."""
+    content, version = insights.get(key, (None, None))
+    if content is None:
+        st.caption("⏳ AI analysis is being generated in the background, refresh in a moment.")
+        return
+    if version != data_version:
+        st.caption("🔄 Stale, regenerating...")
+    if style == "info":
+        st.info(content)
+    else:
+        st.markdown(content)
+
+def generate_section_insights(model):
+    """Background job: regenerates the AI sections from the stored data and stamps them with its version.
+
+    Sections that failed are not stored, so they keep their previous content and are requested again.
+    """
+    from metrics import calculate_weekly_metrics, prepare_data
+
+    conn = connect()
+    data_version = get_data_version(conn)
+    conn.close()
+    strava_df, split_stats_df, _ = prepare_data()
+    weekly_metrics = calculate_weekly_metrics(strava_df, split_stats_df)
+    sections = generate_section_analyses(model, build_analysis_digest(strava_df, weekly_metrics),
+                                         lambda: section_fallback_prompts(strava_df), AI_CALL_TIMEOUT_SECONDS)
+    store_insights({f"section:{key}": text for key, text in sections.items()}, data_version)
+
+def generate_year_review_insights(model, year, compare_year):
+    """Background job: regenerates the Year in Review comparison insights for one pair of years."""
+    from year_review import load_year_review
+
+    conn = connect()
+    data_version = get_data_version(conn)
+    review = load_year_review(conn, [year, compare_year])
+    conn.close()
+    prompts = year_review_prompts(review, year, compare_year)
+    insights = generate_all(model, {f"year_review:{year}:{compare_year}:{topic}": prompt
+                                    for topic, prompt in prompts.items()})
+    store_insights(insights, data_version)
+
+def default_compare_year(years, year):
+    """The closest earlier year with data, else the newest other year."""
+    earlier = [y for y in years if y < year]
+    others = [y for y in years if y != year]
+    return max(earlier) if earlier else (others[0] if others else None)
+
+def enqueue_insight_refresh(synced_years=()):
+    """Sync completion hook: queues regeneration of every AI insight affected by the synced years."""
+    from year_review import available_years
+
+    enqueue_insight_job('sections', generate_section_insights, get_model())
+    conn = connect()
+    years = available_years(conn)
+    conn.close()
+    for year in years:
+        compare_year = default_compare_year(years, year)
+        if compare_year is not None and {year, compare_year} & set(synced_years):
+            enqueue_insight_job(f"year_review:{year}:{compare_year}", generate_year_review_insights, get_model(), year, compare_year)
 
 def add_outlier_settings_ui():
     """Add outlier detection settings to the sidebar."""
@@ -1512,6 +1047,24 @@ def add_outlier_settings_ui():
     
     # Expandable section for outlier settings
     with st.sidebar.expander("Outlier Detection Settings"):
+        # Manual thresholds, or per-metric thresholds derived from the data's spread
+        mode = st.selectbox(
+            "Detection Mode",
+            list(OUTLIER_MODES),
+            format_func=OUTLIER_MODES.get,
+            help="Automatic modes flag runs far from the typical speed, distance and heart rate"
+        )
+        manual = mode == 'manual'
+        sensitivity = st.number_input(
+            "Sensitivity (k)",
+            value=DEFAULT_SENSITIVITY.get(mode, 3.0),
+            min_value=0.5,
+            max_value=10.0,
+            step=0.5,
+            disabled=manual,
+            help="Width of the automatic bounds; larger values flag fewer runs"
+        )
+
         # Speed/Pace settings
         st.subheader("Speed Thresholds")
         min_speed = st.number_input(
@@ -1520,6 +1073,7 @@ def add_outlier_settings_ui():
             min_value=1.0, 
             max_value=20.0, 
             step=0.5,
+            disabled=not manual,
             help="Activities with average speed below this value will be filtered out"
         )
         max_speed = st.number_input(
@@ -1528,6 +1082,7 @@ def add_outlier_settings_ui():
             min_value=5.0, 
             max_value=30.0, 
             step=0.5,
+            disabled=not manual,
             help="Activities with average speed above this value will be filtered out"
         )
 
@@ -1539,6 +1094,7 @@ def add_outlier_settings_ui():
             min_value=5.0, 
             max_value=100.0, 
             step=1.0,
+            disabled=not manual,
             help="Activities with distance above this value will be filtered out"
         )
         min_distance = st.number_input(
@@ -1547,6 +1103,7 @@ def add_outlier_settings_ui():
             min_value=0.1, 
             max_value=10.0, 
             step=0.1,
+            disabled=not manual,
             help="Activities with distance below this value will be filtered out"
         )
 
@@ -1558,6 +1115,7 @@ def add_outlier_settings_ui():
             min_value=30, 
             max_value=100, 
             step=5,
+            disabled=not manual,
             help="Activities with average heart rate below this value will be filtered out"
         )
         max_hr = st.number_input(
@@ -1566,6 +1124,7 @@ def add_outlier_settings_ui():
             min_value=100, 
             max_value=250, 
             step=5,
+            disabled=not manual,
             help="Activities with average heart rate above this value will be filtered out"
         )
 
@@ -1578,271 +1137,195 @@ def add_outlier_settings_ui():
 
     return {
         'enable_filtering': enable_filtering,
+        'mode': mode,
+        'sensitivity': sensitivity,
         'speed': {'min': min_speed, 'max': max_speed},
         'distance': {'min': min_distance, 'max': max_distance},
         'heart_rate': {'min': min_hr, 'max': max_hr}
     }
 
-def filter_outliers(df, settings):
-    """Filter outliers based on user settings."""
-    if not settings['enable_filtering']:
-        return df
-    
-    filtered_df = df.copy()
-    mask = pd.Series(True, index=df.index)
-    
-    # Speed filtering (convert m/s to km/h)
-    if 'average_speed' in df.columns:
-        speed_kmh = df['average_speed'] * 3.6
-        mask &= (speed_kmh >= settings['speed']['min']) & (speed_kmh <= settings['speed']['max'])
-    
-    # Distance filtering
-    if 'distance' in df.columns:
-        mask &= (df['distance'] >= settings['distance']['min']) & (df['distance'] <= settings['distance']['max'])
-    
-    # Heart Rate filtering
-    if 'average_heartrate' in df.columns:
-        mask &= (df['average_heartrate'] >= settings['heart_rate']['min']) & (df['average_heartrate'] <= settings['heart_rate']['max'])
-    
-    filtered_df = filtered_df[mask]
-    
-    # Add debug information
-    if len(filtered_df) < len(df):
-        print(f"Filtered out {len(df) - len(filtered_df)} activities as outliers")
-    
-    return filtered_df
-
-def create_year_review_tab(tab, strava_df, model):
+@timed()
+def year_review_frames(review, review_years):
+    """Derives the per-year summary, monthly, distance category and heart rate zone frames of a review."""
+    from year_review import DISTANCE_CATEGORY_LABELS
+
+    summary = review['summary'].set_index('year')
+    monthly = {y: review['monthly'][review['monthly']['year'] == y].set_index('month').reindex(range(1, 13)).fillna(0)
+               for y in review_years}
+    distance_categories = {
+        y: review['distance_categories'][review['distance_categories']['year'] == y]
+            .set_index('category')['runs'].reindex(DISTANCE_CATEGORY_LABELS).fillna(0).astype(int)
+        for y in review_years
+    }
+    hr_zones = {
+        y: review['hr_zones'][review['hr_zones']['year'] == y]
+            .pivot_table(values='runs', index='month', columns='zone', aggfunc='sum', fill_value=0)
+            .reindex(index=range(1, 13), fill_value=0)
+        for y in review_years
+    }
+    return summary, monthly, distance_categories, hr_zones
+
+# Topics of the Year in Review comparison insights, one per chart; hr_zones only when both years have
+# heart rate zone data
+YEAR_REVIEW_TOPICS = ['distance', 'consistency', 'hr_zones', 'distance_categories', 'pace', 'elevation']
+
+def year_review_prompts(review, year, compare_year):
+    """One-line comparison prompts for the Year in Review charts, keyed by topic (see YEAR_REVIEW_TOPICS)."""
+    summary, monthly, distance_categories, hr_zones = year_review_frames(review, [year, compare_year])
+    prompts = {}
+    prompts['distance'] = f"""Analyze the running distances:
+    {year}: {summary.loc[year, 'total_distance']:.1f} km in {int(summary.loc[year, 'runs'])} runs
+    {compare_year}: {summary.loc[compare_year, 'total_distance']:.1f} km in {int(summary.loc[compare_year, 'runs'])} runs
+    Provide a one-line insight how {year} was better or different than {compare_year} with respect to running distance."""
+
+    prompts['consistency'] = f"""Compare running consistency:
+    {year}: {int(summary.loc[year, 'runs'])} total runs, {summary.loc[year, 'avg_runs_per_week']:.1f} runs/week, 
+    Most common days: {summary.loc[year, 'common_days']}
+    
+    {compare_year}: {int(summary.loc[compare_year, 'runs'])} total runs, {summary.loc[compare_year, 'avg_runs_per_week']:.1f} runs/week, 
+    Most common days: {summary.loc[compare_year, 'common_days']}
+    
+    Provide a one-line insight about running consistency and habit changes in {year} as compared to {compare_year}."""
+
+    if not hr_zones[year].empty and not hr_zones[compare_year].empty:
+        prompts['hr_zones'] = f"""Analyze heart rate distribution between years:
+    {year} Zones: {hr_zones[year].sum().to_dict()}
+    {compare_year} Zones: {hr_zones[compare_year].sum().to_dict()}
+    Provide a one-line insight about training intensity changes between {year} and {compare_year}."""
+
+    # Absolute changes for the distance category insight
+    absolute_changes = distance_categories[year] - distance_categories[compare_year]
+    prompts['distance_categories'] = f"""Compare run distances between {year} and {compare_year}:
+    {year} Counts: {distance_categories[year].to_dict()}
+    {compare_year} Counts: {distance_categories[compare_year].to_dict()}
+    Absolute Changes: {absolute_changes.to_dict()}
+    Provide a one-line insight about the most significant changes in running distance patterns."""
+
+    prompts['pace'] = f"""Compare pace evolution:
+    {year} Avg: {monthly[year]['pace_mean'].mean():.1f} kmph
+    {compare_year} Avg: {monthly[compare_year]['pace_mean'].mean():.1f} kmph
+    Provide a one-line insight about pace development in {year} as compared to {compare_year}."""
+
+    prompts['elevation'] = f"""Compare elevation data:
+    {year} Total: {summary.loc[year, 'total_elevation']:.0f}m
+    {compare_year} Total: {summary.loc[compare_year, 'total_elevation']:.0f}m
+    {year} Avg/km: {(summary.loc[year, 'total_elevation'] / summary.loc[year, 'total_distance']):.1f}m
+    {compare_year} Avg/km: {(summary.loc[compare_year, 'total_elevation'] / summary.loc[compare_year, 'total_distance']):.1f}m
+    Provide a one-line insight about elevation training."""
+    return prompts
+
+def create_year_review_tab(tab, strava_df):
     """Creates the year in review tab with key metrics and clean visualizations."""
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+    import plotly.graph_objects as go
+    from year_review import DISTANCE_CATEGORY_LABELS, available_years, load_year_review
+
     try:
         with tab:
-            if strava_df.empty:
+            conn = connect()
+            years = available_years(conn)
+            if not years:
+                conn.close()
                 st.error("No data available for analysis")
                 return
             
-            st.header("2024 Year in Review")
-            def get_year_data(df, year):
-                year_data = df[df['start_date_ist'].dt.year == year].copy()
-                if year_data.empty:
-                    st.warning(f"No data available for {year}")
-                return year_data
-
-            # Create the yearly dataframes first
-            df_2024 = get_year_data(strava_df, 2024)
-            df_2023 = get_year_data(strava_df, 2023)
-
+            # Year selectors; summaries are precomputed per year and refreshed on sync
+            year_cols = st.columns(2)
+            with year_cols[0]:
+                year = st.selectbox("Year", years, index=0, key="year_review_year")
+            compare_options = [y for y in years if y != year]
+            with year_cols[1]:
+                compare_year = st.selectbox(
+                    "Compare with", compare_options, key="year_review_compare_year",
+                    index=compare_options.index(default_compare_year(years, year)) if compare_options else 0
+                ) if compare_options else None
+            
+            review_years = [year] + ([compare_year] if compare_year is not None else [])
+            review = load_year_review(conn, review_years)
+            summary, monthly, distance_categories, hr_zones = year_review_frames(review, review_years)
+            
+            # Comparison insights are generated in the background; regenerate missing or stale ones
+            data_version = get_data_version(conn)
+            insights = load_insights(conn, f"year_review:{year}:{compare_year}:") if compare_year is not None else {}
+            conn.close()
+            if compare_year is not None:
+                has_hr_zones = not hr_zones[year].empty and not hr_zones[compare_year].empty
+                expected = [topic for topic in YEAR_REVIEW_TOPICS if topic != 'hr_zones' or has_hr_zones]
+                if any(insights.get(f"year_review:{year}:{compare_year}:{topic}", (None, None))[1] != data_version
+                       for topic in expected):
+                    enqueue_insight_job(f"year_review:{year}:{compare_year}", generate_year_review_insights,
+                                        get_model(), year, compare_year)
+            insight_key = f"year_review:{year}:{compare_year}:{{}}"
+            
+            st.header(f"{year} Year in Review")
+            
+            month_order = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+            
             # Create Summary table
-            summary_data = {
-                'Year': ['2024', '2023'],
-                'Total Runs': [len(df_2024), len(df_2023)],
-                                'Total Distance (km)': [
-                    df_2024['distance'].sum().round(1) if not df_2024.empty else 0,
-                    df_2023['distance'].sum().round(1) if not df_2023.empty else 0
-                ],
-                'Avg Pace (km/h)': [(df_2024['average_speed'] * 3.6).mean().round(2), 
-                                   (df_2023['average_speed'] * 3.6).mean().round(2)],
-                'Avg Heart Rate (bpm)': [df_2024['average_heartrate'].mean().round(1), 
-                                       df_2023['average_heartrate'].mean().round(1)],
-                'Total Elevation (m)': [df_2024['total_elevation_gain'].sum().round(0), 
-                                      df_2023['total_elevation_gain'].sum().round(0)],
-                '0-5km Runs': [len(df_2024[df_2024['distance'] <= 5]), 
-                              len(df_2023[df_2023['distance'] <= 5])],
-                '5-10km Runs': [len(df_2024[(df_2024['distance'] > 5) & (df_2024['distance'] <= 10)]), 
-                               len(df_2023[(df_2023['distance'] > 5) & (df_2023['distance'] <= 10)])],
-                '10-20km Runs': [len(df_2024[(df_2024['distance'] > 10) & (df_2024['distance'] <= 20)]), 
-                                len(df_2023[(df_2023['distance'] > 10) & (df_2023['distance'] <= 20)])],
-                '20km+ Runs': [len(df_2024[df_2024['distance'] > 20]), 
-                              len(df_2023[df_2023['distance'] > 20])]
-            }
-
-            df_summary = pd.DataFrame(summary_data)
+            df_summary = pd.DataFrame({
+                'Year': [str(y) for y in review_years],
+                'Total Runs': [int(summary.loc[y, 'runs']) for y in review_years],
+                'Total Distance (km)': [round(summary.loc[y, 'total_distance'], 1) for y in review_years],
+                'Avg Pace (km/h)': [round(summary.loc[y, 'avg_speed_kmh'], 2) for y in review_years],
+                'Avg Heart Rate (bpm)': [round(summary.loc[y, 'avg_heartrate'], 1) for y in review_years],
+                'Total Elevation (m)': [round(summary.loc[y, 'total_elevation'], 0) for y in review_years],
+                **{f"{category} Runs": [distance_categories[y][category] for y in review_years]
+                   for category in DISTANCE_CATEGORY_LABELS}
+            })
             st.dataframe(df_summary.set_index('Year'), use_container_width=True)
-
-            # Helper function with proper error handling
-            def get_year_data(df, year):
-                year_data = df[df['start_date_ist'].dt.year == year].copy()
-                if year_data.empty:
-                    st.warning(f"No data available for {year}")
-                return year_data
-
-            df_2024 = get_year_data(strava_df, 2024)
-            df_2023 = get_year_data(strava_df, 2023)
-
+            
+            # Primary year is drawn strongly, the comparison year faded
+            line_colors = {year: 'rgb(53, 138, 255)', compare_year: 'rgb(128, 128, 128)'}
+            
             # 1. Distance Progress with proper month handling
             st.subheader("Distance Progress")
             
-            def get_monthly_cumulative(df):
-                if df.empty:
-                    return pd.DataFrame()
-                    
-                all_months = pd.date_range(
-                    start=f"{df['start_date_ist'].dt.year.iloc[0]}-01-01",
-                    end=f"{df['start_date_ist'].dt.year.iloc[0]}-12-31",
-                    freq='M'
-                ).strftime('%m').tolist()
-                
-                monthly = df.groupby(df['start_date_ist'].dt.strftime('%m'))\
-                           .agg({'distance': 'sum'}).reindex(all_months).fillna(0).reset_index()
-                monthly['cumulative_distance'] = monthly['distance'].cumsum()
-                return monthly
-
-            monthly_2024 = get_monthly_cumulative(df_2024)
-            monthly_2023 = get_monthly_cumulative(df_2023)
-
-            if not monthly_2024.empty and not monthly_2023.empty:
-                distance_prompt = f"""Analyze the running distances:
-                2024: {monthly_2024['distance'].sum():.1f} km in {len(df_2024)} runs
-                2023: {monthly_2023['distance'].sum():.1f} km in {len(df_2023)} runs
-                Provide a one-line insight how 2024 was better or different than 2023 with respect to running distance."""
-                
-                distance_insight = model.generate_content(distance_prompt).text
-                st.info(distance_insight)
-
-                fig_distance = go.Figure()
-                fig_distance.add_trace(go.Scatter(
-                    x=monthly_2024['start_date_ist'], 
-                    y=monthly_2024['cumulative_distance'],
-                    name='2024',
-                    line=dict(color='rgb(102,178,255)', width=3)
-                ))
+            if compare_year is not None:
+                show_insight(insights, insight_key.format('distance'), data_version, style="info")
+            
+            fig_distance = go.Figure()
+            for y in review_years:
                 fig_distance.add_trace(go.Scatter(
-                    x=monthly_2023['start_date_ist'], 
-                    y=monthly_2023['cumulative_distance'],
-                    name='2023',
-                    line=dict(color='rgba(102,178,255,0.3)', width=2)
+                    x=month_order, 
+                    y=monthly[y]['cumulative_distance'],
+                    name=str(y),
+                    line=dict(color='rgb(102,178,255)', width=3) if y == year else dict(color='rgba(102,178,255,0.3)', width=2)
                 ))
-                fig_distance.update_layout(
-                    title="Cumulative Distance by Month",
-                    xaxis_title="Month",
-                    yaxis_title="Total Distance (km)",
-                    height=500,  # Fixed height for better screenshots
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    hovermode='x unified'
-                )
-                st.plotly_chart(fig_distance, use_container_width=True)
+            fig_distance.update_layout(
+                title="Cumulative Distance by Month",
+                xaxis_title="Month",
+                yaxis_title="Total Distance (km)",
+                height=500,  # Fixed height for better screenshots
+                paper_bgcolor='rgba(0,0,0,0)',
+                plot_bgcolor='rgba(0,0,0,0)',
+                hovermode='x unified'
+            )
+            st.plotly_chart(fig_distance, use_container_width=True)
 
             # 2. Running Consistency - Calendar Heatmaps
             st.subheader("Running Consistency")
 
-            # Calculate running frequency metrics for AI insight
-            def get_consistency_metrics(df):
-                if df.empty:
-                    return {'total_runs': 0, 'avg_runs_per_week': 0, 'most_common_days': []}
-                
-                # Total runs
-                total_runs = len(df)
-                
-                # Average runs per week
-                weeks = df['start_date_ist'].dt.isocalendar().week.nunique()
-                avg_runs_per_week = total_runs / weeks if weeks > 0 else 0
-                
-                # Most common running days
-                day_counts = df['start_date_ist'].dt.strftime('%A').value_counts()
-                most_common_days = day_counts.nlargest(2).index.tolist()
-                
-                return {
-                    'total_runs': total_runs,
-                    'avg_runs_per_week': avg_runs_per_week,
-                    'most_common_days': most_common_days
-                }
-
-            metrics_2024 = get_consistency_metrics(df_2024)
-            metrics_2023 = get_consistency_metrics(df_2023)
-
-            consistency_prompt = f"""Compare running consistency:
-            2024: {metrics_2024['total_runs']} total runs, {metrics_2024['avg_runs_per_week']:.1f} runs/week, 
-            Most common days: {', '.join(metrics_2024['most_common_days'])}
-            
-            2023: {metrics_2023['total_runs']} total runs, {metrics_2023['avg_runs_per_week']:.1f} runs/week, 
-            Most common days: {', '.join(metrics_2023['most_common_days'])}
-            
-            Provide a one-line insight about running consistency and habit changes in 2024 as compared to 2023."""
-
-            consistency_insight = model.generate_content(consistency_prompt).text
-            st.info(consistency_insight)
-
-            
-            def create_calendar_data(df, year):
-                """Creates GitHub-style calendar data."""
-                if df.empty:
-                    return pd.DataFrame()
-                
-                # Create a date range for the entire year
-                date_range = pd.date_range(start=f"{year}-01-01", end=f"{year}-12-31")
-                
-                # Create base dataframe with all dates
-                all_dates = pd.DataFrame({
-                    'date': date_range,
-                    'runs': 0  # Default value
-                })
-                
-                # Count runs per day from actual data
-                df['date'] = df['start_date_ist'].dt.date
-                run_counts = df.groupby('date').size().reset_index(name='runs')
-                run_counts['date'] = pd.to_datetime(run_counts['date'])
-                
-                # Merge with all dates
-                all_dates = all_dates.merge(run_counts, on='date', how='left')
-                all_dates['runs'] = all_dates['runs_y'].fillna(0)
-                
-                # Create month and week within month
-                all_dates['month'] = all_dates['date'].dt.strftime('%b')
-                all_dates['week'] = (all_dates['date'].dt.day - 1) // 7
-                
-                # Pivot to create heatmap format
-                heatmap_data = all_dates.pivot_table(
-                    values='runs',
-                    index='week',
-                    columns='month',
-                    aggfunc='sum',
-                    fill_value=0
-                )
-                
-                # Ensure all months are present in correct order
-                month_order = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
-                             'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-                heatmap_data = heatmap_data.reindex(columns=month_order, fill_value=0)
-                
-                return heatmap_data
-
-            # Create the columns for heatmaps
-            calendar_cols = st.columns(2)
-            
-            with calendar_cols[0]:
-                # st.write("2024 Running Frequency")
-                heatmap_2024 = create_calendar_data(df_2024, 2024)
-                if not heatmap_2024.empty:
-                    fig_cal_2024 = px.imshow(
-                        heatmap_2024,
-                        labels=dict(x="Month", y="Week", color="Runs"),
-                        title="2024 Weekly Running Frequency",
-                        color_continuous_scale="Blues",
-                        aspect="auto"
-                    )
-                    fig_cal_2024.update_layout(
-                        height=300,
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        plot_bgcolor='rgba(0,0,0,0)',
-                        yaxis=dict(
-                            ticktext=['Week 1', 'Week 2', 'Week 3', 'Week 4', 'Week 5'],
-                            tickvals=[0, 1, 2, 3, 4],
-                        )
-                    )
-                    st.plotly_chart(fig_cal_2024, use_container_width=True)
-
-            with calendar_cols[1]:
-                # st.write("2023 Running Frequency")
-                heatmap_2023 = create_calendar_data(df_2023, 2023)
-                if not heatmap_2023.empty:
-                    fig_cal_2023 = px.imshow(
-                        heatmap_2023,
+            if compare_year is not None:
+                show_insight(insights, insight_key.format('consistency'), data_version, style="info")
+
+            calendar_cols = st.columns(len(review_years))
+            for col, y in zip(calendar_cols, review_years):
+                with col:
+                    calendar = review['calendar'][review['calendar']['year'] == y]
+                    heatmap_data = calendar.pivot_table(
+                        values='runs', index='week', columns='month', aggfunc='sum', fill_value=0
+                    ).reindex(index=range(5), columns=range(1, 13), fill_value=0)
+                    heatmap_data.columns = month_order
+                    fig_cal = px.imshow(
+                        heatmap_data,
                         labels=dict(x="Month", y="Week", color="Runs"),
-                        title="2023 Weekly Running Frequency",
+                        title=f"{y} Weekly Running Frequency",
                         color_continuous_scale="Blues",
                         aspect="auto"
                     )
-                    fig_cal_2023.update_layout(
+                    fig_cal.update_layout(
                         height=300,
                         paper_bgcolor='rgba(0,0,0,0)',
                         plot_bgcolor='rgba(0,0,0,0)',
@@ -1851,450 +1334,655 @@ def create_year_review_tab(tab, strava_df, model):
                             tickvals=[0, 1, 2, 3, 4],
                         )
                     )
-                    st.plotly_chart(fig_cal_2023, use_container_width=True)
+                    st.plotly_chart(fig_cal, use_container_width=True)
 
             # 3. Heart Rate Zones - Split View Area Charts
             st.subheader("Heart Rate Zones Development")
 
-            def calculate_hr_zones(df):
-                if df.empty:
-                    return pd.DataFrame()
-                    
-                max_hr = df['max_heartrate'].max()
-                if pd.isna(max_hr) or max_hr == 0:
-                    return pd.DataFrame()
-                    
-                zones = pd.cut(df['average_heartrate'],
-                             bins=[0, 0.6*max_hr, 0.7*max_hr, 0.8*max_hr, 0.9*max_hr, float('inf')],
-                             labels=['Zone 1 (Recovery)', 'Zone 2 (Easy)', 'Zone 3 (Moderate)', 
-                                   'Zone 4 (Hard)', 'Zone 5 (Maximum)'])
-                monthly_zones = df.groupby([df['start_date_ist'].dt.strftime('%m'), zones]).size().unstack()
-                
-                # Fill missing months
-                all_months = [f"{i:02d}" for i in range(1, 13)]
-                return monthly_zones.reindex(all_months).fillna(0)
-
-            hr_2024 = calculate_hr_zones(df_2024)
-            hr_2023 = calculate_hr_zones(df_2023)
-
-            if not hr_2024.empty and not hr_2023.empty:
-                hr_prompt = f"""Analyze heart rate distribution between years:
-                2024 Zones: {hr_2024.sum().to_dict()}
-                2023 Zones: {hr_2023.sum().to_dict()}
-                Provide a one-line insight about training intensity changes between 2024 and 2023."""
-                
-                hr_insight = model.generate_content(hr_prompt).text
-                st.info(hr_insight)
-
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    fig_hr_2024 = go.Figure()
-                    for zone in hr_2024.columns:
-                        fig_hr_2024.add_trace(go.Scatter(
-                            x=hr_2024.index,
-                            y=hr_2024[zone],
-                            name=zone,
-                            stackgroup='one'
-                        ))
-                    fig_hr_2024.update_layout(
-                        title="2024 Heart Rate Zones",
-                        xaxis_title="Month",
-                        yaxis_title="Number of Runs",
-                        height=400,
-                        showlegend=True,
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        plot_bgcolor='rgba(0,0,0,0)'
-                    )
-                    st.plotly_chart(fig_hr_2024, use_container_width=True)
-
-                with col2:
-                    fig_hr_2023 = go.Figure()
-                    for zone in hr_2023.columns:
-                        fig_hr_2023.add_trace(go.Scatter(
-                            x=hr_2023.index,
-                            y=hr_2023[zone],
-                            name=zone,
-                            stackgroup='one'
-                        ))
-                    fig_hr_2023.update_layout(
-                        title="2023 Heart Rate Zones",
-                        xaxis_title="Month",
-                        yaxis_title="Number of Runs",
-                        height=400,
-                        showlegend=True,
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        plot_bgcolor='rgba(0,0,0,0)'
-                    )
-                    st.plotly_chart(fig_hr_2023, use_container_width=True)
+            if all(not hr_zones[y].empty for y in review_years):
+                if compare_year is not None:
+                    show_insight(insights, insight_key.format('hr_zones'), data_version, style="info")
+
+                hr_cols = st.columns(len(review_years))
+                for col, y in zip(hr_cols, review_years):
+                    with col:
+                        fig_hr = go.Figure()
+                        for zone in hr_zones[y].columns:
+                            fig_hr.add_trace(go.Scatter(
+                                x=month_order,
+                                y=hr_zones[y][zone],
+                                name=zone,
+                                stackgroup='one'
+                            ))
+                        fig_hr.update_layout(
+                            title=f"{y} Heart Rate Zones",
+                            xaxis_title="Month",
+                            yaxis_title="Number of Runs",
+                            height=400,
+                            showlegend=True,
+                            paper_bgcolor='rgba(0,0,0,0)',
+                            plot_bgcolor='rgba(0,0,0,0)'
+                        )
+                        st.plotly_chart(fig_hr, use_container_width=True)
 
             # 4. Distance Categories
             st.subheader("Run Distance Categories")
 
-            def calculate_distance_categories(df):
-                if df.empty:
-                    return pd.Series(), pd.Series()
-                    
-                bins = [0, 5, 10, 20, float('inf')]
-                labels = ['0-5km', '5-10km', '10-20km', '20km+']
-                df['distance_category'] = pd.cut(df['distance'], bins=bins, labels=labels)
-                counts = df.groupby('distance_category').size()
-                return counts, None  # We don't need percentages anymore
-
-            # Calculate data for both years
-            dist_cats_2024, _ = calculate_distance_categories(df_2024)
-            dist_cats_2023, _ = calculate_distance_categories(df_2023)
-
-            if not dist_cats_2024.empty and not dist_cats_2023.empty:
-                # Calculate absolute changes for the AI insight
-                absolute_changes = (dist_cats_2024 - dist_cats_2023).round(1)
-                
-                distance_cat_prompt = f"""Compare run distances between 2024 and 2023:
-                2024 Counts: {dist_cats_2024.to_dict()}
-                2023 Counts: {dist_cats_2023.to_dict()}
-                Absolute Changes: {absolute_changes.to_dict()}
-                Provide a one-line insight about the most significant changes in running distance patterns."""
-                
-                distance_cat_insight = model.generate_content(distance_cat_prompt).text
-                st.info(distance_cat_insight)
-
-                # Create horizontal stacked bar visualization
-                fig_dist_cats = go.Figure()
-                
-                # Categories colors
-                colors = ['rgb(158,202,225)', 'rgb(107,174,214)', 
-                        'rgb(66,146,198)', 'rgb(33,113,181)']
+            if compare_year is not None:
+                show_insight(insights, insight_key.format('distance_categories'), data_version, style="info")
 
-                # 2024 stacked bar
-                for i, (cat, count) in enumerate(list(dist_cats_2024.items())[::-1]):  # Reverse for bottom-to-top
-                    fig_dist_cats.add_trace(go.Bar(
-                        name=cat,
-                        y=['2024'],
-                        x=[count],
-                        text=f"{count} runs",
-                        textposition='inside',
-                        marker_color=colors[i],
-                        orientation='h',
-                        legendgroup='2024',
-                    ))
+            # Create horizontal stacked bar visualization
+            fig_dist_cats = go.Figure()
+            
+            # Categories colors
+            colors = ['rgb(158,202,225)', 'rgb(107,174,214)', 
+                    'rgb(66,146,198)', 'rgb(33,113,181)']
 
-                # 2023 stacked bar
-                for i, (cat, count) in enumerate(list(dist_cats_2023.items())[::-1]):  # Reverse for bottom-to-top
+            for y in review_years:
+                for i, (cat, count) in enumerate(list(distance_categories[y].items())[::-1]):  # Reverse for bottom-to-top
                     fig_dist_cats.add_trace(go.Bar(
                         name=cat,
-                        y=['2023'],
+                        y=[str(y)],
                         x=[count],
                         text=f"{count} runs",
                         textposition='inside',
                         marker_color=colors[i],
                         orientation='h',
-                        legendgroup='2023',
-                        showlegend=False
+                        legendgroup=str(y),
+                        showlegend=y == year
                     ))
-
-                fig_dist_cats.update_layout(
-                    barmode='stack',
-                    title="Run Distance Distribution",
-                    # xaxis_title="Number of Runs",
-                    height=300,  # Reduced height for horizontal bars
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    showlegend=True,
-                    legend=dict(
-                        title="Distance Categories",
-                        yanchor="middle",
-                        y=0.5,
-                        xanchor="right",
-                        x=1.1
-                    ),
-                    bargap=0.3,  # Increase gap between year bars
-                    uniformtext=dict(mode='hide', minsize=10),
-                    margin=dict(r=150),  # Add right margin for legend
-                    xaxis = dict(
-                        tickformat="d",
-                        title= "Number of Runs"
-                    ),
-                    yaxis = dict(
-                        ticktext = ['2024', '2023'],
-                        tickvals = [0, 1],
-                        title="2023 2024"
-                    )
-                )
-
+                
                 # Add total runs annotation
                 fig_dist_cats.add_annotation(
-                    x=sum(dist_cats_2024),
-                    y='2024',
-                    text=f"Total: {sum(dist_cats_2024)} runs",
-                    showarrow=False,
-                    xshift=10,
-                    align='left'
-                )
-                fig_dist_cats.add_annotation(
-                    x=sum(dist_cats_2023),
-                    y='2023',
-                    text=f"Total: {sum(dist_cats_2023)} runs",
+                    x=int(distance_categories[y].sum()),
+                    y=str(y),
+                    text=f"Total: {int(distance_categories[y].sum())} runs",
                     showarrow=False,
                     xshift=10,
                     align='left'
                 )
 
-                st.plotly_chart(fig_dist_cats, use_container_width=True)
-
+            fig_dist_cats.update_layout(
+                barmode='stack',
+                title="Run Distance Distribution",
+                height=300,  # Reduced height for horizontal bars
+                paper_bgcolor='rgba(0,0,0,0)',
+                plot_bgcolor='rgba(0,0,0,0)',
+                showlegend=True,
+                legend=dict(
+                    title="Distance Categories",
+                    yanchor="middle",
+                    y=0.5,
+                    xanchor="right",
+                    x=1.1
+                ),
+                bargap=0.3,  # Increase gap between year bars
+                uniformtext=dict(mode='hide', minsize=10),
+                margin=dict(r=150),  # Add right margin for legend
+                xaxis = dict(
+                    tickformat="d",
+                    title= "Number of Runs"
+                )
+            )
 
+            st.plotly_chart(fig_dist_cats, use_container_width=True)
             
             # 5. Pace Evolution
             st.subheader("Pace Evolution")
-            
-            def calculate_monthly_pace(df):
-                if df.empty:
-                    return pd.DataFrame()
-                
-                # Convert average_speed (m/s) to kmph
-                df['pace_kmh'] = df['average_speed'] * 3.6
-                df['month'] = df['start_date_ist'].dt.strftime('%b')
-                monthly_pace = df.groupby('month').agg({'pace_kmh': ['mean', 'min', 'max']}).round(2)
-                monthly_pace.columns = ['average', 'min', 'max']
-                # Fill missing months
-                all_months = [f"{i:02d}" for i in range(1, 13)]
-                return monthly_pace.reindex(all_months).fillna(0)
-
-            pace_2024 = calculate_monthly_pace(df_2024)
-            pace_2023 = calculate_monthly_pace(df_2023)
-
-            if not pace_2024.empty and not pace_2023.empty:
-                pace_prompt = f"""Compare pace evolution:
-                2024 Avg: {pace_2024['average'].mean():.1f} kmph
-                2023 Avg: {pace_2023['average'].mean():.1f} kmph
-                Provide a one-line insight about pace development in 2024 as compared to 2023."""
-                
-                pace_insight = model.generate_content(pace_prompt).text
-                st.info(pace_insight)
-                month_order = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-                fig_pace = go.Figure()
 
-                # 2024 lines (blue)
-                fig_pace.add_trace(go.Scatter(
-                    x=month_order,
-                    y=pace_2024['average'],
-                    name='2024 Average',
-                    line=dict(color='rgb(53, 138, 255)', width=3)  # Solid blue
-                ))
-                fig_pace.add_trace(go.Scatter(
-                    x=month_order,
-                    y=pace_2024['min'],
-                    name='2024 Range',
-                    line=dict(color='rgb(53, 138, 255)', width=1.5, dash='dash')  # Dashed blue
-                ))
-                fig_pace.add_trace(go.Scatter(
-                    x=month_order,
-                    y=pace_2024['max'],
-                    name='2024 Range',
-                    line=dict(color='rgb(53, 138, 255)', width=1.5, dash='dash'),  # Dashed blue
-                    showlegend=False
-                ))
+            if compare_year is not None:
+                show_insight(insights, insight_key.format('pace'), data_version, style="info")
 
-                # 2023 lines (gray)
+            fig_pace = go.Figure()
+            for y in review_years:
+                color = line_colors[y]
                 fig_pace.add_trace(go.Scatter(
                     x=month_order,
-                    y=pace_2023['average'],
-                    name='2023 Average',
-                    line=dict(color='rgb(128, 128, 128)', width=3)  # Solid gray
+                    y=monthly[y]['pace_mean'],
+                    name=f'{y} Average',
+                    line=dict(color=color, width=3)  # Solid
                 ))
                 fig_pace.add_trace(go.Scatter(
                     x=month_order,
-                    y=pace_2023['min'],
-                    name='2023 Range',
-                    line=dict(color='rgb(128, 128, 128)', width=1.5, dash='dash')  # Dashed gray
+                    y=monthly[y]['pace_min'],
+                    name=f'{y} Range',
+                    line=dict(color=color, width=1.5, dash='dash')  # Dashed
                 ))
                 fig_pace.add_trace(go.Scatter(
                     x=month_order,
-                    y=pace_2023['max'],
-                    name='2023 Range',
-                    line=dict(color='rgb(128, 128, 128)', width=1.5, dash='dash'),  # Dashed gray
+                    y=monthly[y]['pace_max'],
+                    name=f'{y} Range',
+                    line=dict(color=color, width=1.5, dash='dash'),  # Dashed
                     showlegend=False
                 ))
 
-                fig_pace.update_layout(
-                    title="Monthly Pace Trends",
-                    xaxis_title="Month",
-                    yaxis_title="Pace (km/h)",
-                    height=400,
-                    showlegend=True,
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    hovermode='x unified',
-                    legend=dict(
-                        yanchor="top",
-                        y=0.99,
-                        xanchor="right",
-                        x=0.99
-                    )
+            fig_pace.update_layout(
+                title="Monthly Pace Trends",
+                xaxis_title="Month",
+                yaxis_title="Pace (km/h)",
+                height=400,
+                showlegend=True,
+                paper_bgcolor='rgba(0,0,0,0)',
+                plot_bgcolor='rgba(0,0,0,0)',
+                hovermode='x unified',
+                legend=dict(
+                    yanchor="top",
+                    y=0.99,
+                    xanchor="right",
+                    x=0.99
                 )
+            )
 
-                # Add gridlines
-                fig_pace.update_xaxes(showgrid=True, gridwidth=1, gridcolor='rgba(128,128,128,0.2)')
-                fig_pace.update_yaxes(
-                    showgrid=True, 
-                    gridwidth=1, 
-                    gridcolor='rgba(128,128,128,0.2)',
-                    tickformat=".1f"  # One decimal place for pace
-                )
-                st.plotly_chart(fig_pace, use_container_width=True)
+            # Add gridlines
+            fig_pace.update_xaxes(showgrid=True, gridwidth=1, gridcolor='rgba(128,128,128,0.2)')
+            fig_pace.update_yaxes(
+                showgrid=True, 
+                gridwidth=1, 
+                gridcolor='rgba(128,128,128,0.2)',
+                tickformat=".1f"  # One decimal place for pace
+            )
+            st.plotly_chart(fig_pace, use_container_width=True)
 
             # 6. Elevation Mastery
             st.subheader("Elevation Mastery")
-            
-            def calculate_monthly_elevation(df):
-                if df.empty:
-                    return pd.DataFrame()
-                
-                monthly_elev = df.groupby(df['start_date_ist'].dt.strftime('%m'))\
-                               .agg({
-                                   'total_elevation_gain': ['sum', 'mean'],
-                                   'distance': 'sum'  # for elevation per km calculation
-                               }).round(2)
-                
-                monthly_elev.columns = ['total_elevation', 'avg_elevation_per_run', 'distance']
-                monthly_elev['elevation_per_km'] = (monthly_elev['total_elevation'] / 
-                                                  monthly_elev['distance']).round(2)
-                
-                all_months = [f"{i:02d}" for i in range(1, 13)]
-                return monthly_elev.reindex(all_months).fillna(0)
-
-            elev_2024 = calculate_monthly_elevation(df_2024)
-            elev_2023 = calculate_monthly_elevation(df_2023)
-
-            if not elev_2024.empty and not elev_2023.empty:
-                elev_prompt = f"""Compare elevation data:
-                2024 Total: {elev_2024['total_elevation'].sum():.0f}m
-                2023 Total: {elev_2023['total_elevation'].sum():.0f}m
-                2024 Avg/km: {(elev_2024['total_elevation'].sum() / elev_2024['distance'].sum()):.1f}m
-                2023 Avg/km: {(elev_2023['total_elevation'].sum() / elev_2023['distance'].sum()):.1f}m
-                Provide a one-line insight about elevation training."""
-                
-                elev_insight = model.generate_content(elev_prompt).text
-                st.info(elev_insight)
 
-                fig_elev = go.Figure()
-                fig_elev.add_trace(go.Bar(
-                    name='2024',
-                    x=elev_2024.index,
-                    y=elev_2024['total_elevation'],
-                    text=elev_2024['elevation_per_km'].apply(lambda x: f"{x:.1f}m/km"),
-                    textposition='auto'
-                ))
+            def elevation_per_km(month_data):
+                return (month_data['elevation_total'] / month_data['distance'].replace(0, np.nan)).fillna(0)
+
+            if compare_year is not None:
+                show_insight(insights, insight_key.format('elevation'), data_version, style="info")
+
+            fig_elev = go.Figure()
+            for y in review_years:
                 fig_elev.add_trace(go.Bar(
-                    name='2023',
-                    x=elev_2023.index,
-                    y=elev_2023['total_elevation'],
-                    text=elev_2023['elevation_per_km'].apply(lambda x: f"{x:.1f}m/km"),
+                    name=str(y),
+                    x=month_order,
+                    y=monthly[y]['elevation_total'],
+                    text=elevation_per_km(monthly[y]).apply(lambda x: f"{x:.1f}m/km"),
                     textposition='auto'
                 ))
 
-                fig_elev.update_layout(
-                    barmode='group',
-                    title="Monthly Elevation Gain",
-                    xaxis_title="Month",
-                    yaxis_title="Total Elevation Gain (meters)",
-                    height=400,
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)'
-                )
-                st.plotly_chart(fig_elev, use_container_width=True)
+            fig_elev.update_layout(
+                barmode='group',
+                title="Monthly Elevation Gain",
+                xaxis_title="Month",
+                yaxis_title="Total Elevation Gain (meters)",
+                height=400,
+                paper_bgcolor='rgba(0,0,0,0)',
+                plot_bgcolor='rgba(0,0,0,0)'
+            )
+            st.plotly_chart(fig_elev, use_container_width=True)
 
 
     except Exception as e:
         st.error(f"Error creating year review: {str(e)}")
         st.exception(e)
 
-# --- Streamlit Layout and Display ---
-def main():
-    st.set_page_config(layout="wide")
-    st.title("AI Running Coach Metrics")
+def format_pace(pace_min_km):
+    """Pace in minutes per km as m:ss."""
+    import pandas as pd
+
+    if pace_min_km is None or pd.isna(pace_min_km):
+        return "–"
+    minutes, seconds = divmod(round(pace_min_km * 60), 60)
+    return f"{minutes}:{seconds:02d}"
+
+def format_duration(seconds):
+    """Duration in seconds as h:mm:ss, or m:ss under an hour."""
+    import pandas as pd
+
+    if seconds is None or pd.isna(seconds):
+        return "–"
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+def route_summary(runs):
+    """One row per repeated route: runs, typical distance, pace range and conditions, most-run first."""
+    summary = runs.groupby('group_id').agg(
+        runs=('id', 'size'),
+        city=('city_name', lambda names: names.dropna().mode().iat[0] if names.notna().any() else None),
+        distance_km=('distance_km', 'median'),
+        best_pace=('pace_min_km', 'min'),
+        median_pace=('pace_min_km', 'median'),
+        temperature_min=('temperature', 'min'),
+        temperature_max=('temperature', 'max'),
+        last_run=('date', 'max')
+    ).sort_values(['runs', 'last_run'], ascending=False)
+    summary['label'] = [
+        f"Route {rank} · {row.city or 'Unknown'} · {row.distance_km:.1f} km · {row.runs} runs"
+        for rank, row in enumerate(summary.itertuples(), start=1)
+    ]
+    return summary
 
-    # Sidebar with title and sync button
-    
-    with st.sidebar:
-        st.title("Strava Integration")
-        
-        # Time range selection with date-based descriptions
-        time_ranges = [
-            "Today",
-            "Yesterday",
-            "Last 7 Days",
-            "Last 14 Days",
-            "Last 30 Days",
-            "Last 90 Days",
-            "Last 180 Days",
-            "This Year",
-            "Last Year"
-        ]
-        
-        selected_range = st.selectbox(
-            "Select date range to sync",
-            time_ranges,
-            index=2  # Default to "Last 7 Days"
-        )
-        
-        # Add sync button with date-based messaging
-        if st.button("🔄 Sync Data"):
-            start_date = calculate_date_for_range(selected_range)
-            with st.spinner(f"Syncing activities from {start_date.strftime('%Y-%m-%d')} to today..."):
-                success, message = sync_data(selected_range)
-                if success:
-                    st.success(message)
-                else:
-                    st.error(message)
+def create_route_comparison_tab(tab, runs):
+    """Pace against temperature and air quality on routes run repeatedly, where the route itself is held constant."""
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
 
-        # Display last sync time as date
-        conn = sqlite3.connect("ai_running_coach.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT MAX(start_date_ist) FROM strava_activities_weather")
-        last_sync = cursor.fetchone()[0]
+    with tab:
+        st.header("Route Comparisons")
+        st.caption("Runs are matched to the same route by the map cells their routes pass through. "
+                   "On a fixed route, pace differences come from conditions and fitness rather than terrain.")
+        conn = connect()
+        grouping_pending = 'route_groups' in pending_rebuilds(conn)
         conn.close()
-        
-        if last_sync:
-            last_sync_date = datetime.fromtimestamp(last_sync).date()
-            st.write(f"Last synced date: {last_sync_date.strftime('%Y-%m-%d')}")
+        if grouping_pending:
+            st.info("Runs stored before route matching was added are matched on the next sync, or now with "
+                    "`python -m runinsight rebuild-rollups`.")
+        if runs.empty:
+            st.write(f"No route has been run {MIN_ROUTE_RUNS} times yet")
+            return
+
+        runs = runs.assign(
+            pace_min_km=1000 / (runs['average_speed'] * 60),
+            distance_km=runs['distance'],
+            date=pd.to_datetime(runs['start_date_ist'], unit='s')
+        )
+        summary = route_summary(runs)
+        group_id = st.selectbox("Route", list(summary.index), format_func=lambda key: summary.at[key, 'label'],
+                                key="route_group")
+        route_runs = runs[runs['group_id'] == group_id]
+
+        cols = st.columns(3)
+        cols[0].metric("Runs", len(route_runs))
+        cols[1].metric("Best pace", format_pace(route_runs['pace_min_km'].min()))
+        cols[2].metric("Median pace", format_pace(route_runs['pace_min_km'].median()))
+
+        hover = {'date': '|%Y-%m-%d', 'distance_km': ':.2f', 'pace_min_km': ':.2f'}
+        chart_cols = st.columns(2)
+        for col, factor, color, label in [
+            (chart_cols[0], 'temperature', 'pollution_aqi', 'Temperature (°C)'),
+            (chart_cols[1], 'pollution_aqi', 'temperature', 'AQI')
+        ]:
+            measured = route_runs.dropna(subset=[factor])
+            with col:
+                if measured.empty:
+                    st.write(f"No {label.split(' (')[0].lower()} data for this route")
+                    continue
+                fig = px.scatter(measured, x=factor, y='pace_min_km', color=color, hover_data=hover,
+                                 color_continuous_scale='RdYlBu_r',
+                                 labels={factor: label, 'pace_min_km': 'Pace (min/km)', 'temperature': 'Temp (°C)',
+                                         'pollution_aqi': 'AQI', 'date': 'Date', 'distance_km': 'Distance (km)'})
+                fig.update_yaxes(autorange='reversed')
+                fig.update_layout(height=360, margin=dict(t=30, l=0, r=0, b=0))
+                st.plotly_chart(fig, use_container_width=True)
+                # Least-squares slope over this route's runs, in seconds per km
+                if measured[factor].nunique() >= 3:
+                    slope = np.polyfit(measured[factor], measured['pace_min_km'], 1)[0] * 60
+                    step = 5 if factor == 'temperature' else 1
+                    unit = "°C" if factor == 'temperature' else "AQI level"
+                    st.caption(f"≈ {slope * step:+.0f} s/km per +{step} {unit} on this route")
+
+        st.subheader("Repeated routes")
+        st.dataframe(
+            pd.DataFrame({
+                'Route': summary['label'],
+                'Best pace': summary['best_pace'].map(format_pace),
+                'Median pace': summary['median_pace'].map(format_pace),
+                'Temperature (°C)': [f"{low:.0f}–{high:.0f}" if pd.notna(low) else "–"
+                                     for low, high in zip(summary['temperature_min'], summary['temperature_max'])],
+                'Last run': summary['last_run'].dt.date
+            }),
+            hide_index=True, use_container_width=True
+        )
 
-        outlier_settings = add_outlier_settings_ui()
+def create_personal_records_tab(tab, records):
+    """Current bests, when each record was set and the fastest efforts, read from the personal records index."""
+    import pandas as pd
+    import plotly.express as px
 
-        st.divider()
-        enable_year_review = st.toggle(
-            "Enable Year Review",
-            value=False,  # Default to off
-            help="Toggle Year in Review analysis (may take longer to load)"
+    with tab:
+        st.header("Personal Records")
+        if records.empty:
+            st.write("No best efforts recorded yet")
+            return
+
+        records = records.assign(
+            date=pd.to_datetime(records['start_date'], utc=True, errors='coerce').dt.tz_localize(None),
+            pace_min_km=records['elapsed_time'] / 60 / (records['distance'] / 1000),
+            time=records['elapsed_time'].map(format_duration)
+        )
+        names = list(records.groupby('name')['distance'].min().sort_values().index)
+
+        # Each record's gain over the one it broke
+        progression = records[records['progression'] == 1].sort_values(['name', 'date'])
+        progression = progression.assign(
+            improvement=(1 - progression['elapsed_time'] / progression.groupby('name')['elapsed_time'].shift()) * 100
+        )
+        current = records[records['rank'] == 1].set_index('name').reindex(names)
+        st.dataframe(
+            pd.DataFrame({
+                'Effort': names,
+                'Best time': current['time'].values,
+                'Pace': current['pace_min_km'].map(format_pace).values,
+                'Date': current['date'].dt.date.values,
+                'City': current['city_name'].values,
+                'Records set': [int((progression['name'] == name).sum()) for name in names]
+            }),
+            hide_index=True, use_container_width=True
+        )
+
+        st.subheader("Record timeline")
+        fig = px.scatter(progression, x='date', y='name', color='improvement', color_continuous_scale='Viridis',
+                         category_orders={'name': names[::-1]},
+                         hover_data={'time': True, 'improvement': ':.1f', 'date': '|%Y-%m-%d', 'name': False},
+                         labels={'date': 'Date', 'name': 'Effort', 'time': 'Time', 'improvement': 'Improvement (%)'})
+        fig.update_traces(marker=dict(size=11))
+        fig.update_layout(height=max(300, 40 * len(names)), margin=dict(t=30, l=0, r=0, b=0))
+        st.plotly_chart(fig, use_container_width=True)
+
+        name = st.selectbox("Effort", names, key="personal_record_effort")
+        cols = st.columns(2)
+        with cols[0]:
+            st.subheader(f"{name} progression")
+            steps = progression[progression['name'] == name]
+            steps = steps.assign(minutes=steps['elapsed_time'] / 60)
+            fig = px.line(steps, x='date', y='minutes', line_shape='hv', markers=True,
+                          hover_data={'time': True, 'minutes': False, 'date': '|%Y-%m-%d'},
+                          labels={'date': 'Date', 'minutes': 'Time (min)', 'time': 'Time'})
+            fig.update_layout(height=360, margin=dict(t=30, l=0, r=0, b=0))
+            st.plotly_chart(fig, use_container_width=True)
+        with cols[1]:
+            st.subheader(f"Fastest {PR_TOP_N}")
+            top = records[(records['name'] == name) & records['rank'].notna()].sort_values('rank')
+            st.dataframe(
+                pd.DataFrame({
+                    'Rank': top['rank'].astype(int),
+                    'Time': top['time'],
+                    'Pace': top['pace_min_km'].map(format_pace),
+                    'Date': top['date'].dt.date,
+                    'Run (km)': top['activity_distance'].round(1),
+                    'City': top['city_name']
+                }),
+                hide_index=True, use_container_width=True
+            )
+
+def create_heatmap_tab(tab, athlete_id, data_version):
+    """Where the athlete runs, drawn from the heatmap tiles rendered when activities were stored."""
+    import base64
+    import plotly.graph_objects as go
+
+    with tab:
+        st.header("Heatmap")
+        conn = connect()
+        tiles_pending = 'heatmap' in pending_rebuilds(conn)
+        conn.close()
+        if tiles_pending:
+            st.info("Runs stored before the heatmap was added are drawn on the next sync, or now with "
+                    "`python -m runinsight rebuild-rollups`.")
+        areas = load_heatmap_areas(athlete_id, data_version)
+        if not areas:
+            st.write("No routes recorded yet")
+            return
+
+        cols = st.columns([3, 2])
+        area = areas[cols[0].selectbox("Area", range(len(areas)), format_func=lambda index: areas[index][2],
+                                       key="heatmap_area")]
+        zoom = cols[1].select_slider("Zoom", list(range(MIN_ZOOM, MAX_ZOOM + 1)), value=HEATMAP_DEFAULT_ZOOM,
+                                     key="heatmap_zoom")
+        tiles = load_heatmap_window(athlete_id, data_version, zoom, area[:2])
+        if not tiles:
+            st.write("No tiles rendered for this area yet")
+            return
+
+        # Tiles are placed at their pixel coordinates; y is negated so that north stays up
+        fig = go.Figure()
+        for x, y, png in tiles:
+            fig.add_layout_image(source="data:image/png;base64," + base64.b64encode(png).decode(),
+                                 xref='x', yref='y', x=x * TILE_SIZE, y=-y * TILE_SIZE,
+                                 sizex=TILE_SIZE, sizey=TILE_SIZE, xanchor='left', yanchor='top', layer='above')
+        xs, ys = [tile[0] for tile in tiles], [tile[1] for tile in tiles]
+        fig.update_xaxes(range=[min(xs) * TILE_SIZE, (max(xs) + 1) * TILE_SIZE], visible=False)
+        fig.update_yaxes(range=[-(max(ys) + 1) * TILE_SIZE, -min(ys) * TILE_SIZE], visible=False,
+                         scaleanchor='x')
+        fig.update_layout(height=700, margin=dict(t=0, l=0, r=0, b=0), plot_bgcolor='#0e1117',
+                          paper_bgcolor='#0e1117')
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption("Brighter streets were run more often. The same tiles are served by the API at "
+                   "/tiles/{z}/{x}/{y}.png, for use as a layer over any web map.")
+
+# --- Streamlit Layout and Display ---
+# Athletes whose memoized data is kept at once (per loader)
+ATHLETE_CACHE_ENTRIES = 4
+
+PAGES = [
+    "Performance Metrics",
+    "Physiological Metrics",
+    "Elevation & Cadence Metrics",
+    "Environmental Metrics",
+    "Inferred Metrics",
+    "Deeper Insights",
+    "Activity Trends",
+    "AI Analysis",
+    "Year in Review",
+    "Route Comparisons",
+    "Heatmap",
+    "Personal Records"
+]
+
+# Areas offered on the Heatmap page (its most run MIN_ZOOM tiles), the zoom it opens at, and the
+# tiles shown across and down around the most run tile
+HEATMAP_AREAS = 10
+HEATMAP_DEFAULT_ZOOM = 12
+HEATMAP_WINDOW_TILES = 7
+
+# Memoized loaders are keyed by athlete and data version: every athlete has its own cache entries
+@st.cache_data(show_spinner=False, max_entries=ATHLETE_CACHE_ENTRIES * 2)
+def load_data(athlete_id, data_version):
+    """prepare_data() on the athlete's shard, memoized per data version."""
+    from metrics import prepare_data
+
+    with use_athlete(athlete_id):
+        return prepare_data()
+
+@st.cache_data(show_spinner=False, max_entries=ATHLETE_CACHE_ENTRIES * 2)
+def load_weekly_metrics(athlete_id, data_version):
+    """Weekly metrics of the Inferred Metrics page, memoized per data version."""
+    from metrics import calculate_weekly_metrics
+
+    strava_df, split_stats_df, _ = load_data(athlete_id, data_version)
+    return calculate_weekly_metrics(strava_df, split_stats_df)
+
+@st.cache_data(show_spinner=False, max_entries=ATHLETE_CACHE_ENTRIES * 2)
+def load_route_comparisons(athlete_id, data_version):
+    """Runs of every repeated route (see route_similarity.py), memoized per data version."""
+    from metrics import fetch_data_from_db
+
+    with use_athlete(athlete_id):
+        return fetch_data_from_db(route_comparison_query())
+
+@st.cache_data(show_spinner=False, max_entries=ATHLETE_CACHE_ENTRIES * 2)
+def load_personal_records(athlete_id, data_version):
+    """Personal records index (see personal_records.py), memoized per data version."""
+    from metrics import fetch_data_from_db
+
+    with use_athlete(athlete_id):
+        return fetch_data_from_db(PERSONAL_RECORDS_QUERY)
+
+@st.cache_data(show_spinner=False, max_entries=ATHLETE_CACHE_ENTRIES * 2)
+def load_heatmap_areas(athlete_id, data_version):
+    """(x, y, label) of the most run MIN_ZOOM heatmap tiles, labelled with the city most runs there are from."""
+    with use_athlete(athlete_id):
+        conn = connect()
+        try:
+            areas = []
+            for x, y in conn.execute("SELECT x, y FROM heatmap_tiles WHERE zoom = ? ORDER BY pixels DESC LIMIT ?",
+                                     (MIN_ZOOM, HEATMAP_AREAS)).fetchall():
+                min_lat, min_lon, max_lat, max_lon = tile_bounds(MIN_ZOOM, x, y)
+                # A sample of the routes crossing the tile is enough to name the city
+                activity_ids = routes_in_bbox(conn, min_lat, min_lon, max_lat, max_lon)[:500]
+                city = conn.execute(f"""
+                    SELECT city_name FROM strava_activities_weather
+                    WHERE id IN ({', '.join('?' for _ in activity_ids)}) AND city_name IS NOT NULL
+                    GROUP BY city_name ORDER BY COUNT(*) DESC LIMIT 1
+                """, activity_ids).fetchone()
+                areas.append((x, y, f"{city[0] if city else 'Unknown'} · "
+                                    f"{(min_lat + max_lat) / 2:.2f}, {(min_lon + max_lon) / 2:.2f}"))
+            return areas
+        finally:
+            conn.close()
+
+@st.cache_data(show_spinner=False, max_entries=ATHLETE_CACHE_ENTRIES * 16)
+def load_heatmap_window(athlete_id, data_version, zoom, area):
+    """[(x, y, png)] of the stored tiles around the most run tile at `zoom` inside a MIN_ZOOM area tile."""
+    scale = 2**(zoom - MIN_ZOOM)
+    x, y = area[0] * scale, area[1] * scale
+    query = "SELECT x, y FROM heatmap_tiles WHERE zoom = ? AND x BETWEEN ? AND ? AND y BETWEEN ? AND ?"
+    with use_athlete(athlete_id):
+        conn = connect()
+        try:
+            center = conn.execute(query + " ORDER BY pixels DESC LIMIT 1",
+                                  (zoom, x, x + scale - 1, y, y + scale - 1)).fetchone()
+            if center is None:
+                return []
+            half = HEATMAP_WINDOW_TILES // 2
+            tiles = conn.execute(query, (zoom, center[0] - half, center[0] + half,
+                                         center[1] - half, center[1] + half)).fetchall()
+            tiles = [(x, y, tile_png(conn, zoom, x, y)) for x, y in tiles]
+            return [tile for tile in tiles if tile[2] is not None]
+        finally:
+            conn.close()
+
+@st.cache_data(show_spinner=False, max_entries=ATHLETE_CACHE_ENTRIES * 8)
+def load_outlier_mask(athlete_id, data_version, outlier_key):
+    """Outlier mask over all activities, computed once per data version and settings."""
+    strava_df, _, _ = load_data(athlete_id, data_version)
+    return compute_outlier_mask(strava_df, json.loads(outlier_key))
+
+@st.cache_data(show_spinner=False, max_entries=ATHLETE_CACHE_ENTRIES * 64)
+def load_metric_figure(athlete_id, data_version, as_of, metric, period, outlier_key):
+    """Activity Trends figure JSON, memoized per data version, day, metric, period and outlier settings."""
+    from metrics import get_trend_data
+
+    strava_df, _, _ = load_data(athlete_id, data_version)
+    outlier_settings = json.loads(outlier_key) if outlier_key else None
+    outlier_mask = load_outlier_mask(athlete_id, data_version, outlier_key) if outlier_settings else None
+    trend_data = get_trend_data(strava_df, metric, period, outlier_settings, outlier_mask)
+    if trend_data is None or trend_data.empty:
+        return None
+    return create_metric_chart(trend_data, metric, period).to_json()
+
+@st.cache_data(show_spinner=False, max_entries=ATHLETE_CACHE_ENTRIES * 16)
+def load_metric_grid(athlete_id, data_version, as_of, metrics, periods):
+    """Values and trends for a metrics page, memoized per data version and day (periods are relative to today)."""
+    from chart_data import reduce_chart_frame
+    from metrics import calculate_metric, calculate_percentage_change, get_previous_period, get_trend_data
+
+    strava_df, _, _ = load_data(athlete_id, data_version)
+    grid = {}
+    for metric in metrics:
+        for period in periods:
+            current_value, _, median_value, _, _ = calculate_metric(strava_df, metric, period)
+            previous_period = get_previous_period(period)
+            previous_value = calculate_metric(strava_df, metric, previous_period)[0] if previous_period else None
+            trend_data = get_trend_data(strava_df, metric, period)
+            if not trend_data.empty:
+                trend_data, _ = reduce_chart_frame(trend_data, how='sum' if metric == "Distance" else 'mean')
+            grid[(metric, period)] = (current_value, median_value, previous_value,
+                                      calculate_percentage_change(current_value, previous_value), trend_data)
+    return grid
+
+def add_performance_panel(recorder):
+    """Flame-style breakdown of the spans recorded while the page rendered, with Prometheus export."""
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    st.subheader("⏱️ Performance")
+    rows = recorder.rows()
+    if rows:
+        # Each block's width is its own time plus its children's; the page is the root at the bottom
+        fig = go.Figure(go.Icicle(
+            ids=[" / ".join(row['path']) for row in rows],
+            parents=[" / ".join(row['path'][:-1]) for row in rows],
+            labels=[row['name'] for row in rows],
+            values=[row['self_seconds'] for row in rows],
+            branchvalues='remainder',
+            tiling=dict(orientation='v', flip='y'),
+            customdata=[[row['calls'], row['seconds']] for row in rows],
+            hovertemplate="%{label}<br>%{customdata[1]:.3f}s in %{customdata[0]} calls<extra></extra>"
+        ))
+        fig.update_layout(height=320, margin=dict(t=10, l=0, r=0, b=0))
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(
+            pd.DataFrame({
+                'Span': ["\u2003" * row['depth'] + row['name'] for row in rows],
+                'Calls': [row['calls'] for row in rows],
+                'Seconds': [round(row['seconds'], 3) for row in rows],
+                'Self': [round(row['self_seconds'], 3) for row in rows]
+            }),
+            hide_index=True, use_container_width=True
         )
+    for name, value in sorted(recorder.counters.items()):
+        st.caption(f"{name}: {value}")
+    st.download_button("Prometheus metrics", prometheus_text(), file_name="runinsight.prom", mime="text/plain")
+
+def add_sync_telemetry(run):
+    """Sidebar summary of the last sync run stored in sync_runs."""
+    import pandas as pd
+
+    with st.expander("📡 Last sync"):
+        finished = datetime.fromtimestamp(run['finished_at']).strftime('%Y-%m-%d %H:%M')
+        st.caption(f"{run['kind']} · {run['status']} · {finished} · "
+                   f"{run['finished_at'] - run['started_at']:.1f}s")
+        if run['error']:
+            st.caption(f"⚠️ {run['error']}")
+        cache_total = (run['cache_hits'] or 0) + (run['cache_misses'] or 0)
+        col1, col2 = st.columns(2)
+        col1.metric("Activities/min", f"{run['activities_per_minute']:.1f}" if run['activities_per_minute'] else "–")
+        col2.metric("Requests", run['requests'])
+        col1.metric("Retries", run['retries'])
+        col2.metric("Received", f"{(run['bytes_received'] or 0) / 2**20:.2f} MiB")
+        col1.metric("Cache hit rate", f"{run['cache_hits'] / cache_total:.0%}" if cache_total else "–")
+        if run['stages']:
+            st.dataframe(
+                pd.DataFrame({
+                    'Stage': list(run['stages']),
+                    'Count': [stage['count'] for stage in run['stages'].values()],
+                    'Mean s': [stage['mean'] for stage in run['stages'].values()],
+                    'p50 ≤': [stage['p50'] for stage in run['stages'].values()],
+                    'p95 ≤': [stage['p95'] for stage in run['stages'].values()]
+                }),
+                hide_index=True, use_container_width=True
+            )
+
+def render_page(page, athlete_id, outlier_settings):
+    """Renders the selected section with the current athlete's data."""
+    from metrics import COMPARISON_PERIODS
+
+    # AI sections are read from storage; missing or stale ones are regenerated in the background
+    conn = connect()
+    data_version = get_data_version(conn)
+    insights = load_insights(conn, 'section:')
+    conn.close()
+    strava_df, split_stats_df, best_efforts_df = load_data(athlete_id, data_version)
+    if any(insights.get(f"section:{key}", (None, None))[1] != data_version for key in SECTION_KEYS):
+        enqueue_insight_job('sections', generate_section_insights, get_model())
+
+    # Activities flagged by the current outlier settings, shared by every chart that filters
+    if outlier_settings['enable_filtering']:
+        outlier_mask = load_outlier_mask(athlete_id, data_version, settings_key(outlier_settings))
+        flagged = int((~outlier_mask).sum())
+        st.sidebar.caption(f"{flagged} of {len(outlier_mask)} activities flagged as outliers")
+        if outlier_settings['mode'] != 'manual':
+            bounds = outlier_thresholds(strava_df, outlier_settings)
+            st.sidebar.caption(" · ".join(
+                f"{key.replace('_', ' ')}: {b['min']:.1f}–{b['max']:.1f}" for key, b in bounds.items()
+            ))
 
-    strava_df, splits_df, best_efforts_df = prepare_data()
-    filtered_strava_df = filter_outliers(strava_df, outlier_settings)
-
-    comparison_periods = ["Last 7 Days", "Last 30 Days", "Last 90 Days", "Year-to-Date", "Last Year", "Overall"]
-    tabs = st.tabs([
-        "Performance Metrics", 
-        "Physiological Metrics", 
-        "Elevation & Cadence Metrics", 
-        "Environmental Metrics", 
-        "Inferred Metrics", 
-        "Deeper Insights", 
-        "Activity Trends", 
-        "AI Analysis",
-        "2024 Year in Review"
-    ])
-
-    with tabs[0]: # Performance Metrics
+    comparison_periods = COMPARISON_PERIODS
+
+    if page == "Performance Metrics":
         st.header("Performance Metrics")
         metrics = ["Distance", "Average Pace"]
+        metric_grid = load_metric_grid(athlete_id, data_version, date.today(), tuple(metrics), tuple(comparison_periods))
         for metric in metrics:
             st.subheader(metric)
             cols = st.columns(len(comparison_periods), gap="medium")
             for i, period in enumerate(comparison_periods):
                 with cols[i]:
-                    current_value, _, median_value, _, _ = calculate_metric(strava_df, metric, period)
-                    previous_period = get_previous_period(period)
-                    previous_value, _, previous_median_value, _, _ = calculate_metric(strava_df, metric, previous_period) if previous_period else (None, None, None, None, None)
-                    percentage_change = calculate_percentage_change(current_value, previous_value)
+                    current_value, median_value, previous_value, percentage_change, trend_data = metric_grid[(metric, period)]
                     
                     if metric == "Average Pace" and current_value is not None:
                         current_value = f"{int(current_value // 1)}:{int((current_value % 1) * 60):02d}"
@@ -2308,23 +1996,20 @@ def main():
                         st.metric(label=period, value="N/A")
                         st.caption("Avg: N/A, Median: N/A")
                     
-                    trend_data = get_trend_data(strava_df, metric, period)
                     if not trend_data.empty:
                         st.line_chart(trend_data, height=200)
-        add_metrics_analysis(strava_df, None, "Performance Metrics")
+        add_metrics_analysis(strava_df, None, "Performance Metrics", insights, data_version)
 
-    with tabs[1]: # Physiological Metrics
+    elif page == "Physiological Metrics":
         st.header("Physiological Metrics")
         metrics = ["Average Heart Rate", "Calories Burned", "Suffer Score"]
+        metric_grid = load_metric_grid(athlete_id, data_version, date.today(), tuple(metrics), tuple(comparison_periods))
         for metric in metrics:
             st.subheader(metric)
             cols = st.columns(len(comparison_periods), gap="medium")
             for i, period in enumerate(comparison_periods):
                 with cols[i]:
-                    current_value, _, median_value, _, _ = calculate_metric(strava_df, metric, period)
-                    previous_period = get_previous_period(period)
-                    previous_value, _, previous_median_value, _, _ = calculate_metric(strava_df, metric, previous_period) if previous_period else (None, None, None, None, None)
-                    percentage_change = calculate_percentage_change(current_value, previous_value)
+                    current_value, median_value, previous_value, percentage_change, trend_data = metric_grid[(metric, period)]
                     
                     if current_value is not None:
                         st.metric(label=period, value=f"{current_value:.2f}", delta=f"{percentage_change:.2f}%" if percentage_change is not None else None)
@@ -2333,23 +2018,20 @@ def main():
                         st.metric(label=period, value="N/A")
                         st.caption("Avg: N/A, Median: N/A")
                     
-                    trend_data = get_trend_data(strava_df, metric, period)
                     if not trend_data.empty:
                         st.line_chart(trend_data, height=200)
-        add_metrics_analysis(strava_df, None, "Physiological Metrics")
+        add_metrics_analysis(strava_df, None, "Physiological Metrics", insights, data_version)
 
-    with tabs[2]: # Elevation & Cadence Metrics
+    elif page == "Elevation & Cadence Metrics":
         st.header("Elevation & Cadence Metrics")
         metrics = ["Total Elevation Gain", "Average Cadence"]
+        metric_grid = load_metric_grid(athlete_id, data_version, date.today(), tuple(metrics), tuple(comparison_periods))
         for metric in metrics:
             st.subheader(metric)
             cols = st.columns(len(comparison_periods), gap="medium")
             for i, period in enumerate(comparison_periods):
                 with cols[i]:
-                    current_value, _, median_value, _, _ = calculate_metric(strava_df, metric, period)
-                    previous_period = get_previous_period(period)
-                    previous_value, _, previous_median_value, _, _ = calculate_metric(strava_df, metric, previous_period) if previous_period else (None, None, None, None, None)
-                    percentage_change = calculate_percentage_change(current_value, previous_value)
+                    current_value, median_value, previous_value, percentage_change, trend_data = metric_grid[(metric, period)]
                     
                     if current_value is not None:
                         st.metric(label=period, value=f"{current_value:.2f}", delta=f"{percentage_change:.2f}%" if percentage_change is not None else None)
@@ -2358,24 +2040,21 @@ def main():
                         st.metric(label=period, value="N/A")
                         st.caption("Avg: N/A, Median: N/A")
                     
-                    trend_data = get_trend_data(strava_df, metric, period)
                     if not trend_data.empty:
                         st.line_chart(trend_data, height=200)
-        add_metrics_analysis(strava_df, None, "Elevation & Cadence")
+        add_metrics_analysis(strava_df, None, "Elevation & Cadence", insights, data_version)
 
 
-    with tabs[3]: # Environmental Metrics
+    elif page == "Environmental Metrics":
         st.header("Environmental Metrics")
         metrics = ["Temperature", "Feels Like Temperature", "Humidity", "Pollution PM2.5", "Pollution AQI"]
+        metric_grid = load_metric_grid(athlete_id, data_version, date.today(), tuple(metrics), tuple(comparison_periods))
         for metric in metrics:
             st.subheader(metric)
             cols = st.columns(len(comparison_periods), gap="medium")
             for i, period in enumerate(comparison_periods):
                 with cols[i]:
-                    current_value, _, median_value, _, _ = calculate_metric(strava_df, metric, period)
-                    previous_period = get_previous_period(period)
-                    previous_value, _, previous_median_value, _, _ = calculate_metric(strava_df, metric, previous_period) if previous_period else (None, None, None, None, None)
-                    percentage_change = calculate_percentage_change(current_value, previous_value)
+                    current_value, median_value, previous_value, percentage_change, trend_data = metric_grid[(metric, period)]
                     
                     if current_value is not None:
                         st.metric(label=period, value=f"{current_value:.2f}", delta=f"{percentage_change:.2f}%" if percentage_change is not None else None)
@@ -2384,16 +2063,14 @@ def main():
                         st.metric(label=period, value="N/A")
                         st.caption("Avg: N/A, Median: N/A")
                     
-                    trend_data = get_trend_data(strava_df, metric, period)
                     if not trend_data.empty:
                         st.line_chart(trend_data, height=200)
-        add_metrics_analysis(strava_df, None, "Environmental Metrics")
+        add_metrics_analysis(strava_df, None, "Environmental Metrics", insights, data_version)
     
-    with tabs[4]:  # Inferred Metrics
+    elif page == "Inferred Metrics":
         st.header("Inferred Metrics")
         
-        # Calculate all weekly metrics at once
-        weekly_pace_var, weekly_hr_zones, weekly_runs, weekly_gap = calculate_weekly_metrics(strava_df, splits_df)
+        weekly_pace_var, weekly_hr_zones, weekly_runs, weekly_gap = load_weekly_metrics(athlete_id, data_version)
         
         # 1. Pace Variation Trend
         st.subheader("Weekly Pace Variation Trend")
@@ -2443,33 +2120,121 @@ def main():
         
         st.divider()
         st.subheader("🤖 AI Analysis")
-        with st.spinner("Generating analysis..."):
-            inferred_prompt = f"""Analyze the runner's derived metrics:
-            - Pace Variability Trend
-            - Heart Rate Zone Distribution
-            - Weekly Running Consistency
-            - Grade Adjusted Pace
-
-            Provide insights about training consistency and adaptations."""
-            
-            try:
-                response = model.generate_content(inferred_prompt)
-                st.markdown(response.text)
-            except Exception as e:
-                st.error(f"Error generating analysis: {e}")
+        show_insight(insights, 'section:inferred', data_version)
 
-    with tabs[5]:  # Combined Metrics
-        add_combined_metrics_tab(tabs[5], strava_df)
+    elif page == "Deeper Insights":
+        add_combined_metrics_tab(st.container(), strava_df)
 
-    with tabs[6]:  # Trends
-        create_activity_trends_tab(tabs[6], strava_df, outlier_settings)
+    elif page == "Activity Trends":
+        create_activity_trends_tab(st.container(), data_version, outlier_settings)
 
-    with tabs[7]:  # AI Analysis tab
-        create_ai_analysis_tab(tabs[7], strava_df)
+    elif page == "AI Analysis":
+        create_ai_analysis_tab(st.container(), insights, data_version)
     
-    if enable_year_review and len(tabs) > 8:  # Check if tab exists
-        with tabs[8]:
-            create_year_review_tab(tabs[8], strava_df, model)
+    elif page == "Year in Review":
+        create_year_review_tab(st.container(), strava_df)
+
+    elif page == "Route Comparisons":
+        create_route_comparison_tab(st.container(), load_route_comparisons(athlete_id, data_version))
+
+    elif page == "Heatmap":
+        create_heatmap_tab(st.container(), athlete_id, data_version)
+
+    elif page == "Personal Records":
+        create_personal_records_tab(st.container(), load_personal_records(athlete_id, data_version))
+
+def main():
+    import pandas as pd
+
+    st.set_page_config(layout="wide")
+    st.title("AI Running Coach Metrics")
+
+    # Sidebar with title and sync button
+    
+    with st.sidebar:
+        st.title("Strava Integration")
+
+        # Registered athletes each have their own database; without a registry the single database is used
+        athletes = list_athletes()
+        athlete_id = None
+        if athletes:
+            names = dict(athletes)
+            athlete_id = st.selectbox("Athlete", list(names), format_func=lambda key: names[key] or key,
+                                      key="athlete")
+        set_current_athlete(athlete_id)
+        ensure_schema(athlete_id)
+        
+        # Time range selection with date-based descriptions
+        time_ranges = [
+            "Today",
+            "Yesterday",
+            "Last 7 Days",
+            "Last 14 Days",
+            "Last 30 Days",
+            "Last 90 Days",
+            "Last 180 Days",
+            "This Year",
+            "Last Year"
+        ]
+        
+        selected_range = st.selectbox(
+            "Select date range to sync",
+            time_ranges,
+            index=2  # Default to "Last 7 Days"
+        )
+        
+        # Add sync button with date-based messaging
+        if st.button("🔄 Sync Data"):
+            start_date = calculate_date_for_range(selected_range)
+            with st.spinner(f"Syncing activities from {start_date.strftime('%Y-%m-%d')} to today..."):
+                success, message = sync_data(selected_range)
+                if success:
+                    st.success(message)
+                else:
+                    st.error(message)
+
+        # Display last sync time as date
+        conn = connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(start_date_ist) FROM strava_activities_weather")
+        last_sync = cursor.fetchone()[0]
+        sync_run = last_sync_run(conn)
+        conn.close()
+        
+        if last_sync:
+            last_sync_date = datetime.fromtimestamp(last_sync).date()
+            st.write(f"Last synced date: {last_sync_date.strftime('%Y-%m-%d')}")
+        if sync_run:
+            add_sync_telemetry(sync_run)
+
+        outlier_settings = add_outlier_settings_ui()
+
+        show_performance = st.checkbox("Show performance panel", key="show_performance",
+                                       help="Where the time of this run went: SQL, pandas, charts and AI calls")
+
+        # Filled in once the selected page has rendered
+        timings_placeholder = st.empty()
+
+    # Only the selected page runs; its data is memoized per data version
+    page = st.radio("Section", PAGES, horizontal=True, key="page", label_visibility="collapsed")
+    # Spans recorded while the page renders feed the Performance panel
+    page_started = time.perf_counter()
+    with collect() as recorder, timed(page):
+        render_page(page, athlete_id, outlier_settings)
+
+    # Per-section timings for this session
+    elapsed = time.perf_counter() - page_started
+    print(f"[UI] {page} rendered in {elapsed:.2f}s")
+    timings = st.session_state.setdefault('section_timings', {})
+    timings[page] = elapsed
+    with timings_placeholder.container():
+        with st.expander("⏱️ Section timings"):
+            st.dataframe(
+                pd.DataFrame({'Section': list(timings), 'Seconds': [round(t, 2) for t in timings.values()]}),
+                hide_index=True, use_container_width=True
+            )
+        if show_performance:
+            add_performance_panel(recorder)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
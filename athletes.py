@@ -0,0 +1,70 @@
+import os, sqlite3, time
+
+from database import ATHLETE_ID_PATTERN, shard_path
+
+
+# Central registry of athletes and their Strava credentials; activity data lives in per-athlete shards
+REGISTRY_DATABASE = "athletes.db"
+
+def _connect(database):
+    conn = sqlite3.connect(database)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS athletes (
+            athlete_id TEXT PRIMARY KEY,
+            name TEXT,
+            refresh_token TEXT,
+            created_at REAL,
+            updated_at REAL
+        )
+    """)
+    return conn
+
+def register_athlete(athlete_id, name, refresh_token, database=REGISTRY_DATABASE):
+    """Adds an athlete, or updates the name and refresh token of a registered one."""
+    athlete_id = str(athlete_id)
+    if not ATHLETE_ID_PATTERN.match(athlete_id):
+        raise ValueError(f"Invalid athlete id '{athlete_id}': use letters, digits, '_' or '-'")
+    now = time.time()
+    conn = _connect(database)
+    conn.execute("""
+        INSERT INTO athletes (athlete_id, name, refresh_token, created_at, updated_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (athlete_id) DO UPDATE SET
+            name = excluded.name, refresh_token = excluded.refresh_token, updated_at = excluded.updated_at
+    """, (athlete_id, name, refresh_token, now, now))
+    conn.commit()
+    conn.close()
+
+def remove_athlete(athlete_id, database=REGISTRY_DATABASE):
+    """Removes an athlete from the registry; the shard file is left in place."""
+    conn = _connect(database)
+    conn.execute("DELETE FROM athletes WHERE athlete_id = ?", (str(athlete_id),))
+    conn.commit()
+    conn.close()
+
+def update_refresh_token(athlete_id, refresh_token, database=REGISTRY_DATABASE):
+    """Stores the refresh token Strava rotated during authentication."""
+    conn = _connect(database)
+    conn.execute("UPDATE athletes SET refresh_token = ?, updated_at = ? WHERE athlete_id = ?",
+                 (refresh_token, time.time(), str(athlete_id)))
+    conn.commit()
+    conn.close()
+
+def get_athlete(athlete_id, database=REGISTRY_DATABASE):
+    """Returns the athlete as a dict (athlete_id, name, refresh_token, shard). Raises KeyError if unknown."""
+    conn = _connect(database)
+    row = conn.execute("SELECT athlete_id, name, refresh_token FROM athletes WHERE athlete_id = ?",
+                       (str(athlete_id),)).fetchone()
+    conn.close()
+    if row is None:
+        raise KeyError(f"Unknown athlete '{athlete_id}'")
+    return {**dict(row), 'shard': shard_path(row['athlete_id'])}
+
+def list_athletes(database=REGISTRY_DATABASE):
+    """Returns every registered athlete as (athlete_id, name), ordered by name."""
+    if not os.path.exists(database):
+        return []
+    conn = _connect(database)
+    rows = conn.execute("SELECT athlete_id, name FROM athletes ORDER BY name, athlete_id").fetchall()
+    conn.close()
+    return [(row['athlete_id'], row['name']) for row in rows]
@@ -0,0 +1,167 @@
+"""Synthetic dataset generator for the benchmarks.
+
+Writes a database with the app's schema holding `count` runs with splits, best efforts, weather and
+pollution, then rebuilds every rollup, the route tables and the heatmap tiles, so the result looks like a
+database filled by syncing.
+
+    python benchmarks/generate_dataset.py COUNT OUTPUT_DB [--seed N]
+"""
+import argparse, functools, math, os, random, sys, time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from database import (ACTIVITY_INSERT, BEST_EFFORT_INSERT, SPLIT_INSERT, activity_rows, connect,  # noqa: E402
+                      create_database_and_tables, rebuild_rollups)
+from heatmap import rebuild_heatmap  # noqa: E402
+from route_similarity import rebuild_route_groups  # noqa: E402
+from routes import COORDINATE_SCALE, encode_polyline, rebuild_routes  # noqa: E402
+
+
+# Runs are spread over at most this many days before today (several runs a day for the large sizes)
+MAX_SPAN_DAYS = 10 * 365
+
+# Activities buffered in memory between bulk inserts
+INSERT_BATCH = 5000
+
+# Cities runs start from, as (name, latitude, longitude, typical temperature in °C)
+CITIES = [
+    ("Bengaluru", 12.97, 77.59, 24), ("Chennai", 13.08, 80.27, 30), ("Mumbai", 19.07, 72.87, 29),
+    ("Delhi", 28.61, 77.21, 26), ("Pune", 18.52, 73.86, 25)
+]
+
+CITY_CENTERS = {name: (latitude, longitude) for name, latitude, longitude, _ in CITIES}
+
+# Standard best effort distances in meters
+BEST_EFFORTS = [("400m", 400), ("1/2 mile", 805), ("1k", 1000), ("1 mile", 1609), ("2 mile", 3219), ("5k", 5000),
+                ("10k", 10000), ("15k", 15000), ("10 mile", 16093), ("20k", 20000), ("Half-Marathon", 21097)]
+
+# Loops run repeatedly from each city, as radii in meters; a run follows one of them with GPS noise
+LOOP_RADII_M = [600, 900, 1200, 1500, 2000, 2600]
+
+# Points of a loop's summary polyline, and the GPS noise added to each of them in meters
+LOOP_POINTS = 48
+GPS_NOISE_M = 8
+
+@functools.lru_cache(maxsize=None)
+def city_loops(city, latitude, longitude):
+    """The city's loops, each a list of (latitude, longitude) degrees; fixed per city."""
+    rng = random.Random(city)
+    loops = []
+    for radius in LOOP_RADII_M:
+        center_lat, center_lon = latitude + rng.uniform(-0.04, 0.04), longitude + rng.uniform(-0.04, 0.04)
+        wobble = [rng.uniform(0.8, 1.2) for _ in range(4)]
+        loops.append([
+            (center_lat + radius * wobble[k % 4] * math.sin(2 * math.pi * k / LOOP_POINTS) / 111320,
+             center_lon + radius * wobble[k % 4] * math.cos(2 * math.pi * k / LOOP_POINTS)
+             / (111320 * math.cos(math.radians(center_lat))))
+            for k in range(LOOP_POINTS + 1)
+        ])
+    return loops
+
+def synthetic_polyline(activity_id, city):
+    """Summary polyline of one of the city's loops; a separate generator keeps the other columns unchanged."""
+    rng = random.Random(activity_id)
+    noise = GPS_NOISE_M / 111320
+    loop = rng.choice(city_loops(city, *CITY_CENTERS[city]))
+    return encode_polyline([(round((lat + rng.gauss(0, noise)) * COORDINATE_SCALE),
+                             round((lon + rng.gauss(0, noise)) * COORDINATE_SCALE)) for lat, lon in loop])
+
+def synthetic_activity(activity_id, start, rng):
+    """Returns (activity, weather_data, air_pollution_data, city_name) shaped like the Strava and OpenWeatherMap responses."""
+    city, latitude, longitude, base_temperature = rng.choice(CITIES)
+    distance = rng.lognormvariate(math.log(8000), 0.45)
+    speed = rng.gauss(3.0, 0.3) + (distance < 6000) * 0.15
+    heartrate = rng.gauss(148, 8)
+    elapsed_time = distance / speed
+
+    splits = []
+    for k in range(int(distance // 1000)):
+        split_speed = speed * rng.uniform(0.93, 1.07)
+        splits.append(SimpleNamespace(
+            split=k + 1, distance=1000.0, elapsed_time=1000 / split_speed * rng.uniform(1.0, 1.05),
+            average_speed=split_speed, elevation_difference=rng.gauss(0, 4), moving_time=1000 / split_speed,
+            average_heartrate=heartrate + k * rng.uniform(0.5, 1.5),
+            average_grade_adjusted_speed=split_speed * rng.uniform(0.97, 1.03)
+        ))
+    best_efforts = [
+        SimpleNamespace(name=name, distance=effort_distance,
+                        elapsed_time=effort_distance / (speed * rng.uniform(1.0, 1.08)), start_date=start)
+        for name, effort_distance in BEST_EFFORTS if effort_distance <= distance
+    ]
+
+    activity = SimpleNamespace(
+        id=activity_id, type="Run", start_date=start, start_date_local=(start + timedelta(hours=5, minutes=30)),
+        timezone="(GMT+05:30) Asia/Kolkata", distance=distance, elapsed_time=elapsed_time,
+        moving_time=elapsed_time * rng.uniform(0.95, 1.0), average_speed=speed, max_speed=speed * rng.uniform(1.2, 1.5),
+        average_heartrate=heartrate, max_heartrate=heartrate + rng.uniform(10, 30),
+        suffer_score=int(elapsed_time / 60 * rng.uniform(0.5, 2)), calories=distance / 1000 * rng.uniform(60, 75),
+        total_elevation_gain=rng.uniform(0, 15) * distance / 1000, average_cadence=rng.gauss(84, 3),
+        start_latlng=SimpleNamespace(lat=latitude + rng.uniform(-0.05, 0.05), lon=longitude + rng.uniform(-0.05, 0.05)),
+        map=SimpleNamespace(summary_polyline=synthetic_polyline(activity_id, city)), gear_id="g1",
+        device_name="Synthetic",
+        splits_metric=splits, best_efforts=best_efforts
+    )
+
+    temperature = base_temperature + 6 * math.sin((start.timetuple().tm_yday - 80) / 365 * 2 * math.pi) + rng.gauss(0, 2)
+    aqi = rng.randint(1, 5)
+    weather_data = {"data": [{"temp": temperature, "feels_like": temperature + rng.uniform(0, 4),
+                              "humidity": rng.uniform(30, 95), "weather": [{"description": "clear sky"}]}]}
+    air_pollution_data = {"list": [{"dt": int(start.timestamp()), "main": {"aqi": aqi},
+                                    "components": {name: rng.uniform(1, 40) * aqi for name in
+                                                   ("pm2_5", "co", "no", "no2", "o3", "so2", "pm10", "nh3")}}]}
+    return activity, weather_data, air_pollution_data, city
+
+def synthetic_activities(count, seed=0, first_id=1, end=None):
+    """Yields `count` synthetic (activity, weather_data, air_pollution_data, city_name), oldest first, up to `end`."""
+    rng = random.Random(seed)
+    end = end or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    span = min(count, MAX_SPAN_DAYS) * 86400
+    offsets = sorted(rng.uniform(0, span) for _ in range(count))
+    for index, offset in enumerate(offsets):
+        start = end - timedelta(seconds=span - offset) + timedelta(hours=rng.choice([0, 1, 2, 12, 13]))
+        yield synthetic_activity(first_id + index, start, rng)
+
+def day_timestamp(start):
+    return int(datetime.combine(start.date(), datetime.min.time()).timestamp())
+
+def generate_database(path, count, seed=0):
+    """Creates `path` with `count` synthetic runs and rebuilt rollups; an existing file is replaced."""
+    if os.path.exists(path):
+        os.remove(path)
+    create_database_and_tables(path)
+
+    conn = connect(path)
+    counts = {'activities': 0, 'splits': 0, 'best_efforts': 0}
+    batch = []
+    for index, (activity, weather_data, air_pollution_data, city_name) in enumerate(synthetic_activities(count, seed)):
+        batch.append(activity_rows(activity, weather_data, air_pollution_data, city_name,
+                                   day_timestamp(activity.start_date)))
+        if len(batch) == INSERT_BATCH or index == count - 1:
+            conn.executemany(ACTIVITY_INSERT, [activity_row for activity_row, _, _ in batch])
+            conn.executemany(SPLIT_INSERT, [row for _, split_rows, _ in batch for row in split_rows])
+            conn.executemany(BEST_EFFORT_INSERT, [row for _, _, effort_rows in batch for row in effort_rows])
+            counts['activities'] += len(batch)
+            counts['splits'] += sum(len(split_rows) for _, split_rows, _ in batch)
+            counts['best_efforts'] += sum(len(effort_rows) for _, _, effort_rows in batch)
+            batch = []
+    conn.commit()
+    rebuild_rollups(conn)
+    rebuild_routes(conn)
+    rebuild_route_groups(conn)
+    rebuild_heatmap(conn)
+    conn.close()
+    return counts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic RunInsight database.")
+    parser.add_argument('count', type=int, help="number of runs")
+    parser.add_argument('output', help="database file to create")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = generate_database(args.output, args.count, args.seed)
+    print(f"[Benchmark] Wrote {counts} to {args.output} in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,200 @@
+"""Benchmarks of the analytics hot paths at several dataset sizes.
+
+Generates (once, cached under benchmarks/data/) a synthetic database per size, then times each hot path
+(best and median of --repeat runs) and measures its peak traced memory in a separate run. Results are
+written as JSON; pass an earlier result file as --baseline to compare, in which case the script exits 1
+when a benchmark got slower than the tolerance.
+
+    python benchmarks/run_benchmarks.py [--sizes 1000 10000 100000] [--repeat 3] [--output PATH]
+                                        [--baseline PATH] [--only NAME ...]
+"""
+import argparse, contextlib, json, os, platform, shutil, statistics, subprocess, sys, tempfile, time, tracemalloc
+from datetime import datetime, timezone
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_ROOT)
+# The hot paths log every stored activity; only warnings and errors are shown during a run
+os.environ.setdefault("RUNINSIGHT_LOG_LEVEL", "WARNING")
+
+from database import DATABASE_NAME, connect, use_athlete  # noqa: E402
+from generate_dataset import day_timestamp, generate_database, synthetic_activities  # noqa: E402
+
+
+# Dataset sizes (number of runs) benchmarked by default
+BENCHMARK_SIZES = [1000, 10000, 100000]
+
+# Generated databases are cached here, one directory per size and seed
+DATA_DIR = os.path.join(BENCHMARK_DIR, "data")
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+
+# New runs stored by the insert_strava_data benchmark (on a copy of the dataset)
+INSERT_SAMPLE = 20
+
+# Slowdown relative to the baseline above which a benchmark counts as a regression
+REGRESSION_TOLERANCE = 0.2
+
+# Differences smaller than this are timer noise and never count as a regression
+REGRESSION_MIN_SECONDS = 0.01
+
+@contextlib.contextmanager
+def in_directory(path):
+    """The hot paths read the current database (DATABASE_NAME in the working directory)."""
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        with use_athlete(None):
+            yield
+    finally:
+        os.chdir(cwd)
+
+def dataset_directory(size, seed, regenerate=False):
+    directory = os.path.join(DATA_DIR, f"{size}-seed{seed}")
+    path = os.path.join(directory, DATABASE_NAME)
+    if regenerate or not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        started = time.perf_counter()
+        counts = generate_database(path, size, seed)
+        print(f"[Benchmark] Generated {counts} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return directory
+
+def benchmark_cases(size, seed):
+    """Returns {name: (setup, run)}; setup() returns the argument passed to run(), and is not timed."""
+    from metrics import (COMPARISON_PERIODS, METRIC_NAMES, calculate_environmental_impact, calculate_metric,
+                         calculate_weekly_metrics, get_trend_data, prepare_data)
+    from database import insert_strava_data
+
+    def loaded():
+        strava_df, split_stats_df, _ = prepare_data()
+        return strava_df, split_stats_df
+
+    def all_metrics(frames):
+        for metric in METRIC_NAMES:
+            for period in COMPARISON_PERIODS:
+                calculate_metric(frames[0], metric, period)
+
+    def all_trends(frames):
+        for metric in METRIC_NAMES:
+            get_trend_data(frames[0], metric, "Overall")
+
+    def fresh_copy():
+        directory = tempfile.mkdtemp(prefix="runinsight-bench-")
+        shutil.copy(DATABASE_NAME, directory)
+        activities = list(synthetic_activities(INSERT_SAMPLE, seed + 1, first_id=size + 1))
+        return directory, activities
+
+    def insert(prepared):
+        directory, activities = prepared
+        conn = connect(os.path.join(directory, DATABASE_NAME))
+        try:
+            for activity, weather_data, air_pollution_data, city_name in activities:
+                insert_strava_data(conn, activity, weather_data, air_pollution_data, city_name,
+                                   day_timestamp(activity.start_date))
+        finally:
+            conn.close()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        'prepare_data': (lambda: None, lambda _: prepare_data()),
+        'calculate_metric': (loaded, all_metrics),
+        'get_trend_data': (loaded, all_trends),
+        'calculate_weekly_metrics': (loaded, lambda frames: calculate_weekly_metrics(*frames)),
+        'calculate_environmental_impact': (loaded, lambda frames: calculate_environmental_impact(frames[0])),
+        'insert_strava_data': (fresh_copy, insert)
+    }
+
+def measure(setup, run, repeat):
+    """Best and median seconds over `repeat` runs, then the peak traced memory of one more run."""
+    timings = []
+    for _ in range(repeat):
+        argument = setup()
+        started = time.perf_counter()
+        run(argument)
+        timings.append(time.perf_counter() - started)
+
+    argument = setup()
+    tracemalloc.start()
+    try:
+        run(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'seconds_best': round(min(timings), 6),
+        'seconds_median': round(statistics.median(timings), 6),
+        'peak_memory_bytes': peak
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(sizes=BENCHMARK_SIZES, repeat=3, seed=0, only=None, regenerate=False):
+    results = {}
+    for size in sizes:
+        directory = dataset_directory(size, seed, regenerate)
+        results[str(size)] = {}
+        with in_directory(directory):
+            for name, (setup, run) in benchmark_cases(size, seed).items():
+                if only and name not in only:
+                    continue
+                result = measure(setup, run, repeat)
+                results[str(size)][name] = result
+                print(f"[Benchmark] {size:>7} {name:<32} {result['seconds_best'] * 1000:10.1f} ms "
+                      f"{result['peak_memory_bytes'] / 2**20:8.1f} MiB", file=sys.stderr)
+    return {
+        'commit': git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'seed': seed,
+        'results': results
+    }
+
+def compare(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Prints the time ratio of each benchmark against the baseline and returns the regressed ones."""
+    regressions = []
+    for size, cases in report['results'].items():
+        for name, result in cases.items():
+            previous = baseline['results'].get(size, {}).get(name)
+            if not previous or not previous['seconds_best']:
+                continue
+            ratio = result['seconds_best'] / previous['seconds_best']
+            memory_ratio = result['peak_memory_bytes'] / max(previous['peak_memory_bytes'], 1)
+            slower = result['seconds_best'] - previous['seconds_best'] > REGRESSION_MIN_SECONDS
+            flag = " REGRESSION" if ratio > 1 + tolerance and slower else ""
+            print(f"[Benchmark] {size:>7} {name:<32} time x{ratio:5.2f}  memory x{memory_ratio:5.2f}{flag}",
+                  file=sys.stderr)
+            if flag:
+                regressions.append(f"{size}/{name}")
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the RunInsight analytics hot paths.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=BENCHMARK_SIZES, help="dataset sizes (runs)")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per benchmark")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic datasets")
+    parser.add_argument('--only', nargs='+', metavar='NAME', help="run only these benchmarks")
+    parser.add_argument('--regenerate', action='store_true', help="regenerate the cached datasets")
+    parser.add_argument('--output', help="result file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument('--baseline', help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.repeat, args.seed, args.only, args.regenerate)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"[Benchmark] Results written to {output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f))
+        if regressions:
+            print(f"[Benchmark] Slower than baseline: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+
+# Charts never send more points than this to the browser
+MAX_CHART_POINTS = 200
+
+# (minimum span in days, pandas rule, label): long spans are resampled before any downsampling
+RESAMPLE_RULES = [
+    (3 * 365, 'MS', 'monthly'),
+    (365, 'W', 'weekly')
+]
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: indices of `threshold` points that preserve the shape of (x, y).
+
+    The first and last points are always kept. Each middle bucket keeps the point forming the largest
+    triangle with the previously kept point and the mean of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # Bucket boundaries for the n - 2 middle points, computed in integers so the last edge is exactly n - 1
+    bounds = (np.arange(threshold - 1) * (n - 2)) // (threshold - 2) + 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        next_hi = bounds[i + 2] if i + 2 < threshold - 1 else n
+        avg_x = x[hi:next_hi].mean()
+        avg_y = y[hi:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+def reduce_chart_frame(frame, how='mean', max_points=MAX_CHART_POINTS):
+    """Reduces a daily, datetime-indexed frame for plotting.
+
+    Spans over a year are resampled to weekly (over three years, monthly) resolution, aggregating the
+    first column with `how` and any other columns with the mean. If more than max_points rows remain,
+    LTTB on the first column picks the rows kept for every column.
+    Returns (frame, resolution) where resolution is 'daily', 'weekly' or 'monthly'.
+    """
+    frame = frame[frame.iloc[:, 0].notna()] if not frame.empty else frame
+    if frame.empty:
+        return frame, 'daily'
+
+    resolution = 'daily'
+    span_days = (frame.index.max() - frame.index.min()).days
+    for min_span, rule, label in RESAMPLE_RULES:
+        if span_days > min_span:
+            aggregations = {col: (how if idx == 0 else 'mean') for idx, col in enumerate(frame.columns)}
+            frame = frame.resample(rule).agg(aggregations)
+            # Empty weeks/months are gaps, not zeros
+            frame = frame[frame.iloc[:, 0].notna() & (frame.iloc[:, 0] != 0)]
+            resolution = label
+            break
+
+    if len(frame) > max_points:
+        x = frame.index.asi8 if isinstance(frame.index, pd.DatetimeIndex) else np.arange(len(frame))
+        frame = frame.iloc[lttb_indices(x, frame.iloc[:, 0].to_numpy(), max_points)]
+    return frame, resolution
@@ -1,11 +1,60 @@
-import sqlite3, time
+import contextvars, os, re, sqlite3, time
+from contextlib import contextmanager
+from env_stats import rebuild_env_stats, update_env_stats
+from logs import get_logger
+from personal_records import rebuild_personal_records, update_personal_records
+from location_clusters import METRIC_COLUMNS as LOCATION_METRIC_COLUMNS, rebuild_location_clusters, update_location_clusters
+from time_of_day import METRIC_COLUMNS as TIME_OF_DAY_METRIC_COLUMNS, local_start_epoch, rebuild_time_of_day_stats, update_time_of_day_stats
 
 
 DATABASE_NAME = "ai_running_coach.db"
 
-def create_database_and_tables():
-    """Creates the SQLite database and tables if they don't exist."""
-    conn = sqlite3.connect(DATABASE_NAME)
+logger = get_logger("database")
+
+# One SQLite shard per registered athlete (see athletes.py); every table, rollup and cache lives in the shard
+ATHLETE_SHARD_DIR = "athletes"
+ATHLETE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# Athlete whose shard connect() opens; None selects the single-athlete database (DATABASE_NAME)
+current_athlete = contextvars.ContextVar("current_athlete", default=None)
+
+def shard_path(athlete_id):
+    """Path of an athlete's shard."""
+    if not ATHLETE_ID_PATTERN.match(str(athlete_id)):
+        raise ValueError(f"Invalid athlete id '{athlete_id}'")
+    return os.path.join(ATHLETE_SHARD_DIR, f"{athlete_id}.db")
+
+def database_path(athlete_id=None):
+    """Database file of the given athlete, else of the current athlete, else the single-athlete database."""
+    athlete_id = athlete_id if athlete_id is not None else current_athlete.get()
+    return DATABASE_NAME if athlete_id is None else shard_path(athlete_id)
+
+def connect(database=None):
+    """Opens `database`, or the current athlete's database when None."""
+    database = database or database_path()
+    directory = os.path.dirname(database)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return sqlite3.connect(database)
+
+def set_current_athlete(athlete_id):
+    """Routes connect() in this context (thread or script run) to the athlete's shard."""
+    if athlete_id is not None:
+        shard_path(athlete_id)
+    return current_athlete.set(athlete_id)
+
+@contextmanager
+def use_athlete(athlete_id):
+    """Routes connect() to the athlete's shard inside the block."""
+    token = set_current_athlete(athlete_id)
+    try:
+        yield
+    finally:
+        current_athlete.reset(token)
+
+def create_database_and_tables(database=None):
+    """Creates the SQLite database and tables if they don't exist (in `database`, else the current one)."""
+    conn = connect(database)
     cursor = conn.cursor()
 
     # Create combined strava_activities_weather table
@@ -46,9 +95,21 @@ def create_database_and_tables():
             pollution_pm10,   
             pollution_nh3,    
             city_name,        
-            start_date_ist    
+            start_date_ist,
+            start_epoch_local INTEGER
         )
     """)
+
+    # Databases created before start_epoch_local existed get the column added and backfilled
+    cursor.execute("PRAGMA table_info(strava_activities_weather)")
+    if "start_epoch_local" not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE strava_activities_weather ADD COLUMN start_epoch_local INTEGER")
+        cursor.execute("SELECT id, start_date_local, start_date, timezone FROM strava_activities_weather")
+        cursor.executemany(
+            "UPDATE strava_activities_weather SET start_epoch_local = ? WHERE id = ?",
+            [(local_start_epoch(local, start, tz), activity_id) for activity_id, local, start, tz in cursor.fetchall()]
+        )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activities_start_epoch_local ON strava_activities_weather (start_epoch_local)")
     
     # Create splits_data table
     cursor.execute("""
@@ -80,15 +141,434 @@ def create_database_and_tables():
         )
     """)
 
+    # Create split_stats table (per-activity split aggregates, see refresh_split_stats)
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'split_stats'")
+    backfill_split_stats = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS split_stats (
+            activity_id INTEGER PRIMARY KEY,
+            split_count INTEGER,
+            pace_mean REAL,
+            pace_variance REAL,
+            gap_count INTEGER,
+            gap_speed_mean REAL,
+            gap_pace_mean REAL,
+            gap_pace_variance REAL,
+            hr_first_half REAL,
+            hr_second_half REAL,
+            hr_drift REAL,
+            FOREIGN KEY (activity_id) REFERENCES strava_activities_weather(id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_splits_data_activity ON splits_data (activity_id, split)")
+
+    # Create environmental running statistics tables (see env_stats.py)
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'env_running_stats'")
+    backfill_env_stats = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS env_running_stats (
+            factor TEXT,
+            metric TEXT,
+            n INTEGER,
+            mean_x REAL,
+            mean_y REAL,
+            m2_x REAL,
+            m2_y REAL,
+            c_xy REAL,
+            min_x REAL,
+            max_x REAL,
+            min_y REAL,
+            max_y REAL,
+            PRIMARY KEY (factor, metric)
+        )
+    """)
+    # Pace and conditions of every run, indexed by pace; optimal conditions read the fastest fraction of it
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS env_fastest_runs (
+            activity_id INTEGER PRIMARY KEY,
+            pace_min_km REAL,
+            temperature REAL,
+            humidity REAL,
+            pollution_aqi REAL,
+            pollution_pm25 REAL,
+            FOREIGN KEY (activity_id) REFERENCES strava_activities_weather(id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_env_fastest_runs_pace ON env_fastest_runs (pace_min_km)")
+
+    # Create location clustering tables: a grid index of start points plus per-cluster aggregates
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'location_points'")
+    backfill_location_clusters = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS location_clusters (
+            cluster_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            label TEXT,
+            centroid_lat REAL,
+            centroid_lon REAL,
+            n_points INTEGER
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS location_points (
+            activity_id INTEGER PRIMARY KEY,
+            latitude REAL,
+            longitude REAL,
+            grid_lat INTEGER,
+            grid_lon INTEGER,
+            cluster_id INTEGER,
+            FOREIGN KEY (activity_id) REFERENCES strava_activities_weather(id),
+            FOREIGN KEY (cluster_id) REFERENCES location_clusters(cluster_id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_location_points_grid ON location_points (grid_lat, grid_lon)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_location_points_cluster ON location_points (cluster_id)")
+    metric_columns = ",\n            ".join(
+        f"{col}_sum REAL, {col}_count INTEGER" for col in LOCATION_METRIC_COLUMNS
+    )
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS location_cluster_stats (
+            cluster_id INTEGER,
+            year INTEGER,
+            runs INTEGER,
+            {metric_columns},
+            PRIMARY KEY (cluster_id, year),
+            FOREIGN KEY (cluster_id) REFERENCES location_clusters(cluster_id)
+        )
+    """)
+
+    # Create time of day aggregates per (time slot, month)
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'time_of_day_stats'")
+    backfill_time_of_day_stats = cursor.fetchone() is None
+    metric_columns = ",\n            ".join(
+        f"{col}_sum REAL, {col}_count INTEGER" for col in TIME_OF_DAY_METRIC_COLUMNS
+    )
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS time_of_day_stats (
+            time_slot TEXT,
+            month TEXT,
+            runs INTEGER,
+            {metric_columns},
+            PRIMARY KEY (time_slot, month)
+        )
+    """)
+
+    # Create Year in Review summary tables (see year_review.py)
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'year_summary'")
+    backfill_year_summaries = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS year_summary (
+            year INTEGER PRIMARY KEY,
+            runs INTEGER,
+            total_distance REAL,
+            avg_speed_kmh REAL,
+            avg_heartrate REAL,
+            total_elevation REAL,
+            max_heartrate REAL,
+            active_weeks INTEGER,
+            avg_runs_per_week REAL,
+            common_days TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS year_monthly (
+            year INTEGER,
+            month INTEGER,
+            runs INTEGER,
+            distance REAL,
+            cumulative_distance REAL,
+            elevation_total REAL,
+            elevation_per_run REAL,
+            pace_mean REAL,
+            pace_min REAL,
+            pace_max REAL,
+            PRIMARY KEY (year, month)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS year_hr_zones (
+            year INTEGER,
+            month INTEGER,
+            zone TEXT,
+            runs INTEGER,
+            PRIMARY KEY (year, month, zone)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS year_distance_categories (
+            year INTEGER,
+            category TEXT,
+            runs INTEGER,
+            PRIMARY KEY (year, category)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS year_calendar (
+            year INTEGER,
+            month INTEGER,
+            week INTEGER,
+            runs INTEGER,
+            PRIMARY KEY (year, month, week)
+        )
+    """)
+
+    # Persistent cache of LLM responses keyed by a hash of model and prompt
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            response TEXT,
+            created_at REAL,
+            last_accessed REAL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_accessed ON llm_cache (last_accessed)")
+
+    # Latency and token counts of every LLM call that reached a backend
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS llm_calls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            called_at REAL,
+            backend TEXT,
+            model TEXT,
+            latency_seconds REAL,
+            prompt_tokens INTEGER,
+            response_tokens INTEGER,
+            error TEXT
+        )
+    """)
+
+    # Single-row counter bumped whenever activity data changes; derived artefacts are stamped with it
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER,
+            updated_at REAL
+        )
+    """)
+
+    # AI insights generated in the background, stamped with the data version they describe
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ai_insights (
+            key TEXT PRIMARY KEY,
+            data_version INTEGER,
+            content TEXT,
+            generated_at REAL
+        )
+    """)
+
+    # Decoded routes (see routes.py): int32 E7 points as blobs, with bounding boxes in an R*Tree
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'routes'")
+    backfill_routes = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS routes (
+            activity_id INTEGER PRIMARY KEY,
+            n_points INTEGER,
+            min_lat INTEGER,
+            min_lon INTEGER,
+            max_lat INTEGER,
+            max_lon INTEGER,
+            points BLOB,
+            FOREIGN KEY (activity_id) REFERENCES strava_activities_weather(id)
+        )
+    """)
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS routes_bbox USING rtree_i32 (
+                activity_id, min_lat, max_lat, min_lon, max_lon
+            )
+        """)
+    except sqlite3.OperationalError:
+        # SQLite built without R*Tree support: a plain table with a B-tree index answers the same queries
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS routes_bbox (
+                activity_id INTEGER PRIMARY KEY,
+                min_lat INTEGER,
+                max_lat INTEGER,
+                min_lon INTEGER,
+                max_lon INTEGER
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_routes_bbox ON routes_bbox (min_lat, max_lat, min_lon, max_lon)")
+
+    # Rollups too slow to build while the schema is checked at startup, left to the next sync or
+    # `runinsight rebuild-rollups` (see run_pending_rebuilds)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pending_rebuilds (
+            name TEXT PRIMARY KEY
+        )
+    """)
+
+    # Repeated-route detection (see route_similarity.py): MinHash signatures, their LSH buckets and route groups
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'route_signatures'")
+    backfill_route_groups = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS route_groups (
+            group_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_activity_id INTEGER,
+            n_runs INTEGER
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS route_signatures (
+            activity_id INTEGER PRIMARY KEY,
+            signature BLOB,
+            group_id INTEGER,
+            similarity REAL,
+            FOREIGN KEY (activity_id) REFERENCES strava_activities_weather(id),
+            FOREIGN KEY (group_id) REFERENCES route_groups(group_id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_route_signatures_group ON route_signatures (group_id)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS route_lsh (
+            band INTEGER,
+            bucket INTEGER,
+            start_date TEXT,
+            activity_id INTEGER,
+            PRIMARY KEY (band, bucket, start_date, activity_id)
+        ) WITHOUT ROWID
+    """)
+
+    # Heatmap tile pyramid (see heatmap.py): count arrays and PNGs live on disk, indexed here per tile,
+    # with the activities already rasterized into them
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'heatmap_activities'")
+    backfill_heatmap = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS heatmap_tiles (
+            zoom INTEGER,
+            x INTEGER,
+            y INTEGER,
+            pixels INTEGER,
+            max_count INTEGER,
+            PRIMARY KEY (zoom, x, y)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS heatmap_activities (
+            activity_id INTEGER PRIMARY KEY,
+            FOREIGN KEY (activity_id) REFERENCES strava_activities_weather(id)
+        )
+    """)
+
+    # Personal records index (see personal_records.py): the fastest efforts of each best effort name, ranked,
+    # and the efforts that were records when run
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'personal_records'")
+    backfill_personal_records = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS personal_records (
+            effort_id INTEGER PRIMARY KEY,
+            name TEXT,
+            activity_id INTEGER,
+            distance REAL,
+            elapsed_time REAL,
+            start_date TEXT,
+            rank INTEGER,
+            progression INTEGER,
+            FOREIGN KEY (effort_id) REFERENCES best_efforts_data(id),
+            FOREIGN KEY (activity_id) REFERENCES strava_activities_weather(id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_personal_records_rank ON personal_records (name, rank)")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_personal_records_progression
+        ON personal_records (name, start_date, effort_id) WHERE progression = 1
+    """)
+
+    # Telemetry of every sync and weather backfill (see sync.sync_telemetry); stages and counters are JSON
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT,
+            started_at REAL,
+            finished_at REAL,
+            status TEXT,
+            error TEXT,
+            activities_listed INTEGER,
+            activities_processed INTEGER,
+            activities_per_minute REAL,
+            requests INTEGER,
+            retries INTEGER,
+            bytes_received INTEGER,
+            cache_hits INTEGER,
+            cache_misses INTEGER,
+            stages TEXT,
+            counters TEXT
+        )
+    """)
+
     conn.commit()
+    if backfill_split_stats:
+        refresh_split_stats(conn)
+    if backfill_env_stats:
+        rebuild_env_stats(conn)
+    if backfill_location_clusters:
+        rebuild_location_clusters(conn)
+    if backfill_time_of_day_stats:
+        rebuild_time_of_day_stats(conn)
+    if backfill_routes:
+        from routes import rebuild_routes
+        rebuild_routes(conn)
+    if backfill_route_groups:
+        # Grouping every stored route takes seconds per thousand runs; only flagged here
+        conn.execute("""
+            INSERT OR IGNORE INTO pending_rebuilds (name) SELECT 'route_groups' WHERE EXISTS (SELECT 1 FROM routes)
+        """)
+        conn.commit()
+    if backfill_heatmap:
+        # Rasterizing every stored route at five zooms is as slow; flagged the same way
+        conn.execute("""
+            INSERT OR IGNORE INTO pending_rebuilds (name) SELECT 'heatmap' WHERE EXISTS (SELECT 1 FROM routes)
+        """)
+        conn.commit()
+    if backfill_personal_records:
+        rebuild_personal_records(conn)
+    if backfill_year_summaries:
+        from year_review import refresh_year_summaries
+        refresh_year_summaries(conn)
     conn.close()
 
-def insert_strava_data(conn, activity, weather_data, air_pollution_data, city_name, ist_timestamp):
-    """Inserts Strava activity and weather data into the database."""
-    cursor = conn.cursor()
-    print(f"[DB] Processing activity {activity.id}")
+# Weather and pollution columns of strava_activities_weather, in table order (see weather_columns)
+WEATHER_COLUMNS = [
+    'temperature', 'feels_like', 'humidity', 'weather_conditions', 'pollution_aqi', 'pollution_pm25',
+    'pollution_co', 'pollution_no', 'pollution_no2', 'pollution_o3', 'pollution_so2', 'pollution_pm10',
+    'pollution_nh3'
+]
 
-    # Insert into strava_activities_weather table
+def weather_columns(start_date, weather_data, air_pollution_data):
+    """Values for WEATHER_COLUMNS from the OpenWeatherMap responses (all None unless both are present).
+
+    Pollution values come from the reading closest to the activity start.
+    """
+    if not (weather_data and air_pollution_data):
+        return (None,) * len(WEATHER_COLUMNS)
+
+    closest_pollution_data = None
+    if "list" in air_pollution_data and air_pollution_data["list"]:
+        timestamp = time.mktime(start_date.timetuple())
+        closest_time_diff = float('inf')
+        for item in air_pollution_data["list"]:
+            time_diff = abs(item["dt"] - int(timestamp))
+            if time_diff < closest_time_diff:
+                closest_time_diff = time_diff
+                closest_pollution_data = item
+
+    current = weather_data["data"][0] if "data" in weather_data and weather_data["data"] else None
+    components = closest_pollution_data.get("components") if closest_pollution_data else None
+    return (
+        current["temp"] if current else None,
+        current["feels_like"] if current else None,
+        current["humidity"] if current else None,
+        current["weather"][0]["description"] if current and "weather" in current else None,
+        closest_pollution_data["main"]["aqi"] if closest_pollution_data else None,
+        *(components[name] if components else None for name in ("pm2_5", "co", "no", "no2", "o3", "so2", "pm10", "nh3"))
+    )
+
+def activity_rows(activity, weather_data, air_pollution_data, city_name, ist_timestamp):
+    """Rows of an activity for strava_activities_weather, splits_data and best_efforts_data.
+
+    Returns (activity row, split rows, best effort rows) in the column order of ACTIVITY_INSERT,
+    SPLIT_INSERT and BEST_EFFORT_INSERT.
+    """
     if activity.start_latlng:
         start_latitude = activity.start_latlng.lat
         start_longitude = activity.start_latlng.lon
@@ -100,160 +580,294 @@ def insert_strava_data(conn, activity, weather_data, air_pollution_data, city_na
         start_date_local = activity.start_date_local.isoformat() if activity.start_date_local else None
     else:
         start_date_local = None
+    start_epoch_local = local_start_epoch(
+        start_date_local,
+        activity.start_date.isoformat() if activity.start_date else None,
+        activity.timezone
+    )
     
-    if weather_data and air_pollution_data:
-        closest_pollution_data = None
-        if "list" in air_pollution_data and air_pollution_data["list"]:
-            timestamp = time.mktime(activity.start_date.timetuple())
-            closest_time_diff = float('inf')
-            for item in air_pollution_data["list"]:
-                time_diff = abs(item["dt"] - int(timestamp))
-                if time_diff < closest_time_diff:
-                    closest_time_diff = time_diff
-                    closest_pollution_data = item
-        
-        strava_weather_data = (
+    strava_weather_data = (
+        activity.id,
+        activity.start_date.isoformat() if activity.start_date else None,
+        start_date_local,
+        float(activity.distance) / 1000 if activity.distance else None,
+        float(activity.elapsed_time) if activity.elapsed_time else None,
+        float(activity.moving_time) if activity.moving_time else None,
+        activity.max_heartrate,
+        activity.average_heartrate,
+        activity.suffer_score,
+        activity.calories,
+        activity.map.summary_polyline if activity.map else None,
+        activity.total_elevation_gain,
+        activity.average_speed,
+        activity.max_speed,
+        activity.average_cadence,
+        str(activity.type),
+        start_latitude,
+        start_longitude,
+        activity.timezone,
+        activity.gear_id,
+        activity.device_name,
+        *weather_columns(activity.start_date, weather_data, air_pollution_data),
+        city_name,
+        ist_timestamp,
+        start_epoch_local
+    )
+
+    splits_data = [
+        (
             activity.id,
-            activity.start_date.isoformat() if activity.start_date else None,
-            start_date_local,
-            float(activity.distance) / 1000 if activity.distance else None,
-            float(activity.elapsed_time) if activity.elapsed_time else None,
-            float(activity.moving_time) if activity.moving_time else None,
-            activity.max_heartrate,
-            activity.average_heartrate,
-            activity.suffer_score,
-            activity.calories,
-            activity.map.summary_polyline if activity.map else None,
-            activity.total_elevation_gain,
-            activity.average_speed,
-            activity.max_speed,
-            activity.average_cadence,
-            str(activity.type),
-            start_latitude,
-            start_longitude,
-            activity.timezone,
-            activity.gear_id,
-            activity.device_name,
-            weather_data["data"][0]["temp"] if weather_data and "data" in weather_data and weather_data["data"] else None,
-            weather_data["data"][0]["feels_like"] if weather_data and "data" in weather_data and weather_data["data"] else None,
-            weather_data["data"][0]["humidity"] if weather_data and "data" in weather_data and weather_data["data"] else None,
-            weather_data["data"][0]["weather"][0]["description"] if weather_data and "data" in weather_data and weather_data["data"] and "weather" in weather_data["data"][0] else None,
-            closest_pollution_data["main"]["aqi"] if closest_pollution_data else None,
-            closest_pollution_data["components"]["pm2_5"] if closest_pollution_data and "components" in closest_pollution_data else None,
-            closest_pollution_data["components"]["co"] if closest_pollution_data and "components" in closest_pollution_data else None,
-            closest_pollution_data["components"]["no"] if closest_pollution_data and "components" in closest_pollution_data else None,
-            closest_pollution_data["components"]["no2"] if closest_pollution_data and "components" in closest_pollution_data else None,
-            closest_pollution_data["components"]["o3"] if closest_pollution_data and "components" in closest_pollution_data else None,
-            closest_pollution_data["components"]["so2"] if closest_pollution_data and "components" in closest_pollution_data else None,
-            closest_pollution_data["components"]["pm10"] if closest_pollution_data and "components" in closest_pollution_data else None,
-            closest_pollution_data["components"]["nh3"] if closest_pollution_data and "components" in closest_pollution_data else None,
-            city_name,
-            ist_timestamp
+            split.split,
+            split.distance,
+            split.elapsed_time,
+            split.average_speed,
+            split.elevation_difference,
+            split.moving_time,
+            split.average_heartrate,
+            split.average_grade_adjusted_speed
         )
-    else:
-        strava_weather_data = (
+        for split in activity.splits_metric or []
+    ]
+
+    best_efforts_data = [
+        (
             activity.id,
-            activity.start_date.isoformat() if activity.start_date else None,
-            start_date_local,
-            float(activity.distance) / 1000 if activity.distance else None,
-            float(activity.elapsed_time) if activity.elapsed_time else None,
-            float(activity.moving_time) if activity.moving_time else None,
-            activity.max_heartrate,
-            activity.average_heartrate,
-            activity.suffer_score,
-            activity.calories,
-            activity.map.summary_polyline if activity.map else None,
-            activity.total_elevation_gain,
-            activity.average_speed,
-            activity.max_speed,
-            activity.average_cadence,
-            str(activity.type),
-            start_latitude,
-            start_longitude,
-            activity.timezone,
-            activity.gear_id,
-            activity.device_name,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            city_name,
-            ist_timestamp
+            effort.name,
+            effort.distance,
+            effort.elapsed_time,
+            effort.start_date.isoformat() if effort.start_date else None
         )
+        for effort in activity.best_efforts or []
+    ]
+    return strava_weather_data, splits_data, best_efforts_data
+
+ACTIVITY_INSERT = """
+    INSERT INTO strava_activities_weather (
+    id, start_date, start_date_local, distance, elapsed_time,
+    moving_time, max_heartrate, average_heartrate, suffer_score,
+    calories, map_summary_polyline, total_elevation_gain,
+    average_speed, max_speed, average_cadence, type,
+    start_latitude, start_longitude, timezone, gear_id,
+    device_name, temperature, feels_like, humidity,
+    weather_conditions, pollution_aqi, pollution_pm25,
+    pollution_co, pollution_no, pollution_no2, pollution_o3,
+    pollution_so2, pollution_pm10, pollution_nh3, city_name,
+    start_date_ist, start_epoch_local
+) VALUES (
+    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+)
+"""
+
+SPLIT_INSERT = """
+    INSERT INTO splits_data (activity_id, split, distance, elapsed_time, average_speed, elevation_difference, moving_time, average_heartrate, average_grade_adjusted_speed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
+BEST_EFFORT_INSERT = """
+    INSERT INTO best_efforts_data (activity_id, name, distance, elapsed_time, start_date) VALUES (?, ?, ?, ?, ?)
+"""
+
+def insert_strava_data(conn, activity, weather_data, air_pollution_data, city_name, ist_timestamp):
+    """Inserts Strava activity and weather data into the database."""
+    # NumPy is only needed once an activity is stored
+    from heatmap import update_heatmap
+    from route_similarity import update_route_group
+    from routes import update_route
+
+    cursor = conn.cursor()
+    logger.info(f"[DB] Processing activity {activity.id}")
+
+    strava_weather_data, splits_data, best_efforts_data = activity_rows(
+        activity, weather_data, air_pollution_data, city_name, ist_timestamp
+    )
+
+    # Insert into strava_activities_weather table
     try:
-        cursor.execute("""
-                INSERT INTO strava_activities_weather (
-                id, start_date, start_date_local, distance, elapsed_time,
-                moving_time, max_heartrate, average_heartrate, suffer_score,
-                calories, map_summary_polyline, total_elevation_gain,
-                average_speed, max_speed, average_cadence, type,
-                start_latitude, start_longitude, timezone, gear_id,
-                device_name, temperature, feels_like, humidity,
-                weather_conditions, pollution_aqi, pollution_pm25,
-                pollution_co, pollution_no, pollution_no2, pollution_o3,
-                pollution_so2, pollution_pm10, pollution_nh3, city_name,
-                start_date_ist
-            ) VALUES (
-                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
-            )
-        """, strava_weather_data)
+        cursor.execute(ACTIVITY_INSERT, strava_weather_data)
         conn.commit()
-        print(f"[DB] Saved activity {activity.id} with weather data")
+        logger.info(f"[DB] Saved activity {activity.id} with weather data")
     except Exception as e:
-        print(f"[DB] Error saving activity {activity.id}: {e}")
+        logger.error(f"[DB] Error saving activity {activity.id}: {e}")
         conn.rollback()
     
     # Insert into splits_data table
-    if activity.splits_metric:
-        print(f"[DB] Processing splits for activity {activity.id}")
-        for split in activity.splits_metric:
-            splits_data = (
-                activity.id,
-                split.split,
-                split.distance,
-                split.elapsed_time,
-                split.average_speed,
-                split.elevation_difference,
-                split.moving_time,
-                split.average_heartrate,
-                split.average_grade_adjusted_speed
-            )
-            cursor.execute("""
-                INSERT INTO splits_data (activity_id, split, distance, elapsed_time, average_speed, elevation_difference, moving_time, average_heartrate, average_grade_adjusted_speed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, splits_data)
+    if splits_data:
+        logger.info(f"[DB] Processing splits for activity {activity.id}")
+        for row in splits_data:
+            cursor.execute(SPLIT_INSERT, row)
             conn.commit()
     
     # Insert into best_efforts_data table
-    if activity.best_efforts:
-        print(f"[DB] Processing best efforts for activity {activity.id}")
-        for effort in activity.best_efforts:
-            best_efforts_data = (
-                activity.id,
-                effort.name,
-                effort.distance,
-                effort.elapsed_time,
-                effort.start_date.isoformat() if effort.start_date else None
-            )
-            cursor.execute("""
-                INSERT INTO best_efforts_data (activity_id, name, distance, elapsed_time, start_date) VALUES (?, ?, ?, ?, ?)
-            """, best_efforts_data)
+    if best_efforts_data:
+        logger.info(f"[DB] Processing best efforts for activity {activity.id}")
+        for row in best_efforts_data:
+            cursor.execute(BEST_EFFORT_INSERT, row)
             conn.commit()
-    print(f"[DB] Completed processing activity {activity.id}")
+
+    refresh_split_stats(conn, [activity.id])
+    update_personal_records(conn, activity.id)
+    update_env_stats(conn, activity.id)
+    update_location_clusters(conn, activity.id)
+    update_time_of_day_stats(conn, activity.id)
+    update_route(conn, activity.id)
+    update_route_group(conn, activity.id)
+    update_heatmap(conn, activity.id)
+    bump_data_version(conn)
+    logger.info(f"[DB] Completed processing activity {activity.id}")
+
+def activities_missing_weather(conn, limit=None):
+    """Returns (id, start_date, start_latitude, start_longitude, elapsed_time) of located activities without weather."""
+    query = """
+        SELECT id, start_date, start_latitude, start_longitude, elapsed_time
+        FROM strava_activities_weather
+        WHERE start_latitude IS NOT NULL AND start_longitude IS NOT NULL AND temperature IS NULL
+        ORDER BY start_date DESC
+    """
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    return conn.execute(query).fetchall()
+
+def update_activity_weather(conn, activity_id, start_date, weather_data, air_pollution_data, city_name):
+    """Stores weather, pollution and city name for an already stored activity.
+
+    Rollups that depend on weather are not touched; run rebuild_rollups once the backfill is done.
+    """
+    values = weather_columns(start_date, weather_data, air_pollution_data)
+    assignments = ", ".join(f"{column} = ?" for column in WEATHER_COLUMNS)
+    conn.execute(
+        f"UPDATE strava_activities_weather SET {assignments}, city_name = COALESCE(?, city_name) WHERE id = ?",
+        (*values, city_name, activity_id)
+    )
+    conn.commit()
+
+def pending_rebuilds(conn):
+    """Names of the rollups create_database_and_tables left for the next sync or rebuild-rollups."""
+    return [row[0] for row in conn.execute("SELECT name FROM pending_rebuilds ORDER BY name")]
+
+def run_pending_rebuilds(conn):
+    """Builds the rollups create_database_and_tables flagged in pending_rebuilds. Returns their names."""
+    from heatmap import rebuild_heatmap
+    from route_similarity import rebuild_route_groups
+
+    rebuilds = {'heatmap': rebuild_heatmap, 'route_groups': rebuild_route_groups}
+    pending = pending_rebuilds(conn)
+    for name in pending:
+        logger.info(f"[DB] Building {name} for the stored activities")
+        rebuilds[name](conn)
+        conn.execute("DELETE FROM pending_rebuilds WHERE name = ?", (name,))
+        conn.commit()
+    return pending
+
+def rebuild_rollups(conn):
+    """Recomputes every derived table (split stats, personal records, environment, locations, time of day, year
+    summaries, route groups, heatmap).
+
+    Routes only depend on the polylines and are kept up to date at insert time.
+    """
+    from heatmap import rebuild_heatmap
+    from route_similarity import rebuild_route_groups
+    from year_review import refresh_year_summaries
+
+    conn.execute("DELETE FROM split_stats")
+    refresh_split_stats(conn)
+    rebuild_personal_records(conn)
+    rebuild_env_stats(conn)
+    rebuild_location_clusters(conn)
+    rebuild_time_of_day_stats(conn)
+    refresh_year_summaries(conn)
+    rebuild_route_groups(conn)
+    rebuild_heatmap(conn)
+    conn.execute("DELETE FROM pending_rebuilds WHERE name IN ('route_groups', 'heatmap')")
+    bump_data_version(conn)
+
+def get_data_version(conn):
+    """Returns the current data version (0 before any activity was stored)."""
+    try:
+        row = conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+def bump_data_version(conn):
+    """Marks activity data as changed."""
+    conn.execute("""
+        INSERT INTO data_version (id, version, updated_at) VALUES (1, 1, ?)
+        ON CONFLICT (id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at
+    """, (time.time(),))
+    conn.commit()
+
+# Per-activity split aggregates computed inside SQLite. Pace is elapsed_time / distance
+# (seconds per meter) and grade adjusted pace is 1000 / average_grade_adjusted_speed
+# (seconds per km). Variances are sample variances; HR drift is the percentage change in
+# average heart rate from the first half of the splits to the second half.
+SPLIT_STATS_QUERY = """
+    WITH paced AS (
+        SELECT
+            activity_id,
+            split,
+            average_heartrate,
+            CASE WHEN distance > 0 THEN elapsed_time / distance END AS pace,
+            CASE WHEN average_grade_adjusted_speed > 0 THEN average_grade_adjusted_speed END AS gap_speed,
+            CASE WHEN average_grade_adjusted_speed > 0 THEN 1000.0 / average_grade_adjusted_speed END AS gap_pace
+        FROM splits_data
+        WHERE {where}
+    ),
+    ranked AS (
+        SELECT
+            paced.*,
+            ROW_NUMBER() OVER (PARTITION BY activity_id ORDER BY split) AS split_rank,
+            COUNT(*) OVER (PARTITION BY activity_id) AS split_count,
+            AVG(pace) OVER (PARTITION BY activity_id) AS pace_mean,
+            AVG(gap_pace) OVER (PARTITION BY activity_id) AS gap_pace_mean
+        FROM paced
+    ),
+    halves AS (
+        SELECT
+            activity_id,
+            MAX(split_count) AS split_count,
+            AVG(pace) AS pace_mean,
+            CASE WHEN COUNT(pace) > 1
+                THEN SUM((pace - pace_mean) * (pace - pace_mean)) / (COUNT(pace) - 1) END AS pace_variance,
+            COUNT(gap_speed) AS gap_count,
+            AVG(gap_speed) AS gap_speed_mean,
+            AVG(gap_pace) AS gap_pace_mean,
+            CASE WHEN COUNT(gap_pace) > 1
+                THEN SUM((gap_pace - gap_pace_mean) * (gap_pace - gap_pace_mean)) / (COUNT(gap_pace) - 1) END AS gap_pace_variance,
+            AVG(CASE WHEN split_rank <= split_count / 2.0 THEN average_heartrate END) AS hr_first_half,
+            AVG(CASE WHEN split_rank > split_count / 2.0 THEN average_heartrate END) AS hr_second_half
+        FROM ranked
+        GROUP BY activity_id
+    )
+    INSERT OR REPLACE INTO split_stats (
+        activity_id, split_count, pace_mean, pace_variance, gap_count, gap_speed_mean,
+        gap_pace_mean, gap_pace_variance, hr_first_half, hr_second_half, hr_drift
+    )
+    SELECT
+        activity_id, split_count, pace_mean, pace_variance, gap_count, gap_speed_mean,
+        gap_pace_mean, gap_pace_variance, hr_first_half, hr_second_half,
+        CASE WHEN hr_first_half > 0
+            THEN (hr_second_half - hr_first_half) / hr_first_half * 100 END
+    FROM halves
+"""
+
+def refresh_split_stats(conn, activity_ids=None):
+    """Recomputes split_stats rows for the given activities, or for activities missing one."""
+    cursor = conn.cursor()
+    if activity_ids is None:
+        cursor.execute(SPLIT_STATS_QUERY.format(
+            where="activity_id NOT IN (SELECT activity_id FROM split_stats)"))
+    else:
+        activity_ids = list(activity_ids)
+        # Stay below SQLite's host parameter limit
+        for start in range(0, len(activity_ids), 500):
+            chunk = activity_ids[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            cursor.execute(SPLIT_STATS_QUERY.format(where=f"activity_id IN ({placeholders})"), chunk)
+    conn.commit()
 
 def fetch_data_from_db(query):
     """Fetches data from the database using the provided query."""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute(query)
     data = cursor.fetchall()
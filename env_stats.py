@@ -0,0 +1,176 @@
+import math
+
+
+# Environmental factors and performance metrics tracked pairwise
+ENV_FACTORS = ['temperature', 'humidity', 'pollution_aqi', 'pollution_pm25']
+PERFORMANCE_METRICS = ['pace_min_km', 'performance_score', 'average_heartrate']
+
+# Columns an activity needs before it counts towards the environmental statistics
+# (mirrors the dropna in calculate_environmental_impact)
+REQUIRED_COLUMNS = ENV_FACTORS + ['distance', 'elapsed_time', 'average_speed']
+
+class RunningCovariance:
+    """Welford-style accumulator for the means, variances and covariance of an (x, y) pair."""
+
+    def __init__(self, n=0, mean_x=0.0, mean_y=0.0, m2_x=0.0, m2_y=0.0, c_xy=0.0,
+                 min_x=None, max_x=None, min_y=None, max_y=None):
+        self.n = n
+        self.mean_x = mean_x
+        self.mean_y = mean_y
+        self.m2_x = m2_x
+        self.m2_y = m2_y
+        self.c_xy = c_xy
+        self.min_x = min_x
+        self.max_x = max_x
+        self.min_y = min_y
+        self.max_y = max_y
+
+    def update(self, x, y):
+        """Adds one observation in O(1)."""
+        self.n += 1
+        dx = x - self.mean_x
+        self.mean_x += dx / self.n
+        dy = y - self.mean_y
+        self.mean_y += dy / self.n
+        self.m2_x += dx * (x - self.mean_x)
+        self.m2_y += dy * (y - self.mean_y)
+        self.c_xy += dx * (y - self.mean_y)
+        self.min_x = x if self.min_x is None else min(self.min_x, x)
+        self.max_x = x if self.max_x is None else max(self.max_x, x)
+        self.min_y = y if self.min_y is None else min(self.min_y, y)
+        self.max_y = y if self.max_y is None else max(self.max_y, y)
+
+    def correlation(self):
+        """Pearson correlation of x and y, or None when undefined."""
+        if self.n < 2 or self.m2_x <= 0 or self.m2_y <= 0:
+            return None
+        return self.c_xy / math.sqrt(self.m2_x * self.m2_y)
+
+    def as_row(self):
+        return (self.n, self.mean_x, self.mean_y, self.m2_x, self.m2_y, self.c_xy,
+                self.min_x, self.max_x, self.min_y, self.max_y)
+
+def performance_values(row):
+    """Derives the performance metrics for an activity row (dict of column values)."""
+    return {
+        'pace_min_km': 1000 / (row['average_speed'] * 60) if row['average_speed'] else None,
+        'performance_score': row['distance'] / row['elapsed_time'] if row['elapsed_time'] else None,
+        'average_heartrate': row.get('average_heartrate')
+    }
+
+def _load_accumulators(cursor):
+    cursor.execute("""
+        SELECT factor, metric, n, mean_x, mean_y, m2_x, m2_y, c_xy, min_x, max_x, min_y, max_y
+        FROM env_running_stats
+    """)
+    return {(r[0], r[1]): RunningCovariance(*r[2:]) for r in cursor.fetchall()}
+
+def _save_accumulators(cursor, accumulators):
+    cursor.executemany("""
+        INSERT OR REPLACE INTO env_running_stats (
+            factor, metric, n, mean_x, mean_y, m2_x, m2_y, c_xy, min_x, max_x, min_y, max_y
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [key + acc.as_row() for key, acc in accumulators.items()])
+
+def _fetch_activity_rows(cursor, where="1 = 1", params=()):
+    columns = ['id', 'average_heartrate'] + REQUIRED_COLUMNS
+    cursor.execute(f"SELECT {', '.join(columns)} FROM strava_activities_weather WHERE {where}", params)
+    rows = []
+    for values in cursor.fetchall():
+        row = dict(zip(columns, values))
+        try:
+            for col in columns[1:]:
+                row[col] = float(row[col]) if row[col] is not None else None
+        except (TypeError, ValueError):
+            continue
+        if all(row[col] is not None for col in REQUIRED_COLUMNS):
+            rows.append(row)
+    return rows
+
+def _apply_rows(cursor, rows):
+    """Folds activity rows into the accumulators and the pace index of runs."""
+    accumulators = _load_accumulators(cursor)
+    paced = []
+
+    for row in rows:
+        performance = performance_values(row)
+        for factor in ENV_FACTORS:
+            for metric in PERFORMANCE_METRICS:
+                if performance[metric] is None:
+                    continue
+                acc = accumulators.setdefault((factor, metric), RunningCovariance())
+                acc.update(row[factor], performance[metric])
+        if performance['pace_min_km'] is not None:
+            paced.append((row['id'], performance['pace_min_km'], row['temperature'], row['humidity'],
+                          row['pollution_aqi'], row['pollution_pm25']))
+
+    _save_accumulators(cursor, accumulators)
+    # Every run is kept: the fastest fraction grows with the number of runs, and a run left out once
+    # could belong to it later
+    cursor.executemany("""
+        INSERT OR REPLACE INTO env_fastest_runs (
+            activity_id, pace_min_km, temperature, humidity, pollution_aqi, pollution_pm25
+        ) VALUES (?, ?, ?, ?, ?, ?)
+    """, paced)
+
+def update_env_stats(conn, activity_id):
+    """Folds a newly inserted activity into the running environmental statistics."""
+    cursor = conn.cursor()
+    rows = _fetch_activity_rows(cursor, "id = ?", (activity_id,))
+    if rows:
+        _apply_rows(cursor, rows)
+        conn.commit()
+
+def rebuild_env_stats(conn):
+    """Recomputes the running environmental statistics from every stored activity."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM env_running_stats")
+    cursor.execute("DELETE FROM env_fastest_runs")
+    _apply_rows(cursor, _fetch_activity_rows(cursor))
+    conn.commit()
+
+def get_env_correlations(conn, metric='pace_min_km'):
+    """Returns {factor: correlation} of each environmental factor against a performance metric."""
+    accumulators = _load_accumulators(conn.cursor())
+    return {
+        factor: accumulators[(factor, metric)].correlation() if (factor, metric) in accumulators else None
+        for factor in ENV_FACTORS
+    }
+
+def get_env_ranges(conn):
+    """Returns {column: (min, max)} for the environmental factors and performance metrics."""
+    accumulators = _load_accumulators(conn.cursor())
+    ranges = {}
+    for (factor, metric), acc in accumulators.items():
+        if acc.n == 0:
+            continue
+        ranges[factor] = (acc.min_x, acc.max_x)
+        ranges[metric] = (acc.min_y, acc.max_y)
+    return ranges
+
+def get_optimal_conditions(conn, fraction=0.1):
+    """Returns min/max/mean of each environmental factor over the fastest `fraction` of runs.
+
+    Reads only those runs, through the pace index of env_fastest_runs.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(n) FROM env_running_stats WHERE metric = 'pace_min_km'")
+    total_runs = cursor.fetchone()[0] or 0
+    top_n = int(total_runs * fraction)
+    if top_n == 0:
+        return None
+
+    cursor.execute(f"""
+        SELECT {', '.join(ENV_FACTORS)} FROM env_fastest_runs
+        ORDER BY pace_min_km LIMIT ?
+    """, (top_n,))
+    best_runs = cursor.fetchall()
+    conditions = {}
+    for idx, factor in enumerate(ENV_FACTORS):
+        values = [run[idx] for run in best_runs]
+        conditions[factor] = {
+            'min': min(values),
+            'max': max(values),
+            'mean': sum(values) / len(values)
+        }
+    return conditions
@@ -0,0 +1,250 @@
+"""Personal route heatmap as a pyramid of pre-rendered map tiles.
+
+Decoded routes (see routes.py) are rasterized into 256x256 Web Mercator tiles at every zoom from
+MIN_ZOOM to MAX_ZOOM. Each tile keeps a uint32 NumPy array counting the activities that crossed each pixel
+(a route counts once per pixel, however many of its points fall in it), saved sparsely since most pixels
+are empty, and a PNG rendered from it. Both are files in a directory next to the database; the
+heatmap_tiles table indexes them. A new activity only
+rewrites the tiles its route touches.
+"""
+import os, shutil, struct, zlib
+
+import numpy as np
+
+from routes import COORDINATE_SCALE, load_routes
+
+
+# Zoom levels of the pyramid: 10 shows a metro area in a tile, 14 a few streets at about 10 m per pixel,
+# which is as fine as Strava's summary polylines go
+MIN_ZOOM = 10
+MAX_ZOOM = 14
+
+TILE_SIZE = 256
+
+# Pixels crossed by this many activities are drawn at full intensity (log scale below it)
+SATURATION_COUNT = 50
+
+# Color ramp from rarely to most run pixels, as (position, red, green, blue, alpha)
+COLOR_STOPS = [(0.0, 120, 20, 20, 110), (0.35, 200, 50, 20, 170), (0.7, 255, 150, 30, 230), (1.0, 255, 255, 210, 255)]
+
+# Routes loaded and rasterized together when rebuilding
+RASTER_BATCH = 2000
+
+# Pixel steps walked at once by rasterize; a batch of long routes is walked in several groups to bound memory
+RASTER_MAX_STEPS = 1_000_000
+
+# Latitudes beyond these limits do not exist in Web Mercator
+MAX_LATITUDE = 85.05112878
+
+def heatmap_directory(conn):
+    """Tile directory of the database behind `conn` (ai_running_coach.db -> ai_running_coach.heatmap/), or None
+    for in-memory and temporary databases, which have no heatmap."""
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    return os.path.splitext(path)[0] + ".heatmap" if path else None
+
+def tile_path(directory, zoom, x, y, extension):
+    return os.path.join(directory, str(zoom), f"{x}_{y}.{extension}")
+
+def _pixels(points, zoom):
+    """Global (x, y) pixel coordinates at `zoom` of E7 (latitude, longitude) points."""
+    world = TILE_SIZE * 2**zoom
+    latitude = np.radians(np.clip(points[:, 0] / COORDINATE_SCALE, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (points[:, 1] / COORDINATE_SCALE + 180) / 360 * world
+    y = (1 - np.log(np.tan(latitude) + 1 / np.cos(latitude)) / np.pi) / 2 * world
+    return np.column_stack([x, y])
+
+def _distinct(values):
+    """Sorted distinct values and how often each occurs (sorting beats np.unique's hashing at this size)."""
+    values = np.sort(values)
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    return values[starts], np.diff(np.append(starts, len(values)))
+
+def rasterize(routes, zoom):
+    """Per-tile activity counts of a batch of E7 routes at `zoom`, as {(x, y): uint32 array}.
+
+    Routes are walked in groups of about RASTER_MAX_STEPS pixel steps, so that memory stays bounded however
+    long the routes are.
+    """
+    # Identical routes (the same loop synced twice, or imported copies) are walked once and counted as often
+    # as they occur
+    distinct = {}
+    for points in routes:
+        if len(points):
+            distinct.setdefault(points.tobytes(), [points, 0])[1] += 1
+    by_repeats = {}
+    for points, repeats in distinct.values():
+        by_repeats.setdefault(repeats, []).append(points)
+
+    tiles = {}
+    for repeats, routes in by_repeats.items():
+        groups, group, group_steps = [], [], 0
+        for points in routes:
+            # At most one step per pixel of the longer axis of each segment, plus one per point
+            steps = np.abs(np.diff(_pixels(points, zoom), axis=0)).max(axis=1, initial=0).sum() + len(points)
+            if group and group_steps + steps > RASTER_MAX_STEPS:
+                groups.append(group)
+                group, group_steps = [], 0
+            group.append(points)
+            group_steps += steps
+        if group:
+            groups.append(group)
+        for group in groups:
+            for key, counts in _rasterize(group, zoom).items():
+                counts *= np.uint32(repeats)
+                tiles[key] = tiles[key] + counts if key in tiles else counts
+    return tiles
+
+def _rasterize(routes, zoom):
+    """rasterize() of one group of non-empty routes, walked in one vectorized pass."""
+    world = TILE_SIZE * 2**zoom
+    tiles = {}
+
+    owner = np.repeat(np.arange(len(routes)), [len(points) for points in routes])
+    pixels = _pixels(np.concatenate(routes), zoom)
+    # Segments are walked in steps of at most one pixel so that lines stay connected; the segments joining
+    # one route to the next get no steps, and each route's last point is added on its own
+    deltas = np.diff(pixels, axis=0)
+    steps = np.where(owner[1:] == owner[:-1],
+                     np.maximum(np.ceil(np.abs(deltas).max(axis=1, initial=0)), 1), 0).astype(np.int64)
+    segment = np.repeat(np.arange(len(deltas)), steps)
+    fraction = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / steps[segment]
+    last = np.flatnonzero(np.append(owner[1:] != owner[:-1], True))
+    walked = np.vstack([pixels[segment] + fraction[:, None] * deltas[segment], pixels[last]])
+    walked = np.clip(np.floor(walked).astype(np.int64), 0, world - 1)
+    walked_owner = np.concatenate([owner[segment], owner[last]])
+
+    # A route counts once per pixel (world**2 * RASTER_BATCH stays within int64 up to zoom 17)
+    keys = _distinct(walked_owner * world**2 + walked[:, 1] * world + walked[:, 0])[0] % world**2
+    pixels, counts = _distinct(keys)
+    y, x = np.divmod(pixels, world)
+    tile_keys = (y // TILE_SIZE) * (world // TILE_SIZE) + x // TILE_SIZE
+    order = np.argsort(tile_keys, kind='stable')
+    boundaries = np.flatnonzero(np.diff(tile_keys[order])) + 1
+    for group in np.split(order, boundaries):
+        tile = np.zeros((TILE_SIZE, TILE_SIZE), dtype=np.uint32)
+        tile[y[group] % TILE_SIZE, x[group] % TILE_SIZE] = counts[group]
+        tiles[(int(x[group[0]] // TILE_SIZE), int(y[group[0]] // TILE_SIZE))] = tile
+    return tiles
+
+def encode_png(rgba):
+    """PNG bytes of an (h, w, 4) uint8 RGBA array, written with zlib only."""
+    height, width = rgba.shape[:2]
+    # Every scanline starts with filter type 0 (none)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)]).tobytes()
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw, 6)) + chunk(b'IEND', b''))
+
+def render_tile(counts):
+    """Transparent PNG of a count tile, colored along COLOR_STOPS on a log scale."""
+    pixels = np.flatnonzero(counts)
+    intensity = np.minimum(np.log1p(counts.flat[pixels]) / np.log1p(SATURATION_COUNT), 1)
+    positions = [stop[0] for stop in COLOR_STOPS]
+    rgba = np.zeros((TILE_SIZE * TILE_SIZE, 4), dtype=np.uint8)
+    for channel in range(4):
+        rgba[pixels, channel] = np.interp(intensity, positions, [stop[channel + 1] for stop in COLOR_STOPS])
+    return encode_png(rgba.reshape(TILE_SIZE, TILE_SIZE, 4))
+
+def _write(path, data):
+    """Writes a file through a temporary name, so readers never see a partial tile."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", 'wb') as f:
+        if isinstance(data, np.ndarray):
+            pixels = np.flatnonzero(data)
+            np.savez(f, pixels=pixels.astype(np.uint16), counts=data.flat[pixels])
+        else:
+            f.write(data)
+    os.replace(path + ".tmp", path)
+
+def load_counts(path):
+    """Count array of a tile saved by _write."""
+    counts = np.zeros((TILE_SIZE, TILE_SIZE), dtype=np.uint32)
+    with np.load(path) as saved:
+        counts.flat[saved['pixels']] = saved['counts']
+    return counts
+
+def _add_counts(directory, zoom, tiles):
+    """Adds count tiles to the saved ones (saving new tiles as they are). Yields ((x, y), total counts)."""
+    for (x, y), counts in tiles.items():
+        path = tile_path(directory, zoom, x, y, 'npz')
+        if os.path.exists(path):
+            counts = counts + load_counts(path)
+        _write(path, counts)
+        yield (x, y), counts
+
+def _render_tiles(cursor, directory, zoom, tiles):
+    """Renders the PNGs of ((x, y), counts) pairs and indexes the tiles."""
+    rows = []
+    for (x, y), counts in tiles:
+        _write(tile_path(directory, zoom, x, y, 'png'), render_tile(counts))
+        rows.append((zoom, x, y, int(np.count_nonzero(counts)), int(counts.max())))
+    cursor.executemany("""
+        INSERT OR REPLACE INTO heatmap_tiles (zoom, x, y, pixels, max_count) VALUES (?, ?, ?, ?, ?)
+    """, rows)
+
+def update_heatmap(conn, activity_id):
+    """Adds a newly stored activity's route to the tiles it crosses."""
+    directory = heatmap_directory(conn)
+    if directory is None:
+        return
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM heatmap_activities WHERE activity_id = ?", (activity_id,))
+    if cursor.fetchone():
+        return
+    if not os.path.isdir(directory):
+        # Tiles deleted or database copied without them: counts can only be rebuilt from all routes
+        cursor.execute("SELECT 1 FROM heatmap_activities LIMIT 1")
+        if cursor.fetchone():
+            rebuild_heatmap(conn)
+            return
+    route = load_routes(conn, [activity_id]).get(activity_id)
+    if route is not None:
+        for zoom in range(MIN_ZOOM, MAX_ZOOM + 1):
+            _render_tiles(cursor, directory, zoom, _add_counts(directory, zoom, rasterize([route], zoom)))
+    cursor.execute("INSERT INTO heatmap_activities (activity_id) VALUES (?)", (activity_id,))
+    conn.commit()
+
+def rebuild_heatmap(conn):
+    """Rasterizes every stored route again, RASTER_BATCH routes at a time.
+
+    Each batch is added to the saved counts of every zoom, and the PNGs are rendered from the final counts
+    one tile at a time, so only one batch and zoom of tiles is held in memory.
+    """
+    directory = heatmap_directory(conn)
+    if directory is None:
+        return
+    cursor = conn.cursor()
+    shutil.rmtree(directory, ignore_errors=True)
+    cursor.execute("DELETE FROM heatmap_tiles")
+    cursor.execute("DELETE FROM heatmap_activities")
+    activity_ids = [row[0] for row in conn.execute("SELECT activity_id FROM routes ORDER BY activity_id")]
+    touched = {zoom: set() for zoom in range(MIN_ZOOM, MAX_ZOOM + 1)}
+    for start in range(0, len(activity_ids), RASTER_BATCH):
+        routes = list(load_routes(conn, activity_ids[start:start + RASTER_BATCH]).values())
+        for zoom, keys in touched.items():
+            keys.update(key for key, _ in _add_counts(directory, zoom, rasterize(routes, zoom)))
+    for zoom, keys in touched.items():
+        _render_tiles(cursor, directory, zoom,
+                      ((key, load_counts(tile_path(directory, zoom, *key, 'npz'))) for key in sorted(keys)))
+    cursor.executemany("INSERT INTO heatmap_activities (activity_id) VALUES (?)", [(i,) for i in activity_ids])
+    conn.commit()
+
+def tile_png(conn, zoom, x, y):
+    """Pre-rendered PNG of a tile, or None when no route crosses it."""
+    directory = heatmap_directory(conn)
+    if directory is None:
+        return None
+    try:
+        with open(tile_path(directory, zoom, x, y, 'png'), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def tile_bounds(zoom, x, y):
+    """(min_lat, min_lon, max_lat, max_lon) in degrees of a tile."""
+    def latitude(tile_y):
+        return float(np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * tile_y / 2**zoom)))))
+    return latitude(y + 1), x / 2**zoom * 360 - 180, latitude(y), (x + 1) / 2**zoom * 360 - 180
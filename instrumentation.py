@@ -0,0 +1,167 @@
+"""Lightweight timing of the hot paths.
+
+`timed` wraps a function or a block in a named span. Spans nest: a span opened while another is running
+is recorded under it, which gives the flame-style breakdown shown in the dashboard's Performance panel.
+Every span is added to two places:
+- process-wide totals (calls and seconds per span name), exported in Prometheus text format
+- the Recorder of the current collect() block, one per dashboard rerun or CLI command
+Counters (cache hits, retries...) are kept the same way with increment().
+"""
+import bisect, contextlib, contextvars, functools, threading, time
+
+
+# Prefix of the exported Prometheus metric names
+METRIC_PREFIX = "runinsight"
+
+# Upper bounds (seconds) of the latency histogram buckets kept per span name; the last bucket is unbounded
+LATENCY_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+# Names of the enclosing spans, outermost first
+_span_path = contextvars.ContextVar("span_path", default=())
+
+# Recorder of the current collect() block, if any
+_recorder = contextvars.ContextVar("recorder", default=None)
+
+class Recorder:
+    """Calls and seconds per span path, latency histograms per span name and counters of one collect() block."""
+
+    def __init__(self):
+        self.spans = {}
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add(self, path, seconds):
+        with self._lock:
+            calls, total = self.spans.get(path, (0, 0.0))
+            self.spans[path] = (calls + 1, total + seconds)
+            buckets = self.histograms.setdefault(path[-1], [0] * (len(LATENCY_BUCKETS) + 1))
+            buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def increment(self, name, amount):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def rows(self):
+        """One dict per span path (path, name, depth, calls, seconds, self_seconds), in call tree order."""
+        with self._lock:
+            spans = dict(self.spans)
+        rows = []
+        for path in sorted(spans):
+            calls, seconds = spans[path]
+            children = sum(child_seconds for child, (_, child_seconds) in spans.items()
+                           if len(child) == len(path) + 1 and child[:-1] == path)
+            rows.append({
+                'path': path,
+                'name': path[-1],
+                'depth': len(path) - 1,
+                'calls': calls,
+                'seconds': seconds,
+                'self_seconds': max(seconds - children, 0.0)
+            })
+        return rows
+
+class _Totals:
+    """Process-wide calls and seconds per span name, and counter values."""
+
+    def __init__(self):
+        self.spans = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+_totals = _Totals()
+
+def record(name, seconds):
+    """Adds an already measured span to the totals and the current recorder, under the enclosing spans."""
+    path = _span_path.get() + (name,)
+    with _totals.lock:
+        calls, total = _totals.spans.get(name, (0, 0.0))
+        _totals.spans[name] = (calls + 1, total + seconds)
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.add(path, seconds)
+
+def increment(name, amount=1):
+    """Adds to a counter, e.g. increment('llm_cache_hits')."""
+    with _totals.lock:
+        _totals.counters[name] = _totals.counters.get(name, 0) + amount
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.increment(name, amount)
+
+class timed:
+    """Times a block (`with timed("load"):`) or every call of a function (`@timed()` or `@timed("name")`).
+
+    Functions are named after their __name__ unless a name is given.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+
+    def __call__(self, func):
+        name = self.name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        self._token = _span_path.set(_span_path.get() + (self.name,))
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self._started
+        _span_path.reset(self._token)
+        record(self.name, seconds)
+        return False
+
+@contextlib.contextmanager
+def collect():
+    """Collects the spans and counters recorded inside the block into a new Recorder (yielded)."""
+    recorder = Recorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+def histogram_quantile(buckets, q):
+    """Upper bound of the bucket holding the q-quantile (None when empty or in the unbounded bucket)."""
+    total = sum(buckets)
+    if not total:
+        return None
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS, buckets):
+        seen += count
+        if seen >= q * total:
+            return bound
+    return None
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_text():
+    """Process-wide span totals and counters in the Prometheus text exposition format."""
+    with _totals.lock:
+        spans = sorted(_totals.spans.items())
+        counters = sorted(_totals.counters.items())
+    lines = [
+        f"# HELP {METRIC_PREFIX}_span_seconds_total Wall-clock seconds spent in instrumented code.",
+        f"# TYPE {METRIC_PREFIX}_span_seconds_total counter"
+    ]
+    lines += [f'{METRIC_PREFIX}_span_seconds_total{{span="{_label(name)}"}} {seconds:.6f}'
+              for name, (_, seconds) in spans]
+    lines += [
+        f"# HELP {METRIC_PREFIX}_span_calls_total Calls of instrumented code.",
+        f"# TYPE {METRIC_PREFIX}_span_calls_total counter"
+    ]
+    lines += [f'{METRIC_PREFIX}_span_calls_total{{span="{_label(name)}"}} {calls}' for name, (calls, _) in spans]
+    lines += [
+        f"# HELP {METRIC_PREFIX}_events_total Counted events such as cache hits.",
+        f"# TYPE {METRIC_PREFIX}_events_total counter"
+    ]
+    lines += [f'{METRIC_PREFIX}_events_total{{event="{_label(name)}"}} {value}' for name, value in counters]
+    return "\n".join(lines) + "\n"
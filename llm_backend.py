@@ -0,0 +1,165 @@
+import hashlib, json, os, sqlite3, threading, time
+
+from database import database_path
+from instrumentation import record
+from logs import get_logger
+
+
+logger = get_logger("llm_backend")
+
+# Backend and model selection, overridable from the environment (.env)
+DEFAULT_LLM_BACKEND = "gemini"
+DEFAULT_LLM_MODEL = "gemini-pro"
+
+# Simulated response time of the stub backend, in seconds
+DEFAULT_STUB_LATENCY_SECONDS = 0.5
+
+def approximate_tokens(text):
+    """Whitespace token count, used when a provider does not report usage."""
+    return len(text.split()) if text else 0
+
+def parse_json_response(text, schema):
+    """Parses a JSON object answer, keeping only the properties whose type matches the schema.
+
+    The schema is a small JSON Schema subset: an object with "properties" of type "string" or
+    "number" and a "required" list. Markdown code fences around the JSON are tolerated.
+    Raises ValueError when the text is not a JSON object.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    payload = json.loads(text)
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object")
+    types = {"string": str, "number": (int, float)}
+    valid = {}
+    for key, spec in schema.get("properties", {}).items():
+        value = payload.get(key)
+        if isinstance(value, types[spec["type"]]) and (not isinstance(value, str) or value.strip()):
+            valid[key] = value
+    return valid
+
+class LLMBackend:
+    """Interface for text generation providers.
+
+    Subclasses implement _generate(prompt, timeout, schema) returning (text, usage), where usage is None or
+    a (prompt_tokens, response_tokens) tuple reported by the provider. A schema asks for a JSON object
+    answer (see parse_json_response). Every call made through generate_content is timed and recorded in
+    the llm_calls table.
+    """
+
+    name = None
+
+    def __init__(self, model_name, database=None):
+        self.model_name = model_name
+        # Calls are recorded in the database of the athlete current when the backend is built
+        self.database = database or database_path()
+        self._lock = threading.Lock()
+
+    def _generate(self, prompt, timeout, schema):
+        raise NotImplementedError
+
+    def generate_content(self, prompt, timeout=None, schema=None):
+        """Returns the complete response text."""
+        started = time.perf_counter()
+        text, usage, error = "", None, None
+        try:
+            text, usage = self._generate(prompt, timeout, schema)
+            return text
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            prompt_tokens, response_tokens = usage or (approximate_tokens(prompt), approximate_tokens(text))
+            self.record_call(time.perf_counter() - started, prompt_tokens, response_tokens, error)
+
+    def record_call(self, latency, prompt_tokens, response_tokens, error=None):
+        """Stores the latency and token counts of one call."""
+        record(f"llm.{self.name}", latency)
+        try:
+            with self._lock:
+                conn = sqlite3.connect(self.database)
+                try:
+                    conn.execute("""
+                        INSERT INTO llm_calls (called_at, backend, model, latency_seconds, prompt_tokens,
+                                               response_tokens, error)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (time.time(), self.name, self.model_name, latency, prompt_tokens, response_tokens,
+                          str(error) if error is not None else None))
+                    conn.commit()
+                finally:
+                    conn.close()
+        except sqlite3.OperationalError as e:
+            logger.warning(f"[LLM] Could not record call metrics: {e}")
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini through the google-generativeai client.
+
+    The SDK is imported and configured on the first request, so building the backend costs nothing until
+    an insight is actually generated.
+    """
+
+    name = "gemini"
+
+    def __init__(self, model_name=DEFAULT_LLM_MODEL, database=None):
+        super().__init__(model_name, database)
+        self._model = None
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                import google.generativeai as genai
+
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                self._model = genai.GenerativeModel(self.model_name)
+            return self._model
+
+    def _generate(self, prompt, timeout, schema):
+        # The JSON shape is spelled out in the prompt; gemini-pro has no JSON response mode
+        options = {"request_options": {"timeout": timeout}} if timeout else {}
+        response = self.model.generate_content(prompt, **options)
+        metadata = getattr(response, "usage_metadata", None)
+        usage = None
+        if metadata is not None and getattr(metadata, "candidates_token_count", None):
+            usage = (metadata.prompt_token_count, metadata.candidates_token_count)
+        return response.text, usage
+
+class StubBackend(LLMBackend):
+    """Deterministic offline backend for tests and benchmarks.
+
+    The response depends only on the prompt (and schema, which yields a JSON object with every required
+    key), and it takes `latency` seconds.
+    """
+
+    name = "stub"
+
+    def __init__(self, model_name="stub", latency=DEFAULT_STUB_LATENCY_SECONDS, database=None):
+        super().__init__(model_name, database)
+        self.latency = latency
+
+    def _generate(self, prompt, timeout, schema):
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        first_line = next((line.strip() for line in prompt.splitlines() if line.strip()), "")
+        if schema:
+            text = json.dumps({key: f"Stub analysis {digest[:8]} for {key}." for key in schema.get("required", [])})
+        else:
+            text = f"Stub analysis {digest[:8]} for: {first_line}"
+        time.sleep(self.latency)
+        return text, None
+
+LLM_BACKENDS = {
+    GeminiBackend.name: GeminiBackend,
+    StubBackend.name: StubBackend
+}
+
+def get_backend(name=None, model_name=None, database=None):
+    """Builds the configured backend (LLM_BACKEND, LLM_MODEL and LLM_STUB_LATENCY environment variables)."""
+    name = name or os.getenv("LLM_BACKEND", DEFAULT_LLM_BACKEND)
+    if name not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}', expected one of {sorted(LLM_BACKENDS)}")
+    if name == StubBackend.name:
+        latency = float(os.getenv("LLM_STUB_LATENCY", DEFAULT_STUB_LATENCY_SECONDS))
+        return StubBackend(model_name or os.getenv("LLM_MODEL", "stub"), latency=latency, database=database)
+    return LLM_BACKENDS[name](model_name or os.getenv("LLM_MODEL", DEFAULT_LLM_MODEL), database=database)
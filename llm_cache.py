@@ -0,0 +1,99 @@
+import hashlib, sqlite3, time
+
+from database import database_path
+from instrumentation import increment
+from llm_backend import parse_json_response
+from logs import get_logger
+
+
+logger = get_logger("llm_cache")
+
+# Cached responses expire after a week and the table keeps at most this many entries
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+LLM_CACHE_MAX_ENTRIES = 500
+
+class CachedResponse:
+    """Response object exposing .text, like a generate_content result."""
+
+    def __init__(self, text):
+        self.text = text
+
+def cache_key(model_name, prompt):
+    """Hashes the model name and the rendered prompt, which carries both the template and its numeric inputs."""
+    return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+class CachedModel:
+    """Wraps an LLMBackend so identical prompts are answered from SQLite instead of the provider."""
+
+    def __init__(self, backend, ttl_seconds=LLM_CACHE_TTL_SECONDS,
+                 max_entries=LLM_CACHE_MAX_ENTRIES, database=None):
+        self.backend = backend
+        self.model_name = f"{backend.name}/{backend.model_name}"
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.database = database or database_path()
+
+    def get(self, key):
+        """Returns the cached text for key, or None when missing or expired."""
+        try:
+            conn = sqlite3.connect(self.database)
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,))
+                row = cursor.fetchone()
+                if not row or time.time() - row[1] > self.ttl_seconds:
+                    increment('llm_cache_misses')
+                    return None
+                cursor.execute("UPDATE llm_cache SET last_accessed = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+                increment('llm_cache_hits')
+                return row[0]
+            finally:
+                conn.close()
+        except sqlite3.OperationalError:
+            # Cache table not created yet or database locked; behave like a miss
+            return None
+
+    def put(self, key, text):
+        """Stores a response, then drops expired entries and evicts least recently used ones past the cap."""
+        now = time.time()
+        try:
+            conn = sqlite3.connect(self.database)
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, last_accessed)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (key, self.model_name, text, now, now))
+                cursor.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+                cursor.execute("""
+                    DELETE FROM llm_cache WHERE key IN (
+                        SELECT key FROM llm_cache ORDER BY last_accessed DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.OperationalError as e:
+            logger.warning(f"[LLM] Could not cache response: {e}")
+
+    def generate_content(self, prompt, timeout=None, schema=None):
+        """Returns the cached response for prompt, calling the wrapped model only on a miss."""
+        key = cache_key(self.model_name, prompt)
+        text = self.get(key)
+        if text is not None:
+            return CachedResponse(text)
+
+        text = self.backend.generate_content(prompt, timeout=timeout, schema=schema)
+        # Only successful responses are cached; errors propagate to the caller as before
+        if schema is None or self._complete(text, schema):
+            self.put(key, text)
+        return CachedResponse(text)
+
+    @staticmethod
+    def _complete(text, schema):
+        """Whether a structured answer parses and carries every required key."""
+        try:
+            return set(schema.get("required", [])) <= parse_json_response(text, schema).keys()
+        except ValueError:
+            return False
@@ -0,0 +1,181 @@
+import math
+from datetime import datetime, timezone
+
+
+# Start points closer than this are density-reachable and end up in the same cluster
+CLUSTER_RADIUS_M = 1000
+
+# Clusters with fewer runs are treated as noise by the location views
+MIN_CLUSTER_RUNS = 2
+
+# Grid cell edge in degrees of latitude; one cell spans CLUSTER_RADIUS_M
+GRID_CELL_DEG = CLUSTER_RADIUS_M / 111320
+
+# Per-run columns aggregated for each (cluster, year)
+METRIC_COLUMNS = ['distance', 'average_heartrate', 'temperature', 'pollution_aqi',
+                  'pollution_pm25', 'total_elevation_gain', 'average_speed']
+
+def _grid_cell(latitude, longitude):
+    return math.floor(latitude / GRID_CELL_DEG), math.floor(longitude / GRID_CELL_DEG)
+
+def _distance_m(lat1, lon1, lat2, lon2):
+    """Equirectangular distance, accurate enough at clustering radius scale."""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371000 * math.hypot(x, y)
+
+def _neighbour_clusters(cursor, latitude, longitude):
+    """Returns the cluster ids of stored start points within CLUSTER_RADIUS_M, using the grid index."""
+    grid_lat, grid_lon = _grid_cell(latitude, longitude)
+    # A degree of longitude shrinks with latitude, so the radius can span more longitude cells
+    lon_span = math.ceil(1 / max(math.cos(math.radians(latitude)), 0.01))
+    cursor.execute("""
+        SELECT latitude, longitude, cluster_id FROM location_points
+        WHERE grid_lat BETWEEN ? AND ? AND grid_lon BETWEEN ? AND ?
+    """, (grid_lat - 1, grid_lat + 1, grid_lon - lon_span, grid_lon + lon_span))
+    return {
+        cluster_id for lat, lon, cluster_id in cursor.fetchall()
+        if _distance_m(latitude, longitude, lat, lon) <= CLUSTER_RADIUS_M
+    }
+
+def _merge_clusters(cursor, target_id, source_ids):
+    """Folds the points and aggregates of source clusters into target_id."""
+    cursor.execute("SELECT label, centroid_lat, centroid_lon, n_points FROM location_clusters WHERE cluster_id = ?",
+                   (target_id,))
+    label, centroid_lat, centroid_lon, n_points = cursor.fetchone()
+    sum_columns = ", ".join(f"{col}_sum, {col}_count" for col in METRIC_COLUMNS)
+    update_columns = ", ".join(
+        f"{col}_sum = {col}_sum + excluded.{col}_sum, {col}_count = {col}_count + excluded.{col}_count"
+        for col in METRIC_COLUMNS
+    )
+    for source_id in source_ids:
+        cursor.execute("SELECT label, centroid_lat, centroid_lon, n_points FROM location_clusters WHERE cluster_id = ?",
+                       (source_id,))
+        source_label, source_lat, source_lon, source_points = cursor.fetchone()
+        total = n_points + source_points
+        centroid_lat = (centroid_lat * n_points + source_lat * source_points) / total
+        centroid_lon = (centroid_lon * n_points + source_lon * source_points) / total
+        n_points = total
+        label = label or source_label
+
+        cursor.execute("UPDATE location_points SET cluster_id = ? WHERE cluster_id = ?", (target_id, source_id))
+        cursor.execute(f"""
+            INSERT INTO location_cluster_stats (cluster_id, year, runs, {sum_columns})
+            SELECT ?, year, runs, {sum_columns} FROM location_cluster_stats WHERE cluster_id = ?
+            ON CONFLICT (cluster_id, year) DO UPDATE SET runs = runs + excluded.runs, {update_columns}
+        """, (target_id, source_id))
+        cursor.execute("DELETE FROM location_cluster_stats WHERE cluster_id = ?", (source_id,))
+        cursor.execute("DELETE FROM location_clusters WHERE cluster_id = ?", (source_id,))
+
+    cursor.execute("""
+        UPDATE location_clusters SET label = ?, centroid_lat = ?, centroid_lon = ?, n_points = ?
+        WHERE cluster_id = ?
+    """, (label, centroid_lat, centroid_lon, n_points, target_id))
+
+def _assign_point(cursor, row):
+    """Adds one activity start point to the index and returns its cluster id."""
+    latitude, longitude = float(row['start_latitude']), float(row['start_longitude'])
+    clusters = _neighbour_clusters(cursor, latitude, longitude)
+
+    if clusters:
+        # Join the largest reachable cluster; a point reaching several clusters connects them
+        cursor.execute(f"""
+            SELECT cluster_id FROM location_clusters WHERE cluster_id IN ({', '.join('?' for _ in clusters)})
+            ORDER BY n_points DESC, cluster_id LIMIT 1
+        """, list(clusters))
+        cluster_id = cursor.fetchone()[0]
+        _merge_clusters(cursor, cluster_id, clusters - {cluster_id})
+        cursor.execute("""
+            UPDATE location_clusters SET
+                centroid_lat = (centroid_lat * n_points + ?) / (n_points + 1),
+                centroid_lon = (centroid_lon * n_points + ?) / (n_points + 1),
+                n_points = n_points + 1,
+                label = COALESCE(label, ?)
+            WHERE cluster_id = ?
+        """, (latitude, longitude, row['city_name'], cluster_id))
+    else:
+        cursor.execute("""
+            INSERT INTO location_clusters (label, centroid_lat, centroid_lon, n_points) VALUES (?, ?, ?, 1)
+        """, (row['city_name'], latitude, longitude))
+        cluster_id = cursor.lastrowid
+
+    grid_lat, grid_lon = _grid_cell(latitude, longitude)
+    cursor.execute("""
+        INSERT OR REPLACE INTO location_points (activity_id, latitude, longitude, grid_lat, grid_lon, cluster_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (row['id'], latitude, longitude, grid_lat, grid_lon, cluster_id))
+
+    year = datetime.fromtimestamp(int(row['start_date_ist']), timezone.utc).year if row['start_date_ist'] else None
+    values = []
+    for col in METRIC_COLUMNS:
+        value = float(row[col]) if row[col] is not None else None
+        values += [value or 0.0, 1 if value is not None else 0]
+    sum_columns = ", ".join(f"{col}_sum, {col}_count" for col in METRIC_COLUMNS)
+    update_columns = ", ".join(
+        f"{col}_sum = {col}_sum + excluded.{col}_sum, {col}_count = {col}_count + excluded.{col}_count"
+        for col in METRIC_COLUMNS
+    )
+    cursor.execute(f"""
+        INSERT INTO location_cluster_stats (cluster_id, year, runs, {sum_columns})
+        VALUES (?, ?, 1, {', '.join('?' for _ in values)})
+        ON CONFLICT (cluster_id, year) DO UPDATE SET runs = runs + 1, {update_columns}
+    """, [cluster_id, year] + values)
+    return cluster_id
+
+def _fetch_activity_rows(cursor, where="1 = 1", params=()):
+    columns = ['id', 'start_latitude', 'start_longitude', 'city_name', 'start_date_ist'] + METRIC_COLUMNS
+    cursor.execute(f"""
+        SELECT {', '.join(columns)} FROM strava_activities_weather
+        WHERE start_latitude IS NOT NULL AND start_longitude IS NOT NULL AND {where}
+        ORDER BY start_date_ist
+    """, params)
+    return [dict(zip(columns, values)) for values in cursor.fetchall()]
+
+def update_location_clusters(conn, activity_id):
+    """Assigns a newly inserted activity to a location cluster and updates the cluster aggregates."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM location_points WHERE activity_id = ?", (activity_id,))
+    if cursor.fetchone():
+        return
+    for row in _fetch_activity_rows(cursor, "id = ?", (activity_id,)):
+        _assign_point(cursor, row)
+    conn.commit()
+
+def rebuild_location_clusters(conn):
+    """Reclusters every stored activity start point from scratch."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM location_points")
+    cursor.execute("DELETE FROM location_cluster_stats")
+    cursor.execute("DELETE FROM location_clusters")
+    for row in _fetch_activity_rows(cursor):
+        _assign_point(cursor, row)
+    conn.commit()
+
+# Per-cluster means over all years (or per year when grouped by year) for the location views
+LOCATION_METRICS_QUERY = """
+    SELECT
+        c.cluster_id,
+        COALESCE(c.label, printf('%.3f, %.3f', c.centroid_lat, c.centroid_lon)) AS city_name,
+        c.centroid_lat,
+        c.centroid_lon,
+        {year_column}
+        {means},
+        SUM(s.runs) AS id
+    FROM location_clusters c
+    JOIN location_cluster_stats s ON s.cluster_id = c.cluster_id
+    WHERE c.n_points >= {min_runs}
+    GROUP BY c.cluster_id{group_by_year}
+    ORDER BY c.cluster_id{group_by_year}
+"""
+
+def location_metrics_query(by_year=False, min_runs=MIN_CLUSTER_RUNS):
+    """Builds the SQL returning cluster-level (optionally per year) metric means."""
+    means = ",\n        ".join(
+        f"SUM(s.{col}_sum) / NULLIF(SUM(s.{col}_count), 0) AS {col}" for col in METRIC_COLUMNS
+    )
+    return LOCATION_METRICS_QUERY.format(
+        year_column="s.year," if by_year else "",
+        means=means,
+        min_runs=int(min_runs),
+        group_by_year=", s.year" if by_year else ""
+    )
@@ -0,0 +1,45 @@
+"""Non-blocking logging for the sync path.
+
+Log calls only put the record on a queue; a background listener thread writes it to stderr, so a slow
+console or redirected log file never holds up a sync. Messages keep their "[Tag] ..." prefixes.
+"""
+import atexit, logging, logging.handlers, os, queue, sys, threading
+
+
+# Level of the runinsight loggers, overridable from the environment (e.g. RUNINSIGHT_LOG_LEVEL=WARNING)
+DEFAULT_LOG_LEVEL = "INFO"
+
+_queue = queue.SimpleQueue()
+_listener = None
+_listener_pid = None
+_lock = threading.Lock()
+
+def _stop_listener():
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Starts the listener thread on first use, and again in a forked worker (threads do not survive fork)."""
+
+    def enqueue(self, record):
+        global _listener, _listener_pid
+        if _listener_pid != os.getpid():
+            with _lock:
+                if _listener_pid != os.getpid():
+                    handler = logging.StreamHandler(sys.stderr)
+                    handler.setFormatter(logging.Formatter("%(message)s"))
+                    _listener = logging.handlers.QueueListener(_queue, handler)
+                    _listener.start()
+                    _listener_pid = os.getpid()
+        super().enqueue(record)
+
+_root = logging.getLogger("runinsight")
+_root.setLevel(os.getenv("RUNINSIGHT_LOG_LEVEL", DEFAULT_LOG_LEVEL))
+_root.addHandler(_QueueHandler(_queue))
+_root.propagate = False
+# Flushes queued records at exit
+atexit.register(_stop_listener)
+
+def get_logger(name):
+    """Logger `runinsight.<name>` writing through the shared queue."""
+    return logging.getLogger(f"runinsight.{name}")
@@ -0,0 +1,644 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from database import connect
+from env_stats import get_env_ranges
+from instrumentation import timed
+from logs import get_logger
+from outliers import compute_outlier_mask
+from time_of_day import assign_time_slots
+
+
+logger = get_logger("metrics")
+
+# Metrics understood by calculate_metric and get_trend_data
+METRIC_NAMES = [
+    "Distance", "Average Pace", "Average Heart Rate", "Max Speed", "Total Elevation Gain", "Average Cadence",
+    "Calories Burned", "Suffer Score", "Temperature", "Feels Like Temperature", "Humidity",
+    "Pollution PM2.5", "Pollution AQI"
+]
+
+# Periods compared on the metrics pages (relative to today)
+COMPARISON_PERIODS = ["Last 7 Days", "Last 30 Days", "Last 90 Days", "Year-to-Date", "Last Year", "Overall"]
+
+# --- Database Connection and Data Fetching ---
+@timed()
+def fetch_data_from_db(query):
+    """Fetches data from the database using the provided query."""
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute(query)
+    data = cursor.fetchall()
+    columns = [description[0] for description in cursor.description]
+    conn.close()
+    return pd.DataFrame(data, columns=columns)
+
+# --- Data Preparation ---
+@timed()
+def prepare_data():
+    """Fetches data from the database and prepares it for analysis.
+
+    Only reads: the tables must exist already (create_database_and_tables runs at startup and on every sync).
+    """
+
+    strava_query = "SELECT id, start_date_ist, start_epoch_local, distance, elapsed_time, moving_time, average_speed, max_speed, average_heartrate, max_heartrate, suffer_score, calories, total_elevation_gain, average_cadence, temperature, feels_like, humidity, weather_conditions, pollution_aqi, pollution_pm25, city_name FROM strava_activities_weather"
+    split_stats_query = "SELECT activity_id, split_count, pace_mean, pace_variance, gap_count, gap_speed_mean, gap_pace_mean, gap_pace_variance, hr_first_half, hr_second_half, hr_drift FROM split_stats"
+    best_efforts_query = "SELECT activity_id, name, distance, elapsed_time, start_date FROM best_efforts_data"
+
+    strava_df = fetch_data_from_db(strava_query)
+    split_stats_df = fetch_data_from_db(split_stats_query)
+    best_efforts_df = fetch_data_from_db(best_efforts_query)
+
+    # Convert start_date_ist to numeric, coercing errors to NaN
+    strava_df['start_date_ist'] = pd.to_numeric(strava_df['start_date_ist'], errors='coerce')
+    
+    # Drop rows where start_date_ist is NaN
+    strava_df.dropna(subset=['start_date_ist'], inplace=True)
+
+    # Convert start_date_ist to datetime
+    strava_df['start_date_ist'] = pd.to_datetime(strava_df['start_date_ist'], unit='s')
+    
+    # Local wall-clock start time and its time of day slot
+    strava_df['start_epoch_local'] = pd.to_numeric(strava_df['start_epoch_local'], errors='coerce')
+    strava_df['start_time_local'] = pd.to_datetime(strava_df['start_epoch_local'], unit='s')
+    strava_df['time_slot'] = pd.Series(
+        assign_time_slots(strava_df['start_time_local'].dt.hour.fillna(0).to_numpy()),
+        index=strava_df.index
+    ).where(strava_df['start_time_local'].notna())
+    
+    # Convert other columns to numeric where applicable
+    numeric_cols = ['distance', 'elapsed_time', 'moving_time', 'average_speed', 'max_speed', 'average_heartrate', 'max_heartrate', 'suffer_score', 'calories', 'total_elevation_gain', 'average_cadence', 'temperature', 'feels_like', 'humidity', 'pollution_aqi', 'pollution_pm25']
+    for col in numeric_cols:
+        if col in strava_df.columns:
+            strava_df[col] = pd.to_numeric(strava_df[col], errors='coerce')
+    
+    numeric_cols_split_stats = ['split_count', 'pace_mean', 'pace_variance', 'gap_count', 'gap_speed_mean', 'gap_pace_mean', 'gap_pace_variance', 'hr_first_half', 'hr_second_half', 'hr_drift']
+    for col in numeric_cols_split_stats:
+        if col in split_stats_df.columns:
+            split_stats_df[col] = pd.to_numeric(split_stats_df[col], errors='coerce')
+    
+    numeric_cols_best_efforts = ['distance', 'elapsed_time']
+    for col in numeric_cols_best_efforts:
+        if col in best_efforts_df.columns:
+            best_efforts_df[col] = pd.to_numeric(best_efforts_df[col], errors='coerce')
+    
+    best_efforts_df['start_date'] = pd.to_datetime(best_efforts_df['start_date'], errors='coerce')
+
+    return strava_df, split_stats_df, best_efforts_df
+# --- Metric Calculation Functions ---
+# def calculate_metric(df, metric, period):
+#     """Calculates a metric for a given period."""
+#     now = datetime.now()
+#     if period == "Last 7 Days":
+#         cutoff = now - timedelta(days=7)
+#     elif period == "Last 30 Days":
+#         cutoff = now - timedelta(days=30)
+#     elif period == "Last 90 Days":
+#         cutoff = now - timedelta(days=90)
+#     elif period == "Year-to-Date":
+#         cutoff = datetime(now.year, 1, 1)
+#     # elif period == "Last Year":
+#     #     cutoff = datetime(now.year - 1, 1, 1)
+#     else: # Overall
+#         cutoff = datetime.min
+
+#     filtered_df = df[
+#         df['start_date_ist'] >= cutoff] if 'start_date_ist' in df.columns else df[df['start_date'] >= cutoff] if 'start_date' in df.columns else df
+
+@timed()
+def calculate_metric(df, metric, period):
+    """Calculates a metric for a given period."""
+    now = datetime.now()
+    
+    if period == "Last 7 Days":
+        start = now - timedelta(days=7)
+        end = now
+    elif period == "Last 30 Days":
+        start = now - timedelta(days=30)
+        end = now
+    elif period == "Last 90 Days":
+        start = now - timedelta(days=90)
+        end = now
+    elif period == "Year-to-Date":
+        start = datetime(now.year, 1, 1)
+        end = now
+    elif period == "Last Year":
+        # Start from January 1st of previous year
+        start = datetime(now.year - 1, 1, 1)
+        # End on December 31st of previous year
+        end = datetime(now.year - 1, 12, 31, 23, 59, 59)
+    elif period == "Overall":
+        start = datetime.min
+        end = now
+    else:
+        return None, None, None, None, None
+
+    filtered_df = df[
+        (df['start_date_ist'] >= start) & 
+        (df['start_date_ist'] <= end)
+    ] if 'start_date_ist' in df.columns else df[
+        (df['start_date'] >= start) & 
+        (df['start_date'] <= end)
+    ] if 'start_date' in df.columns else df
+
+    if filtered_df.empty:
+        return None, None, None, None, None
+    
+    if 'start_date_ist' in filtered_df.columns:
+        daily_data = filtered_df.groupby(filtered_df['start_date_ist'].dt.date)
+    elif 'start_date' in filtered_df.columns:
+        daily_data = filtered_df.groupby(filtered_df['start_date'].dt.date)
+    else:
+        return None, None, None, None, None
+    
+    if metric == "Average Pace":
+        def avg_pace(x):
+            total_distance = x['distance'].sum()
+            total_time = x['elapsed_time'].sum()
+            if total_distance > 0 and total_time > 0:
+                avg_pace_seconds_per_km = (total_time / total_distance)
+                avg_pace_minutes_per_km = avg_pace_seconds_per_km / 60
+                return avg_pace_minutes_per_km
+            else:
+                return None
+        daily_avg_paces = daily_data.apply(avg_pace).dropna()
+        if not daily_avg_paces.empty:
+            avg_pace_minutes_per_km = daily_avg_paces.mean()
+            median_pace_minutes_per_km = daily_avg_paces.median()
+            return round(avg_pace_minutes_per_km, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_pace_minutes_per_km, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
+        else:
+            return None, None, None, None, None
+    elif metric == "Average Heart Rate":
+        daily_avg_heartrates = daily_data['average_heartrate'].mean().dropna()
+        if not daily_avg_heartrates.empty:
+            avg_heartrate = daily_avg_heartrates.mean()
+            median_heartrate = daily_avg_heartrates.median()
+            return round(avg_heartrate, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_heartrate, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
+        else:
+            return None, None, None, None, None
+    elif metric == "Distance":
+        daily_distances = daily_data['distance'].sum().dropna()
+        if not daily_distances.empty:
+            avg_distance = daily_distances.mean()
+            median_distance = daily_distances.median()
+            return round(avg_distance, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_distance, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
+        else:
+            return None, None, None, None, None
+    elif metric == "Max Speed":
+        def max_speed_km_hr(x):
+            max_speed = x['max_speed'].max()
+            return max_speed if max_speed is not None else None
+        daily_max_speeds = daily_data.apply(max_speed_km_hr).dropna()
+        if not daily_max_speeds.empty:
+            avg_max_speed = daily_max_speeds.mean()
+            median_max_speed = daily_max_speeds.median()
+            return round(avg_max_speed, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_max_speed, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
+        else:
+            return None, None, None, None, None
+    elif metric == "Total Elevation Gain":
+        daily_elevation_gains = daily_data['total_elevation_gain'].mean().dropna()
+        if not daily_elevation_gains.empty:
+            avg_elevation_gain = daily_elevation_gains.mean()
+            median_elevation_gain = daily_elevation_gains.median()
+            return round(avg_elevation_gain, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_elevation_gain, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
+        else:
+            return None, None, None, None, None
+    elif metric == "Average Cadence":
+        daily_avg_cadences = daily_data['average_cadence'].mean().dropna()
+        if not daily_avg_cadences.empty:
+            avg_cadence = daily_avg_cadences.mean()
+            median_cadence = daily_avg_cadences.median()
+            return round(avg_cadence, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_cadence, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
+        else:
+            return None, None, None, None, None
+    elif metric == "Calories Burned":
+        daily_calories = daily_data['calories'].mean().dropna()
+        if not daily_calories.empty:
+            avg_calories = daily_calories.mean()
+            median_calories = daily_calories.median()
+            return round(avg_calories, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_calories, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
+        else:
+            return None, None, None, None, None
+    elif metric == "Suffer Score":
+        daily_suffer_scores = daily_data['suffer_score'].mean().dropna()
+        if not daily_suffer_scores.empty:
+            avg_suffer_score = daily_suffer_scores.mean()
+            median_suffer_score = daily_suffer_scores.median()
+            return round(avg_suffer_score, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_suffer_score, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
+        else:
+            return None, None, None, None, None
+    elif metric == "Temperature":
+        daily_temperatures = daily_data['temperature'].mean().dropna()
+        if not daily_temperatures.empty:
+            avg_temperature = daily_temperatures.mean()
+            median_temperature = daily_temperatures.median()
+            return round(avg_temperature, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_temperature, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
+        else:
+            return None, None, None, None, None
+    elif metric == "Feels Like Temperature":
+        daily_feels_like_temperatures = daily_data['feels_like'].mean().dropna()
+        if not daily_feels_like_temperatures.empty:
+            avg_feels_like_temperature = daily_feels_like_temperatures.mean()
+            median_feels_like_temperature = daily_feels_like_temperatures.median()
+            return round(avg_feels_like_temperature, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_feels_like_temperature, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
+        else:
+            return None, None, None, None, None
+    elif metric == "Humidity":
+        daily_humidities = daily_data['humidity'].mean().dropna()
+        if not daily_humidities.empty:
+            avg_humidity = daily_humidities.mean()
+            median_humidity = daily_humidities.median()
+            return round(avg_humidity, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_humidity, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
+        else:
+            return None, None, None, None, None
+    elif metric == "Pollution PM2.5":
+        daily_pm25 = daily_data['pollution_pm25'].mean().dropna()
+        if not daily_pm25.empty:
+            avg_pm25 = daily_pm25.mean()
+            median_pm25 = daily_pm25.median()
+            return round(avg_pm25, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_pm25, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
+        else:
+            return None, None, None, None, None
+    elif metric == "Pollution AQI":
+        daily_aqi = daily_data['pollution_aqi'].mean().dropna()
+        if not daily_aqi.empty:
+            avg_aqi = daily_aqi.mean()
+            median_aqi = daily_aqi.median()
+            return round(avg_aqi, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], round(median_aqi, 2), filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date'], filtered_df['start_date_ist'] if 'start_date_ist' in filtered_df.columns else filtered_df['start_date']
+        else:
+            return None, None, None, None, None
+    else:
+        return None, None, None, None, None
+
+def calculate_percentage_change(current, previous):
+    """Calculates the percentage change between two values."""
+    if previous is None or previous == 0:
+        return None
+    if current is None:
+        return None
+    return ((current - previous) / previous) * 100
+
+def get_previous_period(period):
+    """Gets the previous period for comparison."""
+    if period == "Last 7 Days":
+        return "Last 14 Days"
+    elif period == "Last 30 Days":
+        return "Last 60 Days"
+    elif period == "Last 90 Days":
+        return "Last 180 Days"
+    elif period == "Year-to-Date":
+        return "Last Year"
+    elif period == "Last Year":
+        return "Previous Year"
+    else:
+        return None
+
+# def get_trend_data(df, metric, period):
+#     """Gets the trend data for a metric over a period."""
+#     now = datetime.now()
+#     if period == "Last 7 Days":
+#         cutoff = now - timedelta(days=7)
+#     elif period == "Last 30 Days":
+#         cutoff = now - timedelta(days=30)
+#     elif period == "Last 90 Days":
+#         cutoff = now - timedelta(days=90)
+#     elif period == "Year-to-Date":
+#         cutoff = datetime(now.year, 1, 1)
+#     elif period == "Last Year":
+#         cutoff = datetime(now.year - 1, 1, 1)
+#     else:  # Overall
+#         cutoff = datetime.min
+    
+#     filtered_df = df[
+#         df['start_date_ist'] >= cutoff] if 'start_date_ist' in df.columns else df[df['start_date'] >= cutoff] if 'start_date' in df.columns else df
+
+@timed()
+def get_trend_data(df, metric, period, outlier_settings=None, outlier_mask=None):
+    """Gets the trend data for a metric over a period."""
+    now = datetime.now()
+    
+    if period == "Last 7 Days":
+        start = now - timedelta(days=7)
+        end = now
+    elif period == "Last 30 Days":
+        start = now - timedelta(days=30)
+        end = now
+    elif period == "Last 90 Days":
+        start = now - timedelta(days=90)
+        end = now
+    elif period == "Year-to-Date":
+        start = datetime(now.year, 1, 1)
+        end = now
+    elif period == "Last Year":
+        start = datetime(now.year - 1, 1, 1)
+        end = datetime(now.year - 1, 12, 31, 23, 59, 59)
+    elif period == "Overall":
+        start = datetime.min
+        end = now
+    else:
+        return pd.DataFrame()
+    
+    filtered_df = df[
+        (df['start_date_ist'] >= start) & 
+        (df['start_date_ist'] <= end)
+    ] if 'start_date_ist' in df.columns else df[
+        (df['start_date'] >= start) & 
+        (df['start_date'] <= end)
+    ] if 'start_date' in df.columns else df
+
+    if outlier_settings and outlier_settings['enable_filtering']:
+        filtered_df = filter_outliers(filtered_df, outlier_settings, outlier_mask)
+
+    if filtered_df.empty:
+        return pd.DataFrame()
+    
+    if 'start_date_ist' in filtered_df.columns:
+        date_column = 'start_date_ist'
+    elif 'start_date' in filtered_df.columns:
+        date_column = 'start_date'
+    else:
+        return pd.DataFrame()
+    
+    filtered_df = filtered_df.sort_values(by=date_column)
+    
+    
+
+    # Group by date and calculate the appropriate metric
+    if metric == "Average Pace":
+        # filtered_df['pace'] = filtered_df['elapsed_time'] / filtered_df['distance']
+        # daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['pace'].mean()
+        filtered_df['pace_kmh'] = filtered_df['average_speed'] * 3.6  # Convert m/s to km/h
+        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['pace_kmh'].mean()
+
+    elif metric == "Average Heart Rate":
+        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['average_heartrate'].mean()
+    elif metric == "Distance":
+        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['distance'].sum()
+    elif metric == "Max Speed":
+        filtered_df['max_speed_km_hr'] = filtered_df['max_speed']
+        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['max_speed_km_hr'].max()
+    elif metric == "Total Elevation Gain":
+        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['total_elevation_gain'].mean()
+    elif metric == "Average Cadence":
+        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['average_cadence'].mean()
+    elif metric == "Calories Burned":
+        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['calories'].mean()
+    elif metric == "Suffer Score":
+        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['suffer_score'].mean()
+    elif metric == "Temperature":
+        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['temperature'].mean()
+    elif metric == "Feels Like Temperature":
+        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['feels_like'].mean()
+    elif metric == "Humidity":
+        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['humidity'].mean()
+    elif metric == "Pollution PM2.5":
+        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['pollution_pm25'].mean()
+    elif metric == "Pollution AQI":
+        daily_data = filtered_df.groupby(filtered_df[date_column].dt.date)['pollution_aqi'].mean()
+    else:
+        return pd.DataFrame()
+    
+    # Convert the daily_data Series to a DataFrame with datetime index
+    daily_df = daily_data.to_frame()
+    daily_df.index = pd.to_datetime(daily_df.index)
+    
+    # Remove zeros
+    daily_df = daily_df[daily_df.iloc[:, 0] != 0]
+    
+    return daily_df
+
+# Calculate pace variation for a single activity
+
+def calculate_pace_variation(split_stats_df, activity_id):
+    """Calculate pace variation for a single activity from the precomputed split stats."""
+    activity_stats = split_stats_df[split_stats_df['activity_id'] == activity_id]
+    if activity_stats.empty or pd.isna(activity_stats['pace_variance'].iloc[0]):
+        return None
+    
+    # Standard deviation of split pace (seconds per meter)
+    return np.sqrt(activity_stats['pace_variance'].iloc[0])
+
+# Calculate heart rate zones for a single activity
+
+def calculate_heart_rate_zones(strava_df, row):
+    """Calculate time spent in different heart rate zones for an activity."""
+    if pd.isna(row['average_heartrate']) or pd.isna(row['max_heartrate']):
+        return None
+    
+    # Define heart rate zones based on max heart rate
+    max_hr = row['max_heartrate']
+    zones = {
+        'Easy': (0.6 * max_hr, 0.7 * max_hr),
+        'Moderate': (0.7 * max_hr, 0.8 * max_hr),
+        'Hard': (0.8 * max_hr, 0.9 * max_hr),
+        'Very Hard': (0.9 * max_hr, float('inf'))
+    }
+    
+    # Categorize average heart rate into a zone
+    avg_hr = row['average_heartrate']
+    for zone_name, (min_hr, max_hr) in zones.items():
+        if min_hr <= avg_hr < max_hr:
+            return zone_name
+    return None
+
+# Calculate running consistency over a period
+
+@timed()
+def calculate_running_consistency(strava_df, period):
+    """Calculate number of runs per week over the specified period."""
+    now = datetime.now()
+    if period == "Last 7 Days":
+        cutoff = now - timedelta(days=7)
+    elif period == "Last 30 Days":
+        cutoff = now - timedelta(days=30)
+    elif period == "Last 90 Days":
+        cutoff = now - timedelta(days=90)
+    else:
+        cutoff = datetime(now.year, 1, 1)
+    
+    filtered_df = strava_df[strava_df['start_date_ist'] >= cutoff].copy()
+    filtered_df['week'] = filtered_df['start_date_ist'].dt.isocalendar().week
+    weekly_runs = filtered_df.groupby('week').size()
+    return weekly_runs.mean(), weekly_runs.std()
+
+# Calculate grade adjusted pace metrics
+
+@timed()
+def calculate_grade_adjusted_metrics(split_stats_df, strava_df):
+    """Calculate grade adjusted pace metrics from the precomputed split stats."""
+    if split_stats_df.empty or 'gap_pace_mean' not in split_stats_df.columns:
+        return {
+            'mean_gap': None,
+            'median_gap': None,
+            'std_gap': None
+        }
+        
+    # Only activities with at least one split carrying a grade adjusted speed
+    valid_stats = split_stats_df[
+        (split_stats_df['gap_count'] > 0) & 
+        (split_stats_df['gap_pace_mean'].notna())
+    ]
+    
+    if valid_stats.empty:
+        return {
+            'mean_gap': None,
+            'median_gap': None,
+            'std_gap': None
+        }
+    
+    # Pool the per-activity means and variances back into split-level statistics
+    counts = valid_stats['gap_count']
+    total_splits = counts.sum()
+    mean_gap = (valid_stats['gap_pace_mean'] * counts).sum() / total_splits
+    sum_of_squares = ((counts - 1) * valid_stats['gap_pace_variance'].fillna(0)).sum() + \
+                     (counts * (valid_stats['gap_pace_mean'] - mean_gap) ** 2).sum()
+    
+    metrics = {
+        'mean_gap': mean_gap,
+        # Median over activities; the split-level median is not recoverable from aggregates
+        'median_gap': valid_stats['gap_pace_mean'].median(),
+        'std_gap': np.sqrt(sum_of_squares / (total_splits - 1)) if total_splits > 1 else None
+    }
+    return metrics
+
+# Calculate weekly metrics
+
+@timed()
+def calculate_weekly_metrics(strava_df, split_stats_df):
+    """Calculate metrics aggregated by week."""
+    # Ensure we have datetime index
+    strava_df = strava_df.copy()
+    strava_df['week'] = strava_df['start_date_ist'].dt.strftime('%Y-%W')
+    split_stats_df = split_stats_df.copy()
+    split_stats_df['week'] = split_stats_df['activity_id'].map(strava_df.drop_duplicates('id').set_index('id')['week'])
+    
+    # 1. Pace Variation by Week
+    pace_variations = split_stats_df.dropna(subset=['week', 'pace_variance'])
+    weekly_pace_variation = pd.DataFrame({
+        'week': pace_variations['week'],
+        'variation': np.sqrt(pace_variations['pace_variance'])
+    })
+    if not weekly_pace_variation.empty:
+        weekly_pace_variation = weekly_pace_variation.groupby('week')['variation'].mean().reset_index()
+        weekly_pace_variation['week'] = pd.to_datetime(weekly_pace_variation['week'].apply(
+            lambda x: f"{x}-1"), format='%Y-%W-%w')
+    
+    # 2. Heart Rate Zones by Week
+    weekly_hr_zones = []
+    for _, row in strava_df.iterrows():
+        zone = calculate_heart_rate_zones(strava_df, row)
+        if zone:
+            weekly_hr_zones.append({
+                'week': row['start_date_ist'].strftime('%Y-%W'),
+                'zone': zone
+            })
+    
+    hr_zones_df = pd.DataFrame(weekly_hr_zones)
+    if not hr_zones_df.empty:
+        hr_zones_pivot = pd.crosstab(hr_zones_df['week'], hr_zones_df['zone'], normalize='index') * 100
+        hr_zones_pivot.index = pd.to_datetime(hr_zones_pivot.index.map(lambda x: f"{x}-1"), format='%Y-%W-%w')
+    else:
+        hr_zones_pivot = pd.DataFrame()
+    
+    # 3. Running Consistency (runs per week)
+    weekly_runs = strava_df.groupby('week').size().reset_index()
+    weekly_runs.columns = ['week', 'num_runs']
+    weekly_runs['week'] = pd.to_datetime(weekly_runs['week'].apply(lambda x: f"{x}-1"), format='%Y-%W-%w')
+    
+    # 4. Grade Adjusted Pace by Week
+    gap_stats = split_stats_df[split_stats_df['gap_count'] > 0].dropna(subset=['week']).copy()
+    gap_stats['gap_speed_total'] = gap_stats['gap_speed_mean'] * gap_stats['gap_count']
+    weekly_gap = gap_stats.groupby('week')[['gap_speed_total', 'gap_count']].sum().reset_index()
+    # Mean split speed for the week, converted to pace
+    weekly_gap['average_grade_adjusted_speed'] = 1000 / (weekly_gap['gap_speed_total'] / weekly_gap['gap_count'])
+    weekly_gap = weekly_gap[['week', 'average_grade_adjusted_speed']]
+    
+    weekly_gap['week'] = pd.to_datetime(weekly_gap['week'].apply(lambda x: f"{x}-1"), format='%Y-%W-%w')
+    
+    return weekly_pace_variation, hr_zones_pivot, weekly_runs, weekly_gap
+
+@timed()
+def filter_outliers(df, settings, mask=None):
+    """Filter outliers based on user settings, reusing a precomputed mask (see load_outlier_mask) when given."""
+    if not settings['enable_filtering']:
+        return df
+    
+    if mask is None:
+        mask = compute_outlier_mask(df, settings)
+    filtered_df = df[mask.reindex(df.index, fill_value=False)]
+    
+    # Add debug information
+    if len(filtered_df) < len(df):
+        logger.info(f"[Metrics] Filtered out {len(df) - len(filtered_df)} activities as outliers")
+    
+    return filtered_df
+
+@timed()
+def calculate_environmental_impact(strava_df):
+    """Calculate environmental impact on running performance."""
+    df = strava_df.copy()
+    
+    # Filter out any rows with missing values in key columns
+    required_columns = ['temperature', 'humidity', 'pollution_aqi', 'pollution_pm25', 
+                       'distance', 'elapsed_time', 'average_speed']
+    df = df.dropna(subset=required_columns)
+    
+    # Min/max of each column come from the running statistics maintained at insert time
+    conn = connect()
+    env_ranges = get_env_ranges(conn)
+    conn.close()
+    
+    def normalize(column):
+        min_val, max_val = env_ranges.get(column, (df[column].min(), df[column].max()))
+        if max_val != min_val:
+            return (df[column] - min_val) / (max_val - min_val)
+        return 1
+    
+    # Basic performance calculations
+    df['pace_min_km'] = 1000 / (df['average_speed'] * 60)
+    
+    # Normalize environmental factors (0-1 scale)
+    env_factors = ['temperature', 'humidity', 'pollution_aqi', 'pollution_pm25']
+    for factor in env_factors:
+        df[f'{factor}_normalized'] = normalize(factor)
+    
+    # Calculate performance score (inverse of pace - faster is better)
+    df['performance_score'] = 1 / (df['elapsed_time'] / df['distance'])
+    df['performance_score_normalized'] = normalize('performance_score')
+    
+    return df
+
+@timed()
+def period_metrics(strava_df, metrics=METRIC_NAMES, periods=COMPARISON_PERIODS):
+    """One row per (metric, period): daily mean and median, previous period value and percentage change."""
+    rows = []
+    for metric in metrics:
+        for period in periods:
+            current_value, _, median_value, _, _ = calculate_metric(strava_df, metric, period)
+            previous_period = get_previous_period(period)
+            previous_value = calculate_metric(strava_df, metric, previous_period)[0] if previous_period else None
+            rows.append({
+                'metric': metric,
+                'period': period,
+                'value': current_value,
+                'median': median_value,
+                'previous_value': previous_value,
+                'percentage_change': calculate_percentage_change(current_value, previous_value)
+            })
+    return pd.DataFrame(rows)
+
+@timed()
+def weekly_metrics_frame(weekly_metrics):
+    """Joins the frames returned by calculate_weekly_metrics into one row per week."""
+    weekly_pace_variation, hr_zones_pivot, weekly_runs, weekly_gap = weekly_metrics
+    frame = weekly_runs.set_index('week')
+    if not weekly_pace_variation.empty:
+        frame = frame.join(weekly_pace_variation.set_index('week').rename(columns={'variation': 'pace_variation'}),
+                           how='outer')
+    frame = frame.join(weekly_gap.set_index('week'), how='outer')
+    if not hr_zones_pivot.empty:
+        frame = frame.join(hr_zones_pivot.add_prefix('hr_zone_pct_'), how='outer')
+    frame.index.name = 'week'
+    return frame.sort_index().reset_index()
@@ -0,0 +1,79 @@
+import json
+
+import numpy as np
+
+
+# Settings key -> (activity column, factor converting it to the unit used by the settings)
+OUTLIER_COLUMNS = {
+    'speed': ('average_speed', 3.6),  # m/s to km/h
+    'distance': ('distance', 1.0),
+    'heart_rate': ('average_heartrate', 1.0)
+}
+
+# Detection modes: manual thresholds from the sidebar, or per-metric thresholds derived from the data
+OUTLIER_MODES = {
+    'manual': "Manual thresholds",
+    'mad': "Automatic (median ± k·MAD)",
+    'iqr': "Automatic (quartiles ± k·IQR)"
+}
+
+# Default k for the automatic modes
+DEFAULT_SENSITIVITY = {'mad': 3.0, 'iqr': 1.5}
+
+# Scales the median absolute deviation to a standard deviation for normally distributed data
+MAD_SCALE = 1.4826
+
+def settings_key(settings):
+    """Canonical, hashable form of the outlier settings, used as a memoization key."""
+    return json.dumps(settings, sort_keys=True)
+
+def _values(df):
+    keys = [key for key, (column, _) in OUTLIER_COLUMNS.items() if column in df.columns]
+    columns = [OUTLIER_COLUMNS[key][0] for key in keys]
+    scales = np.array([OUTLIER_COLUMNS[key][1] for key in keys])
+    return keys, df[columns].to_numpy(dtype=float) * scales
+
+def outlier_thresholds(df, settings):
+    """Returns {key: {'min', 'max'}} bounds: the manual settings, or MAD/IQR bounds computed from df.
+
+    The automatic modes compute every metric's bounds in one vectorized pass; a metric without spread
+    is left unbounded.
+    """
+    mode = settings.get('mode', 'manual')
+    if mode == 'manual':
+        return {key: settings[key] for key in OUTLIER_COLUMNS}
+
+    keys, values = _values(df)
+    k = settings.get('sensitivity', DEFAULT_SENSITIVITY[mode])
+    with np.errstate(invalid='ignore'):
+        if mode == 'mad':
+            center = np.nanmedian(values, axis=0)
+            spread = np.nanmedian(np.abs(values - center), axis=0) * MAD_SCALE
+            low, high = center - k * spread, center + k * spread
+        elif mode == 'iqr':
+            q1, q3 = np.nanpercentile(values, [25, 75], axis=0)
+            spread = q3 - q1
+            low, high = q1 - k * spread, q3 + k * spread
+        else:
+            raise ValueError(f"Unknown outlier mode '{mode}'")
+    unbounded = ~(spread > 0)
+    low = np.where(unbounded, -np.inf, low)
+    high = np.where(unbounded, np.inf, high)
+    return {key: {'min': float(lo), 'max': float(hi)} for key, lo, hi in zip(keys, low, high)}
+
+def compute_outlier_mask(df, settings):
+    """Boolean Series, aligned with df, that is True for the activities kept by the settings.
+
+    Activities missing a checked metric are treated as outliers.
+    """
+    import pandas as pd
+
+    if not settings['enable_filtering']:
+        return pd.Series(True, index=df.index)
+    thresholds = outlier_thresholds(df, settings)
+    keys, values = _values(df)
+    low = np.array([thresholds[key]['min'] for key in keys])
+    high = np.array([thresholds[key]['max'] for key in keys])
+    with np.errstate(invalid='ignore'):
+        keep = ((values >= low) & (values <= high)).all(axis=1)
+    return pd.Series(keep, index=df.index)
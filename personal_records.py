@@ -0,0 +1,102 @@
+"""Personal records index over best_efforts_data.
+
+For every best effort name (400m, 1k, 5k, ...) the personal_records table keeps the PR_TOP_N fastest efforts,
+ranked, and every effort that was a personal record when it was run (faster than every earlier effort of that
+name), which together give the current best, its progression and the top efforts. Efforts that are neither
+are not stored, and a stored activity's efforts are placed with a few indexed lookups each, so views never
+scan best_efforts_data.
+"""
+
+
+# Fastest efforts kept per effort name
+PR_TOP_N = 10
+
+# Every indexed effort with its activity's distance and city, shortest effort first and fastest first within each
+PERSONAL_RECORDS_QUERY = """
+    SELECT
+        p.effort_id,
+        p.name,
+        p.activity_id,
+        p.distance,
+        p.elapsed_time,
+        p.start_date,
+        p.rank,
+        p.progression,
+        a.distance AS activity_distance,
+        a.city_name
+    FROM personal_records p
+    LEFT JOIN strava_activities_weather a ON a.id = p.activity_id
+    ORDER BY p.distance, p.name, p.elapsed_time, p.start_date
+"""
+
+def _place_effort(cursor, effort_id, activity_id, name, distance, elapsed_time, start_date):
+    """Ranks and records one effort against the indexed efforts of its name."""
+    # Efforts are ordered in time by (start_date, effort_id); the last record before this effort is the
+    # fastest of everything run earlier
+    cursor.execute("""
+        SELECT elapsed_time FROM personal_records
+        WHERE name = ? AND progression = 1 AND (start_date, effort_id) < (?, ?)
+        ORDER BY start_date DESC, effort_id DESC LIMIT 1
+    """, (name, start_date, effort_id))
+    previous_record = cursor.fetchone()
+    progression = previous_record is None or elapsed_time < previous_record[0]
+    if progression:
+        # Later records this effort is at least as fast as were not records after all
+        cursor.execute("""
+            UPDATE personal_records SET progression = 0
+            WHERE name = ? AND progression = 1 AND (start_date, effort_id) > (?, ?) AND elapsed_time >= ?
+        """, (name, start_date, effort_id, elapsed_time))
+
+    # Ties are ranked by date, then by effort id
+    cursor.execute("""
+        SELECT COUNT(*) FROM personal_records
+        WHERE name = ? AND rank IS NOT NULL AND (elapsed_time, start_date, effort_id) < (?, ?, ?)
+    """, (name, elapsed_time, start_date, effort_id))
+    rank = cursor.fetchone()[0] + 1
+    if rank <= PR_TOP_N:
+        cursor.execute("UPDATE personal_records SET rank = rank + 1 WHERE name = ? AND rank >= ?", (name, rank))
+        cursor.execute("UPDATE personal_records SET rank = NULL WHERE name = ? AND rank > ?", (name, PR_TOP_N))
+    else:
+        rank = None
+
+    if progression or rank is not None:
+        cursor.execute("""
+            INSERT OR REPLACE INTO personal_records
+            (effort_id, name, activity_id, distance, elapsed_time, start_date, rank, progression)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (effort_id, name, activity_id, distance, elapsed_time, start_date, rank, int(progression)))
+        cursor.execute("DELETE FROM personal_records WHERE name = ? AND rank IS NULL AND progression = 0", (name,))
+
+def update_personal_records(conn, activity_id):
+    """Places a newly stored activity's best efforts in the personal records index."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, activity_id, name, distance, elapsed_time, start_date FROM best_efforts_data
+        WHERE activity_id = ? AND elapsed_time IS NOT NULL AND start_date IS NOT NULL
+          AND id NOT IN (SELECT effort_id FROM personal_records WHERE activity_id = ?)
+        ORDER BY id
+    """, (activity_id, activity_id))
+    for effort in cursor.fetchall():
+        _place_effort(cursor, *effort)
+    conn.commit()
+
+def rebuild_personal_records(conn):
+    """Recomputes the personal records index from every stored best effort."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM personal_records")
+    cursor.execute("""
+        INSERT INTO personal_records (effort_id, name, activity_id, distance, elapsed_time, start_date, rank, progression)
+        SELECT id, name, activity_id, distance, elapsed_time, start_date,
+               CASE WHEN fastest <= ? THEN fastest END,
+               earlier_best IS NULL OR elapsed_time < earlier_best
+        FROM (
+            SELECT *,
+                   ROW_NUMBER() OVER (PARTITION BY name ORDER BY elapsed_time, start_date, id) AS fastest,
+                   MIN(elapsed_time) OVER (PARTITION BY name ORDER BY start_date, id
+                                           ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS earlier_best
+            FROM best_efforts_data
+            WHERE elapsed_time IS NOT NULL AND start_date IS NOT NULL
+        )
+        WHERE fastest <= ? OR earlier_best IS NULL OR elapsed_time < earlier_best
+    """, (PR_TOP_N, PR_TOP_N))
+    conn.commit()
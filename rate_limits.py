@@ -0,0 +1,98 @@
+import multiprocessing, time
+
+from instrumentation import increment
+from logs import get_logger
+
+
+# Strava application quota (read requests), shared by every athlete token of the app
+STRAVA_APP_REQUESTS_PER_15_MIN = 100
+STRAVA_APP_REQUESTS_PER_DAY = 1000
+
+# Share of the application quota one athlete token may use, so a large backfill cannot starve the others
+ATHLETE_REQUESTS_PER_15_MIN = 50
+
+# Strava quota windows reset on natural quarter hours
+STRAVA_WINDOW_SECONDS = 15 * 60
+
+logger = get_logger("rate_limits")
+
+class QuotaWindow:
+    """Request quota over fixed windows aligned like Strava's, held in shared memory so that one quota can
+    pace several processes.
+
+    Allows `capacity` requests per window of `period` seconds; windows start on multiples of `period`
+    since the epoch, i.e. on natural quarter hours and at midnight UTC, as Strava counts them. Pass it to
+    worker processes at start-up (pool initializer arguments); a quota used by a single process is simply local.
+    """
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+        self._window = multiprocessing.RawValue('d', -1)
+        self._used = multiprocessing.RawValue('i', 0)
+        self._lock = multiprocessing.Lock()
+
+    def acquire(self):
+        """Counts one request, sleeping until the next window when this one is used up. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.time()
+                window = now // self.period
+                if window != self._window.value:
+                    self._window.value, self._used.value = window, 0
+                if self._used.value < self.capacity:
+                    self._used.value += 1
+                    return waited
+                wait = (window + 1) * self.period - now
+            time.sleep(wait)
+            waited += wait
+
+def app_quotas():
+    """Quotas for the application-wide 15 minute and daily limits."""
+    return [QuotaWindow(STRAVA_APP_REQUESTS_PER_15_MIN, STRAVA_WINDOW_SECONDS),
+            QuotaWindow(STRAVA_APP_REQUESTS_PER_DAY, 24 * 60 * 60)]
+
+def _usage_exhausted(headers):
+    """True when Strava's reported 15 minute usage has reached its limit."""
+    for prefix in ('X-ReadRateLimit', 'X-RateLimit'):
+        usage, limit = headers.get(f'{prefix}-Usage'), headers.get(f'{prefix}-Limit')
+        if usage and limit:
+            try:
+                return int(usage.split(',')[0]) >= int(limit.split(',')[0])
+            except ValueError:
+                return False
+    return False
+
+class QuotaLimiter:
+    """stravalib rate limiter pacing one token with its own quota and the shared application quotas.
+
+    stravalib calls it with the response headers after every request, so each call admits the next request:
+    it waits for the next quarter hour when Strava reports the short-term quota as used up, then counts the
+    next request against every quota. Nothing is counted before the first request; the first call counts it
+    as well. Counts requests and seconds spent waiting.
+    """
+
+    def __init__(self, token_quota, app_quotas=()):
+        self.quotas = [token_quota, *app_quotas]
+        self.requests = 0
+        self.waited_seconds = 0.0
+        # Whether the request just made was counted when the previous call admitted it
+        self._admitted = False
+
+    def _acquire(self):
+        for quota in self.quotas:
+            self.waited_seconds += quota.acquire()
+
+    def __call__(self, headers, method=None):
+        self.requests += 1
+        if not self._admitted:
+            self._acquire()
+        if headers and _usage_exhausted(headers):
+            wait = STRAVA_WINDOW_SECONDS - time.time() % STRAVA_WINDOW_SECONDS
+            logger.info(f"[Strava] Rate limit reached, waiting {wait:.0f}s")
+            increment('strava_rate_limit_waits')
+            time.sleep(wait)
+            self.waited_seconds += wait
+        self._acquire()
+        self._admitted = True
@@ -0,0 +1,195 @@
+"""Repeated-route detection.
+
+A route (see routes.py) is reduced to the set of grid cells it passes through, its "shingles"; two runs
+of the same loop share most of them. MinHash signatures estimate the Jaccard similarity of two shingle
+sets, and their bands are bucketed (locality-sensitive hashing) so that a new route is only compared
+with the stored routes sharing a bucket, not with every stored route. A route at least
+SAME_ROUTE_SIMILARITY similar to a stored one joins that route's group.
+"""
+import collections
+
+import numpy as np
+
+from routes import COORDINATE_SCALE, load_routes
+
+
+# Shingle grid cell edge in degrees (about 110 m of latitude)
+SHINGLE_CELL_DEG = 0.001
+
+# MinHash functions per signature, bucketed in LSH_BANDS bands of equal rows. With 32 bands of 4 rows,
+# a pair of routes at similarity 0.6 shares a bucket with probability 1 - (1 - 0.6**4)**32 ≈ 0.99
+MINHASH_FUNCTIONS = 128
+LSH_BANDS = 32
+
+# Most recently started routes per LSH bucket a new route is compared with; runs of a popular route keep landing
+# in the same buckets, so this bounds the comparisons without missing its group
+LSH_BUCKET_CANDIDATES = 8
+
+# Estimated Jaccard similarity above which two runs are on the same route
+SAME_ROUTE_SIMILARITY = 0.6
+
+# Routes with fewer runs are left out of the route comparisons
+MIN_ROUTE_RUNS = 3
+
+# Seed of the MinHash functions; signatures are only comparable when computed with the same functions
+MINHASH_SEED = 20240601
+
+# Multiply-shift hashing: the high 32 bits of (a * x + b) mod 2**64 with random odd a, one (a, b) per function
+_rng = np.random.default_rng(MINHASH_SEED)
+_multipliers = _rng.integers(0, 2**64, size=(MINHASH_FUNCTIONS, 1), dtype=np.uint64, endpoint=False) | np.uint64(1)
+_increments = _rng.integers(0, 2**64, size=(MINHASH_FUNCTIONS, 1), dtype=np.uint64, endpoint=False)
+
+# Odd 64-bit multipliers mixing the rows of a band into its bucket (wrapping multiplication)
+_band_multipliers = _rng.integers(0, 2**64, size=MINHASH_FUNCTIONS // LSH_BANDS, dtype=np.uint64) | np.uint64(1)
+
+def route_shingles(points):
+    """Ids of the grid cells an E7 route passes through; segments are walked in half-cell steps."""
+    cell = SHINGLE_CELL_DEG * COORDINATE_SCALE
+    points = points.astype(np.float64)
+    deltas = np.diff(points, axis=0)
+    steps = np.maximum(np.ceil(np.abs(deltas).max(axis=1, initial=0) / (cell / 2)), 1).astype(np.int64)
+    segment = np.repeat(np.arange(len(deltas)), steps)
+    fraction = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / steps[segment]
+    walked = np.vstack([points[segment] + fraction[:, None] * deltas[segment], points[-1:]])
+    cells = np.floor(walked / cell).astype(np.int64)
+    # Cell indices stay within ±360000, so this pairing is unique
+    return np.unique(((cells[:, 0] + 180000) * 720001 + cells[:, 1] + 360000).astype(np.uint64))
+
+def minhash_signature(shingles):
+    """MINHASH_FUNCTIONS minimum hash values of a shingle set (uint32)."""
+    return ((_multipliers * shingles[None, :] + _increments) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+def lsh_buckets(signature):
+    """(band, bucket) pairs of a signature; similar signatures share at least one with high probability."""
+    bands = signature.astype(np.uint64).reshape(LSH_BANDS, -1)
+    return list(enumerate((bands * _band_multipliers).sum(axis=1).view(np.int64).tolist()))
+
+def _signature(points):
+    return minhash_signature(route_shingles(points)) if len(points) >= 2 else None
+
+def _best_match(signature, candidate_signatures):
+    """Index and estimated similarity of the most similar candidate, or (None, 0.0)."""
+    if not len(candidate_signatures):
+        return None, 0.0
+    similarity = (np.asarray(candidate_signatures) == signature).mean(axis=1)
+    best = int(similarity.argmax())
+    return best, float(similarity[best])
+
+def _store(cursor, rows):
+    """Stores (activity_id, start_date, signature, similarity, group_id, LSH buckets) rows."""
+    cursor.executemany("""
+        INSERT OR REPLACE INTO route_signatures (activity_id, signature, group_id, similarity) VALUES (?, ?, ?, ?)
+    """, [(activity_id, signature.tobytes(), group_id, similarity)
+          for activity_id, _, signature, similarity, group_id, _ in rows])
+    # Inserted in key order, which keeps the index writes local
+    cursor.executemany("INSERT OR IGNORE INTO route_lsh (band, bucket, start_date, activity_id) VALUES (?, ?, ?, ?)",
+                       sorted((band, bucket, row[1], row[0]) for row in rows for band, bucket in row[5]))
+
+def update_route_group(conn, activity_id):
+    """Assigns a newly stored route to the group of its most similar stored route, or to a new group."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM route_signatures WHERE activity_id = ?", (activity_id,))
+    if cursor.fetchone():
+        return
+    signature = _signature(load_routes(conn, [activity_id]).get(activity_id, np.empty((0, 2))))
+    if signature is None:
+        return
+
+    cursor.execute("SELECT start_date FROM strava_activities_weather WHERE id = ?", (activity_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return
+    start_date = row[0]
+    buckets = lsh_buckets(signature)
+    # One primary key range per bucket, most recently started routes first as in rebuild_route_groups
+    bucket_query = "SELECT * FROM (SELECT activity_id FROM route_lsh WHERE band = ? AND bucket = ? " \
+                   "ORDER BY start_date DESC, activity_id DESC LIMIT ?)"
+    cursor.execute(f"""
+        SELECT activity_id, signature, group_id FROM route_signatures
+        WHERE activity_id IN ({' UNION '.join(bucket_query for _ in buckets)})
+    """, [value for band, bucket in buckets for value in (band, bucket, LSH_BUCKET_CANDIDATES)])
+    candidates = cursor.fetchall()
+    best, similarity = _best_match(signature, [np.frombuffer(row[1], dtype=np.uint32) for row in candidates])
+
+    if best is not None and similarity >= SAME_ROUTE_SIMILARITY:
+        group_id = candidates[best][2]
+        cursor.execute("UPDATE route_groups SET n_runs = n_runs + 1 WHERE group_id = ?", (group_id,))
+    else:
+        cursor.execute("INSERT INTO route_groups (first_activity_id, n_runs) VALUES (?, 1)", (activity_id,))
+        group_id, similarity = cursor.lastrowid, None
+    _store(cursor, [(activity_id, start_date, signature, similarity, group_id, buckets)])
+    conn.commit()
+
+def rebuild_route_groups(conn):
+    """Regroups every stored route from scratch, oldest run first, with the LSH buckets kept in memory.
+
+    Identical routes (the same polyline stored twice) are hashed once.
+    """
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM route_lsh")
+    cursor.execute("DELETE FROM route_signatures")
+    cursor.execute("DELETE FROM route_groups")
+    cursor.execute("""
+        SELECT r.activity_id, a.start_date FROM routes r
+        JOIN strava_activities_weather a ON a.id = r.activity_id
+        ORDER BY a.start_date, r.activity_id
+    """)
+    started = cursor.fetchall()
+    routes = load_routes(conn)
+
+    signatures = np.empty((len(started), MINHASH_FUNCTIONS), dtype=np.uint32)
+    group_ids, buckets, groups, rows, hashed = [], {}, {}, [], {}
+    for activity_id, start_date in started:
+        points = routes[activity_id].tobytes()
+        if points not in hashed:
+            signature = _signature(routes[activity_id])
+            hashed[points] = (signature, lsh_buckets(signature) if signature is not None else None)
+        signature, keys = hashed[points]
+        if signature is None:
+            continue
+        candidates = sorted({index for key in keys for index in buckets.get(key, ())})
+        best, similarity = _best_match(signature, signatures[candidates])
+        if best is not None and similarity >= SAME_ROUTE_SIMILARITY:
+            group_id = group_ids[candidates[best]]
+            groups[group_id][1] += 1
+        else:
+            cursor.execute("INSERT INTO route_groups (first_activity_id, n_runs) VALUES (?, 1)", (activity_id,))
+            group_id, similarity = cursor.lastrowid, None
+            groups[group_id] = [activity_id, 1]
+        for key in keys:
+            buckets.setdefault(key, collections.deque(maxlen=LSH_BUCKET_CANDIDATES)).append(len(group_ids))
+        signatures[len(group_ids)] = signature
+        group_ids.append(group_id)
+        rows.append((activity_id, start_date, signature, similarity, group_id, keys))
+
+    _store(cursor, rows)
+    cursor.executemany("UPDATE route_groups SET n_runs = ? WHERE group_id = ?",
+                       [(n_runs, group_id) for group_id, (_, n_runs) in groups.items()])
+    conn.commit()
+
+# Runs of every route with at least {min_runs} runs, with pace and conditions, for the route comparisons
+ROUTE_COMPARISON_QUERY = """
+    SELECT
+        g.group_id,
+        g.n_runs,
+        a.id,
+        a.start_date_ist,
+        a.distance,
+        a.average_speed,
+        a.average_heartrate,
+        a.temperature,
+        a.humidity,
+        a.pollution_aqi,
+        a.pollution_pm25,
+        a.city_name,
+        s.similarity
+    FROM route_groups g
+    JOIN route_signatures s ON s.group_id = g.group_id
+    JOIN strava_activities_weather a ON a.id = s.activity_id
+    WHERE g.n_runs >= {min_runs}
+    ORDER BY g.n_runs DESC, g.group_id, a.start_date_ist
+"""
+
+def route_comparison_query(min_runs=MIN_ROUTE_RUNS):
+    """Builds the SQL returning the runs of every repeated route."""
+    return ROUTE_COMPARISON_QUERY.format(min_runs=int(min_runs))
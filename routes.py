@@ -0,0 +1,149 @@
+"""Decoded activity routes.
+
+Strava's summary polylines are decoded once, when the activity is stored, into int32 arrays of
+(latitude, longitude) in units of 1e-7 degree ("E7"), kept as blobs in the routes table. Each route's
+bounding box is indexed in the routes_bbox R*Tree for spatial queries.
+"""
+import numpy as np
+
+
+# Polylines encode degrees * 1e5; routes are stored as degrees * 1e7
+POLYLINE_SCALE = 10**5
+COORDINATE_SCALE = 10**7
+
+# Polylines decoded per batch when rebuilding the routes table
+DECODE_BATCH = 5000
+
+# Chunks of 5 bits needed for a 32-bit value; longer chunk runs only appear in corrupt polylines
+MAX_CHUNKS_PER_VALUE = 7
+
+ROUTE_INSERT = """
+    INSERT OR REPLACE INTO routes (activity_id, n_points, min_lat, min_lon, max_lat, max_lon, points)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+BBOX_INSERT = "INSERT OR REPLACE INTO routes_bbox (activity_id, min_lat, max_lat, min_lon, max_lon) VALUES (?, ?, ?, ?, ?)"
+
+def decode_polylines(polylines):
+    """Decodes encoded polylines into (n, 2) int32 arrays of E7 (latitude, longitude), in one vectorized pass.
+
+    None, empty and malformed polylines decode to empty arrays.
+    """
+    encoded = [polyline.encode('ascii', 'replace') if polyline else b'' for polyline in polylines]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    if not lengths.sum():
+        return [np.empty((0, 2), dtype=np.int32) for _ in encoded]
+
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.int64) - 63
+    owner = np.repeat(np.arange(len(encoded)), lengths)
+    bad = (data < 0) | (data > 63)
+
+    # A value ends at a byte without the continuation bit, and never runs into the next polyline
+    last = (data & 0x20) == 0
+    last[np.cumsum(lengths)[lengths > 0] - 1] = True
+    starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    position = np.arange(len(data)) - np.repeat(starts, np.diff(np.append(starts, len(data))))
+    bad |= position >= MAX_CHUNKS_PER_VALUE
+    values = np.add.reduceat((data & 0x1f) << (5 * np.minimum(position, MAX_CHUNKS_PER_VALUE - 1)), starts)
+    values = np.where(values & 1, ~(values >> 1), values >> 1)
+
+    # Values alternate latitude and longitude deltas; polylines with a dangling value are malformed
+    value_owner = owner[starts]
+    counts = np.bincount(value_owner, minlength=len(encoded))
+    valid = (counts % 2 == 0) & (np.bincount(owner[bad], minlength=len(encoded)) == 0)
+    values = values[valid[value_owner]]
+    points = np.where(valid, counts // 2, 0)
+
+    # Deltas accumulate within each polyline: cumulative sums minus the running total before it
+    coordinates = np.cumsum(values.reshape(-1, 2), axis=0)
+    ends = np.cumsum(points)
+    before = np.zeros((len(encoded), 2), dtype=np.int64)
+    before[ends - points > 0] = coordinates[(ends - points)[ends - points > 0] - 1]
+    coordinates -= np.repeat(before, points, axis=0)
+    coordinates *= COORDINATE_SCALE // POLYLINE_SCALE
+
+    routes = np.split(coordinates, ends[:-1])
+    return [
+        route.astype(np.int32) if len(route) and np.abs(route).max() <= 180 * COORDINATE_SCALE
+        else np.empty((0, 2), dtype=np.int32)
+        for route in routes
+    ]
+
+def decode_polyline(polyline):
+    """Decodes one encoded polyline into an (n, 2) int32 array of E7 (latitude, longitude)."""
+    return decode_polylines([polyline])[0]
+
+def encode_polyline(points):
+    """Encodes E7 (latitude, longitude) points as a polyline; the inverse of decode_polyline at 1e-5 degree precision."""
+    encoded, previous = [], (0, 0)
+    for point in points:
+        current = tuple(round(int(value) / (COORDINATE_SCALE // POLYLINE_SCALE)) for value in point)
+        for value, last in zip(current, previous):
+            delta = value - last
+            delta = ~(delta << 1) if delta < 0 else delta << 1
+            while delta >= 0x20:
+                encoded.append(chr((0x20 | (delta & 0x1f)) + 63))
+                delta >>= 5
+            encoded.append(chr(delta + 63))
+        previous = current
+    return ''.join(encoded)
+
+def to_degrees(points):
+    """E7 route points as float (latitude, longitude) degrees."""
+    return points / COORDINATE_SCALE
+
+def _route_rows(activity_ids, polylines):
+    rows = []
+    for activity_id, points in zip(activity_ids, decode_polylines(polylines)):
+        if len(points):
+            (min_lat, min_lon), (max_lat, max_lon) = points.min(axis=0).tolist(), points.max(axis=0).tolist()
+            rows.append((activity_id, len(points), min_lat, min_lon, max_lat, max_lon, points.astype('<i4').tobytes()))
+    return rows
+
+def _store_routes(cursor, rows):
+    cursor.executemany(ROUTE_INSERT, rows)
+    cursor.executemany(BBOX_INSERT, [(row[0], row[2], row[4], row[3], row[5]) for row in rows])
+
+def update_route(conn, activity_id):
+    """Decodes and stores the route of a newly inserted activity."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT map_summary_polyline FROM strava_activities_weather WHERE id = ?", (activity_id,))
+    row = cursor.fetchone()
+    if row and row[0]:
+        _store_routes(cursor, _route_rows([activity_id], [row[0]]))
+        conn.commit()
+
+def rebuild_routes(conn):
+    """Decodes every stored polyline again, in batches."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM routes")
+    cursor.execute("DELETE FROM routes_bbox")
+    rows = conn.execute("""
+        SELECT id, map_summary_polyline FROM strava_activities_weather
+        WHERE map_summary_polyline IS NOT NULL AND map_summary_polyline != ''
+    """)
+    while batch := rows.fetchmany(DECODE_BATCH):
+        _store_routes(cursor, _route_rows([row[0] for row in batch], [row[1] for row in batch]))
+    conn.commit()
+
+def load_routes(conn, activity_ids=None):
+    """Returns {activity_id: (n, 2) int32 E7 array} for the given activities (all stored routes by default)."""
+    if activity_ids is None:
+        rows = conn.execute("SELECT activity_id, points FROM routes").fetchall()
+    else:
+        activity_ids, rows = list(activity_ids), []
+        # Stay below SQLite's host parameter limit
+        for start in range(0, len(activity_ids), 500):
+            chunk = activity_ids[start:start + 500]
+            rows += conn.execute(f"SELECT activity_id, points FROM routes WHERE activity_id IN "
+                                 f"({', '.join('?' for _ in chunk)})", chunk).fetchall()
+    return {activity_id: np.frombuffer(points, dtype='<i4').reshape(-1, 2) for activity_id, points in rows}
+
+def routes_in_bbox(conn, min_lat, min_lon, max_lat, max_lon):
+    """Ids of the activities whose route bounding box intersects the given box (in degrees)."""
+    bounds = [round(value * COORDINATE_SCALE) for value in (max_lat, min_lat, max_lon, min_lon)]
+    rows = conn.execute("""
+        SELECT activity_id FROM routes_bbox
+        WHERE min_lat <= ? AND max_lat >= ? AND min_lon <= ? AND max_lon >= ?
+    """, bounds)
+    return [row[0] for row in rows]
@@ -0,0 +1,187 @@
+"""Headless RunInsight commands for cron jobs and batch exports.
+
+    python -m runinsight [--athlete ID] sync [--since YYYY-MM-DD]
+    python -m runinsight sync-all [--since YYYY-MM-DD] [--workers N] [--slice-size N] [--only ID ...]
+    python -m runinsight [--athlete ID] backfill-weather [--limit N]
+    python -m runinsight [--athlete ID] rebuild-rollups
+    python -m runinsight [--athlete ID] export-metrics --format parquet|csv|json --output PATH [--kind period|weekly]
+    python -m runinsight athletes add ID --name NAME --refresh-token TOKEN | athletes list | athletes remove ID
+
+--athlete runs the command on that athlete's shard; without it the single-athlete database is used.
+
+Progress logs go to stderr. Each command prints one JSON report on stdout (status, elapsed seconds and
+per-stage timings) and exits 0 on success, 1 on failure (including Strava errors during a sync) and 2 on
+invalid arguments.
+"""
+import argparse, contextlib, json, sys, time
+from datetime import datetime, timezone
+
+from api_client import load_env
+from database import connect, create_database_and_tables, use_athlete
+from sync_pool import SYNC_MAX_WORKERS, SYNC_SLICE_ACTIVITIES
+
+
+# Formats accepted by export-metrics
+EXPORT_FORMATS = ['parquet', 'csv', 'json']
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}', expected YYYY-MM-DD")
+
+def run_sync(args):
+    from sync import default_since, sync_activities
+
+    since = args.since or default_since()
+    errors = []
+    report = sync_activities(since, interactive=False, on_error=errors.append)
+    return {'since': since.strftime('%Y-%m-%d'), **report, 'errors': errors}
+
+def run_sync_all(args):
+    from athletes import list_athletes
+    from sync_pool import sync_athletes
+
+    athlete_ids = args.only or [athlete_id for athlete_id, _ in list_athletes()]
+    if not athlete_ids:
+        raise RuntimeError("No registered athletes; add one with 'runinsight athletes add'")
+    report = sync_athletes(athlete_ids, after=args.since, max_workers=args.workers,
+                           slice_activities=args.slice_size)
+    if report['failed']:
+        report['errors'] = [f"{athlete['athlete_id']}: {athlete['error']}"
+                            for athlete in report['athletes'] if athlete['status'] != 'ok']
+    return report
+
+def run_backfill_weather(args):
+    from sync import backfill_weather
+
+    return backfill_weather(limit=args.limit)
+
+def run_rebuild_rollups(args):
+    from database import rebuild_rollups
+
+    create_database_and_tables()
+    started = time.perf_counter()
+    conn = connect()
+    try:
+        rebuild_rollups(conn)
+    finally:
+        conn.close()
+    return {'timings': {'rebuild_rollups': {'seconds': round(time.perf_counter() - started, 4), 'count': 1}}}
+
+def run_export_metrics(args):
+    from metrics import calculate_weekly_metrics, period_metrics, prepare_data, weekly_metrics_frame
+
+    create_database_and_tables()
+    timings = {}
+    started = time.perf_counter()
+    strava_df, split_stats_df, _ = prepare_data()
+    timings['load'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if args.kind == 'weekly':
+        frame = weekly_metrics_frame(calculate_weekly_metrics(strava_df, split_stats_df))
+    else:
+        frame = period_metrics(strava_df)
+    timings['compute'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if args.format == 'parquet':
+        frame.to_parquet(args.output, index=False)
+    elif args.format == 'csv':
+        frame.to_csv(args.output, index=False)
+    else:
+        frame.to_json(args.output, orient='records', date_format='iso', indent=2)
+    timings['write'] = time.perf_counter() - started
+
+    return {
+        'kind': args.kind,
+        'format': args.format,
+        'output': args.output,
+        'rows': len(frame),
+        'timings': {stage: {'seconds': round(seconds, 4), 'count': 1} for stage, seconds in timings.items()}
+    }
+
+def run_athletes(args):
+    from athletes import list_athletes, register_athlete, remove_athlete
+
+    if args.action == 'add':
+        register_athlete(args.athlete_id, args.name, args.refresh_token)
+    elif args.action == 'remove':
+        remove_athlete(args.athlete_id)
+    return {'athletes': [{'athlete_id': athlete_id, 'name': name} for athlete_id, name in list_athletes()]}
+
+COMMANDS = {
+    'sync': run_sync,
+    'sync-all': run_sync_all,
+    'backfill-weather': run_backfill_weather,
+    'rebuild-rollups': run_rebuild_rollups,
+    'export-metrics': run_export_metrics,
+    'athletes': run_athletes
+}
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='runinsight', description="Headless RunInsight sync and export commands.")
+    parser.add_argument('--athlete', help="registered athlete whose shard the command runs on")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sync_parser = subparsers.add_parser('sync', help="fetch new runs from Strava (needs STRAVA_REFRESH_TOKEN)")
+    sync_parser.add_argument('--since', type=parse_date,
+                             help="first day to sync (default: day of the newest stored activity)")
+
+    sync_all_parser = subparsers.add_parser('sync-all', help="sync every registered athlete in parallel")
+    sync_all_parser.add_argument('--since', type=parse_date,
+                                 help="first day to sync (default: each athlete's newest stored day)")
+    sync_all_parser.add_argument('--workers', type=int, default=SYNC_MAX_WORKERS, help="worker processes")
+    sync_all_parser.add_argument('--slice-size', type=int, default=SYNC_SLICE_ACTIVITIES,
+                                 help="activities listed per athlete before the next athlete gets a turn")
+    sync_all_parser.add_argument('--only', nargs='+', metavar='ID', help="sync only these registered athletes")
+
+    backfill_parser = subparsers.add_parser('backfill-weather', help="fetch weather for runs stored without it")
+    backfill_parser.add_argument('--limit', type=int, help="maximum number of activities to update")
+
+    subparsers.add_parser('rebuild-rollups', help="recompute every derived table from the stored activities")
+
+    export_parser = subparsers.add_parser('export-metrics', help="write period or weekly metrics to a file")
+    export_parser.add_argument('--format', choices=EXPORT_FORMATS, required=True)
+    export_parser.add_argument('--output', required=True, help="destination file")
+    export_parser.add_argument('--kind', choices=['period', 'weekly'], default='period',
+                               help="metric x period comparison table, or one row per week")
+
+    athletes_parser = subparsers.add_parser('athletes', help="manage the athlete registry")
+    actions = athletes_parser.add_subparsers(dest='action', required=True)
+    add_parser = actions.add_parser('add', help="register an athlete or update their credentials")
+    add_parser.add_argument('athlete_id')
+    add_parser.add_argument('--name', required=True)
+    add_parser.add_argument('--refresh-token', required=True)
+    remove_parser = actions.add_parser('remove', help="unregister an athlete (the shard is kept)")
+    remove_parser.add_argument('athlete_id')
+    actions.add_parser('list', help="list registered athletes")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    load_env()
+
+    started = time.perf_counter()
+    report = {'command': args.command, 'athlete': args.athlete}
+    try:
+        if args.athlete is not None and args.command not in ('athletes', 'sync-all'):
+            from athletes import get_athlete
+
+            get_athlete(args.athlete)
+        # Logging goes to stderr already; this keeps the interactive Strava authorization prompt and any
+        # third-party output off stdout, which only carries the JSON report
+        with contextlib.redirect_stdout(sys.stderr), use_athlete(args.athlete):
+            report.update(COMMANDS[args.command](args))
+        report['status'] = 'error' if report.get('errors') else 'ok'
+    except Exception as e:
+        report['status'] = 'error'
+        report['error'] = f"{type(e).__name__}: {e}"
+    report['elapsed_seconds'] = round(time.perf_counter() - started, 4)
+
+    print(json.dumps(report, default=str))
+    return 0 if report['status'] == 'ok' else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,291 @@
+import json, sqlite3, time
+from datetime import datetime, timedelta, timezone
+
+from api_client import STRAVA_REQUEST_DELAY, authenticate_strava, fetch_openweathermap_data, stream_activities
+from athletes import get_athlete, update_refresh_token
+from database import (activities_missing_weather, activity_exists, connect, create_database_and_tables, current_athlete,
+                      insert_strava_data, rebuild_rollups, run_pending_rebuilds, update_activity_weather)
+from instrumentation import collect, histogram_quantile, increment, record
+from logs import get_logger
+
+
+logger = get_logger("sync")
+
+# Days synced by default when the athlete has no activities yet
+DEFAULT_SYNC_DAYS = 7
+
+def day_start_timestamp(start_date):
+    """Epoch of local midnight on the activity's start day; weather is looked up and stored for that instant."""
+    return int(datetime.combine(start_date.date(), datetime.min.time()).timestamp())
+
+class StageTimer:
+    """Accumulates wall-clock seconds and call counts per named stage (also recorded as sync.<stage> spans)."""
+
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+
+    def add(self, stage, started):
+        seconds = time.perf_counter() - started
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+        record(f"sync.{stage}", seconds)
+
+    def report(self):
+        return {stage: {'seconds': round(seconds, 4), 'count': self.counts[stage]}
+                for stage, seconds in self.seconds.items()}
+
+def default_since():
+    """Start of the day of the current athlete's newest stored activity (DEFAULT_SYNC_DAYS ago when empty)."""
+    create_database_and_tables()
+    conn = connect()
+    latest = conn.execute("SELECT MAX(CAST(start_date_ist AS INTEGER)) FROM strava_activities_weather").fetchone()[0]
+    conn.close()
+    day = datetime.fromtimestamp(latest).date() if latest is not None else \
+        datetime.now().date() - timedelta(days=DEFAULT_SYNC_DAYS)
+    return datetime.combine(day, datetime.min.time()).replace(tzinfo=timezone.utc)
+
+def authenticate_athlete(interactive=True, rate_limiter=None):
+    """Strava client for the current athlete.
+
+    Registered athletes authenticate with their own refresh token, and the rotated token Strava returns is
+    saved back to the registry; the single-athlete database uses STRAVA_REFRESH_TOKEN. Raises RuntimeError
+    when authentication fails; interactive=False never prompts on the terminal.
+    """
+    athlete_id = current_athlete.get()
+    refresh_token = get_athlete(athlete_id)['refresh_token'] if athlete_id is not None else None
+    client = authenticate_strava(interactive=interactive and athlete_id is None, refresh_token=refresh_token,
+                                 rate_limiter=rate_limiter)
+    if not client:
+        raise RuntimeError("Failed to authenticate with Strava")
+    if athlete_id is not None and client.refresh_token and client.refresh_token != refresh_token:
+        update_refresh_token(athlete_id, client.refresh_token)
+    return client
+
+def sync_telemetry(recorder, seconds, activities):
+    """Summary of the spans and counters recorded during a sync: per-stage latency histograms, requests,
+    retries, bytes received, cache hit rate and activities per minute."""
+    stages = {}
+    for path, (calls, total) in recorder.spans.items():
+        stage = stages.setdefault(path[-1], {'count': 0, 'seconds': 0.0})
+        stage['count'] += calls
+        stage['seconds'] += total
+    for name, stage in stages.items():
+        buckets = recorder.histograms.get(name, [])
+        stage.update({
+            'seconds': round(stage['seconds'], 4),
+            'mean': round(stage['seconds'] / stage['count'], 4),
+            'p50': histogram_quantile(buckets, 0.5),
+            'p95': histogram_quantile(buckets, 0.95),
+            'buckets': buckets
+        })
+    counters = dict(recorder.counters)
+    cache_hits = counters.get('activities_already_stored', 0) + counters.get('geocode_cache_hits', 0)
+    cache_misses = counters.get('activities_fetched', 0) + counters.get('geocode_cache_misses', 0)
+    return {
+        'seconds': round(seconds, 3),
+        'activities_per_minute': round(activities / (seconds / 60), 2) if seconds else None,
+        'requests': counters.get('strava_requests', 0) + counters.get('http_requests', 0),
+        'retries': counters.get('http_retries', 0) + counters.get('strava_rate_limit_waits', 0),
+        'bytes_received': counters.get('strava_bytes', 0) + counters.get('http_bytes', 0),
+        'cache_hits': cache_hits,
+        'cache_misses': cache_misses,
+        'cache_hit_rate': round(cache_hits / (cache_hits + cache_misses), 3) if cache_hits + cache_misses else None,
+        'stages': stages,
+        'counters': counters
+    }
+
+def save_sync_run(kind, started_at, finished_at, status, error, report, telemetry):
+    """Stores one sync_runs row in the current athlete's database and returns its id."""
+    conn = connect()
+    try:
+        cursor = conn.execute("""
+            INSERT INTO sync_runs (kind, started_at, finished_at, status, error, activities_listed,
+                                   activities_processed, activities_per_minute, requests, retries, bytes_received,
+                                   cache_hits, cache_misses, stages, counters)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (kind, started_at, finished_at, status, error,
+              report.get('activities_listed', report.get('activities_checked')),
+              report.get('activities_processed', report.get('activities_updated')),
+              telemetry['activities_per_minute'], telemetry['requests'], telemetry['retries'],
+              telemetry['bytes_received'], telemetry['cache_hits'], telemetry['cache_misses'],
+              json.dumps(telemetry['stages']), json.dumps(telemetry['counters'])))
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+def last_sync_run(conn):
+    """The most recent sync_runs row as a dict (stages and counters decoded), or None."""
+    conn.row_factory = sqlite3.Row
+    try:
+        row = conn.execute("SELECT * FROM sync_runs ORDER BY id DESC LIMIT 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.row_factory = None
+    if row is None:
+        return None
+    return {**dict(row), 'stages': json.loads(row['stages'] or '{}'), 'counters': json.loads(row['counters'] or '{}')}
+
+def _recorded_run(kind, run, errors):
+    """Runs run() while collecting its telemetry, stores it in sync_runs and adds it to the report."""
+    create_database_and_tables()
+    report, error = {}, None
+    started_at = time.time()
+    with collect() as recorder:
+        try:
+            report = run()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            finished_at = time.time()
+            activities = report.get('activities_processed', report.get('activities_updated', 0))
+            telemetry = sync_telemetry(recorder, finished_at - started_at, activities)
+            status = 'error' if error else 'partial' if errors else 'ok'
+            try:
+                telemetry['sync_run_id'] = save_sync_run(kind, started_at, finished_at, status,
+                                                         error or "; ".join(errors) or None, report, telemetry)
+            except sqlite3.Error as e:
+                logger.error(f"[Sync] Could not store sync telemetry: {e}")
+    return {**report, 'telemetry': telemetry}
+
+def sync_activities(after=None, interactive=True, on_error=None, client=None, before=None, limit=None,
+                    request_delay=STRAVA_REQUEST_DELAY):
+    """Fetches the runs newer than `after` (timezone-aware datetime) from Strava into the current athlete's database.
+
+    Without a client one is authenticated with authenticate_athlete. `before` and `limit` sync one slice:
+    at most `limit` listed activities older than `before`; the report's next_before is where the following
+    slice starts (None once the cutoff is reached).
+    Returns a report dict with activities_listed, activities_processed, synced_years, next_before,
+    per-stage timings and the telemetry stored in sync_runs.
+    """
+    errors = []
+
+    def report_error(message):
+        errors.append(message)
+        if on_error:
+            on_error(message)
+
+    return _recorded_run('sync', lambda: _sync_activities(after, interactive, report_error, client, before, limit,
+                                                          request_delay), errors)
+
+def _sync_activities(after, interactive, on_error, client, before, limit, request_delay):
+    from year_review import refresh_year_summaries
+
+    timer = StageTimer()
+
+    if client is None:
+        started = time.perf_counter()
+        client = authenticate_athlete(interactive=interactive)
+        timer.add('authenticate', started)
+
+    activities_listed = 0
+    activities_processed = 0
+    synced_years = set()
+    next_before = None
+    conn = connect()
+    try:
+        # Rollups the schema check left for later are built before new runs are added to them
+        started = time.perf_counter()
+        if run_pending_rebuilds(conn):
+            timer.add('pending_rebuilds', started)
+
+        activities = stream_activities(client, after=after, on_error=on_error, before=before, delay=request_delay)
+        activity = None
+        while True:
+            if limit is not None and activities_listed >= max(limit, 1):
+                # Slice is full; the next one starts below the last listed activity
+                next_before = activity.start_date
+                break
+            started = time.perf_counter()
+            activity = next(activities, None)
+            timer.add('list_activities', started)
+            if activity is None:
+                break
+            activities_listed += 1
+            if activity.type != 'Run':
+                continue
+            if activity_exists(conn, activity.id):
+                increment('activities_already_stored')
+                continue
+            increment('activities_fetched')
+
+            started = time.perf_counter()
+            detailed_activity = client.get_activity(activity.id)
+            timer.add('fetch_activity', started)
+            if not detailed_activity:
+                continue
+
+            weather_data = air_pollution_data = city_name = None
+            if detailed_activity.start_latlng:
+                started = time.perf_counter()
+                weather_data, air_pollution_data, city_name = fetch_openweathermap_data(
+                    detailed_activity.start_latlng.lat,
+                    detailed_activity.start_latlng.lon,
+                    day_start_timestamp(detailed_activity.start_date),
+                    detailed_activity.elapsed_time
+                )
+                timer.add('fetch_weather', started)
+
+            started = time.perf_counter()
+            ist_timestamp = day_start_timestamp(detailed_activity.start_date)
+            insert_strava_data(conn, detailed_activity, weather_data, air_pollution_data, city_name, ist_timestamp)
+            timer.add('store', started)
+            activities_processed += 1
+            synced_years.add(datetime.fromtimestamp(ist_timestamp, timezone.utc).year)
+
+        # Year in Review summaries depend on whole-year aggregates, refresh each touched year once
+        if synced_years:
+            started = time.perf_counter()
+            refresh_year_summaries(conn, synced_years)
+            timer.add('year_summaries', started)
+    finally:
+        conn.close()
+
+    return {
+        'activities_listed': activities_listed,
+        'activities_processed': activities_processed,
+        'synced_years': sorted(synced_years),
+        'next_before': next_before,
+        'timings': timer.report()
+    }
+
+def backfill_weather(limit=None):
+    """Fetches weather for stored activities that have a start location but no weather, then rebuilds rollups.
+
+    Returns a report dict with activities_checked, activities_updated, per-stage timings and the telemetry
+    stored in sync_runs.
+    """
+    return _recorded_run('backfill_weather', lambda: _backfill_weather(limit), [])
+
+def _backfill_weather(limit):
+    timer = StageTimer()
+    conn = connect()
+    try:
+        rows = activities_missing_weather(conn, limit)
+        updated = 0
+        for activity_id, start_date, latitude, longitude, elapsed_time in rows:
+            start = datetime.fromisoformat(start_date)
+            started = time.perf_counter()
+            weather_data, air_pollution_data, city_name = fetch_openweathermap_data(
+                latitude, longitude, day_start_timestamp(start), elapsed_time or 0
+            )
+            timer.add('fetch_weather', started)
+            if not weather_data:
+                logger.info(f"[Weather] No weather data for activity {activity_id}")
+                continue
+            started = time.perf_counter()
+            update_activity_weather(conn, activity_id, start, weather_data, air_pollution_data, city_name)
+            timer.add('store', started)
+            updated += 1
+
+        if updated:
+            started = time.perf_counter()
+            rebuild_rollups(conn)
+            timer.add('rebuild_rollups', started)
+    finally:
+        conn.close()
+
+    return {'activities_checked': len(rows), 'activities_updated': updated, 'timings': timer.report()}
@@ -0,0 +1,163 @@
+import os, time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from logs import get_logger
+from rate_limits import ATHLETE_REQUESTS_PER_15_MIN, STRAVA_WINDOW_SECONDS, QuotaLimiter, QuotaWindow, app_quotas
+
+
+# Worker processes syncing athletes in parallel
+SYNC_MAX_WORKERS = 4
+
+# Activities listed per turn; an athlete with more goes to the back of the queue so others get a turn
+SYNC_SLICE_ACTIVITIES = 25
+
+logger = get_logger("sync_pool")
+
+# Per worker process: the application quotas and the quota of every athlete token, shared with every other
+# worker, and the client of each athlete this worker has synced
+_app_quotas = []
+_athlete_quotas = {}
+_clients = {}
+
+def default_client_factory(rate_limiter):
+    """Authenticates the current athlete with the given limiter (see sync.authenticate_athlete)."""
+    from sync import authenticate_athlete
+
+    return authenticate_athlete(interactive=False, rate_limiter=rate_limiter)
+
+def _init_worker(quotas, athlete_quotas):
+    global _app_quotas, _athlete_quotas
+    _app_quotas, _athlete_quotas = quotas, athlete_quotas
+    logger.debug(f"[Sync] Worker {os.getpid()} started")
+
+def _sync_slice(athlete_id, after, before, limit, client_factory):
+    """Worker task: syncs one slice of one athlete with this worker's client of that athlete, built on the
+    athlete's first slice in this worker."""
+    from database import use_athlete
+    from sync import default_since, sync_activities
+
+    started = time.perf_counter()
+    errors = []
+    with use_athlete(athlete_id):
+        if athlete_id not in _clients:
+            limiter = QuotaLimiter(_athlete_quotas[athlete_id], _app_quotas)
+            _clients[athlete_id] = (client_factory(limiter), limiter)
+        client, limiter = _clients[athlete_id]
+        after = after or default_since()
+        requests_before, waited_before = limiter.requests, limiter.waited_seconds
+        report = sync_activities(after, interactive=False, on_error=errors.append, client=client, before=before,
+                                 limit=limit, request_delay=0)
+    return {
+        **report,
+        'after': after,
+        'errors': errors,
+        'requests': limiter.requests - requests_before,
+        'rate_limit_wait_seconds': limiter.waited_seconds - waited_before,
+        'seconds': time.perf_counter() - started,
+        'pid': os.getpid()
+    }
+
+def _athlete_summary(athlete_id):
+    return {
+        'athlete_id': athlete_id,
+        'status': 'ok',
+        'error': None,
+        'slices': 0,
+        'activities_listed': 0,
+        'activities_processed': 0,
+        'requests': 0,
+        'rate_limit_wait_seconds': 0.0,
+        'seconds': 0.0,
+        'synced_years': set(),
+        'workers': set(),
+        'timings': {}
+    }
+
+def sync_athletes(athlete_ids, after=None, max_workers=SYNC_MAX_WORKERS, slice_activities=SYNC_SLICE_ACTIVITIES,
+                  client_factory=default_client_factory):
+    """Syncs several athletes in worker processes and returns a summary report.
+
+    Athletes are synced in slices of slice_activities listed activities. Pending slices wait in one queue,
+    and whichever of the max_workers single-process lanes frees up first takes the next one: after a slice,
+    an athlete with more to fetch rejoins the back of the queue, so a long backfill never holds the others
+    back and no lane sits idle while work is pending. An athlete has at most one slice queued or in flight,
+    so its slices run one at a time and in order, on whichever lane is free. A lane builds its own client
+    the first time it syncs an athlete (one token refresh per lane at most); the per-token quota of each
+    athlete and the application quotas are shared by all lanes. `after` defaults to each athlete's newest
+    stored day. client_factory(rate_limiter) builds a client for the current athlete and must be picklable
+    (a module-level function).
+    """
+    summaries = {athlete_id: _athlete_summary(athlete_id) for athlete_id in athlete_ids}
+    lanes = max(1, min(max_workers, len(athlete_ids)))
+    pending = deque((athlete_id, None) for athlete_id in athlete_ids)
+    in_flight = {}
+    started = time.perf_counter()
+
+    quotas = app_quotas()
+    athlete_quotas = {athlete_id: QuotaWindow(ATHLETE_REQUESTS_PER_15_MIN, STRAVA_WINDOW_SECONDS)
+                      for athlete_id in athlete_ids}
+    pools = [ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=(quotas, athlete_quotas))
+             for _ in range(lanes)]
+    try:
+        while pending or in_flight:
+            busy = {lane for lane, _ in in_flight.values()}
+            for lane in range(lanes):
+                if pending and lane not in busy:
+                    athlete_id, before = pending.popleft()
+                    future = pools[lane].submit(_sync_slice, athlete_id, after, before, slice_activities,
+                                                client_factory)
+                    in_flight[future] = (lane, athlete_id)
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                lane, athlete_id = in_flight.pop(future)
+                summary = summaries[athlete_id]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    summary['status'] = 'error'
+                    summary['error'] = f"{type(e).__name__}: {e}"
+                    logger.error(f"[Sync] {athlete_id} failed: {summary['error']}")
+                    continue
+
+                summary['slices'] += 1
+                for key in ('activities_listed', 'activities_processed', 'requests', 'rate_limit_wait_seconds',
+                            'seconds'):
+                    summary[key] += result[key]
+                summary['synced_years'].update(result['synced_years'])
+                summary['workers'].add(result['pid'])
+                for stage, timing in result['timings'].items():
+                    merged = summary['timings'].setdefault(stage, {'seconds': 0.0, 'count': 0})
+                    merged['seconds'] = round(merged['seconds'] + timing['seconds'], 4)
+                    merged['count'] += timing['count']
+                if result['errors']:
+                    summary['status'] = 'error'
+                    summary['error'] = "; ".join(result['errors'])
+                elif result['next_before'] is not None:
+                    pending.append((athlete_id, result['next_before']))
+    finally:
+        for pool in pools:
+            pool.shutdown()
+
+    wall_seconds = time.perf_counter() - started
+    athletes = []
+    for summary in summaries.values():
+        minutes = summary['seconds'] / 60
+        athletes.append({
+            **summary,
+            'seconds': round(summary['seconds'], 3),
+            'rate_limit_wait_seconds': round(summary['rate_limit_wait_seconds'], 3),
+            'activities_per_minute': round(summary['activities_processed'] / minutes, 2) if minutes else None,
+            'synced_years': sorted(summary['synced_years']),
+            'workers': len(summary['workers'])
+        })
+    processed = sum(summary['activities_processed'] for summary in athletes)
+    return {
+        'athletes': athletes,
+        'failed': [summary['athlete_id'] for summary in athletes if summary['status'] != 'ok'],
+        'activities_processed': processed,
+        'activities_per_minute': round(processed / (wall_seconds / 60), 2) if wall_seconds else None,
+        'wall_seconds': round(wall_seconds, 3),
+        'max_workers': max_workers
+    }
@@ -0,0 +1,44 @@
+import os, sys
+
+import pytest
+
+# The modules live at the repository root, which is also the directory the app is run from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate_dataset import day_timestamp, synthetic_activities  # noqa: E402
+from database import (ACTIVITY_INSERT, BEST_EFFORT_INSERT, SPLIT_INSERT, activity_rows, connect,  # noqa: E402
+                      create_database_and_tables, insert_strava_data)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """Connection to a new database with the app's schema."""
+    path = str(tmp_path / "runs.db")
+    create_database_and_tables(path)
+    conn = connect(path)
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def store_runs(conn):
+    """store_runs(count, seed=0, first_id=1, end=None) stores synthetic runs one at a time, as sync does."""
+    def store(count, seed=0, first_id=1, end=None):
+        activities = list(synthetic_activities(count, seed, first_id, end))
+        for activity, weather_data, air_pollution_data, city_name in activities:
+            insert_strava_data(conn, activity, weather_data, air_pollution_data, city_name,
+                               day_timestamp(activity.start_date))
+        return [activity for activity, _, _, _ in activities]
+    return store
+
+@pytest.fixture
+def bulk_store(conn):
+    """bulk_store(count, seed=0, first_id=1, end=None) inserts synthetic runs without updating any rollup."""
+    def store(count, seed=0, first_id=1, end=None):
+        rows = [activity_rows(activity, weather_data, air_pollution_data, city_name, day_timestamp(activity.start_date))
+                for activity, weather_data, air_pollution_data, city_name
+                in synthetic_activities(count, seed, first_id, end)]
+        conn.executemany(ACTIVITY_INSERT, [activity_row for activity_row, _, _ in rows])
+        conn.executemany(SPLIT_INSERT, [row for _, split_rows, _ in rows for row in split_rows])
+        conn.executemany(BEST_EFFORT_INSERT, [row for _, _, effort_rows in rows for row in effort_rows])
+        conn.commit()
+    return store
@@ -0,0 +1,69 @@
+import threading
+
+from ai_insights import enqueue_insight_job, is_pending, load_insights, store_insights
+from ai_sections import SECTION_KEYS, generate_section_analyses
+from database import current_athlete, get_data_version, rebuild_rollups, use_athlete
+
+
+def database_of(conn):
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+def stale_keys(conn, prefix):
+    version = get_data_version(conn)
+    return sorted(key for key, (_, stamped) in load_insights(conn, prefix).items() if stamped != version)
+
+def test_storing_runs_makes_stored_insights_stale(conn, store_runs):
+    store_runs(2)
+    store_insights({'section:performance': "Fast week", 'section:monthly': "Steady month"},
+                   get_data_version(conn), database_of(conn))
+    assert stale_keys(conn, 'section:') == []
+
+    store_runs(1, first_id=10)
+    assert stale_keys(conn, 'section:') == ['section:monthly', 'section:performance']
+    # Regenerated insights are stamped with the new version
+    store_insights({'section:performance': "Faster week"}, get_data_version(conn), database_of(conn))
+    assert stale_keys(conn, 'section:') == ['section:monthly']
+
+    rebuild_rollups(conn)
+    assert stale_keys(conn, 'section:') == ['section:monthly', 'section:performance']
+
+def test_jobs_are_deduplicated_per_athlete_while_pending(tmp_path):
+    release, done = threading.Event(), threading.Event()
+    athletes = []
+
+    def job(name):
+        athletes.append(current_athlete.get())
+        release.wait(5)
+        if len(athletes) == 2:
+            done.set()
+
+    with use_athlete('alice'):
+        assert enqueue_insight_job('sections', job, 'first')
+        assert not enqueue_insight_job('sections', job, 'again')
+        assert is_pending('sections')
+    with use_athlete('bob'):
+        assert enqueue_insight_job('sections', job, 'other athlete')
+    release.set()
+    assert done.wait(5)
+    # Each job ran against the athlete that queued it
+    assert athletes == ['alice', 'bob']
+
+class FlakyModel:
+    """Answers the structured request without two sections and fails one fallback request."""
+
+    class Response:
+        def __init__(self, text):
+            self.text = text
+
+    def generate_content(self, prompt, timeout=None, schema=None):
+        if schema:
+            return self.Response('{' + ', '.join(f'"{key}": "{key} analysis"' for key in SECTION_KEYS[2:]) + '}')
+        if prompt == SECTION_KEYS[0]:
+            raise TimeoutError("no answer")
+        return self.Response(f"{prompt} fallback")
+
+def test_failed_sections_are_left_out():
+    sections = generate_section_analyses(FlakyModel(), {}, lambda: {key: key for key in SECTION_KEYS})
+    assert SECTION_KEYS[0] not in sections
+    assert sections[SECTION_KEYS[1]] == f"{SECTION_KEYS[1]} fallback"
+    assert all(sections[key] == f"{key} analysis" for key in SECTION_KEYS[2:])
@@ -0,0 +1,31 @@
+import pytest
+
+import api_server
+
+
+@pytest.fixture
+def server_state(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(api_server, '_responses', api_server.LRUCache(8))
+    monkeypatch.setattr(api_server, '_schema_ready', set())
+
+def test_known_etag_is_answered_without_computing(server_state, monkeypatch):
+    etag, body, gzipped = api_server.build_response('/api/version', {})
+    assert body is not None
+
+    # A restarted server has no cached response; a matching If-None-Match must not reach the handler
+    monkeypatch.setattr(api_server, '_responses', api_server.LRUCache(8))
+    def handler(athlete_id, data_version, query):
+        raise AssertionError("payload recomputed for a 304")
+    monkeypatch.setitem(api_server.ROUTES, '/api/version', handler)
+    assert api_server.build_response('/api/version', {}, [etag]) == (etag, None, None)
+
+def test_etag_changes_with_the_query(server_state):
+    first = api_server.build_response('/api/version', {})[0]
+    assert api_server.build_response('/api/version', {'limit': '5'})[0] != first
+    assert api_server.build_response('/api/version', {}, ['"other"'])[1] is not None
+
+def test_unknown_endpoint_is_404(server_state):
+    with pytest.raises(api_server.ApiError) as error:
+        api_server.build_response('/api/nope', {})
+    assert error.value.status == 404
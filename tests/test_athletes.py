@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from athletes import get_athlete, list_athletes, register_athlete, remove_athlete, update_refresh_token
+from database import DATABASE_NAME, connect, create_database_and_tables, database_path, use_athlete
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return str(tmp_path / "athletes.db")
+
+def test_registry(registry):
+    assert list_athletes(registry) == []
+    register_athlete('42', "Zoe", 'token-a', registry)
+    register_athlete(7, "Ann", 'token-b', registry)
+    register_athlete('42', "Zoe R", 'token-c', registry)
+    assert list_athletes(registry) == [('7', "Ann"), ('42', "Zoe R")]
+    assert get_athlete('42', registry) == {'athlete_id': '42', 'name': "Zoe R", 'refresh_token': 'token-c',
+                                           'shard': os.path.join('athletes', '42.db')}
+
+    update_refresh_token('42', 'rotated', registry)
+    assert get_athlete('42', registry)['refresh_token'] == 'rotated'
+    remove_athlete('42', registry)
+    with pytest.raises(KeyError):
+        get_athlete('42', registry)
+
+def test_invalid_ids_are_rejected(registry):
+    with pytest.raises(ValueError):
+        register_athlete('../other', "Eve", 'token', registry)
+    with pytest.raises(ValueError):
+        with use_athlete('a/b'):
+            pass
+
+def test_connect_routes_to_the_current_athletes_shard(registry):
+    assert database_path() == DATABASE_NAME
+    for athlete_id in ('a', 'b'):
+        with use_athlete(athlete_id):
+            assert database_path() == os.path.join('athletes', f"{athlete_id}.db")
+            create_database_and_tables()
+            conn = connect()
+            conn.execute("INSERT INTO strava_activities_weather (id, city_name) VALUES (?, ?)", (1, athlete_id))
+            conn.commit()
+            conn.close()
+    assert database_path() == DATABASE_NAME
+    assert not os.path.exists(DATABASE_NAME)
+
+    # Same activity id in both shards, each keeps its own row
+    for athlete_id in ('a', 'b'):
+        conn = connect(database_path(athlete_id))
+        assert conn.execute("SELECT city_name FROM strava_activities_weather").fetchall() == [(athlete_id,)]
+        conn.close()
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from chart_data import MAX_CHART_POINTS, lttb_indices, reduce_chart_frame
+
+
+def daily_frame(days, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2020-01-01", periods=days, freq="D")
+    return pd.DataFrame({'distance': rng.uniform(3, 15, days), 'pace': rng.uniform(4, 7, days)}, index=index)
+
+def test_lttb_keeps_the_ends_and_the_peaks():
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[[137, 512, 880]] = [50, -40, 30]
+    selected = lttb_indices(x, y, 50)
+    assert len(selected) == 50
+    assert selected[0] == 0 and selected[-1] == 999
+    assert (np.diff(selected) > 0).all()
+    assert {137, 512, 880} <= set(selected)
+
+def test_short_series_are_left_alone():
+    assert list(lttb_indices(range(10), range(10), 20)) == list(range(10))
+    frame = daily_frame(90)
+    reduced, resolution = reduce_chart_frame(frame)
+    assert resolution == 'daily'
+    pd.testing.assert_frame_equal(reduced, frame)
+
+def test_long_spans_are_resampled():
+    frame = daily_frame(2 * 365)
+    weekly, resolution = reduce_chart_frame(frame, how='sum')
+    assert resolution == 'weekly'
+    assert weekly['distance'].sum() == frame['distance'].sum()
+    assert weekly['pace'].iloc[1] == frame['pace'].resample('W').mean().iloc[1]
+
+    monthly, resolution = reduce_chart_frame(daily_frame(4 * 365))
+    assert resolution == 'monthly'
+    assert len(monthly) == 48
+
+def test_dense_series_are_downsampled_to_the_limit():
+    frame = daily_frame(365)
+    frame.iloc[100, 0] = 100
+    reduced, resolution = reduce_chart_frame(frame)
+    assert resolution == 'daily'
+    assert len(reduced) == MAX_CHART_POINTS
+    assert reduced.index[0] == frame.index[0] and reduced.index[-1] == frame.index[-1]
+    assert reduced['distance'].max() == 100
@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+from env_stats import ENV_FACTORS, REQUIRED_COLUMNS, get_optimal_conditions, rebuild_env_stats
+
+
+def env_tables(conn):
+    return (conn.execute("SELECT * FROM env_running_stats ORDER BY factor, metric").fetchall(),
+            conn.execute("SELECT * FROM env_fastest_runs ORDER BY activity_id").fetchall())
+
+def test_incremental_statistics_match_rebuild(conn, store_runs):
+    store_runs(40)
+    stats, fastest = env_tables(conn)
+    rebuild_env_stats(conn)
+    rebuilt_stats, rebuilt_fastest = env_tables(conn)
+
+    assert len(stats) == len(rebuilt_stats) > 0
+    for row, rebuilt in zip(stats, rebuilt_stats):
+        assert row[:3] == rebuilt[:3]
+        assert row[3:] == pytest.approx(rebuilt[3:])
+    assert fastest == rebuilt_fastest
+
+def test_optimal_conditions_cover_the_fastest_tenth_of_many_runs(conn, bulk_store):
+    bulk_store(1500, seed=3)
+    rebuild_env_stats(conn)
+
+    # What the dashboard computed with pandas: the int(10%) fastest runs with complete environmental data
+    runs = pd.read_sql(f"SELECT {', '.join(REQUIRED_COLUMNS)} FROM strava_activities_weather", conn).dropna()
+    runs['pace_min_km'] = 1000 / (runs['average_speed'] * 60)
+    best_runs = runs.nsmallest(int(len(runs) * 0.1), 'pace_min_km')
+    assert len(best_runs) == 150
+
+    conditions = get_optimal_conditions(conn)
+    for factor in ENV_FACTORS:
+        assert conditions[factor]['min'] == pytest.approx(best_runs[factor].min())
+        assert conditions[factor]['max'] == pytest.approx(best_runs[factor].max())
+        assert conditions[factor]['mean'] == pytest.approx(best_runs[factor].mean())
@@ -0,0 +1,89 @@
+import glob, os, shutil, sqlite3
+
+import numpy as np
+
+import heatmap
+from database import create_database_and_tables, pending_rebuilds, run_pending_rebuilds
+from heatmap import (MAX_ZOOM, MIN_ZOOM, heatmap_directory, load_counts, rasterize, rebuild_heatmap, tile_png,
+                     update_heatmap)
+from routes import COORDINATE_SCALE
+
+
+def tiles(conn):
+    """{(zoom, x, y): (saved counts, pixels, max_count)} of every indexed tile."""
+    directory = heatmap_directory(conn)
+    stored = {}
+    for zoom, x, y, pixels, max_count in conn.execute("SELECT zoom, x, y, pixels, max_count FROM heatmap_tiles"):
+        counts = load_counts(heatmap.tile_path(directory, zoom, x, y, 'npz'))
+        assert os.path.exists(heatmap.tile_path(directory, zoom, x, y, 'png'))
+        stored[(zoom, x, y)] = (counts.tobytes(), pixels, max_count)
+    assert len(glob.glob(os.path.join(directory, '*', '*.npz'))) == len(stored)
+    return stored
+
+def out_and_back(latitude, longitude):
+    """E7 route 1 km east and back along the same street, with most points in pixels already crossed."""
+    east = np.linspace(0, 0.012, 40)
+    return np.round(np.column_stack([np.full(80, latitude), longitude + np.concatenate([east, east[::-1]])])
+                    * COORDINATE_SCALE).astype(np.int64)
+
+def test_in_memory_databases_have_no_heatmap(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for path in (':memory:', ''):
+        conn = sqlite3.connect(path)
+        assert heatmap_directory(conn) is None
+        # Nothing is rasterized or written, not even next to the working directory
+        update_heatmap(conn, 1)
+        rebuild_heatmap(conn)
+        assert tile_png(conn, MIN_ZOOM, 0, 0) is None
+        conn.close()
+    assert os.listdir(tmp_path) == []
+
+def test_rasterize_counts_a_route_once_per_pixel():
+    route = out_and_back(12.97, 77.59)
+    for zoom in (MIN_ZOOM, MAX_ZOOM):
+        once = rasterize([route], zoom)
+        assert once and all(counts.max() == 1 for counts in once.values())
+        # Two activities on the same street count twice, in the same pixels
+        twice = rasterize([route, route.copy()], zoom)
+        assert twice.keys() == once.keys()
+        for key, counts in twice.items():
+            assert np.array_equal(counts, 2 * once[key])
+
+def test_rasterize_walks_long_batches_in_groups(monkeypatch):
+    routes = [out_and_back(12.97 + i * 0.001, 77.59) for i in range(5)]
+    whole = rasterize(routes, MAX_ZOOM)
+    monkeypatch.setattr(heatmap, 'RASTER_MAX_STEPS', 1)
+    grouped = rasterize(routes, MAX_ZOOM)
+    assert grouped.keys() == whole.keys()
+    for key, counts in grouped.items():
+        assert np.array_equal(counts, whole[key])
+
+def test_update_heatmap_adds_to_existing_tiles(conn, store_runs, monkeypatch):
+    # Every stored run is added to the tiles by update_heatmap; the loops of a city overlap
+    store_runs(40)
+    stored = tiles(conn)
+    assert max(max_count for _, _, max_count in stored.values()) > 1
+    assert update_heatmap(conn, 1) is None and tiles(conn) == stored
+
+    # A rebuild streaming small batches into the saved counts draws the same tiles
+    monkeypatch.setattr(heatmap, 'RASTER_BATCH', 7)
+    monkeypatch.setattr(heatmap, 'RASTER_MAX_STEPS', 500)
+    rebuild_heatmap(conn)
+    assert tiles(conn) == stored
+    assert conn.execute("SELECT COUNT(*) FROM heatmap_activities").fetchone()[0] == 40
+
+def test_upgraded_databases_draw_the_heatmap_on_the_next_sync(conn, store_runs):
+    store_runs(30)
+    drawn = tiles(conn)
+    # A database from before the heatmap: the tables are created empty and the tiles are left for later
+    for table in ('heatmap_tiles', 'heatmap_activities'):
+        conn.execute(f"DROP TABLE {table}")
+    conn.commit()
+    shutil.rmtree(heatmap_directory(conn))
+    create_database_and_tables(conn.execute("PRAGMA database_list").fetchone()[2])
+    assert not os.path.exists(heatmap_directory(conn))
+    assert pending_rebuilds(conn) == ['heatmap']
+
+    assert run_pending_rebuilds(conn) == ['heatmap']
+    assert tiles(conn) == drawn
+    assert pending_rebuilds(conn) == []
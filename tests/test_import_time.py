@@ -0,0 +1,13 @@
+import pytest
+
+from tools.check_import_time import FORBIDDEN_IMPORTS, IMPORT_BUDGETS_MS, measure_import
+
+
+@pytest.mark.parametrize('module', list(IMPORT_BUDGETS_MS))
+def test_import_stays_within_budget(module):
+    # Fastest of three fresh imports, as tools/check_import_time.py measures it
+    runs = [measure_import(module) for _ in range(3)]
+    elapsed = min(ms for ms, _ in runs)
+    assert elapsed <= IMPORT_BUDGETS_MS[module], f"import {module} took {elapsed:.0f} ms"
+    eager = [name for name in FORBIDDEN_IMPORTS.get(module, []) if name in runs[0][1]]
+    assert not eager, f"import {module} loads {', '.join(eager)}"
@@ -0,0 +1,50 @@
+import time
+
+import instrumentation
+from instrumentation import LATENCY_BUCKETS, collect, histogram_quantile, increment, prometheus_text, timed
+
+
+@timed()
+def load():
+    with timed("query"):
+        time.sleep(0.002)
+
+def test_spans_nest_under_the_enclosing_span():
+    with collect() as recorder:
+        with timed("render"):
+            load()
+            load()
+            increment('cache_hits', 3)
+    rows = {row['path']: row for row in recorder.rows()}
+
+    assert list(rows) == [('render',), ('render', 'load'), ('render', 'load', 'query')]
+    assert rows[('render', 'load')]['calls'] == 2
+    assert rows[('render', 'load')]['depth'] == 1
+    render = rows[('render',)]
+    assert render['seconds'] >= rows[('render', 'load')]['seconds'] >= rows[('render', 'load', 'query')]['seconds']
+    assert render['self_seconds'] == render['seconds'] - rows[('render', 'load')]['seconds']
+    assert recorder.counters == {'cache_hits': 3}
+    assert sum(recorder.histograms['load']) == 2
+
+def test_spans_outside_collect_only_reach_the_totals(monkeypatch):
+    monkeypatch.setattr(instrumentation, '_totals', instrumentation._Totals())
+    with collect() as recorder:
+        pass
+    load()
+    increment('strava_requests')
+    assert recorder.rows() == []
+
+    text = prometheus_text()
+    assert 'runinsight_span_calls_total{span="load"} 1\n' in text
+    assert 'runinsight_span_calls_total{span="query"} 1\n' in text
+    assert 'runinsight_events_total{event="strava_requests"} 1\n' in text
+    assert text.count("# TYPE") == 3
+
+def test_histogram_quantile():
+    buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+    assert histogram_quantile(buckets, 0.5) is None
+    buckets[0], buckets[3] = 9, 1
+    assert histogram_quantile(buckets, 0.5) == LATENCY_BUCKETS[0]
+    assert histogram_quantile(buckets, 0.95) == LATENCY_BUCKETS[3]
+    buckets[-1] = 90
+    assert histogram_quantile(buckets, 0.99) is None
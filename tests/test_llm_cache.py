@@ -0,0 +1,55 @@
+from llm_backend import StubBackend
+from llm_cache import CachedModel, cache_key
+
+
+SCHEMA = {"type": "object", "properties": {"a": {"type": "string"}, "b": {"type": "string"}}, "required": ["a", "b"]}
+
+def calls(conn):
+    return conn.execute("SELECT COUNT(*) FROM llm_calls").fetchone()[0]
+
+def cached_model(conn, **options):
+    database = conn.execute("PRAGMA database_list").fetchone()[2]
+    return CachedModel(StubBackend(latency=0, database=database), database=database, **options)
+
+def test_identical_prompts_are_answered_from_the_cache(conn):
+    model = cached_model(conn)
+    first = model.generate_content("How was my week?").text
+    assert calls(conn) == 1
+    assert model.generate_content("How was my week?").text == first
+    assert calls(conn) == 1
+
+    # Any change to the rendered prompt, such as a new statistic, is a miss
+    model.generate_content("How was my week? 42 km")
+    assert calls(conn) == 2
+
+def test_the_model_name_is_part_of_the_key(conn):
+    database = conn.execute("PRAGMA database_list").fetchone()[2]
+    cached_model(conn).generate_content("prompt")
+    CachedModel(StubBackend("other", latency=0, database=database), database=database).generate_content("prompt")
+    assert calls(conn) == 2
+    assert cache_key("stub/stub", "prompt") != cache_key("stub/other", "prompt")
+
+def test_expired_entries_are_regenerated(conn):
+    model = cached_model(conn, ttl_seconds=60)
+    model.generate_content("prompt")
+    conn.execute("UPDATE llm_cache SET created_at = created_at - 120")
+    conn.commit()
+    model.generate_content("prompt")
+    assert calls(conn) == 2
+
+def test_least_recently_used_entries_are_evicted(conn):
+    model = cached_model(conn, max_entries=2)
+    for prompt in ["a", "b", "a", "c"]:
+        model.generate_content(prompt)
+    keys = {row[0] for row in conn.execute("SELECT key FROM llm_cache")}
+    assert keys == {cache_key(model.model_name, "a"), cache_key(model.model_name, "c")}
+
+def test_incomplete_structured_answers_are_not_cached(conn):
+    model = cached_model(conn)
+    model.generate_content("sections", schema=SCHEMA)
+    assert conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] == 1
+
+    # An answer missing a required section is returned but asked again next time
+    model.backend.generate_content = lambda prompt, timeout=None, schema=None: '{"a": "only a"}'
+    assert model.generate_content("more sections", schema=SCHEMA).text == '{"a": "only a"}'
+    assert conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] == 1
@@ -0,0 +1,45 @@
+import pytest
+
+from location_clusters import CLUSTER_RADIUS_M, METRIC_COLUMNS, _distance_m, rebuild_location_clusters
+
+
+def clusters(conn):
+    """{frozenset of member activity ids: {year: (runs, sums and counts)}}; cluster ids depend on the order."""
+    members = {}
+    for activity_id, cluster_id in conn.execute("SELECT activity_id, cluster_id FROM location_points"):
+        members.setdefault(cluster_id, set()).add(activity_id)
+    columns = ", ".join(f"{col}_sum, {col}_count" for col in METRIC_COLUMNS)
+    stats = {}
+    for cluster_id, year, *values in conn.execute(f"SELECT cluster_id, year, runs, {columns} FROM location_cluster_stats"):
+        stats.setdefault(frozenset(members[cluster_id]), {})[year] = values
+    return stats
+
+def test_incremental_clusters_match_rebuild(conn, store_runs):
+    # Two interleaved batches, so runs are not stored in start order
+    store_runs(25, seed=1)
+    store_runs(25, seed=2, first_id=100)
+    stored = clusters(conn)
+    rebuild_location_clusters(conn)
+    rebuilt = clusters(conn)
+
+    assert stored.keys() == rebuilt.keys()
+    assert sum(len(members) for members in stored) == 50
+    for members, years in stored.items():
+        assert years.keys() == rebuilt[members].keys()
+        for year, values in years.items():
+            assert values == pytest.approx(rebuilt[members][year])
+
+def test_runs_within_the_radius_share_a_cluster(conn, store_runs):
+    store_runs(60)
+    points = conn.execute("SELECT latitude, longitude, cluster_id FROM location_points").fetchall()
+    close_pairs = 0
+    for index, (latitude, longitude, cluster_id) in enumerate(points):
+        for other_latitude, other_longitude, other_cluster_id in points[index + 1:]:
+            distance = _distance_m(latitude, longitude, other_latitude, other_longitude)
+            if distance <= CLUSTER_RADIUS_M:
+                close_pairs += 1
+                assert cluster_id == other_cluster_id
+            elif distance > 100000:
+                # Different cities
+                assert cluster_id != other_cluster_id
+    assert close_pairs
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from outliers import MAD_SCALE, compute_outlier_mask, outlier_thresholds
+
+
+def activities():
+    rng = np.random.default_rng(4)
+    frame = pd.DataFrame({
+        'average_speed': rng.normal(3, 0.2, 200),
+        'distance': rng.normal(8000, 1000, 200),
+        'average_heartrate': rng.normal(150, 5, 200)
+    })
+    frame.loc[0, 'average_speed'] = 12        # GPS glitch
+    frame.loc[1, 'distance'] = 90000          # forgot to stop the watch
+    frame.loc[2, 'average_heartrate'] = np.nan
+    return frame
+
+MANUAL = {
+    'enable_filtering': True,
+    'mode': 'manual',
+    'speed': {'min': 5, 'max': 20},
+    'distance': {'min': 1000, 'max': 50000},
+    'heart_rate': {'min': 60, 'max': 200}
+}
+
+def test_disabled_filtering_keeps_everything():
+    frame = activities()
+    assert compute_outlier_mask(frame, {**MANUAL, 'enable_filtering': False}).all()
+
+def test_manual_thresholds():
+    frame = activities()
+    mask = compute_outlier_mask(frame, MANUAL)
+    speed = frame['average_speed'] * 3.6
+    expected = (speed.between(5, 20) & frame['distance'].between(1000, 50000)
+                & frame['average_heartrate'].between(60, 200))
+    pd.testing.assert_series_equal(mask, expected)
+    assert not mask[[0, 1, 2]].any()
+
+def test_mad_thresholds():
+    frame = activities()
+    thresholds = outlier_thresholds(frame, {'enable_filtering': True, 'mode': 'mad', 'sensitivity': 3})
+    distance = frame['distance']
+    spread = (distance - distance.median()).abs().median() * MAD_SCALE
+    assert np.isclose(thresholds['distance']['min'], distance.median() - 3 * spread)
+    assert np.isclose(thresholds['distance']['max'], distance.median() + 3 * spread)
+
+    mask = compute_outlier_mask(frame, {'enable_filtering': True, 'mode': 'mad', 'sensitivity': 3})
+    assert not mask[[0, 1, 2]].any()
+    assert mask.mean() > 0.95
+
+def test_iqr_leaves_constant_metrics_unbounded():
+    frame = activities()
+    frame['average_heartrate'] = 150.0
+    thresholds = outlier_thresholds(frame, {'enable_filtering': True, 'mode': 'iqr'})
+    assert thresholds['heart_rate'] == {'min': -np.inf, 'max': np.inf}
+    q1, q3 = frame['distance'].quantile([0.25, 0.75])
+    assert np.isclose(thresholds['distance']['max'], q3 + 1.5 * (q3 - q1))
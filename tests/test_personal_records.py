@@ -0,0 +1,63 @@
+import random, sqlite3
+
+from database import create_database_and_tables
+from personal_records import PR_TOP_N, rebuild_personal_records, update_personal_records
+
+
+def stored_efforts(tmp_path, activities=300):
+    path = str(tmp_path / "records.db")
+    create_database_and_tables(path)
+    conn = sqlite3.connect(path)
+    rng = random.Random(5)
+    rows = []
+    for activity_id in range(1, activities + 1):
+        day = rng.randrange(0, 400)
+        for name in ("1k", "5k"):
+            # Repeated times and days exercise the tie-breaking
+            elapsed_time = rng.choice([rng.uniform(200, 1500), 600.0])
+            rows.append((activity_id, name, 1000, elapsed_time, f"2024-{1 + day // 31 % 12:02d}-{1 + day % 28:02d}"))
+    conn.executemany("""
+        INSERT INTO best_efforts_data (activity_id, name, distance, elapsed_time, start_date) VALUES (?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    return conn, activities
+
+def records(conn):
+    return sorted(conn.execute("SELECT * FROM personal_records").fetchall())
+
+def test_incremental_updates_in_any_order_match_rebuild(tmp_path):
+    conn, activities = stored_efforts(tmp_path)
+    order = list(range(1, activities + 1))
+    random.Random(11).shuffle(order)
+    for activity_id in order:
+        update_personal_records(conn, activity_id)
+    incremental = records(conn)
+
+    rebuild_personal_records(conn)
+    assert incremental == records(conn)
+
+def test_index_holds_top_efforts_and_progression(tmp_path):
+    conn, _ = stored_efforts(tmp_path)
+    rebuild_personal_records(conn)
+    for name in ("1k", "5k"):
+        fastest = [row[0] for row in conn.execute("""
+            SELECT elapsed_time FROM best_efforts_data WHERE name = ? ORDER BY elapsed_time, start_date, id LIMIT ?
+        """, (name, PR_TOP_N))]
+        ranked = [row[0] for row in conn.execute(
+            "SELECT elapsed_time FROM personal_records WHERE name = ? AND rank IS NOT NULL ORDER BY rank", (name,))]
+        assert ranked == fastest
+
+        # Every record is faster than the one before it, and the last one is the current best
+        progression = [row[0] for row in conn.execute("""
+            SELECT elapsed_time FROM personal_records WHERE name = ? AND progression = 1 ORDER BY start_date, effort_id
+        """, (name,))]
+        assert progression == sorted(progression, reverse=True)
+        assert progression[-1] == fastest[0]
+
+def test_update_is_idempotent(tmp_path):
+    conn, _ = stored_efforts(tmp_path, activities=20)
+    for activity_id in range(1, 21):
+        update_personal_records(conn, activity_id)
+    before = records(conn)
+    update_personal_records(conn, 7)
+    assert records(conn) == before
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+import route_similarity
+from database import create_database_and_tables, pending_rebuilds, run_pending_rebuilds
+from route_similarity import LSH_BANDS, MINHASH_FUNCTIONS, rebuild_route_groups, update_route_group
+
+
+def route_groups(conn):
+    """Partition of the grouped activities: {frozenset of member ids}; group ids depend on the order."""
+    members = {}
+    for activity_id, group_id in conn.execute("SELECT activity_id, group_id FROM route_signatures"):
+        members.setdefault(group_id, set()).add(activity_id)
+    n_runs = dict(conn.execute("SELECT group_id, n_runs FROM route_groups"))
+    assert all(n_runs[group_id] == len(ids) for group_id, ids in members.items())
+    return {frozenset(ids) for ids in members.values()}
+
+def test_incremental_groups_match_rebuild(conn, store_runs):
+    # Two interleaved batches, so runs are not stored in start order
+    store_runs(40, seed=1)
+    store_runs(40, seed=2, first_id=100)
+    stored = route_groups(conn)
+    rebuild_route_groups(conn)
+
+    assert stored == route_groups(conn)
+    assert sum(len(ids) for ids in stored) == 80
+    assert max(len(ids) for ids in stored) > 1
+
+def test_missing_activity_is_skipped(conn, store_runs):
+    store_runs(3)
+    conn.execute("INSERT INTO routes (activity_id, n_points, points) SELECT 999, n_points, points FROM routes LIMIT 1")
+    update_route_group(conn, 999)
+    assert conn.execute("SELECT COUNT(*) FROM route_signatures WHERE activity_id = 999").fetchone()[0] == 0
+
+# Rows per LSH band
+BAND_ROWS = MINHASH_FUNCTIONS // LSH_BANDS
+
+def controlled_signatures():
+    """A new run X and two earlier runs, each 66% similar to X but only 31% to each other.
+
+    Both earlier runs match X in the first ten bands, the only buckets they share with it; elsewhere each matches
+    X in half of every band's rows, so neither shares any other bucket.
+    """
+    x = np.zeros(MINHASH_FUNCTIONS, dtype=np.uint32)
+    first, second = x.copy(), x.copy()
+    for band in range(10, LSH_BANDS):
+        rows = band * BAND_ROWS + np.arange(BAND_ROWS)
+        first[rows[:2]], second[rows[2:]] = 1, 2
+    return x, first, second
+
+def test_new_runs_are_compared_with_the_most_recently_started_runs(conn, monkeypatch):
+    x, first, second = controlled_signatures()
+    # Activity id -> (start date, signature); the run started in 2024 is stored before the one from 2020
+    runs = {1: ('2024-05-01T07:00:00Z', second), 2: ('2020-05-01T07:00:00Z', first), 3: ('2025-05-01T07:00:00Z', x)}
+    monkeypatch.setattr(route_similarity, 'LSH_BUCKET_CANDIDATES', 1)
+    monkeypatch.setattr(route_similarity, 'load_routes', lambda conn, ids=None: {
+        activity_id: np.array([[activity_id, 0], [activity_id, 1]]) for activity_id in (ids or runs)})
+    monkeypatch.setattr(route_similarity, '_signature', lambda points: runs[int(points[0, 0])][1])
+    for activity_id, (start_date, _) in runs.items():
+        conn.execute("INSERT INTO strava_activities_weather (id, start_date) VALUES (?, ?)", (activity_id, start_date))
+        conn.execute("INSERT INTO routes (activity_id) VALUES (?)", (activity_id,))
+        update_route_group(conn, activity_id)
+
+    # With one candidate per bucket, X is compared with the 2024 run, not with the run stored last
+    assert route_groups(conn) == {frozenset({1, 3}), frozenset({2})}
+    similarity = conn.execute("SELECT similarity FROM route_signatures WHERE activity_id = 3").fetchone()[0]
+    assert similarity == pytest.approx(84 / 128)
+    rebuild_route_groups(conn)
+    assert route_groups(conn) == {frozenset({1, 3}), frozenset({2})}
+
+def test_upgraded_databases_group_routes_on_the_next_sync(conn, store_runs):
+    store_runs(30)
+    grouped = route_groups(conn)
+    # A database from before route matching: the tables are created empty and the grouping is deferred
+    for table in ('route_lsh', 'route_signatures', 'route_groups'):
+        conn.execute(f"DROP TABLE {table}")
+    conn.commit()
+    create_database_and_tables(conn.execute("PRAGMA database_list").fetchone()[2])
+    assert conn.execute("SELECT COUNT(*) FROM route_signatures").fetchone()[0] == 0
+    assert pending_rebuilds(conn) == ['route_groups']
+
+    assert run_pending_rebuilds(conn) == ['route_groups']
+    assert route_groups(conn) == grouped
+    assert pending_rebuilds(conn) == []
+    assert run_pending_rebuilds(conn) == []
@@ -0,0 +1,56 @@
+import random
+
+import numpy as np
+
+from routes import COORDINATE_SCALE, POLYLINE_SCALE, decode_polyline, decode_polylines, encode_polyline
+
+
+def reference_decode(polyline):
+    """Straightforward decoder following Google's polyline algorithm description."""
+    points, index, latitude, longitude = [], 0, 0, 0
+    while index < len(polyline):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                chunk = ord(polyline[index]) - 63
+                index += 1
+                result |= (chunk & 0x1f) << shift
+                shift += 5
+                if chunk < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        latitude += deltas[0]
+        longitude += deltas[1]
+        points.append((latitude * (COORDINATE_SCALE // POLYLINE_SCALE), longitude * (COORDINATE_SCALE // POLYLINE_SCALE)))
+    return np.array(points, dtype=np.int64).reshape(-1, 2)
+
+def random_route(rng, n):
+    latitude, longitude = rng.uniform(-60, 60), rng.uniform(-179, 179)
+    points = []
+    for _ in range(n):
+        latitude += rng.uniform(-0.01, 0.01)
+        longitude += rng.uniform(-0.01, 0.01)
+        points.append((round(latitude * COORDINATE_SCALE), round(longitude * COORDINATE_SCALE)))
+    return points
+
+def test_decodes_googles_example():
+    points = decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+    assert points.tolist() == [[385000000, -1202000000], [407000000, -1209500000], [432520000, -1264530000]]
+
+def test_batch_matches_reference_decoder():
+    rng = random.Random(7)
+    polylines = [encode_polyline(random_route(rng, rng.randint(1, 60))) for _ in range(50)]
+    for polyline, points in zip(polylines, decode_polylines(polylines)):
+        assert np.array_equal(points, reference_decode(polyline))
+
+def test_encode_round_trip_at_polyline_precision():
+    rng = random.Random(3)
+    route = random_route(rng, 40)
+    decoded = decode_polyline(encode_polyline(route))
+    assert np.abs(decoded - np.array(route)).max() <= COORDINATE_SCALE // POLYLINE_SCALE // 2
+
+def test_missing_and_malformed_polylines_decode_empty():
+    valid = encode_polyline([(1, 2), (3, 4)])
+    routes = decode_polylines([None, "", "_p~iF", "a b", valid])
+    assert [len(points) for points in routes] == [0, 0, 0, 0, 2]
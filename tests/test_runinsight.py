@@ -0,0 +1,58 @@
+import json
+
+import pandas as pd
+import pytest
+
+import database
+from metrics import COMPARISON_PERIODS, METRIC_NAMES
+from runinsight import main
+
+
+@pytest.fixture
+def stored_database(tmp_path, monkeypatch, conn, store_runs):
+    """The single-athlete database holds 40 synthetic runs; commands run from an empty directory."""
+    store_runs(40)
+    monkeypatch.setattr(database, 'DATABASE_NAME', conn.execute("PRAGMA database_list").fetchone()[2])
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def run(capsys, *argv):
+    status = main(list(argv))
+    return status, json.loads(capsys.readouterr().out)
+
+@pytest.mark.parametrize('format, read', [('csv', pd.read_csv), ('json', pd.read_json)])
+def test_export_period_metrics(stored_database, capsys, format, read):
+    output = str(stored_database / f"metrics.{format}")
+    status, report = run(capsys, 'export-metrics', '--format', format, '--output', output)
+
+    assert status == 0
+    assert report['status'] == 'ok'
+    assert report['rows'] == len(METRIC_NAMES) * len(COMPARISON_PERIODS)
+    assert set(report['timings']) == {'load', 'compute', 'write'}
+    frame = read(output)
+    assert list(frame.columns) == ['metric', 'period', 'value', 'median', 'previous_value', 'percentage_change']
+    assert len(frame) == report['rows']
+    assert set(frame['metric']) == set(METRIC_NAMES)
+    assert frame.loc[(frame['metric'] == 'Distance') & (frame['period'] == 'Overall'), 'value'].item() > 0
+
+def test_export_weekly_metrics(stored_database, capsys):
+    output = str(stored_database / "weekly.csv")
+    status, report = run(capsys, 'export-metrics', '--format', 'csv', '--output', output, '--kind', 'weekly')
+
+    assert status == 0
+    frame = pd.read_csv(output)
+    assert len(frame) == report['rows'] > 0
+    assert frame['week'].is_monotonic_increasing
+    assert frame['num_runs'].sum() == 40
+
+def test_export_failure_is_reported(stored_database, capsys):
+    status, report = run(capsys, 'export-metrics', '--format', 'csv', '--output',
+                         str(stored_database / "missing" / "metrics.csv"))
+    assert status == 1
+    assert report['status'] == 'error'
+    assert report['error']
+
+def test_unknown_format_is_an_argument_error(stored_database):
+    with pytest.raises(SystemExit) as exit_info:
+        main(['export-metrics', '--format', 'xlsx', '--output', 'metrics.xlsx'])
+    assert exit_info.value.code == 2
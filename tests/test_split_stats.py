@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from database import refresh_split_stats
+
+
+def split_stats(conn):
+    return pd.read_sql("SELECT * FROM split_stats ORDER BY activity_id", conn).set_index('activity_id')
+
+def test_incremental_split_stats_match_rebuild(conn, store_runs):
+    store_runs(30)
+    stored = split_stats(conn)
+    conn.execute("DELETE FROM split_stats")
+    refresh_split_stats(conn)
+
+    assert len(stored) == 30
+    pd.testing.assert_frame_equal(stored, split_stats(conn))
+
+def test_split_stats_match_the_splits(conn, store_runs):
+    store_runs(30)
+    splits = pd.read_sql("SELECT * FROM splits_data ORDER BY activity_id, split", conn)
+    splits['pace'] = splits['elapsed_time'] / splits['distance']
+    stats = split_stats(conn)
+
+    for activity_id, activity_splits in splits.groupby('activity_id'):
+        row = stats.loc[activity_id]
+        half = len(activity_splits) / 2
+        first_half = activity_splits['average_heartrate'].iloc[:int(half)].mean() if half >= 1 else None
+        second_half = activity_splits['average_heartrate'].iloc[int(half):].mean()
+        assert row['split_count'] == len(activity_splits)
+        assert row['pace_mean'] == pytest.approx(activity_splits['pace'].mean())
+        if len(activity_splits) > 1:
+            assert row['pace_variance'] == pytest.approx(activity_splits['pace'].var())
+            assert row['hr_first_half'] == pytest.approx(first_half)
+        assert row['hr_second_half'] == pytest.approx(second_half)
@@ -0,0 +1,144 @@
+import os, sqlite3, time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limits
+from athletes import register_athlete
+from database import current_athlete
+from rate_limits import QuotaLimiter, QuotaWindow
+from sync_pool import sync_athletes
+
+
+# Activities each fake athlete has on Strava
+ATHLETE_ACTIVITIES = {'alice': 7, 'bob': 3, 'carol': 0}
+
+# Seconds alice's first slice takes, long enough for the other lane to sync everyone else meanwhile
+SLOW_SLICE_SECONDS = 2
+
+START = datetime(2024, 3, 1, 6, tzinfo=timezone.utc)
+
+def fake_activity(activity_id, start):
+    return SimpleNamespace(
+        id=activity_id, type='Run', start_date=start, start_date_local=start.replace(tzinfo=None),
+        distance=5000.0, elapsed_time=1500.0, moving_time=1500.0, max_heartrate=170, average_heartrate=150,
+        suffer_score=40, calories=400, map=SimpleNamespace(summary_polyline=None), total_elevation_gain=20,
+        average_speed=3.3, max_speed=4.0, average_cadence=85, start_latlng=None,
+        timezone="(GMT+00:00) UTC", gear_id=None, device_name=None, splits_metric=[],
+        best_efforts=[SimpleNamespace(name='1k', distance=1000, elapsed_time=290.0 + activity_id % 7, start_date=start)]
+    )
+
+class FakeClient:
+    """Newest-first activity list of one athlete, calling the rate limiter after every request like stravalib."""
+
+    def __init__(self, athlete_id, rate_limiter):
+        self.athlete_id = athlete_id
+        offset = sorted(ATHLETE_ACTIVITIES).index(athlete_id) * 1000
+        self.activities = [fake_activity(offset + i, START + timedelta(days=i))
+                           for i in reversed(range(ATHLETE_ACTIVITIES[athlete_id]))]
+        self.rate_limiter = rate_limiter
+
+    def get_activities(self, before=None):
+        # Slices are logged in the order they start
+        with open("slices.txt", "a") as f:
+            f.write(f"{self.athlete_id} {os.getpid()}\n")
+        if self.athlete_id == 'alice' and before is None:
+            time.sleep(SLOW_SLICE_SECONDS)
+        for activity in self.activities:
+            if before is None or activity.start_date < before:
+                self.rate_limiter({})
+                yield activity
+
+    def get_activity(self, activity_id):
+        self.rate_limiter({})
+        return next(activity for activity in self.activities if activity.id == activity_id)
+
+def fake_client_factory(rate_limiter):
+    athlete_id = current_athlete.get()
+    # Workers are separate processes; the calls are counted in a file in the working directory
+    with open("factory_calls.txt", "a") as f:
+        f.write(f"{athlete_id} {os.getpid()}\n")
+    if athlete_id == 'dave':
+        raise RuntimeError("Failed to authenticate with Strava")
+    return FakeClient(athlete_id, rate_limiter)
+
+def test_free_lanes_take_the_next_pending_slice(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for athlete_id in [*ATHLETE_ACTIVITIES, 'dave']:
+        register_athlete(athlete_id, athlete_id.title(), 'token')
+
+    report = sync_athletes([*ATHLETE_ACTIVITIES, 'dave'], after=START - timedelta(days=1), max_workers=2,
+                           slice_activities=2, client_factory=fake_client_factory)
+    athletes = {summary['athlete_id']: summary for summary in report['athletes']}
+
+    assert report['failed'] == ['dave']
+    assert athletes['alice']['slices'] == 4
+    for athlete_id, count in ATHLETE_ACTIVITIES.items():
+        assert athletes[athlete_id]['activities_processed'] == count
+        # One listing and one detail request per activity
+        assert athletes[athlete_id]['requests'] == 2 * count
+        stored = sqlite3.connect(f"athletes/{athlete_id}.db").execute(
+            "SELECT COUNT(*) FROM strava_activities_weather").fetchone()[0]
+        assert stored == count
+
+    # While alice's first slice runs, the other lane syncs everyone else instead of waiting behind it
+    slices = [line.split() for line in open("slices.txt")]
+    alice_pid = slices[[athlete_id for athlete_id, _ in slices].index('alice')][1]
+    others = [pid for athlete_id, pid in slices if athlete_id != 'alice']
+    assert others and alice_pid not in others
+    assert [athlete_id for athlete_id, _ in slices].count('bob') == 2
+
+    # A lane authenticates an athlete once, however many of its slices it runs
+    calls = [tuple(line.split()) for line in open("factory_calls.txt")]
+    assert len(calls) == len(set(calls))
+    assert {athlete_id for athlete_id, _ in calls} == {*ATHLETE_ACTIVITIES, 'dave'}
+    assert all(athletes[athlete_id]['workers'] <= 2 for athlete_id in ATHLETE_ACTIVITIES)
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock(10 * rate_limits.STRAVA_WINDOW_SECONDS + 600)
+    monkeypatch.setattr(rate_limits, 'time', clock)
+    return clock
+
+def test_quota_window_waits_for_the_next_strava_window(clock):
+    quota = QuotaWindow(3, rate_limits.STRAVA_WINDOW_SECONDS)
+    assert [quota.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # The fourth request waits for the next natural quarter hour, not for a gradual refill
+    assert quota.acquire() == pytest.approx(300)
+    assert clock.now % rate_limits.STRAVA_WINDOW_SECONDS == 0
+    assert [quota.acquire() for _ in range(2)] == [0.0, 0.0]
+
+def test_quota_limiter_counts_from_the_first_request(clock):
+    athlete, app = QuotaWindow(2, rate_limits.STRAVA_WINDOW_SECONDS), QuotaWindow(100, rate_limits.STRAVA_WINDOW_SECONDS)
+    limiter = QuotaLimiter(athlete, [app])
+    assert limiter.requests == 0
+    # After the first request, the second is admitted within the window
+    limiter({})
+    assert clock.slept == []
+    # The third request of the athlete waits although the application quota has room
+    limiter({})
+    assert limiter.requests == 2
+    assert limiter.waited_seconds == pytest.approx(300)
+
+def test_quota_limiter_does_not_count_before_the_first_request(clock):
+    athlete = QuotaWindow(2, rate_limits.STRAVA_WINDOW_SECONDS)
+    QuotaLimiter(athlete)
+    assert [athlete.acquire() for _ in range(2)] == [0.0, 0.0]
+
+def test_quota_limiter_waits_when_strava_reports_the_quota_used(clock):
+    limiter = QuotaLimiter(QuotaWindow(50, rate_limits.STRAVA_WINDOW_SECONDS))
+    limiter({'X-RateLimit-Usage': '100,300', 'X-RateLimit-Limit': '100,1000'})
+    assert clock.slept == [pytest.approx(300)]
@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from time_of_day import TIME_SLOT_LABELS, assign_time_slots, local_start_epoch, rebuild_time_of_day_stats
+
+
+def time_of_day_stats(conn):
+    return conn.execute("SELECT * FROM time_of_day_stats ORDER BY time_slot, month").fetchall()
+
+def test_incremental_time_of_day_stats_match_rebuild(conn, store_runs):
+    store_runs(25, seed=1)
+    store_runs(25, seed=2, first_id=100)
+    stored = time_of_day_stats(conn)
+    rebuild_time_of_day_stats(conn)
+    rebuilt = time_of_day_stats(conn)
+
+    assert len(stored) == len(rebuilt)
+    assert sum(row[2] for row in stored) == 50
+    for row, rebuilt_row in zip(stored, rebuilt):
+        assert row[:3] == rebuilt_row[:3]
+        assert row[3:] == pytest.approx(rebuilt_row[3:])
+
+def test_slots_follow_the_local_start_hour():
+    hours = np.arange(24)
+    slots = assign_time_slots(hours)
+    assert list(slots[[0, 4, 5, 7, 8, 10, 11, 15, 16, 18, 19, 23]]) == [
+        TIME_SLOT_LABELS[0], TIME_SLOT_LABELS[0], 'Early Morning (5-8 AM)', 'Early Morning (5-8 AM)',
+        'Morning (8-11 AM)', 'Morning (8-11 AM)', 'Afternoon (11 AM-4 PM)', 'Afternoon (11 AM-4 PM)',
+        'Evening (4-7 PM)', 'Evening (4-7 PM)', 'Night (7 PM-5 AM)', 'Night (7 PM-5 AM)'
+    ]
+
+def test_local_start_epoch_falls_back_to_the_activity_timezone():
+    local = local_start_epoch(None, datetime(2024, 1, 1, 0, 30, tzinfo=timezone.utc), "(GMT+05:30) Asia/Kolkata")
+    assert datetime.fromtimestamp(local, timezone.utc).replace(tzinfo=None) == datetime(2024, 1, 1, 6, 0)
+    assert local_start_epoch("2024-01-01 06:00:00") == local
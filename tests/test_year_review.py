@@ -0,0 +1,31 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from year_review import YEAR_REVIEW_TABLES, available_years, refresh_year_summaries
+
+
+def year_tables(conn):
+    return {table: pd.read_sql(f"SELECT * FROM {table} ORDER BY {', '.join(columns[:3])}", conn)
+            for table, columns in YEAR_REVIEW_TABLES.values()}
+
+def test_refreshing_synced_years_matches_a_full_refresh(conn, bulk_store):
+    bulk_store(500, seed=1, end=datetime(2023, 3, 1, tzinfo=timezone.utc))
+    refresh_year_summaries(conn)
+    # A later sync only refreshes the years it touched, as sync_activities does
+    bulk_store(200, seed=2, first_id=1000, end=datetime(2023, 9, 1, tzinfo=timezone.utc))
+    refresh_year_summaries(conn, [2023])
+    refreshed = year_tables(conn)
+    refresh_year_summaries(conn)
+
+    assert available_years(conn) == [2023, 2022, 2021]
+    for table, frame in year_tables(conn).items():
+        pd.testing.assert_frame_equal(refreshed[table], frame, check_dtype=False)
+
+def test_summary_counts_every_run_once(conn, bulk_store):
+    bulk_store(500, seed=1, end=datetime(2023, 3, 1, tzinfo=timezone.utc))
+    refresh_year_summaries(conn)
+    runs = conn.execute("SELECT SUM(runs) FROM year_summary").fetchone()[0]
+    monthly_runs = conn.execute("SELECT SUM(runs) FROM year_monthly").fetchone()[0]
+    categories = conn.execute("SELECT SUM(runs) FROM year_distance_categories").fetchone()[0]
+    assert runs == monthly_runs == categories == 500
@@ -0,0 +1,110 @@
+import calendar
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+
+# Hour edges of the time slots; hours before the first edge wrap around into the night slot
+TIME_SLOT_EDGES = [5, 8, 11, 16, 19]
+TIME_SLOT_LABELS = [
+    'Night (7 PM-5 AM)',
+    'Early Morning (5-8 AM)',
+    'Morning (8-11 AM)',
+    'Afternoon (11 AM-4 PM)',
+    'Evening (4-7 PM)',
+    'Night (7 PM-5 AM)'
+]
+
+# Chronological order of the slots for display
+TIME_SLOT_ORDER = TIME_SLOT_LABELS[1:]
+
+# Per-run columns aggregated for each (time slot, month)
+METRIC_COLUMNS = ['average_speed', 'average_heartrate', 'temperature', 'pollution_aqi', 'distance']
+
+def local_start_epoch(start_date_local, start_date=None, timezone_name=None):
+    """Returns the local wall-clock start time as seconds since the epoch (read back as UTC)."""
+    if start_date_local:
+        local = datetime.fromisoformat(str(start_date_local))
+    elif start_date:
+        # Fall back to the UTC start shifted into the activity timezone, e.g. "(GMT+05:30) Asia/Kolkata"
+        local = datetime.fromisoformat(str(start_date))
+        if local.tzinfo is None:
+            local = local.replace(tzinfo=timezone.utc)
+        if timezone_name:
+            try:
+                local = local.astimezone(ZoneInfo(str(timezone_name).split()[-1]))
+            except (KeyError, ValueError):
+                pass
+    else:
+        return None
+    return calendar.timegm(local.replace(tzinfo=None).timetuple())
+
+def assign_time_slots(hours):
+    """Vectorized bucketing of local start hours into time slot labels."""
+    return np.array(TIME_SLOT_LABELS, dtype=object)[np.digitize(hours, TIME_SLOT_EDGES)]
+
+def _aggregate(rows):
+    """Groups (epoch, metric values...) rows into {(time_slot, month): [runs, sum, count, ...]}."""
+    if not rows:
+        return {}
+    epochs = np.array([row[0] for row in rows], dtype=np.int64)
+    hours = (epochs // 3600) % 24
+    slots = assign_time_slots(hours)
+    months = [datetime(1970, 1, 1) + timedelta(seconds=int(epoch)) for epoch in epochs]
+
+    groups = {}
+    for row, slot, month in zip(rows, slots, months):
+        totals = groups.setdefault((slot, month.strftime('%Y-%m')), [0] + [0.0, 0] * len(METRIC_COLUMNS))
+        totals[0] += 1
+        for idx, value in enumerate(row[1:]):
+            if value is not None:
+                totals[1 + 2 * idx] += float(value)
+                totals[2 + 2 * idx] += 1
+    return groups
+
+def _store(cursor, groups):
+    sum_columns = ", ".join(f"{col}_sum, {col}_count" for col in METRIC_COLUMNS)
+    update_columns = ", ".join(
+        f"{col}_sum = {col}_sum + excluded.{col}_sum, {col}_count = {col}_count + excluded.{col}_count"
+        for col in METRIC_COLUMNS
+    )
+    cursor.executemany(f"""
+        INSERT INTO time_of_day_stats (time_slot, month, runs, {sum_columns})
+        VALUES (?, ?, ?, {', '.join('?' for _ in range(2 * len(METRIC_COLUMNS)))})
+        ON CONFLICT (time_slot, month) DO UPDATE SET runs = runs + excluded.runs, {update_columns}
+    """, [list(key) + totals for key, totals in groups.items()])
+
+def _fetch_rows(cursor, where="1 = 1", params=()):
+    cursor.execute(f"""
+        SELECT start_epoch_local, {', '.join(METRIC_COLUMNS)} FROM strava_activities_weather
+        WHERE start_epoch_local IS NOT NULL AND {where}
+    """, params)
+    return cursor.fetchall()
+
+def update_time_of_day_stats(conn, activity_id):
+    """Adds a newly inserted activity to the time slot x month aggregates."""
+    cursor = conn.cursor()
+    _store(cursor, _aggregate(_fetch_rows(cursor, "id = ?", (activity_id,))))
+    conn.commit()
+
+def rebuild_time_of_day_stats(conn):
+    """Recomputes the time slot x month aggregates from every stored activity."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM time_of_day_stats")
+    _store(cursor, _aggregate(_fetch_rows(cursor)))
+    conn.commit()
+
+def time_of_day_metrics_query():
+    """Builds the SQL returning per time slot metric means."""
+    means = ",\n            ".join(
+        f"SUM({col}_sum) / NULLIF(SUM({col}_count), 0) AS {col}" for col in METRIC_COLUMNS
+    )
+    return f"""
+        SELECT
+            time_slot,
+            {means},
+            SUM(runs) AS id
+        FROM time_of_day_stats
+        GROUP BY time_slot
+    """
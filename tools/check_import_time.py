@@ -0,0 +1,79 @@
+"""Import-time budget check.
+
+Imports each module in a fresh interpreter with `python -X importtime`, keeps the fastest of a few runs,
+and exits non-zero when a module is over its budget or pulls in a dependency it must load lazily.
+
+    python tools/check_import_time.py [--runs N]
+"""
+import argparse, os, subprocess, sys
+
+
+# Module -> cumulative import budget in milliseconds (fastest run, on a warm file system cache)
+IMPORT_BUDGETS_MS = {
+    'api_client': 60,
+    'database': 250,
+    'llm_backend': 250,
+    'llm_cache': 250,
+    'ai_insights': 250,
+    'runinsight': 250,
+    'api_server': 250,
+    'sync': 1000,
+    'app': 1000
+}
+
+# Modules that must never be loaded just by importing the given module
+FORBIDDEN_IMPORTS = {
+    'api_client': ['streamlit', 'stravalib', 'requests', 'dotenv'],
+    'database': ['streamlit', 'stravalib', 'pandas'],
+    'llm_backend': ['streamlit', 'google.generativeai'],
+    'llm_cache': ['streamlit', 'google.generativeai'],
+    'ai_insights': ['streamlit', 'google.generativeai'],
+    'runinsight': ['streamlit', 'stravalib', 'pandas'],
+    'api_server': ['streamlit', 'stravalib', 'pandas'],
+    'sync': ['streamlit', 'stravalib', 'plotly'],
+    'app': ['stravalib', 'google.generativeai', 'plotly.express', 'requests', 'pandas', 'metrics', 'year_review']
+}
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure_import(module):
+    """Returns (cumulative import time in ms, set of imported module names) for one fresh import."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=REPO_ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+    total_us, imported = None, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        name = name.strip()
+        imported.add(name)
+        if name == module:
+            total_us = int(cumulative)
+    return (total_us or 0) / 1000, imported
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3, help="imports per module; the fastest one is kept")
+    args = parser.parse_args(argv)
+
+    failures = []
+    for module, budget in IMPORT_BUDGETS_MS.items():
+        runs = [measure_import(module) for _ in range(args.runs)]
+        elapsed = min(ms for ms, _ in runs)
+        imported = runs[0][1]
+        status = 'ok' if elapsed <= budget else 'OVER BUDGET'
+        print(f"[Import] {module}: {elapsed:.0f} ms (budget {budget} ms) {status}")
+        if elapsed > budget:
+            failures.append(f"{module} took {elapsed:.0f} ms, budget is {budget} ms")
+        for forbidden in FORBIDDEN_IMPORTS.get(module, []):
+            if forbidden in imported:
+                failures.append(f"{module} imports {forbidden} eagerly")
+
+    for failure in failures:
+        print(f"[Import] FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
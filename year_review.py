@@ -0,0 +1,148 @@
+import sqlite3
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+
+HR_ZONE_LABELS = ['Zone 1 (Recovery)', 'Zone 2 (Easy)', 'Zone 3 (Moderate)', 'Zone 4 (Hard)', 'Zone 5 (Maximum)']
+HR_ZONE_BINS = [0, 0.6, 0.7, 0.8, 0.9, float('inf')]  # Fractions of the year's max heart rate
+
+DISTANCE_CATEGORY_LABELS = ['0-5km', '5-10km', '10-20km', '20km+']
+DISTANCE_CATEGORY_BINS = [0, 5, 10, 20, float('inf')]
+
+MONTHS = list(range(1, 13))
+
+def _activities_query(years):
+    query = """
+        SELECT start_date_ist, distance, average_speed, average_heartrate, max_heartrate, total_elevation_gain
+        FROM strava_activities_weather
+    """
+    if years is None:
+        return query, ()
+    years = sorted(years)
+    # start_date_ist is an epoch; select whole UTC calendar years
+    bounds = " OR ".join("(CAST(start_date_ist AS INTEGER) >= ? AND CAST(start_date_ist AS INTEGER) < ?)" for _ in years)
+    params = []
+    for year in years:
+        params += [int(datetime(year, 1, 1, tzinfo=timezone.utc).timestamp()),
+                   int(datetime(year + 1, 1, 1, tzinfo=timezone.utc).timestamp())]
+    return query + f" WHERE {bounds}", tuple(params)
+
+def _load_activities(conn, years=None):
+    query, params = _activities_query(years)
+    df = pd.read_sql_query(query, conn, params=params)
+    df = df.apply(pd.to_numeric, errors='coerce').astype(float).dropna(subset=['start_date_ist'])
+    df['start_date_ist'] = pd.to_datetime(df['start_date_ist'], unit='s')
+    return df
+
+def build_year_summaries(df):
+    """Computes per-year aggregates for every year in df in one grouped pass.
+
+    Returns a dict of DataFrames: summary, monthly, hr_zones, distance_categories and calendar.
+    """
+    df = df.copy()
+    dates = df['start_date_ist']
+    df['year'] = dates.dt.year
+    df['month'] = dates.dt.month
+    df['pace_kmh'] = df['average_speed'] * 3.6
+
+    # Yearly summary
+    summary = df.groupby('year').agg(
+        runs=('distance', 'size'),
+        total_distance=('distance', 'sum'),
+        avg_speed_kmh=('pace_kmh', 'mean'),
+        avg_heartrate=('average_heartrate', 'mean'),
+        total_elevation=('total_elevation_gain', 'sum'),
+        max_heartrate=('max_heartrate', 'max')
+    )
+    summary['active_weeks'] = df.assign(week=dates.dt.isocalendar().week).groupby('year')['week'].nunique()
+    summary['avg_runs_per_week'] = summary['runs'] / summary['active_weeks'].where(summary['active_weeks'] > 0)
+    day_counts = df.groupby(['year', dates.dt.day_name().rename('day')]).size().rename('runs').reset_index()
+    day_counts = day_counts.sort_values(['year', 'runs'], ascending=[True, False])
+    summary['common_days'] = day_counts.groupby('year')['day'].apply(lambda days: ', '.join(days.head(2)))
+    summary = summary.reset_index()
+
+    # Monthly distance, cumulative distance, elevation and pace, with every month present
+    monthly = df.groupby(['year', 'month']).agg(
+        runs=('distance', 'size'),
+        distance=('distance', 'sum'),
+        elevation_total=('total_elevation_gain', 'sum'),
+        elevation_per_run=('total_elevation_gain', 'mean'),
+        pace_mean=('pace_kmh', 'mean'),
+        pace_min=('pace_kmh', 'min'),
+        pace_max=('pace_kmh', 'max')
+    )
+    full_index = pd.MultiIndex.from_product([summary['year'], MONTHS], names=['year', 'month'])
+    monthly = monthly.reindex(full_index).fillna(0).reset_index()
+    monthly['cumulative_distance'] = monthly.groupby('year')['distance'].cumsum()
+
+    # Heart rate zones relative to each year's max heart rate
+    year_max_hr = df.groupby('year')['max_heartrate'].transform('max').replace(0, np.nan)
+    df['hr_zone'] = pd.cut(df['average_heartrate'] / year_max_hr, bins=HR_ZONE_BINS, labels=HR_ZONE_LABELS)
+    hr_zones = df.dropna(subset=['hr_zone']).groupby(['year', 'month', 'hr_zone'], observed=True).size()
+    hr_zones = hr_zones.rename('runs').reset_index().rename(columns={'hr_zone': 'zone'})
+    hr_zones['zone'] = hr_zones['zone'].astype(str)
+
+    # Distance categories
+    df['category'] = pd.cut(df['distance'], bins=DISTANCE_CATEGORY_BINS, labels=DISTANCE_CATEGORY_LABELS)
+    distance_categories = df.groupby(['year', 'category'], observed=False).size().rename('runs').reset_index()
+    distance_categories = distance_categories[distance_categories['year'].isin(summary['year'])]
+    distance_categories['category'] = distance_categories['category'].astype(str)
+
+    # Calendar heatmap: runs per week-of-month
+    df['week'] = (dates.dt.day - 1) // 7
+    calendar = df.groupby(['year', 'month', 'week']).size().rename('runs').reset_index()
+
+    return {
+        'summary': summary,
+        'monthly': monthly,
+        'hr_zones': hr_zones,
+        'distance_categories': distance_categories,
+        'calendar': calendar
+    }
+
+YEAR_REVIEW_TABLES = {
+    'summary': ('year_summary', ['year', 'runs', 'total_distance', 'avg_speed_kmh', 'avg_heartrate',
+                                 'total_elevation', 'max_heartrate', 'active_weeks', 'avg_runs_per_week',
+                                 'common_days']),
+    'monthly': ('year_monthly', ['year', 'month', 'runs', 'distance', 'cumulative_distance',
+                                 'elevation_total', 'elevation_per_run', 'pace_mean', 'pace_min', 'pace_max']),
+    'hr_zones': ('year_hr_zones', ['year', 'month', 'zone', 'runs']),
+    'distance_categories': ('year_distance_categories', ['year', 'category', 'runs']),
+    'calendar': ('year_calendar', ['year', 'month', 'week', 'runs'])
+}
+
+def refresh_year_summaries(conn, years=None):
+    """Rebuilds the stored year summaries for the given years (all years when None)."""
+    summaries = build_year_summaries(_load_activities(conn, years))
+    cursor = conn.cursor()
+    for key, (table, columns) in YEAR_REVIEW_TABLES.items():
+        if years is None:
+            cursor.execute(f"DELETE FROM {table}")
+        else:
+            cursor.executemany(f"DELETE FROM {table} WHERE year = ?", [(int(year),) for year in years])
+        frame = summaries[key][columns].astype(object).where(summaries[key][columns].notna(), None)
+        cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+            [tuple(value.item() if hasattr(value, 'item') else value for value in row)
+             for row in frame.itertuples(index=False)]
+        )
+    conn.commit()
+
+def load_year_review(conn, years):
+    """Reads the stored year summaries for the given years as DataFrames keyed like build_year_summaries."""
+    placeholders = ", ".join("?" for _ in years)
+    params = [int(year) for year in years]
+    return {
+        key: pd.read_sql_query(f"SELECT {', '.join(columns)} FROM {table} WHERE year IN ({placeholders})",
+                               conn, params=params)
+        for key, (table, columns) in YEAR_REVIEW_TABLES.items()
+    }
+
+def available_years(conn):
+    """Returns the years that have stored summaries, newest first."""
+    try:
+        return [row[0] for row in conn.execute("SELECT year FROM year_summary ORDER BY year DESC")]
+    except sqlite3.OperationalError:
+        return []